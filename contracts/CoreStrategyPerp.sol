@@ -8,6 +8,7 @@ pragma solidity 0.8.15;
 import {BaseStrategy, StrategyParams} from "@yearnvaults/contracts/BaseStrategy.sol";
 import {SafeERC20, IERC20, Address} from "@openzeppelin/contracts/token/ERC20/utils/SafeERC20.sol";
 import {Math} from "@openzeppelin/contracts/utils/math/Math.sol";
+import {SafeCast} from "@openzeppelin/contracts/utils/math/SafeCast.sol";
 import "@openzeppelin/contracts/utils/math/SafeMath.sol";
 import "./interfaces/perp/IVault.sol";
 import "./interfaces/perp/IBaseToken.sol";
@@ -48,53 +49,116 @@ abstract contract CoreStrategyPerp is BaseStrategy {
     using SafeMath for uint256;
     using SafeMath for uint128;
     using SafeMath for uint8;
-
-    event DebtRebalance(
-        uint256 indexed debtRatio,
-        uint256 indexed swapAmount,
-        uint256 indexed slippage
+    using SafeCast for uint256;
+
+    // Telemetry, indexed by scripts/sim/telemetry.py. Only the kind of an
+    // event is indexed; amounts are in want (collected fees in quote, 18
+    // decimals, like pendingRewards) and ratios in basis points.
+    uint8 constant REBALANCE_DEBT = 0;
+    uint8 constant REBALANCE_COLLATERAL = 1;
+    uint8 constant CALL_CLOSE_POSITION = 1;
+    uint8 constant CALL_COLLECT_FEES = 2;
+    // Packed calldata, see fallback. Bytes no function selector starts with.
+    uint8 constant PACKED_HARVEST = 0x12;
+    uint8 constant PACKED_TEND = 0x13;
+    uint8 constant PACKED_REBALANCE_DEBT = 0x16;
+    uint8 constant PACKED_REBALANCE_COLLATERAL = 0x17;
+    uint8 constant PACKED_SHIFT_RUNGS = 0x18;
+    uint8 constant PACKED_HARVEST_THRESHOLD = 0x19;
+    uint8 constant PACKED_TICK_RANGE_MULTIPLIER = 0x1a;
+    uint8 constant PACKED_DEBT_THRESHOLDS = 0x1b;
+    uint8 constant PACKED_COLLATERAL_THRESHOLDS = 0x1c;
+
+    event Rebalanced(uint8 indexed kind, uint256 ratio, uint256 deployed);
+    event TicksUpdated(
+        uint8 indexed rung,
+        int24 lowerTick,
+        int24 upperTick,
+        int24 multiplier
     );
-    event CollatRebalance(
-        uint256 indexed collatRatio,
-        uint256 indexed adjAmount
+    event Harvested(
+        uint256 fees,
+        uint256 profit,
+        uint256 loss,
+        uint256 insurancePayment,
+        uint256 compensation
     );
-    event Debug(uint256 indexed debug1, uint256 indexed debug2);
-
-    uint256 public collatUpper = 5100;
-    uint256 public collatLower = 4900;
-    uint256 public debtUpper = 10100;
-    uint256 public debtMultiple = 10000;
-    uint256 public debtLower = 9900;
+    event Withdrawn(uint256 requested, uint256 freed, uint256 stratPercent);
+    event PerpCallFailed(uint8 indexed call, string reason);
+
+    // Storage is packed by access pattern, see tests/local/test_storage_layout.py.
+    // Parameters read by the rebalance checks, calcDebtRatio and the deploy and
+    // withdraw paths share one slot. Ratios are in BASIS_PRECISION.
+    uint16 public collatUpper = 5100;
+    uint16 public collatLower = 4900;
+    uint16 public debtUpper = 10100;
+    uint16 public debtLower = 9900;
+    uint32 public debtMultiple = 10000;
     //uint256 public rebalancePercent = 10000; // 100% (how far does rebalance of debt move towards 100% from threshold)
 
     // protocal limits & upper, target and lower thresholds for ratio of debt to collateral
-    uint256 public collatLimit = 7500;
+    uint16 public collatLimit = 7500;
+    uint16 public slippageAdj = 9900; // 99%
+    // taker residual (share of total assets) left open by in place rebalances
+    uint16 public residualTolerance = 50; // 0.5%
+    uint8 wantDecimals;
+    uint8 shortDecimals;
+    // withdrawals of up to 95% only remove the liquidity they need (opt in)
+    bool public partialWithdraw = false;
+    // rebalances keep the range when the ticks do not move and only resize it
+    bool public inPlaceRebalance = false;
 
     // ERC20 Tokens;
     IERC20 public short;
-    uint8 wantDecimals;
-    uint8 shortDecimals;
+    uint96 public minDeploy;
     // Contract Interfaces
     IStrategyInsurance public insurance;
 
-    uint256 public slippageAdj = 9900; // 99%
+    // harvest path
+    uint128 public minProfit;
+    // pendingRewards (18 decimals) harvestTrigger waits for between the report delays, 0 to disable
+    uint128 public harvestThreshold;
+
+    // The core range and its width
+    //uint256 public totalLiquidity = 0;
+    int24 public lowerTick = 0;
+    int24 public upperTick = 0;
+    int24 public tickRangeMultiplier;
+    // bounds keepers may move tickRangeMultiplier within, see setTickRangeMultiplier
+    int24 public minTickRangeMultiplier;
+    int24 public maxTickRangeMultiplier;
+    uint24 public twapTime;
+    // resolved from perpVault, see refreshPerpComponents
+    uint32 public twapInterval;
+    // wings.length, kept next to the core ticks so single range mode reads no
+    // more storage than before the ladder
+    uint8 ladderWings;
 
     uint256 constant BASIS_PRECISION = 10000;
 
     uint256 constant STD_PRECISION = 1e18;
     address weth;
-    uint256 public minDeploy;
-    uint256 public minProfit;
     IVault public perpVault;
     IClearingHouse public clearingHouse;
     IOrderBook public orderBook;
     IMarketRegistry public marketRegistery;
     IBaseToken public baseToken;
-    int24 public tickRangeMultiplier;
-    //uint256 public totalLiquidity = 0;
-    int24 public lowerTick = 0;
-    int24 public upperTick = 0;
-    uint24 public twapTime;
+    // resolved from perpVault, see refreshPerpComponents
+    IExchange public perpExchange;
+    IClearingHouseConfig public clearingHouseConfig;
+
+    // Ladder mode: ranges held next to the core range (lowerTick / upperTick,
+    // rung 0), each in one storage slot. Empty in single range mode.
+    struct Rung {
+        int24 lowerTick;
+        int24 upperTick;
+        // half width in tick spacings
+        int24 multiplier;
+        // share of the position, in BASIS_PRECISION
+        uint16 weight;
+    }
+    uint256 constant MAX_WINGS = 3;
+    Rung[] public wings;
 
     constructor(address _vault, CoreStrategyPerpConfig memory _config)
         BaseStrategy(_vault)
@@ -107,8 +171,8 @@ abstract contract CoreStrategyPerp is BaseStrategy {
         // initialize other interfaces
         maxReportDelay = 21600;
         minReportDelay = 14400;
-        minDeploy = _config.minDeploy;
-        minProfit = _config.minProfit;
+        minDeploy = _config.minDeploy.toUint96();
+        minProfit = _config.minProfit.toUint128();
 
         // PERP
         perpVault = IVault(_config.perpVault);
@@ -117,8 +181,11 @@ abstract contract CoreStrategyPerp is BaseStrategy {
         marketRegistery = IMarketRegistry(_config.marketRegistery);
         baseToken = IBaseToken(_config.baseToken);
         tickRangeMultiplier = _config.tickRangeMultiplier;
+        minTickRangeMultiplier = _config.tickRangeMultiplier;
+        maxTickRangeMultiplier = _config.tickRangeMultiplier;
         twapTime = _config.twapTime;
-        debtMultiple = _config.debtMultiple;
+        debtMultiple = _config.debtMultiple.toUint32();
+        _refreshPerpComponents();
 
         approveContracts();
     }
@@ -141,15 +208,69 @@ abstract contract CoreStrategyPerp is BaseStrategy {
     * @return _liquidity The total liquidity of this contract for the specified trading pair within the given price range.
     */
     function getTotalLiquidity() public view returns (uint256 _liquidity) {
+        for (uint256 i = 0; i <= ladderWings; i++) {
+            _liquidity = _liquidity.add(getRungLiquidity(i));
+        }
+    }
+
+    /**
+    * @dev Returns the liquidity of one range: 0 is the core range, 1.. the ladder wings.
+    */
+    function getRungLiquidity(uint256 _rung) public view returns (uint256) {
+        (int24 lower, int24 upper) = _rungTicks(_rung);
         OpenOrder.Info memory info = orderBook.getOpenOrder(
             address(this),
             address(short),
-            lowerTick,
-            upperTick
+            lower,
+            upper
         );
         return uint256(info.liquidity);
     }
 
+    /**
+    * @notice Number of ranges held next to the core range, 0 in single range mode.
+    */
+    function wingCount() external view returns (uint256) {
+        return ladderWings;
+    }
+
+    /**
+    * @notice Ranges the mark TWAP has left, bit i set for rung i, see shiftRungs.
+    * @dev Rungs without liquidity (not deployed yet) are never out of range.
+    */
+    function rungsOutOfRange() public view returns (uint256 _mask) {
+        int24 tick = getBaseTokenMarkTwapTick();
+        for (uint256 i = 0; i <= ladderWings; i++) {
+            (int24 lower, int24 upper) = _rungTicks(i);
+            if ((tick < lower || tick >= upper) && getRungLiquidity(i) > 0) {
+                _mask |= 1 << i;
+            }
+        }
+    }
+
+    function _rungTicks(uint256 _rung) internal view returns (int24, int24) {
+        if (_rung == 0) {
+            return (lowerTick, upperTick);
+        }
+        Rung storage wing = wings[_rung - 1];
+        return (wing.lowerTick, wing.upperTick);
+    }
+
+    function _rungMultiplier(uint256 _rung) internal view returns (int24) {
+        return _rung == 0 ? tickRangeMultiplier : wings[_rung - 1].multiplier;
+    }
+
+    /// @dev The core range holds what the wings leave.
+    function _rungWeight(uint256 _rung) internal view returns (uint256 _weight) {
+        if (_rung > 0) {
+            return wings[_rung - 1].weight;
+        }
+        _weight = BASIS_PRECISION;
+        for (uint256 i = 0; i < ladderWings; i++) {
+            _weight = _weight.sub(wings[i].weight);
+        }
+    }
+
     /**
     * @notice Get the TWAP (Time-Weighted Average Price) of the base token in terms of the quote token.
     * The TWAP is computed based on the price observations of the base token over a fixed time interval,
@@ -159,14 +280,9 @@ abstract contract CoreStrategyPerp is BaseStrategy {
     * @return The TWAP price of the base token in units of 10^18 of the quote token per unit of the base token.
     */
     function getBaseTokenMarkTwapPrice() public view returns (uint256) {
-        IExchange exchange = IExchange(perpVault.getExchange());
-        IClearingHouseConfig config = IClearingHouseConfig(
-            perpVault.getClearingHouseConfig()
-        );
-
-        uint160 sqrtMarkTwapX96 = exchange.getSqrtMarkTwapX96(
+        uint160 sqrtMarkTwapX96 = perpExchange.getSqrtMarkTwapX96(
             address(baseToken),
-            config.getTwapInterval()
+            twapInterval
         );
         uint256 markPriceX96 = PerpMath.formatSqrtPriceX96ToPriceX96(
             sqrtMarkTwapX96
@@ -177,18 +293,12 @@ abstract contract CoreStrategyPerp is BaseStrategy {
 
     /**
     * @dev Returns the current spot price of the base token in quote token units.
-    * The spot price is calculated as the current TWAP (time-weighted average price) of the base token
-    * over a configurable period of time (specified in the clearing house configuration), converted to
-    * quote token units using the current quote token's decimals.
+    * The spot price is the current mark price of the base token (a zero length TWAP),
+    * converted to quote token units using the current quote token's decimals.
     * @return uint256 representing the current spot price of the base token in quote token units
     */
     function getBaseTokenSpotPrice() public view returns (uint256) {
-        IExchange exchange = IExchange(perpVault.getExchange());
-        IClearingHouseConfig config = IClearingHouseConfig(
-            perpVault.getClearingHouseConfig()
-        );
-
-        uint160 sqrtMarkTwapX96 = exchange.getSqrtMarkTwapX96(
+        uint160 sqrtMarkTwapX96 = perpExchange.getSqrtMarkTwapX96(
             address(baseToken),
             0
         );
@@ -200,21 +310,13 @@ abstract contract CoreStrategyPerp is BaseStrategy {
     }
 
     /**
-    * @notice Returns the spot price of the base token in terms of the quote token.
-    * @return The spot price of the base token in terms of the quote token, represented in 18 decimal places.
+    * @notice Returns the mark TWAP tick of the base token.
+    * @return The tick of the mark price averaged over the cached twap interval.
     */
     function getBaseTokenMarkTwapTick() public view returns (int24) {
-        IExchange exchange = IExchange(perpVault.getExchange());
-        IClearingHouseConfig config = IClearingHouseConfig(
-            perpVault.getClearingHouseConfig()
-        );
-
-        uint160 sqrtMarkTwapX96 = exchange.getSqrtMarkTwapX96(
+        uint160 sqrtMarkTwapX96 = perpExchange.getSqrtMarkTwapX96(
             address(baseToken),
-            config.getTwapInterval()
-        );
-        uint256 markPriceX96 = PerpMath.formatSqrtPriceX96ToPriceX96(
-            sqrtMarkTwapX96
+            twapInterval
         );
         return TickMath.getTickAtSqrtRatio(sqrtMarkTwapX96);
     }
@@ -242,12 +344,18 @@ abstract contract CoreStrategyPerp is BaseStrategy {
     * @return _shortAmount The total value of short position deployed, denominated in quote tokens.
     */
     function shortDeployed() public view returns (uint256 _shortAmount) {
-            //uint256 sqrtMarkPriceX96 = PerpMath.getSqrtRatioAtTick(getBaseTokenMarkTwapTick());
-            return LiquidityAmounts.getAmount0ForLiquidity(
-            TickMath.getSqrtRatioAtTick(getBaseTokenMarkTwapTick()) > TickMath.getSqrtRatioAtTick(lowerTick) ? TickMath.getSqrtRatioAtTick(getBaseTokenMarkTwapTick()) : TickMath.getSqrtRatioAtTick(lowerTick),
-            TickMath.getSqrtRatioAtTick(upperTick),
-            uint128(getTotalLiquidity())
-        );
+        uint160 sqrtMarkTwapX96 = TickMath.getSqrtRatioAtTick(getBaseTokenMarkTwapTick());
+        for (uint256 i = 0; i <= ladderWings; i++) {
+            (int24 lower, int24 upper) = _rungTicks(i);
+            uint160 sqrtLowerX96 = TickMath.getSqrtRatioAtTick(lower);
+            _shortAmount = _shortAmount.add(
+                LiquidityAmounts.getAmount0ForLiquidity(
+                    sqrtMarkTwapX96 > sqrtLowerX96 ? sqrtMarkTwapX96 : sqrtLowerX96,
+                    TickMath.getSqrtRatioAtTick(upper),
+                    uint128(getRungLiquidity(i))
+                )
+            );
+        }
     }
 
     // TODO
@@ -305,14 +413,57 @@ abstract contract CoreStrategyPerp is BaseStrategy {
     * @dev Calculates the pending rewards that can be claimed by the strategy from the order book.
     * @return The amount of pending rewards in wei denominated in quote tokens.
     */
-    function pendingRewards() public view returns (uint256) {
-        return
-            orderBook.getPendingFee(
-                address(this),
-                address(short),
-                lowerTick,
-                upperTick
+    function pendingRewards() public view returns (uint256 _fees) {
+        for (uint256 i = 0; i <= ladderWings; i++) {
+            (int24 lower, int24 upper) = _rungTicks(i);
+            _fees = _fees.add(
+                orderBook.getPendingFee(
+                    address(this),
+                    address(short),
+                    lower,
+                    upper
+                )
             );
+        }
+    }
+
+    /**
+    * @notice Whether a keeper should harvest now.
+    * @dev The BaseStrategy rules, except that with a harvestThreshold set a profit
+    * between minReportDelay and maxReportDelay is only reported once pendingRewards
+    * reaches it. Losses, debt the vault wants back and credit worth the call cost
+    * still trigger a harvest right away.
+    */
+    function harvestTrigger(uint256 callCostInWei)
+        public
+        view
+        override
+        returns (bool)
+    {
+        if (harvestThreshold == 0) {
+            return super.harvestTrigger(callCostInWei);
+        }
+        StrategyParams memory params = vault.strategies(address(this));
+        if (params.activation == 0) {
+            return false;
+        }
+        uint256 sinceReport = block.timestamp.sub(params.lastReport);
+        if (sinceReport < minReportDelay) {
+            return false;
+        }
+        if (sinceReport >= maxReportDelay) {
+            return true;
+        }
+        if (vault.debtOutstanding() > debtThreshold) {
+            return true;
+        }
+        if (estimatedTotalAssets().add(debtThreshold) < params.totalDebt) {
+            return true;
+        }
+        if (profitFactor.mul(ethToWant(callCostInWei)) < vault.creditAvailable()) {
+            return true;
+        }
+        return pendingRewards() >= harvestThreshold;
     }
 
     function _getTotalDebt() internal view returns (uint256) {
@@ -325,7 +476,116 @@ abstract contract CoreStrategyPerp is BaseStrategy {
     * @dev Only authorized addresses can call this function.
     */
     function setSlippageConfig(uint256 _slippageAdj) external onlyAuthorized {
-        slippageAdj = _slippageAdj;
+        slippageAdj = _slippageAdj.toUint16();
+    }
+
+    /**
+    * @notice Choose how withdrawals of up to 95% of the position are served.
+    * @dev When disabled (the default), withdrawals remove all liquidity and re-add the remainder.
+    * @param _partialWithdraw True to remove only the share of liquidity being withdrawn.
+    */
+    function setPartialWithdraw(bool _partialWithdraw) external onlyAuthorized {
+        partialWithdraw = _partialWithdraw;
+    }
+
+    /**
+    * @notice Configure how rebalances move the position.
+    * @param _inPlace When true, a rebalance that lands on the current ticks only adds or
+    * removes the liquidity difference, and the taker residual is only closed above the tolerance.
+    * @param _residualTolerance Taker position notional left open, in BASIS_PRECISION of total assets.
+    */
+    function setRebalanceConfig(bool _inPlace, uint256 _residualTolerance)
+        external
+        onlyAuthorized
+    {
+        require(_residualTolerance <= BASIS_PRECISION);
+        inPlaceRebalance = _inPlace;
+        residualTolerance = _residualTolerance.toUint16();
+    }
+
+    /**
+    * @notice Set the pendingRewards harvestTrigger waits for, see harvestTrigger.
+    * @param _harvestThreshold Pending maker fees in 18 decimals, 0 for the BaseStrategy rules.
+    */
+    function setHarvestThreshold(uint256 _harvestThreshold) external onlyKeepers {
+        harvestThreshold = _harvestThreshold.toUint128();
+    }
+
+    /**
+    * @notice Set the range keepers may move tickRangeMultiplier within. Governance only.
+    * @dev Equal bounds (the default) pin the multiplier. The current multiplier is clamped into the new range.
+    * @param _min The narrowest multiplier a keeper may set.
+    * @param _max The widest multiplier a keeper may set.
+    */
+    function setTickRangeLimits(int24 _min, int24 _max)
+        external
+        onlyGovernance
+    {
+        require(_min > 0);
+        require(_min <= _max);
+        minTickRangeMultiplier = _min;
+        maxTickRangeMultiplier = _max;
+        if (tickRangeMultiplier < _min) {
+            tickRangeMultiplier = _min;
+        } else if (tickRangeMultiplier > _max) {
+            tickRangeMultiplier = _max;
+        }
+    }
+
+    /**
+    * @notice Set the width of the range the next rebalance or deposit opens.
+    * @dev The live position keeps its ticks until `_determineTicks` runs again.
+    * @param _tickRangeMultiplier Half width of the range in tick spacings, within the limits.
+    */
+    function setTickRangeMultiplier(int24 _tickRangeMultiplier)
+        external
+        onlyKeepers
+    {
+        require(_tickRangeMultiplier >= minTickRangeMultiplier);
+        require(_tickRangeMultiplier <= maxTickRangeMultiplier);
+        tickRangeMultiplier = _tickRangeMultiplier;
+    }
+
+    /**
+    * @notice Hold up to MAX_WINGS wider ranges next to the core range (ladder mode), or none.
+    * @dev A live position is redeployed across the new rungs. The core range keeps
+    * BASIS_PRECISION less the wing weights.
+    * @param _multipliers Half width of each wing in tick spacings.
+    * @param _weights Share of the position in each wing, in BASIS_PRECISION.
+    */
+    function setLadder(int24[] calldata _multipliers, uint16[] calldata _weights)
+        external
+        onlyAuthorized
+    {
+        require(_multipliers.length == _weights.length);
+        require(_multipliers.length <= MAX_WINGS);
+        bool deployed = getTotalLiquidity() > 0;
+        if (deployed) {
+            liquidateAllToLend();
+            _closePosition();
+        }
+        delete wings;
+        uint256 total;
+        for (uint256 i = 0; i < _multipliers.length; i++) {
+            require(_multipliers[i] > 0);
+            total = total.add(_weights[i]);
+            wings.push(Rung(0, 0, _multipliers[i], _weights[i]));
+        }
+        require(total < BASIS_PRECISION);
+        ladderWings = uint8(_multipliers.length);
+        if (deployed) {
+            _deployFromLend(estimatedTotalAssets());
+        }
+    }
+
+    /**
+    * @notice Move the rungs in `_mask` the price has left back around it, leaving the others.
+    * @param _mask Bit i for rung i, a subset of rungsOutOfRange.
+    */
+    function shiftRungs(uint256 _mask) external onlyKeepers {
+        require(_mask != 0);
+        require(_mask & ~rungsOutOfRange() == 0);
+        _shiftRungs(_mask);
     }
 
     /**
@@ -349,6 +609,23 @@ abstract contract CoreStrategyPerp is BaseStrategy {
     */
     function setPerpVault(address _vault) external onlyAuthorized {
         perpVault = IVault(_vault);
+        _refreshPerpComponents();
+    }
+
+    /**
+    * @notice Re-read the Exchange, ClearingHouseConfig and twap interval from the Perp Vault
+    * @dev Call after Perp points the vault at new components or changes the twap interval
+    */
+    function refreshPerpComponents() external onlyAuthorized {
+        _refreshPerpComponents();
+    }
+
+    function _refreshPerpComponents() internal {
+        perpExchange = IExchange(perpVault.getExchange());
+        clearingHouseConfig = IClearingHouseConfig(
+            perpVault.getClearingHouseConfig()
+        );
+        twapInterval = clearingHouseConfig.getTwapInterval();
     }
 
     /**
@@ -365,8 +642,8 @@ abstract contract CoreStrategyPerp is BaseStrategy {
         require(_lower < _upper);
         //require(_debtMultiple <= BASIS_PRECISION.mul(10));
         require(_lower < _upper);
-        debtUpper = _upper;
-        debtLower = _lower;
+        debtUpper = _upper.toUint16();
+        debtLower = _lower.toUint16();
         //debtMultiple = _debtMultiple;
     }
 
@@ -385,12 +662,12 @@ abstract contract CoreStrategyPerp is BaseStrategy {
         uint256 _limit
     ) external onlyAuthorized {
         require(_limit <= BASIS_PRECISION);
-        collatLimit = _limit;
+        collatLimit = _limit.toUint16();
         require(collatLimit > _upper);
         require(_upper > _lower);
-        collatUpper = _upper;
-        debtMultiple = _debtMultiple;
-        collatLower = _lower;
+        collatUpper = _upper.toUint16();
+        debtMultiple = _debtMultiple.toUint32();
+        collatLower = _lower.toUint16();
     }
 
     function prepareReturn(uint256 _debtOutstanding)
@@ -420,20 +697,34 @@ abstract contract CoreStrategyPerp is BaseStrategy {
             _loss = totalDebt.sub(totalAssets);
         }
 
+        uint256 fees;
         if (pendingRewards() > minProfit) {
-            _profit += _harvestInternal();
+            fees = _harvestInternal();
+            _profit += fees;
         }
 
         // Check if we're net loss or net profit
+        uint256 insurancePayment;
+        uint256 compensation;
         if (_loss >= _profit) {
             _loss = _loss.sub(_profit);
             _profit = 0;
-            _loss = _loss.sub(insurance.reportLoss(totalDebt, _loss));
+            compensation = insurance.reportLoss(totalDebt, _loss);
+            // the fund also pays out losses still owed from earlier harvests,
+            // so it can send more than this one lost
+            if (compensation > _loss) {
+                _profit = compensation.sub(_loss);
+                _loss = 0;
+            } else {
+                _loss = _loss.sub(compensation);
+            }
         } else {
             _profit = _profit.sub(_loss);
             _loss = 0;
-            (uint256 insurancePayment, uint256 compensation) = insurance
-                .reportProfit(totalDebt, _profit);
+            (insurancePayment, compensation) = insurance.reportProfit(
+                totalDebt,
+                _profit
+            );
             _profit = _profit.sub(insurancePayment).add(compensation);
 
             // double check insurance isn't asking for too much or zero
@@ -445,6 +736,7 @@ abstract contract CoreStrategyPerp is BaseStrategy {
                 );
             }
         }
+        emit Harvested(fees, _profit, _loss, insurancePayment, compensation);
     }
 
     function adjustPosition(uint256 _debtOutstanding) internal override {
@@ -508,28 +800,147 @@ abstract contract CoreStrategyPerp is BaseStrategy {
         _rebalanceCollateralInternal();
     }
 
+    /**
+    * @notice Packed calldata for the frequent keeper and tuning calls, which cuts their
+    * L1 data fee on Optimism (see scripts/keeper/packed.py). The first byte picks the
+    * call and its arguments follow big-endian in as few bytes as they need:
+    * harvest, tend, rebalanceDebt, rebalanceCollateral: none; shiftRungs: uint8;
+    * setHarvestThreshold: uint128; setTickRangeMultiplier: int24;
+    * setDebtThresholds: 2 x uint16; setCollateralThresholds: 4 x uint16.
+    * @dev The call is re-encoded and delegatecalled into this contract, so the ABI
+    * function runs with the same sender and checks.
+    */
+    fallback() external {
+        require(msg.data.length > 0, "!packed");
+        uint8 op = uint8(msg.data[0]);
+        bytes memory call;
+        if (op == PACKED_HARVEST) {
+            _packedArgs(0);
+            call = abi.encodeCall(this.harvest, ());
+        } else if (op == PACKED_TEND) {
+            _packedArgs(0);
+            call = abi.encodeCall(this.tend, ());
+        } else if (op == PACKED_REBALANCE_DEBT) {
+            _packedArgs(0);
+            call = abi.encodeCall(this.rebalanceDebt, ());
+        } else if (op == PACKED_REBALANCE_COLLATERAL) {
+            _packedArgs(0);
+            call = abi.encodeCall(this.rebalanceCollateral, ());
+        } else if (op == PACKED_SHIFT_RUNGS) {
+            bytes calldata args = _packedArgs(1);
+            call = abi.encodeCall(this.shiftRungs, (_packedUint(args, 0, 1)));
+        } else if (op == PACKED_HARVEST_THRESHOLD) {
+            bytes calldata args = _packedArgs(16);
+            call = abi.encodeCall(
+                this.setHarvestThreshold,
+                (_packedUint(args, 0, 16))
+            );
+        } else if (op == PACKED_TICK_RANGE_MULTIPLIER) {
+            bytes calldata args = _packedArgs(3);
+            call = abi.encodeCall(
+                this.setTickRangeMultiplier,
+                (int24(uint24(_packedUint(args, 0, 3))))
+            );
+        } else if (op == PACKED_DEBT_THRESHOLDS) {
+            bytes calldata args = _packedArgs(4);
+            call = abi.encodeCall(
+                this.setDebtThresholds,
+                (_packedUint(args, 0, 2), _packedUint(args, 2, 2))
+            );
+        } else if (op == PACKED_COLLATERAL_THRESHOLDS) {
+            bytes calldata args = _packedArgs(8);
+            call = abi.encodeCall(
+                this.setCollateralThresholds,
+                (
+                    _packedUint(args, 0, 2),
+                    _packedUint(args, 2, 2),
+                    _packedUint(args, 4, 2),
+                    _packedUint(args, 6, 2)
+                )
+            );
+        } else {
+            revert("!packed");
+        }
+        (bool success, bytes memory result) = address(this).delegatecall(call);
+        if (!success) {
+            assembly {
+                revert(add(result, 32), mload(result))
+            }
+        }
+    }
+
+    /// @dev The arguments of a packed call, which must be `_size` bytes.
+    function _packedArgs(uint256 _size) internal pure returns (bytes calldata) {
+        require(msg.data.length == _size + 1, "!packed");
+        return msg.data[1:];
+    }
+
+    /// @dev Big-endian unsigned integer of `_size` bytes at `_offset` of `_args`.
+    function _packedUint(
+        bytes calldata _args,
+        uint256 _offset,
+        uint256 _size
+    ) internal pure returns (uint256 _value) {
+        for (uint256 i = 0; i < _size; i++) {
+            _value = (_value << 8) | uint8(_args[_offset + i]);
+        }
+    }
+
     function exec(address _target, bytes memory _data) external onlyAuthorized {
         PerpLib.exec(_target, _data);
     }
 
-    function liquidateAllToLend()
+    /// @dev Removes every rung. Removing liquidity collects its fees.
+    function liquidateAllToLend() internal {
+        require(getTotalLiquidity() > 0, "RL_LIQ");
+        for (uint256 i = 0; i <= ladderWings; i++) {
+            uint256 liquidity = getRungLiquidity(i);
+            if (liquidity > 0) {
+                _removeLiquidity(i, liquidity);
+            }
+        }
+        //_closePosition(); //TODO: Bring back later
+    }
+
+    function _removeLiquidity(uint256 _rung, uint256 _liquidity)
         internal
         returns (IClearingHouse.RemoveLiquidityResponse memory _resp)
     {
-        require(getTotalLiquidity() > 0, "RL_LIQ");
-        _collectPendingFees();
+        (int24 lower, int24 upper) = _rungTicks(_rung);
         IClearingHouse.RemoveLiquidityParams memory params = IClearingHouse
             .RemoveLiquidityParams({
                 baseToken: address(short),
-                lowerTick: lowerTick,
-                upperTick: upperTick,
-                liquidity: uint128(getTotalLiquidity()),
+                lowerTick: lower,
+                upperTick: upper,
+                liquidity: uint128(_liquidity),
                 minBase: 0,
                 minQuote: 0,
                 deadline: 0xffffffffffffffffffffffffffffffffffffffffffffffffffffffffffffffff
             });
         _resp = clearingHouse.removeLiquidity(params);
-        //_closePosition(); //TODO: Bring back later
+    }
+
+    /**
+     * @dev Removes the share of liquidity backing `_amount` out of `_deployed` from
+     * every rung (rounded up), closes the taker residual the removal leaves above
+     * `residualTolerance` and withdraws `_amount` of collateral. The rest of the
+     * position keeps its ticks. Fees are collected by the removal.
+     */
+    function _withdrawPartial(uint256 _amount, uint256 _deployed) internal {
+        for (uint256 i = 0; i <= ladderWings; i++) {
+            uint256 liquidity = getRungLiquidity(i);
+            uint256 toRemove = Math.min(
+                liquidity.mul(_amount).div(_deployed).add(1),
+                liquidity
+            );
+            if (toRemove > 0) {
+                _removeLiquidity(i, toRemove);
+            }
+        }
+        _closeResidual();
+        _removeCollateral(
+            Math.min(_amount, perpVault.getFreeCollateral(address(this)))
+        );
     }
 
     function liquidatePosition(uint256 _amountNeeded)
@@ -571,9 +982,7 @@ abstract contract CoreStrategyPerp is BaseStrategy {
         if (getTotalLiquidity() < DUST_LIQ) {
             return 0;
         }
-        IClearingHouse.RemoveLiquidityResponse
-            memory response = _collectPendingFees();
-        return response.fee;
+        return _collectPendingFees();
     }
 
     // deploy assets according to vault strategy
@@ -590,21 +999,89 @@ abstract contract CoreStrategyPerp is BaseStrategy {
     }
 
     function _determineTicks() internal {
+        for (uint256 i = 0; i <= ladderWings; i++) {
+            _recentreRung(i);
+        }
+    }
+
+    function _recentreRung(uint256 _rung) internal {
+        (int24 lower, int24 upper) = _targetTicks(_rungMultiplier(_rung));
+        _setTicks(_rung, lower, upper);
+    }
+
+    function _setTicks(
+        uint256 _rung,
+        int24 _lower,
+        int24 _upper
+    ) internal {
+        (int24 lower, int24 upper) = _rungTicks(_rung);
+        if (_lower == lower && _upper == upper) {
+            return;
+        }
+        if (_rung == 0) {
+            lowerTick = _lower;
+            upperTick = _upper;
+        } else {
+            Rung storage wing = wings[_rung - 1];
+            wing.lowerTick = _lower;
+            wing.upperTick = _upper;
+        }
+        emit TicksUpdated(uint8(_rung), _lower, _upper, _rungMultiplier(_rung));
+    }
+
+    function _targetTicks(int24 _multiplier) internal view returns (int24, int24) {
         IUniswapV3Pool pool = IUniswapV3Pool(
             marketRegistery.getPool(address(short))
         );
 
-        (lowerTick, upperTick) = PerpLib.determineTicks(
-            pool,
-            twapTime,
-            tickRangeMultiplier
-        );
+        return PerpLib.determineTicks(pool, twapTime, _multiplier);
     }
 
-    function _addLiquidityToShortMarket(uint256 _amount)
+    /**
+     * @dev Liquidity `_addLiquidity(_rung, _amount)` would mint in the rung's current range.
+     */
+    function _liquidityForAmount(uint256 _rung, uint256 _amount)
+        internal
+        view
+        returns (uint256)
+    {
+        (int24 lower, int24 upper) = _rungTicks(_rung);
+        uint256 amountInSTD = _amount.mul(uint256(10)**(18 - wantDecimals));
+        uint256 amountShortNeeded = amountInSTD
+            .mul(STD_PRECISION)
+            .div(getBaseTokenMarkTwapPrice())
+            .div(uint256(2));
+        (uint160 sqrtPriceX96, , , , , , ) = IUniswapV3Pool(
+            marketRegistery.getPool(address(short))
+        ).slot0();
+        return
+            LiquidityAmounts.getLiquidityForAmounts(
+                sqrtPriceX96,
+                TickMath.getSqrtRatioAtTick(lower),
+                TickMath.getSqrtRatioAtTick(upper),
+                amountShortNeeded,
+                amountInSTD.div(2)
+            );
+    }
+
+    /// @dev Adds `_amount` of leveraged want across the rungs by weight.
+    function _addLiquidityToShortMarket(uint256 _amount) internal {
+        uint256 core = _amount;
+        for (uint256 i = 0; i < ladderWings; i++) {
+            uint256 share = _amount.mul(wings[i].weight).div(BASIS_PRECISION);
+            if (share > 0) {
+                _addLiquidity(i + 1, share);
+                core = core.sub(share);
+            }
+        }
+        _addLiquidity(0, core);
+    }
+
+    function _addLiquidity(uint256 _rung, uint256 _amount)
         internal
         returns (IClearingHouse.AddLiquidityResponse memory _resp)
     {
+        (int24 lower, int24 upper) = _rungTicks(_rung);
         uint256 amountInSTD = _amount.mul(uint256(10)**(18 - wantDecimals));
         uint256 twapMarkPrice = getBaseTokenMarkTwapPrice();
         uint256 amountShortNeeded = amountInSTD
@@ -616,8 +1093,8 @@ abstract contract CoreStrategyPerp is BaseStrategy {
                 baseToken: address(short),
                 base: amountShortNeeded,
                 quote: amountInSTD.div(2),
-                lowerTick: lowerTick,
-                upperTick: upperTick,
+                lowerTick: lower,
+                upperTick: upper,
                 minBase: 0, //amountShortNeeded.mul(slippageAdj).div(
                 //    BASIS_PRECISION
                 //),
@@ -640,28 +1117,30 @@ abstract contract CoreStrategyPerp is BaseStrategy {
         perpVault.deposit(address(want), _amount);
     }
 
-    function _collectPendingFees()
-        internal
-        returns (IClearingHouse.RemoveLiquidityResponse memory _resp)
-    {
-        IClearingHouse.RemoveLiquidityParams memory params = IClearingHouse
-            .RemoveLiquidityParams({
-                baseToken: address(short),
-                lowerTick: lowerTick,
-                upperTick: upperTick,
-                liquidity: 0,
-                minBase: 0,
-                minQuote: 0,
-                deadline: 0xffffffffffffffffffffffffffffffffffffffffffffffffffffffffffffffff
-            });
-        try clearingHouse.removeLiquidity(params) returns (IClearingHouse.RemoveLiquidityResponse memory resp) {
-            _resp = resp;
-        } catch Error(string memory reason) {
-            emit LogError(reason,2);
+    /// @dev Collects the maker fees of every rung in one pass; returns their sum.
+    function _collectPendingFees() internal returns (uint256 _fees) {
+        for (uint256 i = 0; i <= ladderWings; i++) {
+            if (getRungLiquidity(i) == 0) {
+                continue;
+            }
+            (int24 lower, int24 upper) = _rungTicks(i);
+            IClearingHouse.RemoveLiquidityParams memory params = IClearingHouse
+                .RemoveLiquidityParams({
+                    baseToken: address(short),
+                    lowerTick: lower,
+                    upperTick: upper,
+                    liquidity: 0,
+                    minBase: 0,
+                    minQuote: 0,
+                    deadline: 0xffffffffffffffffffffffffffffffffffffffffffffffffffffffffffffffff
+                });
+            try clearingHouse.removeLiquidity(params) returns (IClearingHouse.RemoveLiquidityResponse memory resp) {
+                _fees = _fees.add(resp.fee);
+            } catch Error(string memory reason) {
+                emit PerpCallFailed(CALL_COLLECT_FEES, reason);
+            }
         }
-        //_resp = clearingHouse.removeLiquidity(params);
     }
-    event LogError(string log, uint256 number);
     function _closePosition() internal returns (uint256 _base, uint256 _quote) {
         IClearingHouse.ClosePositionParams memory params = IClearingHouse
             .ClosePositionParams({
@@ -672,13 +1151,10 @@ abstract contract CoreStrategyPerp is BaseStrategy {
                 referralCode: bytes32(bytes("ROBO"))
             });
         try clearingHouse.closePosition(params) returns (uint256 base, uint256 quote){
-            //emit Debug(base, 808);
-            //emit Debug(quote, 809);
             _base = base;
             _quote = quote;
-
         } catch Error(string memory reason) {
-            emit LogError(reason,1);
+            emit PerpCallFailed(CALL_CLOSE_POSITION, reason);
         }
         //(_base, _quote) = clearingHouse.closePosition(params);
     }
@@ -693,33 +1169,116 @@ abstract contract CoreStrategyPerp is BaseStrategy {
     }
 
     function _rebalanceDebtInternal() internal {
-        uint256 debtRatio = calcDebtRatio();
-        emit DebtRebalance(debtRatio, balanceDeployed(), 0);
-        // Liquidate all the lend, leaving none in debt or as short
-        if (getTotalLiquidity() > 0) {
-            liquidateAllToLend();
-            _closePosition();
-        }
-        _deployFromLend(estimatedTotalAssets());
+        emit Rebalanced(REBALANCE_DEBT, calcDebtRatio(), balanceDeployed());
+        _rebalance();
     }
 
     function _rebalanceCollateralInternal() internal {
-        uint256 collatRatio = calcCollateral();
+        emit Rebalanced(
+            REBALANCE_COLLATERAL,
+            calcCollateral(),
+            balanceDeployed()
+        );
+        _rebalance();
+    }
 
-        emit CollatRebalance(collatRatio, balanceDeployed());
-        // Liquidate all the lend, leaving none in debt or as short
-        if (getTotalLiquidity() > 0) {
-            liquidateAllToLend();
+    function _rebalance() internal {
+        uint256 liquidity = getTotalLiquidity();
+        if (!inPlaceRebalance || liquidity == 0) {
+            // Liquidate all the lend, leaving none in debt or as short
+            if (liquidity > 0) {
+                liquidateAllToLend();
+                _closePosition();
+            }
+            _deployFromLend(estimatedTotalAssets());
+            return;
+        }
+
+        if (ladderWings > 0) {
+            // Ladder: only the rungs the price has left move
+            uint256 outOfRange = rungsOutOfRange();
+            if (outOfRange == 0) {
+                liquidateAllToLend();
+                _closePosition();
+                _deployFromLend(estimatedTotalAssets());
+            } else {
+                _shiftRungs(outOfRange);
+            }
+            return;
+        }
+
+        (int24 lower, int24 upper) = _targetTicks(tickRangeMultiplier);
+        if (lower != lowerTick || upper != upperTick) {
+            _shiftRungs(1);
+            return;
+        }
+
+        // Same range: only add or remove the difference in size
+        uint256 leverageAmount = estimatedTotalAssets().mul(debtMultiple).div(
+            BASIS_PRECISION
+        );
+        uint256 target = _liquidityForAmount(0, leverageAmount);
+        if (target > liquidity) {
+            _addLiquidity(0, leverageAmount.mul(target.sub(liquidity)).div(target));
+        } else if (target < liquidity) {
+            _removeLiquidity(0, liquidity.sub(target));
+            _closeResidual();
+        }
+    }
+
+    /**
+     * @dev Removes the rungs in `_mask` (bit i for rung i), closes the residual, and
+     * places them back around the price with their weight of the position. The
+     * other rungs keep their ticks and liquidity.
+     */
+    function _shiftRungs(uint256 _mask) internal {
+        uint256 rungs = uint256(ladderWings).add(1);
+        for (uint256 i = 0; i < rungs; i++) {
+            uint256 liquidity = getRungLiquidity(i);
+            if (_mask & (1 << i) != 0 && liquidity > 0) {
+                _removeLiquidity(i, liquidity);
+            }
+        }
+        _closeResidual();
+        uint256 leverageAmount = estimatedTotalAssets().mul(debtMultiple).div(
+            BASIS_PRECISION
+        );
+        for (uint256 i = 0; i < rungs; i++) {
+            if (_mask & (1 << i) != 0) {
+                _recentreRung(i);
+                _addLiquidity(
+                    i,
+                    leverageAmount.mul(_rungWeight(i)).div(BASIS_PRECISION)
+                );
+            }
+        }
+    }
+
+    /**
+     * @dev Closes the taker position left by removing liquidity, unless its notional is
+     * within `residualTolerance` of total assets, saving the taker fee on small residuals.
+     */
+    function _closeResidual() internal {
+        int256 size = IAccountBalance(clearingHouse.getAccountBalance())
+            .getTakerPositionSize(address(this), address(short));
+        uint256 notional = uint256(size >= 0 ? size : -size)
+            .mul(getBaseTokenSpotPrice())
+            .div(STD_PRECISION);
+        uint256 tolerance = estimatedTotalAssets()
+            .mul(uint256(10)**(18 - wantDecimals))
+            .mul(residualTolerance)
+            .div(BASIS_PRECISION);
+        if (notional > tolerance) {
             _closePosition();
         }
-        _deployFromLend(estimatedTotalAssets());
     }
 
     /**
      * function to remove funds from strategy when users withdraws funds in excess of reserves
      *
      * withdraw takes the following steps:
-     * 1. Removes _amountNeeded worth of LP from the farms and pool
+     * 1. Removes _amountNeeded worth of LP from the farms and pool (only that share
+     *    of the range when `partialWithdraw` is set, otherwise all of it)
      * 2. Uses the short removed to repay debt (Swaps short or base for large withdrawals)
      * 3. Redeems the
      * @param _amountNeeded `want` amount to liquidate
@@ -738,20 +1297,26 @@ abstract contract CoreStrategyPerp is BaseStrategy {
             .sub(balanceWant)
             .mul(BASIS_PRECISION)
             .div(deployed);
-        emit Debug(stratPercent, 601);
         if (stratPercent > 9500) {
             // If this happened, we just undeploy the lot
             // and it'll be redeployed during the next harvest.
             (, _loss) = liquidateAllPositionsInternal();
-            _liquidatedAmount = balanceOfWant().sub(balanceWant);
+        } else if (partialWithdraw) {
+            _withdrawPartial(_amountNeeded.sub(balanceWant), deployed);
         } else {
             liquidateAllToLend();
             _removeCollateral(_amountNeeded);
             if (_getTotalDebt() > _amountNeeded) {
                 _addLiquidityToShortMarket(deployed.sub(_amountNeeded));
             }
-            return (balanceOfWant().sub(balanceWant), 0);
         }
+        _liquidatedAmount = balanceOfWant().sub(balanceWant);
+        // requested - freed is the slippage of the withdrawal
+        emit Withdrawn(
+            _amountNeeded.sub(balanceWant),
+            _liquidatedAmount,
+            stratPercent
+        );
     }
 
     function ethToWant(uint256 _amtInWei)
@@ -51,12 +51,13 @@ contract StrategyInsurance {
     uint256 constant BPS_MAX = 10000;
     uint256 public lossSum = 0;
 
+    // Same schema as the strategy's telemetry: amounts in want, not indexed
     event InsurancePayment(
-        uint256 indexed strategyDebt,
-        uint256 indexed harvestProfit,
-        uint256 indexed wantPayment
+        uint256 strategyDebt,
+        uint256 harvestProfit,
+        uint256 wantPayment
     );
-    event InsurancePayout(uint256 indexed wantPayout);
+    event InsurancePayout(uint256 wantPayout);
 
     // Bips - Proportion of totalDebt the inssurance fund is targeting to grow
     uint256 public targetFundSize = 50; // 0.5% default
@@ -0,0 +1,15 @@
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8;
+
+import "../CoreStrategyPerp.sol";
+
+/**
+ * @notice CoreStrategyPerp with its market passed in at deployment rather than
+ *  hardcoded as in `entry/optimism`, for markets and chains without their own
+ *  entry contract (including the local Perp stack in `contracts/mocks/perp`).
+ */
+contract PerpStrategy is CoreStrategyPerp {
+    constructor(address _vault, CoreStrategyPerpConfig memory _config)
+        CoreStrategyPerp(_vault, _config)
+    {}
+}
@@ -0,0 +1,56 @@
+// SPDX-License-Identifier: GPL-3.0-or-later
+pragma solidity 0.8.15;
+
+import {Ownable} from "@openzeppelin/contracts/access/Ownable.sol";
+
+/**
+ * @title Local GasPriceOracle
+ * @notice The L1 data fee of Optimism's GasPriceOracle predeploy (Ecotone formula), with
+ * the L1 fee parameters set by the owner instead of read from the L1 block attributes
+ */
+contract MockGasPriceOracle is Ownable {
+    uint256 public constant decimals = 6;
+
+    uint256 public l1BaseFee;
+    uint256 public blobBaseFee;
+    uint256 public baseFeeScalar;
+    uint256 public blobBaseFeeScalar;
+
+    constructor(
+        uint256 _l1BaseFee,
+        uint256 _blobBaseFee,
+        uint256 _baseFeeScalar,
+        uint256 _blobBaseFeeScalar
+    ) {
+        setL1Fees(_l1BaseFee, _blobBaseFee, _baseFeeScalar, _blobBaseFeeScalar);
+    }
+
+    function setL1Fees(
+        uint256 _l1BaseFee,
+        uint256 _blobBaseFee,
+        uint256 _baseFeeScalar,
+        uint256 _blobBaseFeeScalar
+    ) public onlyOwner {
+        l1BaseFee = _l1BaseFee;
+        blobBaseFee = _blobBaseFee;
+        baseFeeScalar = _baseFeeScalar;
+        blobBaseFeeScalar = _blobBaseFeeScalar;
+    }
+
+    /// @notice L1 gas of a transaction with `_data`, 68 non-zero bytes for its signature included
+    function getL1GasUsed(bytes calldata _data) public pure returns (uint256 gas) {
+        for (uint256 i = 0; i < _data.length; i++) {
+            gas += _data[i] == 0 ? 4 : 16;
+        }
+        gas += 68 * 16;
+    }
+
+    /// @notice L1 data fee, in wei, of a transaction with `_data`
+    function getL1Fee(bytes calldata _data) external view returns (uint256) {
+        uint256 scaledBaseFee = baseFeeScalar * 16 * l1BaseFee;
+        uint256 scaledBlobBaseFee = blobBaseFeeScalar * blobBaseFee;
+        return
+            (getL1GasUsed(_data) * (scaledBaseFee + scaledBlobBaseFee)) /
+            (16 * 10**decimals);
+    }
+}
@@ -0,0 +1,54 @@
+// SPDX-License-Identifier: GPL-3.0-or-later
+pragma solidity 0.8.15;
+
+import "../interfaces/perp/IVault.sol";
+import "../interfaces/perp/IExchange.sol";
+import "../interfaces/perp/IClearingHouseConfig.sol";
+import "../lib/PerpMath.sol";
+import {TickMath} from "../lib/TickMath.sol";
+
+/**
+ * @title Uncached price views
+ * @notice The strategy's mark TWAP views as they were before the Exchange, ClearingHouseConfig
+ * and twap interval were cached: resolved through the Perp Vault on every call. The gas
+ * profile measures both in the same test to price the cache.
+ */
+contract UncachedPerpViews {
+    IVault public perpVault;
+    address public baseToken;
+
+    constructor(address _perpVault, address _baseToken) {
+        perpVault = IVault(_perpVault);
+        baseToken = _baseToken;
+    }
+
+    function getBaseTokenMarkTwapPrice() public view returns (uint256) {
+        IExchange exchange = IExchange(perpVault.getExchange());
+        IClearingHouseConfig config = IClearingHouseConfig(
+            perpVault.getClearingHouseConfig()
+        );
+
+        uint160 sqrtMarkTwapX96 = exchange.getSqrtMarkTwapX96(
+            baseToken,
+            config.getTwapInterval()
+        );
+        uint256 markPriceX96 = PerpMath.formatSqrtPriceX96ToPriceX96(
+            sqrtMarkTwapX96
+        );
+
+        return PerpMath.formatX96ToX10_18(markPriceX96);
+    }
+
+    function getBaseTokenMarkTwapTick() public view returns (int24) {
+        IExchange exchange = IExchange(perpVault.getExchange());
+        IClearingHouseConfig config = IClearingHouseConfig(
+            perpVault.getClearingHouseConfig()
+        );
+
+        uint160 sqrtMarkTwapX96 = exchange.getSqrtMarkTwapX96(
+            baseToken,
+            config.getTwapInterval()
+        );
+        return TickMath.getTickAtSqrtRatio(sqrtMarkTwapX96);
+    }
+}
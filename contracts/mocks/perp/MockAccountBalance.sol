@@ -0,0 +1,279 @@
+// SPDX-License-Identifier: GPL-3.0-or-later
+pragma solidity 0.8.15;
+
+import {Ownable} from "@openzeppelin/contracts/access/Ownable.sol";
+import {PerpMath} from "../../lib/PerpMath.sol";
+import {PerpSafeCast} from "../../lib/PerpSafeCast.sol";
+import {MockMarketRegistry} from "./MockMarketRegistry.sol";
+import {MockOrderBook} from "./MockOrderBook.sol";
+import {MockUniswapV3Pool} from "./MockUniswapV3Pool.sol";
+
+/**
+ * @title Local AccountBalance
+ * @notice Taker positions, owed realized PnL and the position and debt values Perp derives
+ *  from them. The index price is the pool's spot price.
+ */
+contract MockAccountBalance is Ownable {
+    using PerpMath for int256;
+    using PerpSafeCast for uint256;
+
+    struct TakerInfo {
+        int256 takerPositionSize;
+        int256 takerOpenNotional;
+    }
+
+    MockMarketRegistry internal immutable marketRegistry;
+    MockOrderBook internal immutable orderBook;
+    address public clearingHouse;
+    address public vault;
+
+    mapping(address => mapping(address => TakerInfo)) internal takerInfo;
+    mapping(address => int256) internal owedRealizedPnl;
+    mapping(address => address[]) internal baseTokens;
+
+    event PnlRealized(address indexed trader, int256 amount);
+
+    modifier onlyClearingHouse() {
+        require(msg.sender == clearingHouse, "AB_OCH");
+        _;
+    }
+
+    constructor(address _marketRegistry, address _orderBook) {
+        marketRegistry = MockMarketRegistry(_marketRegistry);
+        orderBook = MockOrderBook(_orderBook);
+    }
+
+    function setClearingHouse(address _clearingHouse) external onlyOwner {
+        clearingHouse = _clearingHouse;
+    }
+
+    function setVault(address _vault) external onlyOwner {
+        vault = _vault;
+    }
+
+    function registerBaseToken(address _trader, address _baseToken)
+        external
+        onlyClearingHouse
+    {
+        address[] storage tokens = baseTokens[_trader];
+        for (uint256 i = 0; i < tokens.length; i++) {
+            if (tokens[i] == _baseToken) {
+                return;
+            }
+        }
+        tokens.push(_baseToken);
+    }
+
+    /**
+     * @notice Apply a trade to the taker position. Reducing or flipping a position
+     *  realizes the PnL of the closed part into owed realized PnL.
+     * @dev Unlike Perp, also returns the realized PnL for the ClearingHouse events
+     */
+    function modifyTakerBalance(
+        address _trader,
+        address _baseToken,
+        int256 _base,
+        int256 _quote
+    )
+        external
+        onlyClearingHouse
+        returns (
+            int256 size,
+            int256 notional,
+            int256 realizedPnl
+        )
+    {
+        TakerInfo storage info = takerInfo[_trader][_baseToken];
+        size = info.takerPositionSize;
+        notional = info.takerOpenNotional;
+        if (size == 0 || (size > 0) == (_base > 0) || _base == 0) {
+            notional += _quote;
+        } else if (_base.abs() <= size.abs()) {
+            int256 closedNotional = notional.mulDiv(
+                _base.abs().toInt256(),
+                size.abs()
+            );
+            realizedPnl = closedNotional + _quote;
+            notional -= closedNotional;
+        } else {
+            int256 closedQuote = _quote.mulDiv(size.abs().toInt256(), _base.abs());
+            realizedPnl = notional + closedQuote;
+            notional = _quote - closedQuote;
+        }
+        size += _base;
+        if (size == 0 && notional != 0) {
+            realizedPnl += notional;
+            notional = 0;
+        }
+        info.takerPositionSize = size;
+        info.takerOpenNotional = notional;
+        if (realizedPnl != 0) {
+            _modifyOwedRealizedPnl(_trader, realizedPnl);
+        }
+    }
+
+    function modifyOwedRealizedPnl(address _trader, int256 _amount)
+        external
+        onlyClearingHouse
+    {
+        _modifyOwedRealizedPnl(_trader, _amount);
+    }
+
+    function settleOwedRealizedPnl(address _trader) external returns (int256 pnl) {
+        require(msg.sender == vault, "AB_OV");
+        pnl = owedRealizedPnl[_trader];
+        owedRealizedPnl[_trader] = 0;
+    }
+
+    function getOrderBook() external view returns (address) {
+        return address(orderBook);
+    }
+
+    function getVault() external view returns (address) {
+        return vault;
+    }
+
+    function getBaseTokens(address _trader) external view returns (address[] memory) {
+        return baseTokens[_trader];
+    }
+
+    function getTakerPositionSize(address _trader, address _baseToken)
+        external
+        view
+        returns (int256)
+    {
+        return takerInfo[_trader][_baseToken].takerPositionSize;
+    }
+
+    function getTakerOpenNotional(address _trader, address _baseToken)
+        external
+        view
+        returns (int256)
+    {
+        return takerInfo[_trader][_baseToken].takerOpenNotional;
+    }
+
+    /// @return Taker position size plus the maker's impermanent position
+    function getTotalPositionSize(address _trader, address _baseToken)
+        public
+        view
+        returns (int256)
+    {
+        (uint256 baseInPool, ) = orderBook.getTotalTokenAmountInPoolAndPendingFee(
+            _trader,
+            _baseToken,
+            true
+        );
+        uint256 baseDebt = orderBook.getTotalOrderDebt(_trader, _baseToken, true);
+        return
+            takerInfo[_trader][_baseToken].takerPositionSize +
+            baseInPool.toInt256() -
+            baseDebt.toInt256();
+    }
+
+    function getTotalOpenNotional(address _trader, address _baseToken)
+        public
+        view
+        returns (int256)
+    {
+        (uint256 quoteInPool, ) = orderBook.getTotalTokenAmountInPoolAndPendingFee(
+            _trader,
+            _baseToken,
+            false
+        );
+        uint256 quoteDebt = orderBook.getTotalOrderDebt(_trader, _baseToken, false);
+        return
+            takerInfo[_trader][_baseToken].takerOpenNotional +
+            quoteInPool.toInt256() -
+            quoteDebt.toInt256();
+    }
+
+    function getTotalPositionValue(address _trader, address _baseToken)
+        public
+        view
+        returns (int256)
+    {
+        return
+            getTotalPositionSize(_trader, _baseToken).mulDiv(
+                getIndexPrice(_baseToken).toInt256(),
+                1e18
+            );
+    }
+
+    function getTotalAbsPositionValue(address _trader) external view returns (uint256 value) {
+        address[] storage tokens = baseTokens[_trader];
+        for (uint256 i = 0; i < tokens.length; i++) {
+            value += getTotalPositionValue(_trader, tokens[i]).abs();
+        }
+    }
+
+    /// @return Taker position size less the base debt of the orders
+    function getBase(address _trader, address _baseToken) public view returns (int256) {
+        return
+            takerInfo[_trader][_baseToken].takerPositionSize -
+            orderBook.getTotalOrderDebt(_trader, _baseToken, true).toInt256();
+    }
+
+    /// @return Taker open notional less the quote debt of the orders
+    function getQuote(address _trader, address _baseToken) public view returns (int256) {
+        return
+            takerInfo[_trader][_baseToken].takerOpenNotional -
+            orderBook.getTotalOrderDebt(_trader, _baseToken, false).toInt256();
+    }
+
+    function getTotalDebtValue(address _trader) external view returns (uint256) {
+        int256 totalQuoteBalance;
+        int256 totalBaseDebtValue;
+        address[] storage tokens = baseTokens[_trader];
+        for (uint256 i = 0; i < tokens.length; i++) {
+            int256 baseBalance = getBase(_trader, tokens[i]);
+            if (baseBalance < 0) {
+                totalBaseDebtValue += baseBalance.mulDiv(
+                    getIndexPrice(tokens[i]).toInt256(),
+                    1e18
+                );
+            }
+            totalQuoteBalance += getQuote(_trader, tokens[i]);
+        }
+        int256 totalQuoteDebtValue = totalQuoteBalance >= 0 ? int256(0) : totalQuoteBalance;
+        return (totalQuoteDebtValue + totalBaseDebtValue).abs();
+    }
+
+    function getPnlAndPendingFee(address _trader)
+        external
+        view
+        returns (
+            int256 owedPnl,
+            int256 unrealizedPnl,
+            uint256 pendingFee
+        )
+    {
+        address[] storage tokens = baseTokens[_trader];
+        for (uint256 i = 0; i < tokens.length; i++) {
+            unrealizedPnl +=
+                getTotalPositionValue(_trader, tokens[i]) +
+                getTotalOpenNotional(_trader, tokens[i]);
+            (, uint256 fee) = orderBook.getTotalTokenAmountInPoolAndPendingFee(
+                _trader,
+                tokens[i],
+                true
+            );
+            pendingFee += fee;
+        }
+        owedPnl = owedRealizedPnl[_trader];
+    }
+
+    /// @return Index price of the base token in 18 decimals, the pool's spot price here
+    function getIndexPrice(address _baseToken) public view returns (uint256) {
+        (uint160 sqrtPriceX96, , , , , , ) = MockUniswapV3Pool(
+            marketRegistry.getPool(_baseToken)
+        ).slot0();
+        return
+            PerpMath.formatX96ToX10_18(PerpMath.formatSqrtPriceX96ToPriceX96(sqrtPriceX96));
+    }
+
+    function _modifyOwedRealizedPnl(address _trader, int256 _amount) internal {
+        owedRealizedPnl[_trader] += _amount;
+        emit PnlRealized(_trader, _amount);
+    }
+}
@@ -0,0 +1,387 @@
+// SPDX-License-Identifier: GPL-3.0-or-later
+pragma solidity 0.8.15;
+
+import {FullMath} from "@uniswap/v3-core/contracts/libraries/FullMath.sol";
+import {IClearingHouse} from "../../interfaces/perp/IClearingHouse.sol";
+import {LiquidityAmounts} from "../../lib/LiquidityAmounts.sol";
+import {PerpMath} from "../../lib/PerpMath.sol";
+import {PerpSafeCast} from "../../lib/PerpSafeCast.sol";
+import {SettlementTokenMath} from "../../lib/SettlementTokenMath.sol";
+import {TickMath} from "../../lib/TickMath.sol";
+import {MockAccountBalance} from "./MockAccountBalance.sol";
+import {MockClearingHouseConfig} from "./MockClearingHouseConfig.sol";
+import {MockMarketRegistry} from "./MockMarketRegistry.sol";
+import {MockOrderBook} from "./MockOrderBook.sol";
+import {MockPerpVault} from "./MockPerpVault.sol";
+import {MockUniswapV3Pool} from "./MockUniswapV3Pool.sol";
+
+/**
+ * @title Local ClearingHouse
+ * @notice The `addLiquidity`, `removeLiquidity`, `openPosition` and `closePosition` entry
+ *  points of Perp's ClearingHouse over the local stack, with the same parameter and
+ *  response structs. Exchange fees are charged in quote at the pool's fee ratio and go to
+ *  the makers in range; there is no funding, insurance fund or liquidation.
+ */
+contract MockClearingHouse {
+    using PerpMath for int256;
+    using PerpSafeCast for uint256;
+    using SettlementTokenMath for int256;
+
+    uint256 internal constant ONE_HUNDRED_PERCENT = 1e6;
+
+    MockPerpVault internal immutable vault;
+    MockClearingHouseConfig internal immutable clearingHouseConfig;
+    MockMarketRegistry internal immutable marketRegistry;
+    MockOrderBook internal immutable orderBook;
+    MockAccountBalance internal immutable accountBalance;
+    address internal immutable exchange;
+    address internal immutable quoteToken;
+
+    struct SwapResponse {
+        uint256 base;
+        uint256 quote;
+        int256 exchangedPositionSize;
+        int256 exchangedPositionNotional;
+        uint256 fee;
+        uint160 sqrtPriceAfterX96;
+    }
+
+    event LiquidityChanged(
+        address indexed maker,
+        address indexed baseToken,
+        address indexed quoteToken,
+        int24 lowerTick,
+        int24 upperTick,
+        int256 base,
+        int256 quote,
+        int128 liquidity,
+        uint256 quoteFee
+    );
+
+    event PositionChanged(
+        address indexed trader,
+        address indexed baseToken,
+        int256 exchangedPositionSize,
+        int256 exchangedPositionNotional,
+        uint256 fee,
+        int256 openNotional,
+        int256 realizedPnl,
+        uint256 sqrtPriceAfterX96
+    );
+
+    event ReferredPositionChanged(bytes32 indexed referralCode);
+
+    modifier checkDeadline(uint256 _deadline) {
+        require(block.timestamp <= _deadline, "CH_TE");
+        _;
+    }
+
+    constructor(
+        address _vault,
+        address _clearingHouseConfig,
+        address _marketRegistry,
+        address _orderBook,
+        address _accountBalance,
+        address _exchange
+    ) {
+        vault = MockPerpVault(_vault);
+        clearingHouseConfig = MockClearingHouseConfig(_clearingHouseConfig);
+        marketRegistry = MockMarketRegistry(_marketRegistry);
+        orderBook = MockOrderBook(_orderBook);
+        accountBalance = MockAccountBalance(_accountBalance);
+        exchange = _exchange;
+        quoteToken = MockMarketRegistry(_marketRegistry).getQuoteToken();
+    }
+
+    function addLiquidity(IClearingHouse.AddLiquidityParams calldata _params)
+        external
+        checkDeadline(_params.deadline)
+        returns (IClearingHouse.AddLiquidityResponse memory response)
+    {
+        require(!_params.useTakerBalance, "CH_DUTB");
+        uint128 liquidity = _getLiquidity(_params);
+        require(liquidity > 0, "CH_ZL");
+        (response.base, response.quote) = _pool(_params.baseToken).mint(
+            _params.lowerTick,
+            _params.upperTick,
+            liquidity
+        );
+        require(
+            response.base >= _params.minBase && response.quote >= _params.minQuote,
+            "CH_PSCF"
+        );
+        response.fee = orderBook.addLiquidity(
+            msg.sender,
+            _params.baseToken,
+            _params.lowerTick,
+            _params.upperTick,
+            liquidity,
+            response.base,
+            response.quote
+        );
+        response.liquidity = liquidity;
+        accountBalance.registerBaseToken(msg.sender, _params.baseToken);
+        if (response.fee > 0) {
+            accountBalance.modifyOwedRealizedPnl(msg.sender, response.fee.toInt256());
+        }
+        _requireEnoughFreeCollateral(msg.sender);
+        emit LiquidityChanged(
+            msg.sender,
+            _params.baseToken,
+            quoteToken,
+            _params.lowerTick,
+            _params.upperTick,
+            response.base.toInt256(),
+            response.quote.toInt256(),
+            int128(liquidity),
+            response.fee
+        );
+    }
+
+    /**
+     * @notice Remove liquidity (0 only collects fees). The removed tokens less the order
+     *  debt they repay become a taker position.
+     */
+    function removeLiquidity(IClearingHouse.RemoveLiquidityParams calldata _params)
+        external
+        checkDeadline(_params.deadline)
+        returns (IClearingHouse.RemoveLiquidityResponse memory response)
+    {
+        uint256 baseDebt;
+        uint256 quoteDebt;
+        (response.fee, baseDebt, quoteDebt) = orderBook.removeLiquidity(
+            msg.sender,
+            _params.baseToken,
+            _params.lowerTick,
+            _params.upperTick,
+            _params.liquidity
+        );
+        if (_params.liquidity > 0) {
+            (response.base, response.quote) = _pool(_params.baseToken).burn(
+                _params.lowerTick,
+                _params.upperTick,
+                _params.liquidity
+            );
+        }
+        require(
+            response.base >= _params.minBase && response.quote >= _params.minQuote,
+            "CH_PSCF"
+        );
+        if (response.fee > 0) {
+            accountBalance.modifyOwedRealizedPnl(msg.sender, response.fee.toInt256());
+        }
+        if (_params.liquidity > 0) {
+            accountBalance.modifyTakerBalance(
+                msg.sender,
+                _params.baseToken,
+                response.base.toInt256() - baseDebt.toInt256(),
+                response.quote.toInt256() - quoteDebt.toInt256()
+            );
+        }
+        emit LiquidityChanged(
+            msg.sender,
+            _params.baseToken,
+            quoteToken,
+            _params.lowerTick,
+            _params.upperTick,
+            -response.base.toInt256(),
+            -response.quote.toInt256(),
+            -int128(_params.liquidity),
+            response.fee
+        );
+    }
+
+    function openPosition(IClearingHouse.OpenPositionParams memory _params)
+        external
+        checkDeadline(_params.deadline)
+        returns (uint256 base, uint256 quote)
+    {
+        int256 size = accountBalance.getTakerPositionSize(msg.sender, _params.baseToken);
+        SwapResponse memory response = _openPosition(msg.sender, _params);
+        bool isReducingPosition = size != 0 &&
+            (size > 0) != (response.exchangedPositionSize > 0) &&
+            response.exchangedPositionSize.abs() <= size.abs();
+        if (!isReducingPosition) {
+            _requireEnoughFreeCollateral(msg.sender);
+        }
+        if (_params.referralCode != 0) {
+            emit ReferredPositionChanged(_params.referralCode);
+        }
+        return (response.base, response.quote);
+    }
+
+    function closePosition(IClearingHouse.ClosePositionParams calldata _params)
+        external
+        checkDeadline(_params.deadline)
+        returns (uint256 base, uint256 quote)
+    {
+        int256 size = accountBalance.getTakerPositionSize(msg.sender, _params.baseToken);
+        require(size != 0, "CH_PSZ");
+        // sell the whole long, or buy back the whole short
+        SwapResponse memory response = _openPosition(
+            msg.sender,
+            IClearingHouse.OpenPositionParams({
+                baseToken: _params.baseToken,
+                isBaseToQuote: size > 0,
+                isExactInput: size > 0,
+                amount: size.abs(),
+                oppositeAmountBound: _params.oppositeAmountBound,
+                deadline: _params.deadline,
+                sqrtPriceLimitX96: _params.sqrtPriceLimitX96,
+                referralCode: _params.referralCode
+            })
+        );
+        if (_params.referralCode != 0) {
+            emit ReferredPositionChanged(_params.referralCode);
+        }
+        return (response.base, response.quote);
+    }
+
+    /// @return Account value in 18 decimals
+    function getAccountValue(address _trader) external view returns (int256) {
+        return vault.getAccountValue(_trader).parseSettlementToken(vault.decimals());
+    }
+
+    function getQuoteToken() external view returns (address) {
+        return quoteToken;
+    }
+
+    function getClearingHouseConfig() external view returns (address) {
+        return address(clearingHouseConfig);
+    }
+
+    function getVault() external view returns (address) {
+        return address(vault);
+    }
+
+    function getExchange() external view returns (address) {
+        return exchange;
+    }
+
+    function getOrderBook() external view returns (address) {
+        return address(orderBook);
+    }
+
+    function getAccountBalance() external view returns (address) {
+        return address(accountBalance);
+    }
+
+    function _getLiquidity(IClearingHouse.AddLiquidityParams calldata _params)
+        internal
+        view
+        returns (uint128)
+    {
+        (uint160 sqrtPriceX96, , , , , , ) = _pool(_params.baseToken).slot0();
+        return
+            LiquidityAmounts.getLiquidityForAmounts(
+                sqrtPriceX96,
+                TickMath.getSqrtRatioAtTick(_params.lowerTick),
+                TickMath.getSqrtRatioAtTick(_params.upperTick),
+                _params.base,
+                _params.quote
+            );
+    }
+
+    function _openPosition(address _trader, IClearingHouse.OpenPositionParams memory _params)
+        internal
+        returns (SwapResponse memory response)
+    {
+        response = _swap(_params);
+        _checkSlippage(_params, response);
+        accountBalance.registerBaseToken(_trader, _params.baseToken);
+        (, int256 openNotional, int256 realizedPnl) = accountBalance.modifyTakerBalance(
+            _trader,
+            _params.baseToken,
+            response.exchangedPositionSize,
+            response.exchangedPositionNotional
+        );
+        emit PositionChanged(
+            _trader,
+            _params.baseToken,
+            response.exchangedPositionSize,
+            response.exchangedPositionNotional,
+            response.fee,
+            openNotional,
+            realizedPnl,
+            response.sqrtPriceAfterX96
+        );
+    }
+
+    /**
+     * @dev Quote amounts given by the trader include the fee: exact quote input is scaled
+     *  down to what reaches the pool and exact quote output scaled up to what leaves it.
+     */
+    function _swap(IClearingHouse.OpenPositionParams memory _params)
+        internal
+        returns (SwapResponse memory response)
+    {
+        MockUniswapV3Pool pool = _pool(_params.baseToken);
+        uint256 feeRatio = pool.fee();
+        uint256 amount = _params.amount;
+        if (_params.isBaseToQuote && !_params.isExactInput) {
+            amount = FullMath.mulDivRoundingUp(
+                amount,
+                ONE_HUNDRED_PERCENT,
+                ONE_HUNDRED_PERCENT - feeRatio
+            );
+        } else if (!_params.isBaseToQuote && _params.isExactInput) {
+            amount = FullMath.mulDiv(
+                amount,
+                ONE_HUNDRED_PERCENT - feeRatio,
+                ONE_HUNDRED_PERCENT
+            );
+        }
+        (uint256 amount0, uint256 amount1, uint256 fee) = pool.swap(
+            _params.isBaseToQuote,
+            _params.isExactInput,
+            amount,
+            _params.sqrtPriceLimitX96
+        );
+        require(amount0 > 0 && amount1 > 0, "CH_ZA");
+        response.base = amount0;
+        response.fee = fee;
+        if (_params.isBaseToQuote) {
+            response.quote = amount1 - fee;
+            response.exchangedPositionSize = -amount0.toInt256();
+            response.exchangedPositionNotional = response.quote.toInt256();
+        } else {
+            response.quote = amount1 + fee;
+            response.exchangedPositionSize = amount0.toInt256();
+            response.exchangedPositionNotional = -response.quote.toInt256();
+        }
+        (response.sqrtPriceAfterX96, , , , , , ) = pool.slot0();
+    }
+
+    function _checkSlippage(
+        IClearingHouse.OpenPositionParams memory _params,
+        SwapResponse memory _response
+    ) internal pure {
+        if (_params.oppositeAmountBound == 0) {
+            return;
+        }
+        if (_params.isBaseToQuote) {
+            if (_params.isExactInput) {
+                require(_response.quote >= _params.oppositeAmountBound, "CH_TLRS");
+            } else {
+                require(_response.base <= _params.oppositeAmountBound, "CH_TMRS");
+            }
+        } else {
+            if (_params.isExactInput) {
+                require(_response.base >= _params.oppositeAmountBound, "CH_TLRL");
+            } else {
+                require(_response.quote <= _params.oppositeAmountBound, "CH_TMRL");
+            }
+        }
+    }
+
+    function _requireEnoughFreeCollateral(address _trader) internal view {
+        require(
+            vault.getFreeCollateralByRatio(_trader, clearingHouseConfig.getImRatio()) >= 0,
+            "CH_NEFCI"
+        );
+    }
+
+    function _pool(address _baseToken) internal view returns (MockUniswapV3Pool) {
+        return MockUniswapV3Pool(marketRegistry.getPool(_baseToken));
+    }
+}
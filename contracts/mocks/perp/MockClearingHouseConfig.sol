@@ -0,0 +1,42 @@
+// SPDX-License-Identifier: GPL-3.0-or-later
+pragma solidity 0.8.15;
+
+import {Ownable} from "@openzeppelin/contracts/access/Ownable.sol";
+
+/**
+ * @title Local ClearingHouseConfig
+ * @notice The ratios and twap interval read by the local Perp stack, with Perp's mainnet defaults
+ */
+contract MockClearingHouseConfig is Ownable {
+    uint32 internal twapInterval = 900;
+    uint24 internal imRatio = 100000; // 10%
+    uint24 internal mmRatio = 62500; // 6.25%
+
+    function setTwapInterval(uint32 _twapInterval) external onlyOwner {
+        twapInterval = _twapInterval;
+    }
+
+    function setImRatio(uint24 _imRatio) external onlyOwner {
+        imRatio = _imRatio;
+    }
+
+    function setMmRatio(uint24 _mmRatio) external onlyOwner {
+        mmRatio = _mmRatio;
+    }
+
+    function getTwapInterval() external view returns (uint32) {
+        return twapInterval;
+    }
+
+    function getImRatio() external view returns (uint24) {
+        return imRatio;
+    }
+
+    function getMmRatio() external view returns (uint24) {
+        return mmRatio;
+    }
+
+    function getMaxMarketsPerAccount() external pure returns (uint8) {
+        return 10;
+    }
+}
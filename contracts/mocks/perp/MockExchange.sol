@@ -0,0 +1,33 @@
+// SPDX-License-Identifier: GPL-3.0-or-later
+pragma solidity 0.8.15;
+
+import {UniswapV3Broker} from "../../lib/UniswapV3Broker.sol";
+import {MockMarketRegistry} from "./MockMarketRegistry.sol";
+
+/**
+ * @title Local Exchange
+ * @notice Mark price TWAP reads; swaps go through `MockClearingHouse` directly
+ */
+contract MockExchange {
+    MockMarketRegistry internal immutable marketRegistry;
+
+    constructor(address _marketRegistry) {
+        marketRegistry = MockMarketRegistry(_marketRegistry);
+    }
+
+    function getSqrtMarkTwapX96(address _baseToken, uint32 _twapInterval)
+        external
+        view
+        returns (uint160)
+    {
+        return
+            UniswapV3Broker.getSqrtMarkTwapX96(
+                marketRegistry.getPool(_baseToken),
+                _twapInterval
+            );
+    }
+
+    function getMarketRegistry() external view returns (address) {
+        return address(marketRegistry);
+    }
+}
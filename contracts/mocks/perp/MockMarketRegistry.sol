@@ -0,0 +1,49 @@
+// SPDX-License-Identifier: GPL-3.0-or-later
+pragma solidity 0.8.15;
+
+import {Ownable} from "@openzeppelin/contracts/access/Ownable.sol";
+import {MockUniswapV3Pool} from "./MockUniswapV3Pool.sol";
+
+/**
+ * @title Local MarketRegistry
+ * @notice Maps base tokens to their `MockUniswapV3Pool`; the pool fee is the exchange fee
+ */
+contract MockMarketRegistry is Ownable {
+    address internal immutable quoteToken;
+    mapping(address => address) internal pools;
+
+    event PoolAdded(
+        address indexed baseToken,
+        uint24 indexed feeRatio,
+        address indexed pool
+    );
+
+    constructor(address _quoteToken) {
+        quoteToken = _quoteToken;
+    }
+
+    function addPool(address _baseToken, address _pool) external onlyOwner {
+        require(pools[_baseToken] == address(0), "MR_EP");
+        require(MockUniswapV3Pool(_pool).token0() == _baseToken, "MR_IB");
+        require(MockUniswapV3Pool(_pool).token1() == quoteToken, "MR_IQ");
+        pools[_baseToken] = _pool;
+        emit PoolAdded(_baseToken, MockUniswapV3Pool(_pool).fee(), _pool);
+    }
+
+    function getPool(address _baseToken) external view returns (address) {
+        require(pools[_baseToken] != address(0), "MR_PNE");
+        return pools[_baseToken];
+    }
+
+    function getFeeRatio(address _baseToken) external view returns (uint24) {
+        return MockUniswapV3Pool(pools[_baseToken]).fee();
+    }
+
+    function getQuoteToken() external view returns (address) {
+        return quoteToken;
+    }
+
+    function hasPool(address _baseToken) external view returns (bool) {
+        return pools[_baseToken] != address(0);
+    }
+}
@@ -0,0 +1,254 @@
+// SPDX-License-Identifier: GPL-3.0-or-later
+pragma solidity 0.8.15;
+
+import {Ownable} from "@openzeppelin/contracts/access/Ownable.sol";
+import {FullMath} from "@uniswap/v3-core/contracts/libraries/FullMath.sol";
+import {LiquidityAmounts} from "../../lib/LiquidityAmounts.sol";
+import {OpenOrder} from "../../lib/OpenOrder.sol";
+import {TickMath} from "../../lib/TickMath.sol";
+import {MockMarketRegistry} from "./MockMarketRegistry.sol";
+import {MockUniswapV3Pool} from "./MockUniswapV3Pool.sol";
+
+/**
+ * @title Local OrderBook
+ * @notice Maker orders, their debts and their quote fees. Orders are only changed by the
+ *  ClearingHouse, which calls `addLiquidity` after minting and `removeLiquidity` before
+ *  burning so fee growth is read with the order's ticks initialized. There is no funding.
+ */
+contract MockOrderBook is Ownable {
+    uint256 internal constant Q128 = 0x100000000000000000000000000000000;
+
+    MockMarketRegistry internal immutable marketRegistry;
+    address public clearingHouse;
+
+    mapping(bytes32 => OpenOrder.Info) internal openOrders;
+    // trader => base token => order keys
+    mapping(address => mapping(address => bytes32[])) internal openOrderIds;
+
+    modifier onlyClearingHouse() {
+        require(msg.sender == clearingHouse, "OB_OCH");
+        _;
+    }
+
+    constructor(address _marketRegistry) {
+        marketRegistry = MockMarketRegistry(_marketRegistry);
+    }
+
+    function setClearingHouse(address _clearingHouse) external onlyOwner {
+        clearingHouse = _clearingHouse;
+    }
+
+    /**
+     * @return fee Quote fee collected from the existing order, if any
+     */
+    function addLiquidity(
+        address _trader,
+        address _baseToken,
+        int24 _lowerTick,
+        int24 _upperTick,
+        uint128 _liquidity,
+        uint256 _base,
+        uint256 _quote
+    ) external onlyClearingHouse returns (uint256 fee) {
+        bytes32 key = OpenOrder.calcOrderKey(_trader, _baseToken, _lowerTick, _upperTick);
+        OpenOrder.Info storage order = openOrders[key];
+        uint256 feeGrowthInsideX128 = _pool(_baseToken).getFeeGrowthInsideX128(
+            _lowerTick,
+            _upperTick
+        );
+        if (order.liquidity == 0) {
+            openOrderIds[_trader][_baseToken].push(key);
+            order.lowerTick = _lowerTick;
+            order.upperTick = _upperTick;
+        } else {
+            fee = _pendingFee(order, feeGrowthInsideX128);
+        }
+        order.lastFeeGrowthInsideX128 = feeGrowthInsideX128;
+        order.liquidity += _liquidity;
+        order.baseDebt += _base;
+        order.quoteDebt += _quote;
+    }
+
+    /**
+     * @return fee Quote fee collected from the order
+     * @return baseDebt Share of the base debt repaid by the removed liquidity
+     * @return quoteDebt Share of the quote debt repaid by the removed liquidity
+     */
+    function removeLiquidity(
+        address _trader,
+        address _baseToken,
+        int24 _lowerTick,
+        int24 _upperTick,
+        uint128 _liquidity
+    )
+        external
+        onlyClearingHouse
+        returns (
+            uint256 fee,
+            uint256 baseDebt,
+            uint256 quoteDebt
+        )
+    {
+        bytes32 key = OpenOrder.calcOrderKey(_trader, _baseToken, _lowerTick, _upperTick);
+        OpenOrder.Info storage order = openOrders[key];
+        require(order.liquidity > 0, "OB_NEO");
+        require(order.liquidity >= _liquidity, "OB_NEL");
+        uint256 feeGrowthInsideX128 = _pool(_baseToken).getFeeGrowthInsideX128(
+            _lowerTick,
+            _upperTick
+        );
+        fee = _pendingFee(order, feeGrowthInsideX128);
+        order.lastFeeGrowthInsideX128 = feeGrowthInsideX128;
+        if (_liquidity == 0) {
+            return (fee, 0, 0);
+        }
+        baseDebt = FullMath.mulDiv(order.baseDebt, _liquidity, order.liquidity);
+        quoteDebt = FullMath.mulDiv(order.quoteDebt, _liquidity, order.liquidity);
+        order.liquidity -= _liquidity;
+        if (order.liquidity == 0) {
+            // the last of the liquidity takes whatever rounding left behind
+            baseDebt = order.baseDebt;
+            quoteDebt = order.quoteDebt;
+            delete openOrders[key];
+            _removeOrderId(_trader, _baseToken, key);
+        } else {
+            order.baseDebt -= baseDebt;
+            order.quoteDebt -= quoteDebt;
+        }
+    }
+
+    function getOpenOrderIds(address _trader, address _baseToken)
+        external
+        view
+        returns (bytes32[] memory)
+    {
+        return openOrderIds[_trader][_baseToken];
+    }
+
+    function getOpenOrderById(bytes32 _orderId)
+        external
+        view
+        returns (OpenOrder.Info memory)
+    {
+        return openOrders[_orderId];
+    }
+
+    function getOpenOrder(
+        address _trader,
+        address _baseToken,
+        int24 _lowerTick,
+        int24 _upperTick
+    ) external view returns (OpenOrder.Info memory) {
+        return
+            openOrders[
+                OpenOrder.calcOrderKey(_trader, _baseToken, _lowerTick, _upperTick)
+            ];
+    }
+
+    function hasOrder(address _trader, address[] calldata _tokens)
+        external
+        view
+        returns (bool)
+    {
+        for (uint256 i = 0; i < _tokens.length; i++) {
+            if (openOrderIds[_trader][_tokens[i]].length > 0) {
+                return true;
+            }
+        }
+        return false;
+    }
+
+    function getPendingFee(
+        address _trader,
+        address _baseToken,
+        int24 _lowerTick,
+        int24 _upperTick
+    ) external view returns (uint256) {
+        OpenOrder.Info storage order = openOrders[
+            OpenOrder.calcOrderKey(_trader, _baseToken, _lowerTick, _upperTick)
+        ];
+        if (order.liquidity == 0) {
+            return 0;
+        }
+        return
+            _pendingFee(
+                order,
+                _pool(_baseToken).getFeeGrowthInsideX128(_lowerTick, _upperTick)
+            );
+    }
+
+    /**
+     * @return tokenAmount Base (or quote) the trader's orders hold at the current price
+     * @return totalPendingFee Quote fees not yet collected by those orders
+     */
+    function getTotalTokenAmountInPoolAndPendingFee(
+        address _trader,
+        address _baseToken,
+        bool _fetchBase
+    ) public view returns (uint256 tokenAmount, uint256 totalPendingFee) {
+        MockUniswapV3Pool pool = _pool(_baseToken);
+        (uint160 sqrtPriceX96, , , , , , ) = pool.slot0();
+        bytes32[] storage ids = openOrderIds[_trader][_baseToken];
+        for (uint256 i = 0; i < ids.length; i++) {
+            OpenOrder.Info storage order = openOrders[ids[i]];
+            (uint256 amount0, uint256 amount1) = LiquidityAmounts
+                .getAmountsForLiquidity(
+                    sqrtPriceX96,
+                    TickMath.getSqrtRatioAtTick(order.lowerTick),
+                    TickMath.getSqrtRatioAtTick(order.upperTick),
+                    order.liquidity
+                );
+            tokenAmount += _fetchBase ? amount0 : amount1;
+            totalPendingFee += _pendingFee(
+                order,
+                pool.getFeeGrowthInsideX128(order.lowerTick, order.upperTick)
+            );
+        }
+    }
+
+    function getTotalOrderDebt(
+        address _trader,
+        address _baseToken,
+        bool _fetchBase
+    ) public view returns (uint256 debtAmount) {
+        bytes32[] storage ids = openOrderIds[_trader][_baseToken];
+        for (uint256 i = 0; i < ids.length; i++) {
+            OpenOrder.Info storage order = openOrders[ids[i]];
+            debtAmount += _fetchBase ? order.baseDebt : order.quoteDebt;
+        }
+    }
+
+    function _pendingFee(OpenOrder.Info storage _order, uint256 _feeGrowthInsideX128)
+        internal
+        view
+        returns (uint256)
+    {
+        unchecked {
+            return
+                FullMath.mulDiv(
+                    _feeGrowthInsideX128 - _order.lastFeeGrowthInsideX128,
+                    _order.liquidity,
+                    Q128
+                );
+        }
+    }
+
+    function _removeOrderId(
+        address _trader,
+        address _baseToken,
+        bytes32 _key
+    ) internal {
+        bytes32[] storage ids = openOrderIds[_trader][_baseToken];
+        for (uint256 i = 0; i < ids.length; i++) {
+            if (ids[i] == _key) {
+                ids[i] = ids[ids.length - 1];
+                ids.pop();
+                return;
+            }
+        }
+    }
+
+    function _pool(address _baseToken) internal view returns (MockUniswapV3Pool) {
+        return MockUniswapV3Pool(marketRegistry.getPool(_baseToken));
+    }
+}
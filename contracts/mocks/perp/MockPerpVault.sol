@@ -0,0 +1,170 @@
+// SPDX-License-Identifier: GPL-3.0-or-later
+pragma solidity 0.8.15;
+
+import {Ownable} from "@openzeppelin/contracts/access/Ownable.sol";
+import {IERC20, SafeERC20} from "@openzeppelin/contracts/token/ERC20/utils/SafeERC20.sol";
+import {IERC20Metadata} from "@openzeppelin/contracts/token/ERC20/extensions/IERC20Metadata.sol";
+import {PerpMath} from "../../lib/PerpMath.sol";
+import {PerpSafeCast} from "../../lib/PerpSafeCast.sol";
+import {SettlementTokenMath} from "../../lib/SettlementTokenMath.sol";
+import {MockAccountBalance} from "./MockAccountBalance.sol";
+import {MockClearingHouseConfig} from "./MockClearingHouseConfig.sol";
+
+/**
+ * @title Local Perp Vault
+ * @notice Settlement token collateral and Perp's account value and free collateral maths.
+ *  Only the settlement token is accepted and there is no funding payment.
+ */
+contract MockPerpVault is Ownable {
+    using SafeERC20 for IERC20;
+    using PerpMath for int256;
+    using PerpSafeCast for uint256;
+    using PerpSafeCast for int256;
+    using SettlementTokenMath for uint256;
+    using SettlementTokenMath for int256;
+
+    address internal immutable settlementToken;
+    uint8 public immutable decimals;
+    MockClearingHouseConfig internal immutable clearingHouseConfig;
+    MockAccountBalance internal immutable accountBalance;
+    address internal immutable exchange;
+    address internal clearingHouse;
+
+    // settlement token decimals
+    mapping(address => int256) internal balances;
+
+    event Deposited(
+        address indexed collateralToken,
+        address indexed trader,
+        uint256 amount
+    );
+    event Withdrawn(
+        address indexed collateralToken,
+        address indexed trader,
+        uint256 amount
+    );
+
+    constructor(
+        address _settlementToken,
+        address _clearingHouseConfig,
+        address _accountBalance,
+        address _exchange
+    ) {
+        settlementToken = _settlementToken;
+        decimals = IERC20Metadata(_settlementToken).decimals();
+        clearingHouseConfig = MockClearingHouseConfig(_clearingHouseConfig);
+        accountBalance = MockAccountBalance(_accountBalance);
+        exchange = _exchange;
+    }
+
+    function setClearingHouse(address _clearingHouse) external onlyOwner {
+        clearingHouse = _clearingHouse;
+    }
+
+    function deposit(address _token, uint256 _amount) external {
+        require(_token == settlementToken, "V_OSCT");
+        require(_amount > 0, "V_ZA");
+        IERC20(_token).safeTransferFrom(msg.sender, address(this), _amount);
+        balances[msg.sender] += _amount.toInt256();
+        emit Deposited(_token, msg.sender, _amount);
+    }
+
+    function withdraw(address _token, uint256 _amount) external {
+        require(_token == settlementToken, "V_OSCT");
+        int256 pnl = accountBalance.settleOwedRealizedPnl(msg.sender);
+        balances[msg.sender] += pnl.formatSettlementToken(decimals);
+        require(getFreeCollateral(msg.sender) >= _amount, "V_NEFC");
+        balances[msg.sender] -= _amount.toInt256();
+        IERC20(_token).safeTransfer(msg.sender, _amount);
+        emit Withdrawn(_token, msg.sender, _amount);
+    }
+
+    function getBalance(address _trader) external view returns (int256) {
+        return balances[_trader];
+    }
+
+    function getBalanceByToken(address _trader, address _token)
+        external
+        view
+        returns (int256)
+    {
+        return _token == settlementToken ? balances[_trader] : int256(0);
+    }
+
+    /// @return Account value in settlement token decimals
+    function getAccountValue(address _trader) external view returns (int256) {
+        (, int256 accountValue) = _getValues(_trader);
+        return accountValue.formatSettlementToken(decimals);
+    }
+
+    /// @return Free collateral in settlement token decimals
+    function getFreeCollateral(address _trader) public view returns (uint256) {
+        int256 free = getFreeCollateralByRatio(
+            _trader,
+            clearingHouseConfig.getImRatio()
+        );
+        return free > 0 ? free.toUint256().formatSettlementToken(decimals) : 0;
+    }
+
+    /**
+     * @return Free collateral in 18 decimals: the lesser of collateral value and account
+     *  value, less `_ratio` of the larger of position value and debt value
+     */
+    function getFreeCollateralByRatio(address _trader, uint24 _ratio)
+        public
+        view
+        returns (int256)
+    {
+        (int256 collateralValue, int256 accountValue) = _getValues(_trader);
+        uint256 totalMarginRequirement = PerpMath.mulRatio(
+            _max(
+                accountBalance.getTotalAbsPositionValue(_trader),
+                accountBalance.getTotalDebtValue(_trader)
+            ),
+            _ratio
+        );
+        return
+            PerpMath.min(collateralValue, accountValue) -
+            totalMarginRequirement.toInt256();
+    }
+
+    function getSettlementToken() external view returns (address) {
+        return settlementToken;
+    }
+
+    function getClearingHouse() external view returns (address) {
+        return clearingHouse;
+    }
+
+    function getClearingHouseConfig() external view returns (address) {
+        return address(clearingHouseConfig);
+    }
+
+    function getAccountBalance() external view returns (address) {
+        return address(accountBalance);
+    }
+
+    function getExchange() external view returns (address) {
+        return exchange;
+    }
+
+    /// @return collateralValue Balance, owed realized PnL and pending fees in 18 decimals
+    /// @return accountValue Collateral value plus unrealized PnL in 18 decimals
+    function _getValues(address _trader)
+        internal
+        view
+        returns (int256 collateralValue, int256 accountValue)
+    {
+        (int256 owedRealizedPnl, int256 unrealizedPnl, uint256 pendingFee) = accountBalance
+            .getPnlAndPendingFee(_trader);
+        collateralValue =
+            balances[_trader].parseSettlementToken(decimals) +
+            owedRealizedPnl +
+            pendingFee.toInt256();
+        accountValue = collateralValue + unrealizedPnl;
+    }
+
+    function _max(uint256 _a, uint256 _b) internal pure returns (uint256) {
+        return _a > _b ? _a : _b;
+    }
+}
@@ -0,0 +1,513 @@
+// SPDX-License-Identifier: GPL-3.0-or-later
+pragma solidity 0.8.15;
+
+import {Ownable} from "@openzeppelin/contracts/access/Ownable.sol";
+import {FullMath} from "@uniswap/v3-core/contracts/libraries/FullMath.sol";
+import {TickMath} from "../../lib/TickMath.sol";
+import {SqrtPriceMath} from "../../lib/SqrtPriceMath.sol";
+
+/**
+ * @title Local vETH/vUSD pool
+ * @notice Concentrated liquidity pool with the Uniswap V3 swap and oracle maths and the
+ *  views the strategy and Perp read (slot0, observe, tickSpacing, liquidity).
+ *  No tokens move: the Perp ClearingHouse is the only caller and keeps the balances.
+ *  token0 is always the base token and token1 the quote token. Fees are charged in
+ *  quote (on the quote input, or on the quote output) as Perp does, so makers only
+ *  ever earn quote.
+ */
+contract MockUniswapV3Pool is Ownable {
+    struct TickInfo {
+        uint128 liquidityGross;
+        int128 liquidityNet;
+        uint256 feeGrowthOutsideX128;
+    }
+
+    struct Observation {
+        uint32 blockTimestamp;
+        int56 tickCumulative;
+    }
+
+    struct SwapState {
+        uint256 remaining;
+        uint160 sqrtPriceX96;
+        int24 tick;
+        uint128 liquidity;
+        uint256 amount0;
+        uint256 amount1;
+        uint256 fee;
+    }
+
+    uint256 internal constant Q128 = 0x100000000000000000000000000000000;
+    uint256 internal constant ONE_HUNDRED_PERCENT = 1e6;
+
+    address public immutable token0;
+    address public immutable token1;
+    uint24 public immutable fee;
+    int24 public immutable tickSpacing;
+    address public clearingHouse;
+
+    uint160 internal sqrtPriceX96;
+    int24 internal tick;
+    uint128 public liquidity;
+    uint256 public feeGrowthGlobalX128;
+    mapping(int24 => TickInfo) public ticks;
+    // initialized ticks in ascending order
+    int24[] internal initializedTicks;
+    Observation[] public observations;
+
+    event Swap(
+        address indexed sender,
+        address indexed recipient,
+        int256 amount0,
+        int256 amount1,
+        uint160 sqrtPriceX96,
+        uint128 liquidity,
+        int24 tick
+    );
+    event Mint(
+        address sender,
+        address indexed owner,
+        int24 indexed tickLower,
+        int24 indexed tickUpper,
+        uint128 amount,
+        uint256 amount0,
+        uint256 amount1
+    );
+    event Burn(
+        address indexed owner,
+        int24 indexed tickLower,
+        int24 indexed tickUpper,
+        uint128 amount,
+        uint256 amount0,
+        uint256 amount1
+    );
+
+    modifier onlyClearingHouse() {
+        require(msg.sender == clearingHouse, "UP_OCH");
+        _;
+    }
+
+    constructor(
+        address _baseToken,
+        address _quoteToken,
+        uint24 _fee,
+        int24 _tickSpacing,
+        uint160 _sqrtPriceX96
+    ) {
+        token0 = _baseToken;
+        token1 = _quoteToken;
+        fee = _fee;
+        tickSpacing = _tickSpacing;
+        sqrtPriceX96 = _sqrtPriceX96;
+        tick = TickMath.getTickAtSqrtRatio(_sqrtPriceX96);
+        observations.push(Observation(uint32(block.timestamp), 0));
+    }
+
+    function setClearingHouse(address _clearingHouse) external onlyOwner {
+        clearingHouse = _clearingHouse;
+    }
+
+    function slot0()
+        external
+        view
+        returns (
+            uint160,
+            int24,
+            uint16 observationIndex,
+            uint16 observationCardinality,
+            uint16 observationCardinalityNext,
+            uint8 feeProtocol,
+            bool unlocked
+        )
+    {
+        uint16 cardinality = uint16(
+            observations.length > type(uint16).max
+                ? type(uint16).max
+                : observations.length
+        );
+        return (sqrtPriceX96, tick, cardinality - 1, cardinality, cardinality, 0, true);
+    }
+
+    function observe(uint32[] calldata secondsAgos)
+        external
+        view
+        returns (
+            int56[] memory tickCumulatives,
+            uint160[] memory secondsPerLiquidityCumulativeX128s
+        )
+    {
+        tickCumulatives = new int56[](secondsAgos.length);
+        secondsPerLiquidityCumulativeX128s = new uint160[](secondsAgos.length);
+        for (uint256 i = 0; i < secondsAgos.length; i++) {
+            tickCumulatives[i] = _observeSingle(
+                uint32(block.timestamp) - secondsAgos[i]
+            );
+        }
+    }
+
+    function getFeeGrowthInsideX128(int24 _lowerTick, int24 _upperTick)
+        public
+        view
+        returns (uint256 feeGrowthInsideX128)
+    {
+        unchecked {
+            uint256 lowerOutside = ticks[_lowerTick].feeGrowthOutsideX128;
+            uint256 upperOutside = ticks[_upperTick].feeGrowthOutsideX128;
+            uint256 below = tick >= _lowerTick
+                ? lowerOutside
+                : feeGrowthGlobalX128 - lowerOutside;
+            uint256 above = tick < _upperTick
+                ? upperOutside
+                : feeGrowthGlobalX128 - upperOutside;
+            return feeGrowthGlobalX128 - below - above;
+        }
+    }
+
+    function mint(
+        int24 _lowerTick,
+        int24 _upperTick,
+        uint128 _liquidity
+    ) external onlyClearingHouse returns (uint256 amount0, uint256 amount1) {
+        require(_liquidity > 0, "UP_ZL");
+        _checkTicks(_lowerTick, _upperTick);
+        _updateTick(_lowerTick, int128(_liquidity), false);
+        _updateTick(_upperTick, int128(_liquidity), true);
+        (amount0, amount1) = _amounts(_lowerTick, _upperTick, _liquidity, true);
+        if (tick >= _lowerTick && tick < _upperTick) {
+            liquidity += _liquidity;
+        }
+        emit Mint(msg.sender, msg.sender, _lowerTick, _upperTick, _liquidity, amount0, amount1);
+    }
+
+    function burn(
+        int24 _lowerTick,
+        int24 _upperTick,
+        uint128 _liquidity
+    ) external onlyClearingHouse returns (uint256 amount0, uint256 amount1) {
+        (amount0, amount1) = _amounts(_lowerTick, _upperTick, _liquidity, false);
+        if (tick >= _lowerTick && tick < _upperTick) {
+            liquidity -= _liquidity;
+        }
+        _updateTick(_lowerTick, -int128(_liquidity), false);
+        _updateTick(_upperTick, -int128(_liquidity), true);
+        emit Burn(msg.sender, _lowerTick, _upperTick, _liquidity, amount0, amount1);
+    }
+
+    /**
+     * @notice Swap against the pool until `_amount` is filled or the price reaches
+     *  `_sqrtPriceLimitX96` (0 for no limit).
+     * @param _zeroForOne True to sell base for quote
+     * @param _exactInput Whether `_amount` is the input (base when selling) or the output
+     * @return amount0 Base sold to (or bought from) the pool
+     * @return amount1 Quote bought from (or sold to) the pool, excluding the fee
+     * @return quoteFee Fee in quote, already credited to the makers in range
+     */
+    function swap(
+        bool _zeroForOne,
+        bool _exactInput,
+        uint256 _amount,
+        uint160 _sqrtPriceLimitX96
+    )
+        external
+        onlyClearingHouse
+        returns (
+            uint256 amount0,
+            uint256 amount1,
+            uint256 quoteFee
+        )
+    {
+        if (_sqrtPriceLimitX96 == 0) {
+            _sqrtPriceLimitX96 = _zeroForOne
+                ? TickMath.MIN_SQRT_RATIO + 1
+                : TickMath.MAX_SQRT_RATIO - 1;
+        }
+        require(
+            _zeroForOne
+                ? _sqrtPriceLimitX96 < sqrtPriceX96 &&
+                    _sqrtPriceLimitX96 > TickMath.MIN_SQRT_RATIO
+                : _sqrtPriceLimitX96 > sqrtPriceX96 &&
+                    _sqrtPriceLimitX96 < TickMath.MAX_SQRT_RATIO,
+            "UP_SPL"
+        );
+        _writeObservation();
+
+        SwapState memory state = SwapState({
+            remaining: _amount,
+            sqrtPriceX96: sqrtPriceX96,
+            tick: tick,
+            liquidity: liquidity,
+            amount0: 0,
+            amount1: 0,
+            fee: 0
+        });
+        while (state.remaining != 0 && state.sqrtPriceX96 != _sqrtPriceLimitX96) {
+            _swapStep(state, _zeroForOne, _exactInput, _sqrtPriceLimitX96);
+        }
+
+        sqrtPriceX96 = state.sqrtPriceX96;
+        tick = state.tick;
+        liquidity = state.liquidity;
+        emit Swap(
+            msg.sender,
+            msg.sender,
+            _zeroForOne ? int256(state.amount0) : -int256(state.amount0),
+            _zeroForOne ? -int256(state.amount1) : int256(state.amount1),
+            state.sqrtPriceX96,
+            state.liquidity,
+            state.tick
+        );
+        return (state.amount0, state.amount1, state.fee);
+    }
+
+    /// @dev Swap up to the next initialized tick or the price limit, crossing the tick if reached
+    function _swapStep(
+        SwapState memory _state,
+        bool _zeroForOne,
+        bool _exactInput,
+        uint160 _sqrtPriceLimitX96
+    ) internal {
+        (int24 next, bool initialized) = _nextInitializedTick(_state.tick, _zeroForOne);
+        uint160 sqrtNext = TickMath.getSqrtRatioAtTick(next);
+        uint160 target = _zeroForOne
+            ? (sqrtNext < _sqrtPriceLimitX96 ? _sqrtPriceLimitX96 : sqrtNext)
+            : (sqrtNext > _sqrtPriceLimitX96 ? _sqrtPriceLimitX96 : sqrtNext);
+
+        uint160 sqrtPriceAfter = target;
+        if (_state.liquidity > 0) {
+            uint256 amountIn;
+            uint256 amountOut;
+            (sqrtPriceAfter, amountIn, amountOut) = _step(
+                _state.sqrtPriceX96,
+                target,
+                _state.liquidity,
+                _state.remaining,
+                _zeroForOne,
+                _exactInput
+            );
+            _state.remaining -= _exactInput ? amountIn : amountOut;
+            uint256 stepFee = _zeroForOne
+                ? FullMath.mulDiv(amountOut, fee, ONE_HUNDRED_PERCENT)
+                : FullMath.mulDivRoundingUp(amountIn, fee, ONE_HUNDRED_PERCENT - fee);
+            unchecked {
+                feeGrowthGlobalX128 += FullMath.mulDiv(stepFee, Q128, _state.liquidity);
+            }
+            _state.fee += stepFee;
+            _state.amount0 += _zeroForOne ? amountIn : amountOut;
+            _state.amount1 += _zeroForOne ? amountOut : amountIn;
+        }
+
+        if (sqrtPriceAfter == sqrtNext) {
+            if (initialized) {
+                TickInfo storage info = ticks[next];
+                unchecked {
+                    info.feeGrowthOutsideX128 = feeGrowthGlobalX128 - info.feeGrowthOutsideX128;
+                }
+                _state.liquidity = _addDelta(
+                    _state.liquidity,
+                    _zeroForOne ? -info.liquidityNet : info.liquidityNet
+                );
+            }
+            _state.tick = _zeroForOne ? next - 1 : next;
+        } else if (sqrtPriceAfter != _state.sqrtPriceX96) {
+            _state.tick = TickMath.getTickAtSqrtRatio(sqrtPriceAfter);
+        }
+        _state.sqrtPriceX96 = sqrtPriceAfter;
+    }
+
+    function _step(
+        uint160 _price,
+        uint160 _target,
+        uint128 _liquidity,
+        uint256 _remaining,
+        bool _zeroForOne,
+        bool _exactInput
+    )
+        internal
+        pure
+        returns (
+            uint160 sqrtPriceAfter,
+            uint256 amountIn,
+            uint256 amountOut
+        )
+    {
+        amountIn = _zeroForOne
+            ? SqrtPriceMath.getAmount0Delta(_target, _price, _liquidity, true)
+            : SqrtPriceMath.getAmount1Delta(_price, _target, _liquidity, true);
+        amountOut = _zeroForOne
+            ? SqrtPriceMath.getAmount1Delta(_target, _price, _liquidity, false)
+            : SqrtPriceMath.getAmount0Delta(_price, _target, _liquidity, false);
+        if (_exactInput ? _remaining >= amountIn : _remaining >= amountOut) {
+            return (_target, amountIn, amountOut);
+        }
+        if (_exactInput) {
+            sqrtPriceAfter = SqrtPriceMath.getNextSqrtPriceFromInput(
+                _price,
+                _liquidity,
+                _remaining,
+                _zeroForOne
+            );
+            amountIn = _remaining;
+            amountOut = _zeroForOne
+                ? SqrtPriceMath.getAmount1Delta(sqrtPriceAfter, _price, _liquidity, false)
+                : SqrtPriceMath.getAmount0Delta(_price, sqrtPriceAfter, _liquidity, false);
+        } else {
+            sqrtPriceAfter = SqrtPriceMath.getNextSqrtPriceFromOutput(
+                _price,
+                _liquidity,
+                _remaining,
+                _zeroForOne
+            );
+            amountOut = _remaining;
+            amountIn = _zeroForOne
+                ? SqrtPriceMath.getAmount0Delta(sqrtPriceAfter, _price, _liquidity, true)
+                : SqrtPriceMath.getAmount1Delta(_price, sqrtPriceAfter, _liquidity, true);
+        }
+    }
+
+    function _amounts(
+        int24 _lowerTick,
+        int24 _upperTick,
+        uint128 _liquidity,
+        bool _roundUp
+    ) internal view returns (uint256 amount0, uint256 amount1) {
+        uint160 sqrtLower = TickMath.getSqrtRatioAtTick(_lowerTick);
+        uint160 sqrtUpper = TickMath.getSqrtRatioAtTick(_upperTick);
+        if (tick < _lowerTick) {
+            amount0 = SqrtPriceMath.getAmount0Delta(sqrtLower, sqrtUpper, _liquidity, _roundUp);
+        } else if (tick < _upperTick) {
+            amount0 = SqrtPriceMath.getAmount0Delta(sqrtPriceX96, sqrtUpper, _liquidity, _roundUp);
+            amount1 = SqrtPriceMath.getAmount1Delta(sqrtLower, sqrtPriceX96, _liquidity, _roundUp);
+        } else {
+            amount1 = SqrtPriceMath.getAmount1Delta(sqrtLower, sqrtUpper, _liquidity, _roundUp);
+        }
+    }
+
+    function _checkTicks(int24 _lowerTick, int24 _upperTick) internal view {
+        require(_lowerTick < _upperTick, "UP_TLU");
+        require(_lowerTick >= TickMath.MIN_TICK && _upperTick <= TickMath.MAX_TICK, "UP_TR");
+        require(_lowerTick % tickSpacing == 0 && _upperTick % tickSpacing == 0, "UP_TS");
+    }
+
+    function _updateTick(
+        int24 _tick,
+        int128 _liquidityDelta,
+        bool _upper
+    ) internal {
+        TickInfo storage info = ticks[_tick];
+        uint128 grossBefore = info.liquidityGross;
+        uint128 grossAfter = _addDelta(grossBefore, _liquidityDelta);
+        if (grossBefore == 0) {
+            // per Uniswap, all growth before initialization happened below the tick
+            if (_tick <= tick) {
+                info.feeGrowthOutsideX128 = feeGrowthGlobalX128;
+            }
+            _insertTick(_tick);
+        }
+        info.liquidityGross = grossAfter;
+        info.liquidityNet = _upper
+            ? info.liquidityNet - _liquidityDelta
+            : info.liquidityNet + _liquidityDelta;
+        if (grossAfter == 0) {
+            delete ticks[_tick];
+            _removeTick(_tick);
+        }
+    }
+
+    function _insertTick(int24 _tick) internal {
+        initializedTicks.push(_tick);
+        uint256 i = initializedTicks.length - 1;
+        while (i > 0 && initializedTicks[i - 1] > _tick) {
+            initializedTicks[i] = initializedTicks[i - 1];
+            i--;
+        }
+        initializedTicks[i] = _tick;
+    }
+
+    function _removeTick(int24 _tick) internal {
+        uint256 length = initializedTicks.length;
+        uint256 i = 0;
+        while (initializedTicks[i] != _tick) {
+            i++;
+        }
+        for (; i + 1 < length; i++) {
+            initializedTicks[i] = initializedTicks[i + 1];
+        }
+        initializedTicks.pop();
+    }
+
+    /// @dev Next initialized tick at or below `_tick` when `_lte`, strictly above otherwise
+    function _nextInitializedTick(int24 _tick, bool _lte)
+        internal
+        view
+        returns (int24 next, bool initialized)
+    {
+        uint256 length = initializedTicks.length;
+        // first index with initializedTicks[i] > _tick
+        uint256 lo = 0;
+        uint256 hi = length;
+        while (lo < hi) {
+            uint256 mid = (lo + hi) / 2;
+            if (initializedTicks[mid] > _tick) {
+                hi = mid;
+            } else {
+                lo = mid + 1;
+            }
+        }
+        if (_lte) {
+            return lo == 0 ? (TickMath.MIN_TICK, false) : (initializedTicks[lo - 1], true);
+        }
+        return lo == length ? (TickMath.MAX_TICK, false) : (initializedTicks[lo], true);
+    }
+
+    function _addDelta(uint128 _x, int128 _y) internal pure returns (uint128) {
+        return _y < 0 ? _x - uint128(-_y) : _x + uint128(_y);
+    }
+
+    function _writeObservation() internal {
+        Observation memory last = observations[observations.length - 1];
+        if (last.blockTimestamp == uint32(block.timestamp)) {
+            return;
+        }
+        observations.push(
+            Observation(
+                uint32(block.timestamp),
+                last.tickCumulative +
+                    int56(tick) *
+                    int56(uint56(uint32(block.timestamp) - last.blockTimestamp))
+            )
+        );
+    }
+
+    function _observeSingle(uint32 _target) internal view returns (int56) {
+        uint256 length = observations.length;
+        Observation memory last = observations[length - 1];
+        if (_target >= last.blockTimestamp) {
+            return
+                last.tickCumulative +
+                int56(tick) *
+                int56(uint56(_target - last.blockTimestamp));
+        }
+        require(_target >= observations[0].blockTimestamp, "OLD");
+        // last observation at or before the target
+        uint256 lo = 0;
+        uint256 hi = length - 1;
+        while (lo < hi) {
+            uint256 mid = (lo + hi + 1) / 2;
+            if (observations[mid].blockTimestamp <= _target) {
+                lo = mid;
+            } else {
+                hi = mid - 1;
+            }
+        }
+        Observation memory prev = observations[lo];
+        if (prev.blockTimestamp == _target) {
+            return prev.tickCumulative;
+        }
+        Observation memory next = observations[lo + 1];
+        return
+            prev.tickCumulative +
+            ((next.tickCumulative - prev.tickCumulative) /
+                int56(uint56(next.blockTimestamp - prev.blockTimestamp))) *
+            int56(uint56(_target - prev.blockTimestamp));
+    }
+}
@@ -0,0 +1,156 @@
+// SPDX-License-Identifier: AGPL-3.0
+pragma solidity 0.8.15;
+
+import "@openzeppelin/contracts/access/Ownable.sol";
+
+interface IKeeperStrategy {
+    function harvest() external;
+
+    function tend() external;
+
+    function rebalanceDebt() external;
+
+    function rebalanceCollateral() external;
+
+    function shiftRungs(uint256 _mask) external;
+
+    function setHarvestThreshold(uint256 _harvestThreshold) external;
+
+    function setTickRangeMultiplier(int24 _tickRangeMultiplier) external;
+
+    function rungsOutOfRange() external view returns (uint256);
+}
+
+/**
+ * @title KeeperRouter
+ * @notice
+ *  Set as the `keeper` of any number of strategies, runs a keeper round in one
+ *  transaction. A batch packs 21 bytes per item: the strategy address followed
+ *  by an action byte. Each item runs in its own call, so one that reverts does
+ *  not stop the rest, and bit i of the result is set when item i succeeded.
+ *  The router only acts for the strategies its owner has listed with
+ *  `setStrategy`, and only makes the keeper calls of `IKeeperStrategy`.
+ */
+contract KeeperRouter is Ownable {
+    uint8 constant HARVEST = 0;
+    uint8 constant TEND = 1;
+    uint8 constant REBALANCE_DEBT = 2;
+    uint8 constant REBALANCE_COLLATERAL = 3;
+    // shifts every rung rungsOutOfRange reports
+    uint8 constant SHIFT_RUNGS = 4;
+    uint256 constant ITEM_SIZE = 21;
+    uint256 constant MAX_ITEMS = 256;
+
+    mapping(address => bool) public keepers;
+    mapping(address => bool) public strategies;
+
+    event Executed(uint256 results, uint256 items);
+    event ItemFailed(uint256 indexed index, bytes reason);
+
+    modifier onlyKeepers() {
+        require(keepers[msg.sender] || msg.sender == owner(), "!keeper");
+        _;
+    }
+
+    function setKeeper(address _keeper, bool _allowed) external onlyOwner {
+        keepers[_keeper] = _allowed;
+    }
+
+    function setStrategy(address _strategy, bool _allowed) external onlyOwner {
+        strategies[_strategy] = _allowed;
+    }
+
+    /**
+     * @notice Runs each packed (strategy, action) item of `_batch`.
+     * @return _results Bit i set when item i succeeded.
+     */
+    function execute(bytes calldata _batch)
+        external
+        onlyKeepers
+        returns (uint256 _results)
+    {
+        require(_batch.length % ITEM_SIZE == 0, "!batch");
+        uint256 items = _batch.length / ITEM_SIZE;
+        require(items <= MAX_ITEMS, "!batch");
+        for (uint256 i = 0; i < items; i++) {
+            uint256 offset = i * ITEM_SIZE;
+            address strategy = address(bytes20(_batch[offset:offset + 20]));
+            if (_run(strategy, uint8(_batch[offset + 20]), i)) {
+                _results |= 1 << i;
+            }
+        }
+        emit Executed(_results, items);
+    }
+
+    /**
+     * @notice A keeper call outside a batch (e.g. `setHarvestThreshold`) to a
+     * listed strategy, made as the router and reverting with the strategy's
+     * reason.
+     */
+    function forward(address _strategy, bytes calldata _data)
+        external
+        onlyKeepers
+        returns (bytes memory)
+    {
+        require(strategies[_strategy], "!strategy");
+        require(_data.length >= 4 && _forwardable(bytes4(_data[:4])), "!call");
+        (bool success, bytes memory result) = _strategy.call(_data);
+        if (!success) {
+            assembly {
+                revert(add(result, 32), mload(result))
+            }
+        }
+        return result;
+    }
+
+    function _run(
+        address _strategy,
+        uint8 _action,
+        uint256 _index
+    ) internal returns (bool) {
+        if (!strategies[_strategy]) {
+            emit ItemFailed(_index, "!strategy");
+            return false;
+        }
+        bytes memory data;
+        if (_action == HARVEST) {
+            data = abi.encodeCall(IKeeperStrategy.harvest, ());
+        } else if (_action == TEND) {
+            data = abi.encodeCall(IKeeperStrategy.tend, ());
+        } else if (_action == REBALANCE_DEBT) {
+            data = abi.encodeCall(IKeeperStrategy.rebalanceDebt, ());
+        } else if (_action == REBALANCE_COLLATERAL) {
+            data = abi.encodeCall(IKeeperStrategy.rebalanceCollateral, ());
+        } else if (_action == SHIFT_RUNGS && _strategy.code.length > 0) {
+            try IKeeperStrategy(_strategy).rungsOutOfRange() returns (
+                uint256 mask
+            ) {
+                data = abi.encodeCall(IKeeperStrategy.shiftRungs, (mask));
+            } catch (bytes memory reason) {
+                emit ItemFailed(_index, reason);
+                return false;
+            }
+        }
+        // an unknown action, or an address without code the call would not catch
+        if (data.length == 0 || _strategy.code.length == 0) {
+            emit ItemFailed(_index, "");
+            return false;
+        }
+        (bool success, bytes memory result) = _strategy.call(data);
+        if (!success) {
+            emit ItemFailed(_index, result);
+        }
+        return success;
+    }
+
+    function _forwardable(bytes4 _selector) internal pure returns (bool) {
+        return
+            _selector == IKeeperStrategy.harvest.selector ||
+            _selector == IKeeperStrategy.tend.selector ||
+            _selector == IKeeperStrategy.rebalanceDebt.selector ||
+            _selector == IKeeperStrategy.rebalanceCollateral.selector ||
+            _selector == IKeeperStrategy.shiftRungs.selector ||
+            _selector == IKeeperStrategy.setHarvestThreshold.selector ||
+            _selector == IKeeperStrategy.setTickRangeMultiplier.selector;
+    }
+}
@@ -0,0 +1,40 @@
+// SPDX-License-Identifier: MIT
+pragma solidity 0.8.15;
+
+import "../interfaces/IMulticall3.sol";
+
+/**
+ * @title Multicall3
+ * @notice
+ *  Minimal aggregate3 subset of the canonical Multicall3
+ *  (0xcA11bde05977b3631167028862bE2a173976CA11) for local chains where it is
+ *  not already deployed.
+ */
+contract Multicall3 is IMulticall3 {
+    function aggregate3(Call3[] calldata calls)
+        external
+        payable
+        override
+        returns (Result[] memory returnData)
+    {
+        uint256 length = calls.length;
+        returnData = new Result[](length);
+        for (uint256 i = 0; i < length; i++) {
+            Call3 calldata call = calls[i];
+            Result memory result = returnData[i];
+            (result.success, result.returnData) = call.target.call(
+                call.callData
+            );
+            require(call.allowFailure || result.success, "MC_FAIL");
+        }
+    }
+
+    function getBlockNumber()
+        external
+        view
+        override
+        returns (uint256 blockNumber)
+    {
+        blockNumber = block.number;
+    }
+}
@@ -1,40 +1,381 @@
+"""
+Deploy the strategy on every market of a network in `markets.yml`.
+
+For each market the deployer sends the strategy (through the market's entry
+contract), its `StrategyInsurance`, `setInsurance`, `setKeeper`,
+`setPartialWithdraw`, the insurance settings and, when the deployer governs the vault and `debt_ratio` is set,
+`vault.addStrategy`. `PerpLib` is deployed first (unless `perp_lib` pins an
+existing one) since the entry contracts link against it.
+
+Nothing waits for a receipt before the next transaction is sent. Nonces are
+assigned locally, so the address of every contract is known before it is
+mined and later transactions (the insurance constructor, the setters) can
+already target it; `batch_size` transactions are sent back to back and then
+their receipts are awaited concurrently. Each transaction is written to a
+JSON manifest (`deployments/<network>.json`) as soon as it is sent, so a
+re-run skips confirmed steps, waits for pending ones and re-sends dropped
+ones at their original nonce, which keeps the planned addresses. Adding a
+market to the registry and re-running deploys only that market. Calls the
+deployer is not allowed to make (`addStrategy` on a vault it does not govern)
+are written to the manifest's `manual` section as `{to, data}` instead.
+
+    brownie run deploy main markets.yml <account id> --network optimism-main
+
+The keystore password is read from `DEPLOYER_PASSWORD`; on development
+networks the first unlocked account deploys when no account is given.
+"""
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Callable
+
+import brownie
+from brownie import accounts, network, web3
+from brownie.network.contract import ContractCall, ContractTx
+from web3.exceptions import TransactionNotFound
+
+from scripts.markets import INSURANCE_SETTERS, load_markets, network_settings
+
+GAS_LIMITS = {
+    "PerpLib": 2_000_000,
+    "strategy": 9_000_000,
+    "insurance": 2_000_000,
+    "call": 300_000,
+}
+
+VAULT_ABI = [
+    {
+        "name": "governance",
+        "type": "function",
+        "stateMutability": "view",
+        "inputs": [],
+        "outputs": [{"name": "", "type": "address"}],
+    },
+    {
+        "name": "addStrategy",
+        "type": "function",
+        "stateMutability": "nonpayable",
+        "inputs": [
+            {"name": "strategy", "type": "address"},
+            {"name": "debtRatio", "type": "uint256"},
+            {"name": "minDebtPerHarvest", "type": "uint256"},
+            {"name": "maxDebtPerHarvest", "type": "uint256"},
+            {"name": "performanceFee", "type": "uint256"},
+        ],
+        "outputs": [],
+    },
+]
+
+
+@dataclass
+class Step:
+    key: str
+    gas: int
+    # calldata (or init code), given the addresses planned so far
+    encode: Callable[[dict], str]
+    # recipient, None for a contract creation
+    to: Callable[[dict], str] = None
+    # left to another account: recorded in the manifest instead of sent
+    manual: bool = False
+
+
+def encode_call(abi, address, name, *args):
+    """Calldata for `name` on a contract that may not be mined yet."""
+    fn = next(i for i in abi if i["type"] == "function" and i["name"] == name)
+    return ContractTx(address, fn, name, None).encode_input(*args)
+
+
+def _resolve(addresses, value):
+    """Step keys among call arguments stand for the address deployed by that step."""
+    return addresses.get(value, value) if isinstance(value, str) else value
+
+
+def _deploy(key, gas, container, *args):
+    return Step(
+        key,
+        gas,
+        lambda a: container.deploy.encode_input(*(_resolve(a, x) for x in args)),
+    )
 
-from brownie import BrownieTemplate, accounts, config, network, project, web3
-from eth_utils import is_checksum_address
-import click
 
+def _call(key, gas, abi, target, fn, *args, manual=False):
+    return Step(
+        key,
+        gas,
+        lambda a: encode_call(
+            abi, _resolve(a, target), fn, *(_resolve(a, x) for x in args)
+        ),
+        lambda a: _resolve(a, target),
+        manual,
+    )
+
+
+class Manifest:
+    """Sent transactions and deployed addresses, rewritten atomically on every change."""
+
+    def __init__(self, path, chain_id, deployer):
+        self.path = Path(path)
+        if self.path.exists():
+            self.data = json.loads(self.path.read_text())
+            if (self.data["chain_id"], self.data["deployer"]) != (chain_id, deployer):
+                raise ValueError(
+                    "{} is a deployment by {} on chain {}".format(
+                        path, self.data["deployer"], self.data["chain_id"]
+                    )
+                )
+        else:
+            self.data = {
+                "chain_id": chain_id,
+                "deployer": deployer,
+                "steps": {},
+                "manual": {},
+            }
+
+    @property
+    def steps(self):
+        return self.data["steps"]
+
+    def addresses(self):
+        return {k: s["address"] for k, s in self.steps.items() if s.get("address")}
+
+    def record(self, key, **values):
+        self.steps.setdefault(key, {}).update(values)
+        self.save()
+
+    def manual(self, key, to, data):
+        self.data["manual"][key] = {"to": to, "data": data}
+        self.save()
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.data, indent=2))
+        os.replace(tmp, self.path)
 
-def get_address(msg: str, default: str = None) -> str:
-    val = click.prompt(msg, default=default)
 
-    # Keep asking user for click.prompt until it passes
-    while True:
+def plan(markets, deployer, gas=None):
+    """The deployment steps for `markets`, in nonce order."""
+    gas = dict(GAS_LIMITS, **(gas or {}))
+    insurance = brownie.StrategyInsurance
+    steps = [_deploy("PerpLib", gas["PerpLib"], brownie.PerpLib)]
+    for market in markets:
+        entry = getattr(brownie, market.entry)
+        strategy_key = market.name + ".strategy"
+        insurance_key = market.name + ".insurance"
+        steps += [
+            _deploy(strategy_key, gas["strategy"], entry, *market.constructor_args()),
+            _deploy(insurance_key, gas["insurance"], insurance, strategy_key),
+            _call(
+                market.name + ".setInsurance",
+                gas["call"],
+                entry.abi,
+                strategy_key,
+                "setInsurance",
+                insurance_key,
+            ),
+        ]
+        if market.keeper:
+            steps.append(
+                _call(
+                    market.name + ".setKeeper",
+                    gas["call"],
+                    entry.abi,
+                    strategy_key,
+                    "setKeeper",
+                    market.keeper,
+                )
+            )
+        if market.partial_withdraw:
+            steps.append(
+                _call(
+                    market.name + ".setPartialWithdraw",
+                    gas["call"],
+                    entry.abi,
+                    strategy_key,
+                    "setPartialWithdraw",
+                    True,
+                )
+            )
+        for setting, value in sorted(market.insurance.items()):
+            setter = INSURANCE_SETTERS[setting]
+            steps.append(
+                _call(
+                    "{}.{}".format(insurance_key, setter),
+                    gas["call"],
+                    insurance.abi,
+                    insurance_key,
+                    setter,
+                    value,
+                )
+            )
+        if market.debt_ratio is not None:
+            governance = ContractCall(market.vault, VAULT_ABI[0], "governance", None)
+            steps.append(
+                _call(
+                    market.name + ".addStrategy",
+                    gas["call"],
+                    VAULT_ABI,
+                    market.vault,
+                    "addStrategy",
+                    strategy_key,
+                    market.debt_ratio,
+                    0,
+                    market.max_debt_per_harvest,
+                    market.performance_fee,
+                    manual=governance() != deployer.address,
+                )
+            )
+    return steps
 
-        if is_checksum_address(val):
-            return val
-        elif addr := web3.ens.address(val):
-            click.echo(f"Found ENS '{val}' [{addr}]")
-            return addr
 
-        click.echo(
-            f"I'm sorry, but '{val}' is not a checksummed address or valid ENS record"
+class Deployment:
+    def __init__(self, deployer, manifest_path, batch_size=16, timeout=600):
+        self.deployer = deployer
+        self.manifest = Manifest(manifest_path, web3.eth.chain_id, deployer.address)
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(batch_size)
+
+    def _wait(self, keys):
+        """Wait for the receipts of `keys`; raises if any of them reverted."""
+        hashes = [self.manifest.steps[k]["tx"] for k in keys]
+        receipts = self._executor.map(
+            lambda h: web3.eth.wait_for_transaction_receipt(h, self.timeout), hashes
         )
-        # NOTE: Only display default once
-        val = click.prompt(msg)
+        failed = []
+        for key, receipt in zip(keys, receipts):
+            if receipt["status"] == 0:
+                self.manifest.record(key, status="reverted")
+                failed.append(key)
+            else:
+                self.manifest.record(
+                    key, status="confirmed", block=receipt["blockNumber"]
+                )
+        if failed:
+            raise ValueError("reverted: {}".format(", ".join(failed)))
 
+    def _send(self, step, nonce, addresses):
+        if step.to is None:
+            addresses[step.key] = self.deployer.get_deployment_address(nonce)
+        tx = self.deployer.transfer(
+            step.to(addresses) if step.to else None,
+            data=step.encode(addresses),
+            gas_limit=step.gas,
+            nonce=nonce,
+            required_confs=0,
+            silent=True,
+        )
+        self.manifest.record(
+            step.key,
+            tx=tx.txid,
+            nonce=nonce,
+            address=addresses.get(step.key),
+            status="sent",
+        )
 
-def main():
-    print(f"You are using the '{network.show_active()}' network")
-    dev = accounts[0] # accounts.load(click.prompt("Account", type=click.Choice(accounts.load())))
-    print(f"You are using: 'dev' [{dev.address}]")
+    def _pending(self, sent, next_nonce):
+        """True if a sent transaction is still known to the node."""
+        try:
+            web3.eth.get_transaction(sent["tx"])
+            return True
+        except TransactionNotFound:
+            if sent["nonce"] < next_nonce:
+                raise ValueError(
+                    "{} was dropped and nonce {} has been used since".format(
+                        sent["tx"], sent["nonce"]
+                    )
+                )
+            return False
+
+    def run(self, steps):
+        """Send every step that is not confirmed yet, `batch_size` at a time."""
+        addresses = self.manifest.addresses()
+        next_nonce = web3.eth.get_transaction_count(self.deployer.address, "pending")
+        # never reuse a nonce the manifest holds, even if the node forgot it
+        free_nonce = max(
+            [next_nonce] + [s["nonce"] + 1 for s in self.manifest.steps.values()]
+        )
+        batch = []
+        for step in steps:
+            sent = self.manifest.steps.get(step.key, {})
+            if sent.get("status") == "confirmed":
+                continue
+            if step.manual:
+                self.manifest.manual(
+                    step.key, step.to(addresses), step.encode(addresses)
+                )
+                continue
+            if sent.get("status") == "reverted":
+                raise ValueError("{} reverted in {}".format(step.key, sent["tx"]))
+            if not sent:
+                self._send(step, free_nonce, addresses)
+                free_nonce += 1
+            elif not self._pending(sent, next_nonce):
+                # dropped: the same nonce gives the same contract address
+                self._send(step, sent["nonce"], addresses)
+            batch.append(step.key)
+            if len(batch) >= self.batch_size:
+                self._wait(batch)
+                batch = []
+        self._wait(batch)
+        return self.manifest.addresses()
 
-    treasury = get_address("Treasury address: ")
 
-    publish_source = click.confirm("Verify source on etherscan?")
-    if input("Deploy Contract? y/[N]: ").lower() != "y":
-        return
+def deploy_markets(
+    markets,
+    deployer,
+    manifest_path,
+    perp_lib=None,
+    gas=None,
+    batch_size=16,
+    publish_source=False,
+):
+    """
+    Deploy or finish deploying `markets` from `deployer`. Returns
+    `{market name: (strategy, insurance)}` as contract objects.
+    """
+    deployment = Deployment(deployer, manifest_path, batch_size)
+    manifest = deployment.manifest
+    if perp_lib and "PerpLib" not in manifest.steps:
+        manifest.record("PerpLib", address=perp_lib, nonce=-1, status="confirmed")
+
+    # the entry contracts' init code links the library, so it is mined first
+    deployment.run(plan([], deployer, gas))
+    brownie.PerpLib.at(manifest.steps["PerpLib"]["address"])
+    deployment.run(plan(markets, deployer, gas))
+
+    deployed = {}
+    for market in markets:
+        entry = getattr(brownie, market.entry)
+        strategy = entry.at(manifest.steps[market.name + ".strategy"]["address"])
+        insurance = brownie.StrategyInsurance.at(
+            manifest.steps[market.name + ".insurance"]["address"]
+        )
+        if publish_source:
+            entry.publish_source(strategy)
+            brownie.StrategyInsurance.publish_source(insurance)
+        deployed[market.name] = (strategy, insurance)
+    return deployed
+
 
-    contract = BrownieTemplate.deploy(
-        treasury, {"from": dev}, publish_source=publish_source
+def main(registry="markets.yml", account_id=None, manifest=None, publish="false"):
+    name = network.show_active()
+    if account_id:
+        deployer = accounts.load(account_id, os.environ.get("DEPLOYER_PASSWORD"))
+    else:
+        deployer = accounts[0]
+    settings = network_settings(registry, name)
+    deployed = deploy_markets(
+        load_markets(registry, name),
+        deployer,
+        manifest or "deployments/{}.json".format(name),
+        perp_lib=settings.get("perp_lib"),
+        gas=settings.get("gas"),
+        batch_size=settings.get("batch_size", 16),
+        publish_source=publish.lower() == "true",
     )
+    for market, (strategy, insurance) in deployed.items():
+        print("{}: strategy {} insurance {}".format(market, strategy, insurance))
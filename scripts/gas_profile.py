@@ -0,0 +1,169 @@
+"""
+Gas and external-call profiling of strategy transactions.
+
+`profile_tx` replays a mined transaction with `debug_traceTransaction` and
+reduces the struct logs to the gas each opcode spent (excluding gas forwarded to
+sub-calls), the number of calls made to each target contract and the number of
+storage slots read in each contract, each of which costs a cold SLOAD. Reports are
+plain JSON, keyed by scenario name, so they can be committed as a baseline and
+diffed:
+
+    python -m scripts.gas_profile gas-report.json tests/op/gas_baseline.json
+
+The op test suite builds the report in tests/op/test_gas_profile.py.
+"""
+
+import argparse
+import json
+import sys
+from collections import Counter
+from pathlib import Path
+
+CALL_OPS = ("CALL", "CALLCODE", "DELEGATECALL", "STATICCALL")
+TOP_OPCODES = 15
+
+
+def _target(step):
+    # the address is the second stack item for every call op
+    return "0x{:040x}".format(int(step["stack"][-2], 16) & (2**160 - 1))
+
+
+def summarize_trace(struct_logs, labels=None, to=None):
+    """
+    Reduce `debug_traceTransaction` struct logs to
+    `{"opcodes": {op: gas}, "calls": {target: count}, "storage": {contract: slots}}`.
+
+    Gas is exclusive: a CALL is charged what it cost the caller minus what the
+    callee spent. `labels` maps lowercase addresses to names for `calls` and
+    `storage`; `to` is the transaction's target, whose storage the top frame reads.
+    """
+    labels = labels or {}
+    opcodes = Counter()
+    calls = Counter()
+    # frames entered by a call op: [step index, gas spent by the callee]
+    frames = []
+    # contract whose storage each frame reads; delegate calls keep the caller's
+    contexts = [to.lower() if to else None]
+    slots = set()
+    for i, step in enumerate(struct_logs):
+        op = step["op"]
+        following = struct_logs[i + 1] if i + 1 < len(struct_logs) else None
+
+        if op in CALL_OPS:
+            target = _target(step)
+            calls[labels.get(target, target)] += 1
+        elif op == "SLOAD" and step.get("stack"):
+            slots.add((contexts[-1], int(step["stack"][-1], 16)))
+
+        if following is None or following["depth"] < step["depth"]:
+            # last step of a frame (or a precompile / empty account call)
+            cost = step["gasCost"]
+        elif following["depth"] > step["depth"]:
+            frames.append([i, 0])
+            delegated = op in ("DELEGATECALL", "CALLCODE")
+            contexts.append(contexts[-1] if delegated else _target(step))
+            continue
+        else:
+            cost = step["gas"] - following["gas"]
+        opcodes[op] += cost
+        if frames:
+            frames[-1][1] += cost
+
+        if following is not None and following["depth"] < step["depth"] and frames:
+            contexts.pop()
+            start, child = frames.pop()
+            call = struct_logs[start]
+            inclusive = call["gas"] - following["gas"]
+            opcodes[call["op"]] += inclusive - child
+            if frames:
+                frames[-1][1] += inclusive
+
+    storage = Counter(labels.get(contract, contract) for contract, _ in slots)
+    return {
+        "opcodes": dict(opcodes.most_common(TOP_OPCODES)),
+        "calls": dict(sorted(calls.items())),
+        "storage": {str(k): v for k, v in sorted(storage.items(), key=str)},
+    }
+
+
+def profile_tx(tx, labels=None):
+    """Gas, opcode hotspots, calls and storage reads of a brownie transaction."""
+    # imported here so reports can be diffed without a brownie project
+    from brownie import web3
+
+    trace = web3.provider.make_request(
+        "debug_traceTransaction",
+        [tx.txid, {"disableStorage": True, "disableMemory": True}],
+    )
+    if "error" in trace:
+        raise RuntimeError(trace["error"])
+    labels = {address.lower(): name for address, name in (labels or {}).items()}
+    summary = summarize_trace(trace["result"]["structLogs"], labels, tx.receiver)
+    summary["gas_used"] = tx.gas_used
+    summary["call_count"] = sum(summary["calls"].values())
+    summary["storage_reads"] = sum(summary["storage"].values())
+    return summary
+
+
+def compare(report, baseline, tolerance=0.02):
+    """
+    List regressions of `report` against `baseline`: gas above
+    `baseline * (1 + tolerance)`, or more external calls or storage slots read
+    than before. Scenarios missing from either side are ignored.
+    """
+    regressions = []
+    for name, result in sorted(report.items()):
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        if result["gas_used"] > base["gas_used"] * (1 + tolerance):
+            regressions.append(
+                "{}: gas {} -> {} (+{:.1%})".format(
+                    name,
+                    base["gas_used"],
+                    result["gas_used"],
+                    result["gas_used"] / base["gas_used"] - 1,
+                )
+            )
+        if result["call_count"] > base["call_count"]:
+            regressions.append(
+                "{}: external calls {} -> {}".format(
+                    name, base["call_count"], result["call_count"]
+                )
+            )
+        # baselines from before storage reads were recorded have none
+        if "storage_reads" in base and result["storage_reads"] > base["storage_reads"]:
+            regressions.append(
+                "{}: storage slots read {} -> {}".format(
+                    name, base["storage_reads"], result["storage_reads"]
+                )
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("report")
+    parser.add_argument("baseline")
+    parser.add_argument("--tolerance", type=float, default=0.02)
+    args = parser.parse_args()
+
+    report = json.loads(Path(args.report).read_text())
+    baseline = json.loads(Path(args.baseline).read_text())
+    for name in sorted(report):
+        if name in baseline:
+            print(
+                "{:40} {:>10} {:>+8.2%}".format(
+                    name,
+                    report[name]["gas_used"],
+                    report[name]["gas_used"] / baseline[name]["gas_used"] - 1,
+                )
+            )
+    regressions = compare(report, baseline, args.tolerance)
+    for line in regressions:
+        print("REGRESSION " + line)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
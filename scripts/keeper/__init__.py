@@ -0,0 +1 @@
+"""Off-chain tooling for operating deployed CoreStrategyPerp strategies."""
@@ -0,0 +1,441 @@
+"""
+Event driven keeper for CoreStrategyPerp strategies.
+
+One asyncio process watches any number of strategies. Each new block it pulls
+the ClearingHouse `PositionChanged` logs for the watched markets in a single
+`eth_getLogs`, and only strategies whose market price moved by more than
+`price_move_bps` since their last check (or that have not been checked for
+`max_idle_blocks`) are re-read, all together in one Multicall3 call. An action
+is only sent when the same thresholds `rebalanceDebt`, `rebalanceCollateral`,
+`harvestTrigger` and `tendTrigger` check on chain say it will go through, and
+transactions are sent with locally tracked nonces so several can be in flight.
+
+Strategies given a `RangeOptimizer` (`scripts/sim/tick_range.py`) also have
+their range width kept up to date: every market trade the keeper sees is
+folded into the optimizer, and when a strategy is re-read the keeper sends
+`setTickRangeMultiplier` if the optimizer's width beats the current one by
+more than `range_min_gain`, so the next rebalance opens the new range.
+Strategies given a `HarvestScheduler` (`scripts/sim/harvest.py`) have their
+`pendingRewards` followed the same way, and `setHarvestThreshold` is sent
+when the scheduler's threshold at the current gas price drifts more than
+`threshold_tolerance` from the one on chain, which `harvestTrigger` then uses.
+Strategies in ladder mode (`setLadder`) that need no rebalance get
+`shiftRungs` for the ranges the mark price has left, which moves only those.
+
+Every rebalance, shift, harvest and tend is first simulated against the
+pending block by `scripts/keeper/preflight.py`, all of a round's candidates at
+once, and only sent if it would succeed, with the simulated gas plus
+`gas_margin` as its limit. The ones that would revert are kept in
+`Keeper.rejected` with their decoded reason. Given a `KeeperRouter` (set as
+the strategies' keeper and listing them), the round's candidates that pass go out as one
+`execute` batch and the setters through its `forward`
+(`scripts/keeper/router.py`).
+
+    brownie run keeper/daemon main <keeper account id> <strategy> [<strategy> ...]
+"""
+
+import asyncio
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+from brownie import Contract, accounts, interface, web3
+from brownie.convert import to_address
+from hexbytes import HexBytes
+
+from scripts.sim.tick_range import LOG_TICK
+
+from .preflight import simulate
+from .router import due_action, encode_batch
+from .state import get_multicall, read_states
+
+POSITION_CHANGED_SIG = (
+    "PositionChanged(address,address,int256,int256,uint256,int256,int256,uint256)"
+)
+POSITION_CHANGED = "0x" + bytes(web3.keccak(text=POSITION_CHANGED_SIG)).hex()
+
+
+def _topic(address):
+    return "0x" + address[2:].lower().rjust(64, "0")
+
+
+class NonceManager:
+    """Hands out sequential nonces for one account without waiting for receipts."""
+
+    def __init__(self, account):
+        self.account = account
+        self._lock = None
+        self._next = None
+
+    async def next(self, rpc):
+        # created lazily so the lock binds to the loop that is actually running
+        self._lock = self._lock or asyncio.Lock()
+        async with self._lock:
+            if self._next is None:
+                self._next = await rpc(
+                    web3.eth.get_transaction_count, self.account.address, "pending"
+                )
+            nonce = self._next
+            self._next += 1
+            return nonce
+
+    def reset(self):
+        self._next = None
+
+
+class WatchedStrategy:
+    __slots__ = (
+        "contract",
+        "base_token",
+        "clearing_house",
+        "price",
+        "checked_block",
+        "harvest_block",
+        "pending",
+        "range",
+        "pool",
+        "pool_liquidity",
+        "multiplier",
+        "limits",
+        "want_unit",
+        "harvest",
+        "harvest_threshold",
+    )
+
+    def __init__(self, contract, range_optimizer=None, harvest_scheduler=None):
+        self.contract = contract
+        self.base_token = contract.short()
+        self.clearing_house = contract.clearingHouse()
+        self.price = None
+        self.checked_block = 0
+        self.harvest_block = 0
+        self.pending = None
+        self.range = range_optimizer
+        if range_optimizer is not None:
+            registry = interface.IMarketRegistry(contract.marketRegistery())
+            self.pool = interface.IUniswapV3PoolState(registry.getPool(self.base_token))
+            self.pool_liquidity = self.pool.liquidity() / 1e18
+            self.multiplier = contract.tickRangeMultiplier()
+            self.limits = (
+                contract.minTickRangeMultiplier(),
+                contract.maxTickRangeMultiplier(),
+            )
+        self.harvest = harvest_scheduler
+        if harvest_scheduler is not None:
+            self.harvest_threshold = contract.harvestThreshold()
+        if range_optimizer is not None or harvest_scheduler is not None:
+            decimals = interface.IERC20Extended(contract.want()).decimals()
+            self.want_unit = 10**decimals
+
+
+class Keeper:
+    def __init__(
+        self,
+        strategies,
+        account,
+        multicall=None,
+        price_move_bps=20,
+        max_idle_blocks=300,
+        trigger_interval=50,
+        call_cost=0,
+        max_rpc=4,
+        poll_interval=2.0,
+        ranges=None,
+        range_min_gain=0.0,
+        block_time=2.0,
+        harvests=None,
+        eth_price=2000.0,
+        threshold_tolerance=0.25,
+        gas_margin=0.1,
+        router=None,
+    ):
+        self.account = account
+        self.multicall = multicall or get_multicall()
+        self.price_move_bps = price_move_bps
+        self.max_idle_blocks = max_idle_blocks
+        self.trigger_interval = trigger_interval
+        self.call_cost = call_cost
+        self.poll_interval = poll_interval
+        self.range_min_gain = range_min_gain
+        self.block_time = block_time
+        # USD per ETH, for the gas cost of a harvest; update as the market moves
+        self.eth_price = eth_price
+        self.threshold_tolerance = threshold_tolerance
+        self.gas_margin = gas_margin
+        self.router = router
+        self.nonces = NonceManager(account)
+        self.block = None
+        self.sent = []
+        # (strategy, action, Simulation) of the candidates that would revert
+        self.rejected = []
+
+        self._executor = ThreadPoolExecutor(max_rpc)
+        self._max_rpc = max_rpc
+        self._rpc_slots = None
+        ranges = {to_address(str(s)): r for s, r in (ranges or {}).items()}
+        harvests = {to_address(str(s)): h for s, h in (harvests or {}).items()}
+        self.strategies = [
+            WatchedStrategy(
+                s if hasattr(s, "rebalanceDebt") else Contract(s),
+                ranges.get(to_address(str(s))),
+                harvests.get(to_address(str(s))),
+            )
+            for s in strategies
+        ]
+        self._prices = {}
+
+    async def rpc(self, fn, *args, **kwargs):
+        """Run a blocking brownie/web3 call in the pool, bounded by `max_rpc`."""
+        self._rpc_slots = self._rpc_slots or asyncio.Semaphore(self._max_rpc)
+        async with self._rpc_slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, lambda: fn(*args, **kwargs)
+            )
+
+    async def _poll_prices(self, from_block, to_block):
+        by_house = {}
+        ranged = {}
+        for watched in self.strategies:
+            by_house.setdefault(watched.clearing_house, set()).add(watched.base_token)
+            if watched.range is not None:
+                ranged.setdefault(watched.base_token, []).append(watched)
+        for house, bases in by_house.items():
+            logs = await self.rpc(
+                web3.eth.get_logs,
+                {
+                    "fromBlock": from_block,
+                    "toBlock": to_block,
+                    "address": house,
+                    "topics": [
+                        POSITION_CHANGED,
+                        None,
+                        [_topic(base) for base in sorted(bases)],
+                    ],
+                },
+            )
+            for log in logs:
+                base = to_address("0x" + bytes(HexBytes(log["topics"][2])[-20:]).hex())
+                sqrt_price = int.from_bytes(HexBytes(log["data"])[-32:], "big")
+                # base and quote tokens both have 18 decimals
+                self._prices[base] = (sqrt_price / 2**96) ** 2
+                if base in ranged:
+                    notional = int.from_bytes(HexBytes(log["data"])[32:64], "big")
+                    if notional >= 2**255:
+                        notional = 2**256 - notional
+                    tick = math.floor(math.log(self._prices[base]) / LOG_TICK)
+                    for watched in ranged[base]:
+                        watched.range.observe(
+                            log["blockNumber"] * self.block_time,
+                            tick,
+                            notional / 1e18,
+                            watched.pool_liquidity,
+                        )
+
+    def _moved(self, watched):
+        price = self._prices.get(watched.base_token)
+        if watched.price is None:
+            return True
+        if price is None:
+            return False
+        return abs(price / watched.price - 1) * 10000 >= self.price_move_bps
+
+    async def _triggers(self, watched):
+        contract = watched.contract
+        if await self.rpc(contract.harvestTrigger, self.call_cost):
+            return "harvest"
+        if await self.rpc(contract.tendTrigger, self.call_cost):
+            return "tend"
+        return None
+
+    async def _range(self, watched, state):
+        """The range width to push for `watched`, if any."""
+        watched.pool_liquidity = await self.rpc(watched.pool.liquidity) / 1e18
+        if not state.estimated_total_assets:
+            return None
+        return watched.range.decide(
+            watched.multiplier,
+            state.estimated_total_assets / watched.want_unit,
+            self.range_min_gain,
+            limits=watched.limits,
+        )
+
+    async def _harvest_threshold(self, watched, state):
+        """The harvest threshold to push for `watched`, if any."""
+        if state.pending_rewards is None or not state.estimated_total_assets:
+            return None
+        timestamp = state.block * self.block_time
+        watched.harvest.observe(timestamp, state.pending_rewards / 1e18)
+        gas_price = await self.rpc(lambda: web3.eth.gas_price)
+        threshold = watched.harvest.threshold(
+            state.estimated_total_assets / watched.want_unit,
+            float(watched.harvest.model.harvest_cost(gas_price, self.eth_price)),
+        )
+        if threshold is None:
+            return None
+        # pendingRewards has 18 decimals
+        threshold = int(threshold * 1e18)
+        current = watched.harvest_threshold
+        if current and abs(threshold / current - 1) <= self.threshold_tolerance:
+            return None
+        return threshold
+
+    async def _transact(self, fn, *args, gas_limit=None):
+        nonce = await self.nonces.next(self.rpc)
+        params = {"from": self.account, "nonce": nonce, "required_confs": 0}
+        if gas_limit is not None:
+            params["gas_limit"] = gas_limit
+        try:
+            return await self.rpc(fn, *args, params)
+        except Exception:
+            # the nonce was not used (or is stale): resync from the node
+            self.nonces.reset()
+            raise
+
+    async def _send(self, watched, action, *args, gas_limit=None):
+        fn = getattr(watched.contract, action)
+        if self.router is not None:
+            # the router is the strategies' keeper
+            fn, args = self.router.forward, (watched.contract, fn.encode_input(*args))
+        tx = await self._transact(fn, *args, gas_limit=gas_limit)
+        watched.pending = tx
+        self.sent.append((watched.contract.address, action, tx))
+        return tx
+
+    async def _submit(self, candidates):
+        """Simulate `(watched, action, args)` candidates together; send the ones that pass."""
+        sender = self.account.address if self.router is None else self.router.address
+        simulations = await asyncio.gather(
+            *(
+                self.rpc(
+                    simulate,
+                    web3,
+                    watched.contract.address,
+                    getattr(watched.contract, action).encode_input(*args),
+                    sender,
+                )
+                for watched, action, args in candidates
+            )
+        )
+        passed = []
+        for candidate, simulation in zip(candidates, simulations):
+            if simulation.success:
+                passed.append((candidate, simulation))
+            else:
+                watched, action, _ = candidate
+                self.rejected.append((watched.contract.address, action, simulation))
+        if self.router is not None:
+            return await self._send_batch(passed)
+
+        sent = []
+        for (watched, action, args), simulation in passed:
+            sent.append(
+                await self._send(
+                    watched,
+                    action,
+                    *args,
+                    gas_limit=simulation.gas_limit(self.gas_margin),
+                )
+            )
+        return sent
+
+    async def _send_batch(self, passed):
+        """One `KeeperRouter.execute` for every candidate that passed."""
+        if not passed:
+            return []
+        batch = encode_batch(
+            [(watched.contract.address, action) for (watched, action, _), _ in passed]
+        )
+        # each estimate counts its own base cost, which covers the router's
+        gas_limit = sum(s.gas_limit(self.gas_margin) for _, s in passed)
+        tx = await self._transact(self.router.execute, batch, gas_limit=gas_limit)
+        for (watched, action, _), _ in passed:
+            watched.pending = tx
+            self.sent.append((watched.contract.address, action, tx))
+        return [tx]
+
+    def _settled(self, watched):
+        tx = watched.pending
+        if tx is None:
+            return True
+        if tx.status.name == "Pending":
+            return False
+        watched.pending = None
+        return True
+
+    async def run_once(self):
+        """Process every block since the last call. Returns the transactions sent."""
+        block = await self.rpc(web3.eth.get_block_number)
+        if self.block is not None and block <= self.block:
+            return []
+        from_block = block if self.block is None else self.block + 1
+        self.block = block
+        await self._poll_prices(from_block, block)
+
+        idle = [w for w in self.strategies if self._settled(w)]
+        stale = [
+            w
+            for w in idle
+            if self._moved(w) or block - w.checked_block >= self.max_idle_blocks
+        ]
+        sent = []
+        candidates = []
+        if stale:
+            states = await self.rpc(
+                read_states, [w.contract for w in stale], self.multicall
+            )
+            for watched, state in zip(stale, states):
+                watched.checked_block = state.block
+                if state.spot_price:
+                    watched.price = state.spot_price / 1e18
+                    self._prices[watched.base_token] = watched.price
+                if watched.range is not None:
+                    # sent first so a rebalance in the same round opens the new range
+                    multiplier = await self._range(watched, state)
+                    if multiplier is not None:
+                        sent.append(
+                            await self._send(
+                                watched, "setTickRangeMultiplier", multiplier
+                            )
+                        )
+                        watched.multiplier = multiplier
+                if watched.harvest is not None:
+                    threshold = await self._harvest_threshold(watched, state)
+                    if threshold is not None:
+                        sent.append(
+                            await self._send(watched, "setHarvestThreshold", threshold)
+                        )
+                        watched.harvest_threshold = threshold
+                action = due_action(state)
+                if action == "shiftRungs":
+                    candidates.append((watched, action, (state.rungs_out_of_range,)))
+                elif action:
+                    candidates.append((watched, action, ()))
+
+        busy = {id(watched) for watched, _, _ in candidates}
+        due = [
+            w
+            for w in idle
+            if w.pending is None
+            and id(w) not in busy
+            and block - w.harvest_block >= self.trigger_interval
+        ]
+        for watched in due:
+            watched.harvest_block = block
+        actions = await asyncio.gather(*(self._triggers(w) for w in due))
+        candidates += [(w, action, ()) for w, action in zip(due, actions) if action]
+        sent += await self._submit(candidates)
+        return sent
+
+    async def run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as exc:
+                print("keeper round failed: {!r}".format(exc))
+            await asyncio.sleep(self.poll_interval)
+
+
+def main(account_id, *strategies):
+    keeper = Keeper(strategies, accounts.load(account_id))
+    print("watching {} strategies from {}".format(len(strategies), keeper.account))
+    asyncio.run(keeper.run())
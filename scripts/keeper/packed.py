@@ -0,0 +1,164 @@
+"""
+Packed calldata for the strategy's frequent keeper and tuning calls.
+
+On Optimism most of what a keeper call costs is its L1 data fee, which is paid
+per calldata byte: 16 L1 gas per non-zero byte, 4 per zero byte. ABI calldata
+spends a 4 byte selector and a 32 byte word per argument, mostly zeros, on
+calls whose arguments fit in a few bytes. The strategy's `fallback` takes the
+same calls as one opcode byte followed by each argument big-endian in a fixed
+number of bytes, so `setCollateralThresholds` goes from 132 bytes to 9.
+
+`encode` builds the packed calldata, `abi_calldata` the ABI calldata of the
+same call, and `l1_fee` prices either with the GasPriceOracle (Ecotone)
+formula. `main` runs the comparison against `MockGasPriceOracle`, the local
+stand-in for the predeploy:
+
+    brownie run keeper/packed main --network development
+"""
+
+from dataclasses import dataclass
+
+from .router import TX_L1_GAS, calldata_gas, selector
+
+# name: (opcode, ABI signature, packed size in bytes of each argument)
+CALLS = {
+    "harvest": (0x12, "harvest()", ()),
+    "tend": (0x13, "tend()", ()),
+    "rebalanceDebt": (0x16, "rebalanceDebt()", ()),
+    "rebalanceCollateral": (0x17, "rebalanceCollateral()", ()),
+    "shiftRungs": (0x18, "shiftRungs(uint256)", (1,)),
+    "setHarvestThreshold": (0x19, "setHarvestThreshold(uint256)", (16,)),
+    "setTickRangeMultiplier": (0x1A, "setTickRangeMultiplier(int24)", (3,)),
+    "setDebtThresholds": (0x1B, "setDebtThresholds(uint256,uint256)", (2, 2)),
+    "setCollateralThresholds": (
+        0x1C,
+        "setCollateralThresholds(uint256,uint256,uint256,uint256)",
+        (2, 2, 2, 2),
+    ),
+}
+# arguments the contract reads as signed
+SIGNED = {"setTickRangeMultiplier"}
+DECIMALS = 6
+
+# fee parameters of the benchmark, in the range Optimism mainnet has run at
+# since Ecotone
+DEFAULT_FEES = {
+    "l1_base_fee": 10 * 10**9,
+    "blob_base_fee": 10**6,
+    "base_fee_scalar": 5227,
+    "blob_base_fee_scalar": 1014213,
+}
+
+
+def _arguments(name, args):
+    if name not in CALLS:
+        raise ValueError("no packed form of {}".format(name))
+    _, _, sizes = CALLS[name]
+    if len(args) != len(sizes):
+        raise ValueError("{} takes {} arguments".format(name, len(sizes)))
+    return sizes
+
+
+def encode(name, *args):
+    """
+    Packed calldata of `name(*args)`. Raises ValueError when an argument does
+    not fit its packed size, in which case the ABI function has to be used.
+    """
+    sizes = _arguments(name, args)
+    data = bytes([CALLS[name][0]])
+    for value, size in zip(args, sizes):
+        bits = size * 8
+        if name in SIGNED:
+            if not -(1 << bits - 1) <= value < 1 << bits - 1:
+                raise ValueError("{} does not fit int{}".format(value, bits))
+            value %= 1 << bits
+        elif not 0 <= value < 1 << bits:
+            raise ValueError("{} does not fit uint{}".format(value, bits))
+        data += value.to_bytes(size, "big")
+    return data
+
+
+def abi_calldata(name, *args):
+    """ABI calldata of the same call, for comparison."""
+    _arguments(name, args)
+    _, signature, _ = CALLS[name]
+    return selector(signature) + b"".join(
+        (value % (1 << 256)).to_bytes(32, "big") for value in args
+    )
+
+
+def l1_fee(
+    data,
+    l1_base_fee,
+    blob_base_fee,
+    base_fee_scalar,
+    blob_base_fee_scalar,
+):
+    """L1 data fee, in wei, of a transaction with `data`: GasPriceOracle.getL1Fee."""
+    scaled = base_fee_scalar * 16 * l1_base_fee + blob_base_fee_scalar * blob_base_fee
+    return (calldata_gas(data) + TX_L1_GAS) * scaled // (16 * 10**DECIMALS)
+
+
+@dataclass
+class Saving:
+    name: str
+    abi_bytes: int
+    packed_bytes: int
+    abi_fee: int
+    packed_fee: int
+
+    @property
+    def fee_saved(self):
+        return self.abi_fee - self.packed_fee
+
+
+def benchmark(get_l1_fee, calls):
+    """
+    `Saving` of each `(name, args)` in `calls`, with `get_l1_fee(data)` pricing
+    calldata, e.g. a GasPriceOracle's `getL1Fee` or `l1_fee` with fixed fees.
+    """
+    savings = []
+    for name, args in calls:
+        packed = encode(name, *args)
+        full = abi_calldata(name, *args)
+        savings.append(
+            Saving(name, len(full), len(packed), get_l1_fee(full), get_l1_fee(packed))
+        )
+    return savings
+
+
+# a representative call of each kind
+BENCHMARK_CALLS = [
+    ("harvest", ()),
+    ("tend", ()),
+    ("rebalanceDebt", ()),
+    ("rebalanceCollateral", ()),
+    ("shiftRungs", (0b101,)),
+    ("setHarvestThreshold", (500 * 10**6,)),
+    ("setTickRangeMultiplier", (250,)),
+    ("setDebtThresholds", (9800, 10200)),
+    ("setCollateralThresholds", (6000, 8000, 10000, 20000)),
+]
+
+
+def main():
+    from brownie import MockGasPriceOracle, accounts
+
+    oracle = MockGasPriceOracle.deploy(*DEFAULT_FEES.values(), {"from": accounts[0]})
+    savings = benchmark(oracle.getL1Fee, BENCHMARK_CALLS)
+    print(
+        "{:>24} {:>6} {:>6} {:>14} {:>14} {:>8}".format(
+            "", "abi", "packed", "abi fee", "packed fee", "saved"
+        )
+    )
+    for s in savings:
+        print(
+            "{:>24} {:6d} {:6d} {:14d} {:14d} {:7.1f}%".format(
+                s.name,
+                s.abi_bytes,
+                s.packed_bytes,
+                s.abi_fee,
+                s.packed_fee,
+                100 * s.fee_saved / s.abi_fee,
+            )
+        )
@@ -0,0 +1,131 @@
+"""
+Pre-flight simulation of keeper transactions.
+
+`rebalanceDebt` and friends revert on their own threshold checks (a bare
+`require`, so no reason), on `RL_LIQ` when there is no liquidity, and on Perp
+margin checks inside `addLiquidity`. `simulate` runs a candidate transaction
+with `eth_call` against the pending block, optionally with state overrides
+(`{address: {"balance": ..., "nonce": ..., "code": ..., "stateDiff": ...}}`),
+decodes the revert data when it fails and, when it succeeds, asks
+`eth_estimateGas` for the gas it uses. `preflight` does this for any number of
+candidates at once over a thread pool, and the keeper daemon only sends the
+ones that succeed, with `Simulation.gas_limit` as their gas limit so brownie
+skips its own estimate.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from hexbytes import HexBytes
+
+ERROR_SELECTOR = HexBytes("0x08c379a0")  # Error(string)
+PANIC_SELECTOR = HexBytes("0x4e487b71")  # Panic(uint256)
+PANIC_CODES = {
+    0x01: "assert",
+    0x11: "arithmetic overflow",
+    0x12: "division by zero",
+    0x21: "invalid enum value",
+    0x22: "invalid storage byte array",
+    0x31: "pop on empty array",
+    0x32: "array index out of bounds",
+    0x41: "out of memory",
+    0x51: "uninitialized function",
+}
+
+
+@dataclass
+class Simulation:
+    """Outcome of one candidate; `reason` is "" for a revert without one."""
+
+    to: str
+    data: str
+    success: bool
+    gas: int = None
+    reason: str = None
+
+    def gas_limit(self, margin=0.1):
+        """The estimate with `margin` for state moving before inclusion."""
+        return int(self.gas * (1 + margin))
+
+
+def decode_revert(data):
+    """Human readable reason of the revert `data` an eth_call returned."""
+    data = HexBytes(data or b"")
+    if len(data) == 0:
+        return ""
+    body = bytes(data[4:])
+    if data[:4] == ERROR_SELECTOR:
+        offset = int.from_bytes(body[:32], "big")
+        length = int.from_bytes(body[offset : offset + 32], "big")
+        return body[offset + 32 : offset + 32 + length].decode(errors="replace")
+    if data[:4] == PANIC_SELECTOR:
+        code = int.from_bytes(body[:32], "big")
+        return "Panic({:#x}): {}".format(code, PANIC_CODES.get(code, "unknown"))
+    return "custom error 0x{}".format(bytes(data[:4]).hex())
+
+
+def _revert_data(error):
+    """
+    Revert data out of a JSON-RPC error: geth and its forks put the hex in
+    `data`, ganache nests it as `data.result` (or keys it by transaction hash).
+    """
+    data = error.get("data")
+    if isinstance(data, dict):
+        if "result" in data or "data" in data:
+            return data.get("result", data.get("data"))
+        nested = [v for v in data.values() if isinstance(v, dict) and "return" in v]
+        return nested[0]["return"] if nested else None
+    if isinstance(data, str) and data.startswith("0x"):
+        return data
+    return None
+
+
+def _reason(error):
+    revert = _revert_data(error)
+    if revert is not None:
+        return decode_revert(revert)
+    # nodes that only report the reason in the message
+    message = error.get("message", "")
+    return message.split("revert", 1)[1].strip() if "revert" in message else message
+
+
+def _hex(value):
+    return hex(value) if isinstance(value, int) else value
+
+
+def _overrides(overrides):
+    return {
+        address: {key: _hex(value) for key, value in fields.items()}
+        for address, fields in overrides.items()
+    }
+
+
+def simulate(w3, to, data, sender, block="pending", overrides=None):
+    """`Simulation` of sending `data` to `to` from `sender` at `block`."""
+    tx = {"from": sender, "to": to, "data": data}
+    params = [tx, block]
+    if overrides:
+        params.append(_overrides(overrides))
+    response = w3.provider.make_request("eth_call", params)
+    error = response.get("error")
+    if error:
+        return Simulation(to, data, False, reason=_reason(error))
+
+    # eth_estimateGas only takes overrides on some nodes, so the estimate uses
+    # the unmodified state
+    response = w3.provider.make_request("eth_estimateGas", [tx, block])
+    error = response.get("error")
+    if error:
+        return Simulation(to, data, False, reason=_reason(error))
+    return Simulation(to, data, True, gas=int(response["result"], 16))
+
+
+def preflight(w3, candidates, sender, block="pending", overrides=None, workers=8):
+    """`simulate` every `(to, data)` in `candidates` concurrently, in order."""
+    with ThreadPoolExecutor(workers) as executor:
+        return list(
+            executor.map(
+                lambda c: simulate(w3, c[0], c[1], sender, block, overrides),
+                candidates,
+            )
+        )
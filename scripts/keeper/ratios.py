@@ -0,0 +1,229 @@
+"""
+Integer-exact off-chain port of `shortDeployed`, `calcDebtRatio` and
+`calcCollateral`.
+
+`RatioModel` takes the position state that only changes when the strategy
+transacts (ticks, liquidity, total debt, free collateral) once, then follows
+the market from a stream of `(timestamp, sqrtPriceX96)` updates, e.g. the
+`sqrtPriceAfterX96` of every ClearingHouse `PositionChanged` log. The mark TWAP
+`shortDeployed` uses is rebuilt from the same stream by `TwapTracker`, which
+replays the Uniswap V3 tick accumulator, so no eth_call is needed per swap.
+
+Free collateral is priced by Perp off the index (oracle) price rather than the
+pool, so `calcCollateral` is exact for the `free_collateral` last passed in and
+has to be refreshed from chain with the rest of the position.
+
+In ladder mode the snapshot's ticks and liquidity are the core range's and
+`wings` holds `(lower_tick, upper_tick, liquidity)` for each wing; the short
+is the sum over all of them, as in the contract.
+"""
+
+from bisect import bisect_right
+from dataclasses import dataclass
+
+from scripts.sim.liquidity_amounts import get_amount0_for_liquidity
+from scripts.sim.tickmath import Q96, get_sqrt_ratio_at_tick, get_tick_at_sqrt_ratio
+
+BASIS_PRECISION = 10000
+
+
+def _div(a, b):
+    """Solidity signed division, rounding towards zero."""
+    q = abs(a) // abs(b)
+    return q if (a >= 0) == (b >= 0) else -q
+
+
+def price_x10_18(sqrt_price_x96):
+    """`PerpMath.formatX96ToX10_18(formatSqrtPriceX96ToPriceX96(sqrtPriceX96))`"""
+    return (sqrt_price_x96 * sqrt_price_x96 // Q96) * 10**18 // Q96
+
+
+class TwapTracker:
+    """
+    Tick accumulator of a Uniswap V3 pool, rebuilt from price updates.
+
+    `mean_tick(now)` matches the tick `UniswapV3Broker.getSqrtMarkTwapX96`
+    converts back to a price: `(cumulative(now) - cumulative(now - interval)) /
+    interval`, or the current tick for intervals under 10 seconds.
+    """
+
+    def __init__(self, interval, timestamp, tick, cumulative=0):
+        self.interval = interval
+        # (timestamp, tick cumulative at timestamp, tick from timestamp on)
+        self._points = [(timestamp, cumulative, tick)]
+
+    @classmethod
+    def from_cumulatives(cls, interval, now, cumulatives, tick):
+        """
+        Seed from `pool.observe([interval, interval - 1, ..., 0])` taken at
+        `now`, which pins down the tick for every second of the window.
+        """
+        start = now - interval
+        tracker = cls(interval, start, cumulatives[1] - cumulatives[0], cumulatives[0])
+        for i in range(1, interval):
+            tracker.update(start + i, cumulatives[i + 1] - cumulatives[i])
+        tracker.update(now, tick)
+        return tracker
+
+    @property
+    def tick(self):
+        return self._points[-1][2]
+
+    def update(self, timestamp, tick):
+        last_time, last_cumulative, last_tick = self._points[-1]
+        if timestamp < last_time:
+            raise ValueError("updates must be in time order")
+        if timestamp == last_time:
+            # the accumulator only sees the last tick of a block
+            self._points[-1] = (last_time, last_cumulative, tick)
+        elif tick != last_tick:
+            cumulative = last_cumulative + last_tick * (timestamp - last_time)
+            self._points.append((timestamp, cumulative, tick))
+
+        # keep one point at or before the oldest time a TWAP can ask for
+        oldest = bisect_right(self._points, (timestamp - self.interval, float("inf")))
+        if oldest > 1:
+            del self._points[: oldest - 1]
+
+    def cumulative(self, timestamp):
+        i = bisect_right(self._points, (timestamp, float("inf"))) - 1
+        if i < 0:
+            raise ValueError("{} is older than the tracked window".format(timestamp))
+        point_time, point_cumulative, tick = self._points[i]
+        return point_cumulative + tick * (timestamp - point_time)
+
+    def mean_tick(self, now):
+        if self.interval < 10:
+            return self.tick
+        delta = self.cumulative(now) - self.cumulative(now - self.interval)
+        return _div(delta, self.interval)
+
+
+@dataclass
+class PositionSnapshot:
+    lower_tick: int
+    upper_tick: int
+    liquidity: int
+    total_debt: int
+    debt_multiple: int
+    want_decimals: int
+    free_collateral: int = 0
+    wings: tuple = ()
+
+
+class RatioModel:
+    def __init__(self, position, twap, sqrt_price_x96, timestamp):
+        self.twap = twap
+        self.sqrt_price_x96 = sqrt_price_x96
+        self.timestamp = timestamp
+        self._short = {}
+        self.set_position(position)
+
+    def set_position(self, position):
+        """Swap in new position state after the strategy transacted."""
+        self.position = position
+        self._ranges = [
+            (get_sqrt_ratio_at_tick(lower), get_sqrt_ratio_at_tick(upper), liquidity)
+            for lower, upper, liquidity in (
+                (position.lower_tick, position.upper_tick, position.liquidity),
+            )
+            + tuple(position.wings)
+        ]
+        self._short.clear()
+
+    def update(self, timestamp, sqrt_price_x96, tick=None):
+        """
+        Apply a swap. Pass the pool tick when known: a swap that ends exactly on
+        an initialized tick going down leaves `slot0.tick` one below
+        `getTickAtSqrtRatio(sqrtPriceX96)`.
+        """
+        if tick is None:
+            tick = get_tick_at_sqrt_ratio(sqrt_price_x96)
+        self.twap.update(timestamp, tick)
+        self.sqrt_price_x96 = sqrt_price_x96
+        self.timestamp = timestamp
+
+    def mark_twap_tick(self, now=None):
+        return self.twap.mean_tick(self.timestamp if now is None else now)
+
+    def spot_price(self):
+        return price_x10_18(self.sqrt_price_x96)
+
+    def short_deployed(self, now=None):
+        tick = self.mark_twap_tick(now)
+        # the amount only moves with the TWAP tick, so most swaps hit the cache
+        if tick not in self._short:
+            if len(self._short) > 4096:
+                self._short.clear()
+            sqrt_mark = get_sqrt_ratio_at_tick(tick)
+            self._short[tick] = sum(
+                get_amount0_for_liquidity(max(sqrt_mark, sqrt_lower), sqrt_upper, liq)
+                for sqrt_lower, sqrt_upper, liq in self._ranges
+            )
+        return self._short[tick]
+
+    def debt_ratio(self, now=None):
+        short_amount = self.short_deployed(now)
+        if short_amount == 0:
+            return 0
+        short_amount = short_amount * self.spot_price() // 10**18
+        position = self.position
+        return (
+            position.total_debt
+            * position.debt_multiple
+            // 20000
+            * 10 ** (18 - position.want_decimals)
+            * BASIS_PRECISION
+            // short_amount
+        )
+
+    def collateral_ratio(self):
+        return (
+            self.position.free_collateral * BASIS_PRECISION // self.position.total_debt
+        )
+
+
+def load_model(strategy, vault=None, block="latest"):
+    """
+    Build a `RatioModel` for a deployed strategy from chain state at `block`.
+    `vault` is the strategy's yearn vault, looked up on the explorer if omitted.
+    """
+    # imported here so the model itself works without a brownie project loaded
+    from brownie import Contract, interface, web3
+
+    perp_vault = interface.IVault(strategy.perpVault())
+    base_token = strategy.short()
+    registry = interface.IMarketRegistry(strategy.marketRegistery())
+    pool_address = registry.getPool(base_token)
+    pool = interface.IUniswapV3PoolState(pool_address)
+    vault = vault or Contract(strategy.vault())
+
+    block = web3.eth.get_block(block)
+    kwargs = {"block_identifier": block.number}
+    interval = strategy.twapInterval(**kwargs)
+    sqrt_price, tick = pool.slot0(**kwargs)[:2]
+    if interval < 10:
+        twap = TwapTracker(interval, block.timestamp, tick)
+    else:
+        cumulatives, _ = interface.IUniswapV3PoolDerivedState(pool_address).observe(
+            list(range(interval, -1, -1)), **kwargs
+        )
+        twap = TwapTracker.from_cumulatives(
+            interval, block.timestamp, list(cumulatives), tick
+        )
+
+    wings = []
+    for i in range(strategy.wingCount(**kwargs)):
+        lower, upper = strategy.wings(i, **kwargs)[:2]
+        wings.append((lower, upper, strategy.getRungLiquidity(i + 1, **kwargs)))
+    position = PositionSnapshot(
+        lower_tick=strategy.lowerTick(**kwargs),
+        upper_tick=strategy.upperTick(**kwargs),
+        liquidity=strategy.getRungLiquidity(0, **kwargs),
+        total_debt=vault.strategies(strategy, **kwargs)["totalDebt"],
+        debt_multiple=strategy.debtMultiple(**kwargs),
+        want_decimals=vault.decimals(),
+        free_collateral=perp_vault.getFreeCollateral(strategy, **kwargs),
+        wings=tuple(wings),
+    )
+    return RatioModel(position, twap, sqrt_price, block.timestamp)
@@ -0,0 +1,212 @@
+"""
+Client for `KeeperRouter`, which runs a whole keeper round in one transaction.
+
+With the router set as each strategy's `keeper`, the harvests, tends,
+rebalances and rung shifts of a round go out as one `execute(batch)`, where
+the batch packs 21 bytes per item (strategy address, action byte). That saves
+the 21000 base gas and the L1 data fee overhead of every transaction but one,
+and most of their calldata. Items run one by one, each in its own call, and
+the router returns a bitmap of the ones that succeeded.
+
+`build_batch` picks each strategy's actions from the same state the keeper
+daemon uses, and `benchmark` prices a batch against sending its items one
+transaction each, in L2 gas and L1 calldata gas:
+
+    brownie run keeper/router main <router> <strategy> [<strategy> ...] --network optimism-main
+"""
+
+from dataclasses import dataclass
+
+from eth_utils import keccak, to_checksum_address
+
+from .preflight import simulate
+
+ACTIONS = {
+    "harvest": 0,
+    "tend": 1,
+    "rebalanceDebt": 2,
+    "rebalanceCollateral": 3,
+    "shiftRungs": 4,
+}
+ITEM_SIZE = 21
+MAX_ITEMS = 256
+# what OVM_GasPriceOracle.getL1GasUsed adds for the signature and fields of
+# a transaction on top of its data
+TX_L1_GAS = 68 * 16
+
+
+def selector(signature):
+    return keccak(text=signature)[:4]
+
+
+def encode_batch(items):
+    """Packed `execute` argument of `[(strategy, action), ...]`."""
+    if len(items) > MAX_ITEMS:
+        raise ValueError("at most {} items per batch".format(MAX_ITEMS))
+    return b"".join(
+        bytes.fromhex(to_checksum_address(strategy)[2:]) + bytes([ACTIONS[action]])
+        for strategy, action in items
+    )
+
+
+def decode_batch(batch):
+    names = {code: name for name, code in ACTIONS.items()}
+    return [
+        (to_checksum_address("0x" + batch[i : i + 20].hex()), names[batch[i + 20]])
+        for i in range(0, len(batch), ITEM_SIZE)
+    ]
+
+
+def decode_results(bitmap, n_items):
+    """Success of each item from `execute`'s result bitmap."""
+    return [bool(bitmap >> i & 1) for i in range(n_items)]
+
+
+def execute_calldata(batch):
+    """Calldata of `execute(bytes)`."""
+    padded = batch + b"\0" * (-len(batch) % 32)
+    return (
+        selector("execute(bytes)")
+        + (32).to_bytes(32, "big")
+        + len(batch).to_bytes(32, "big")
+        + padded
+    )
+
+
+def action_calldata(action, mask=0):
+    """Calldata of calling `action` on a strategy directly."""
+    if action == "shiftRungs":
+        return selector("shiftRungs(uint256)") + mask.to_bytes(32, "big")
+    return selector(action + "()")
+
+
+def calldata_gas(data):
+    """L1 gas of `data`: 4 per zero byte, 16 per other byte."""
+    zeros = data.count(0)
+    return zeros * 4 + (len(data) - zeros) * 16
+
+
+def due_action(state):
+    """
+    The rebalance (or rung shift) a `StrategyState` calls for, or None: the
+    checks `rebalanceDebt`, `rebalanceCollateral` and `shiftRungs` make, against
+    the thresholds read in the same state.
+    """
+    if None not in (state.debt_ratio, state.debt_lower, state.debt_upper) and (
+        state.debt_ratio < state.debt_lower or state.debt_ratio > state.debt_upper
+    ):
+        return "rebalanceDebt"
+    if None not in (
+        state.collateral_ratio,
+        state.collat_lower,
+        state.collat_upper,
+    ) and (
+        state.collateral_ratio < state.collat_lower
+        or state.collateral_ratio > state.collat_upper
+    ):
+        return "rebalanceCollateral"
+    if state.wing_count and state.rungs_out_of_range:
+        return "shiftRungs"
+    return None
+
+
+@dataclass
+class Benchmark:
+    items: int
+    individual_gas: int
+    batch_gas: int
+    individual_l1_gas: int
+    batch_l1_gas: int
+
+    @property
+    def gas_saved(self):
+        return self.individual_gas - self.batch_gas
+
+    @property
+    def l1_gas_saved(self):
+        return self.individual_l1_gas - self.batch_l1_gas
+
+
+def benchmark(w3, router, sender, items, masks=None):
+    """
+    Gas of `items` sent as one `execute` from `sender` against sending each on
+    its own from the router (the strategies' keeper), both estimated on the
+    pending block. Items that would revert on their own are left out of both.
+    `masks` gives the `shiftRungs` argument per strategy.
+    """
+    masks = masks or {}
+    individual_gas = individual_l1 = 0
+    kept = []
+    for strategy, action in items:
+        data = action_calldata(action, masks.get(strategy, 0))
+        simulation = simulate(w3, strategy, "0x" + data.hex(), router)
+        if not simulation.success:
+            continue
+        kept.append((strategy, action))
+        individual_gas += simulation.gas
+        individual_l1 += calldata_gas(data) + TX_L1_GAS
+
+    data = execute_calldata(encode_batch(kept))
+    simulation = simulate(w3, router, "0x" + data.hex(), sender)
+    if not simulation.success:
+        raise ValueError("batch reverts: {}".format(simulation.reason))
+    return Benchmark(
+        len(kept),
+        individual_gas,
+        simulation.gas,
+        individual_l1,
+        calldata_gas(data) + TX_L1_GAS,
+    )
+
+
+def build_batch(strategies, multicall=None, call_cost=0):
+    """
+    `(items, masks)` for a round over `strategies`: the rebalance or rung shift
+    each one's state calls for, else a harvest or tend if its trigger is set.
+    """
+    # imported here so the encoding works without a brownie project loaded
+    from .state import read_states
+
+    items, masks = [], {}
+    for strategy, state in zip(strategies, read_states(strategies, multicall)):
+        action = due_action(state)
+        if action is None and strategy.harvestTrigger(call_cost):
+            action = "harvest"
+        elif action is None and strategy.tendTrigger(call_cost):
+            action = "tend"
+        if action is not None:
+            items.append((strategy.address, action))
+        if action == "shiftRungs":
+            masks[strategy.address] = state.rungs_out_of_range
+    return items, masks
+
+
+def execute(router, items, account, gas_limit=None):
+    """Send `items` through `router`; returns the transaction and each item's success."""
+    params = {"from": account}
+    if gas_limit is not None:
+        params["gas_limit"] = gas_limit
+    tx = router.execute(encode_batch(items), params)
+    return tx, decode_results(tx.events["Executed"]["results"], len(items))
+
+
+def main(router, *strategies):
+    from brownie import Contract, web3
+
+    router = Contract(router)
+    strategies = [Contract(s) for s in strategies]
+    items, masks = build_batch(strategies)
+    if not items:
+        print("nothing to do")
+        return
+    result = benchmark(web3, router.address, router.owner(), items, masks)
+    print("{} items".format(result.items))
+    print("{:>12} {:>12} {:>12}".format("", "individual", "batch"))
+    print(
+        "{:>12} {:12d} {:12d}".format("L2 gas", result.individual_gas, result.batch_gas)
+    )
+    print(
+        "{:>12} {:12d} {:12d}".format(
+            "L1 gas", result.individual_l1_gas, result.batch_l1_gas
+        )
+    )
@@ -0,0 +1,104 @@
+"""
+Batched reads of a strategy's view functions.
+
+`read_states` resolves every view a keeper or dashboard needs for any number of
+strategies with a single Multicall3 `aggregate3` eth_call, so all values come
+from the same block and cost one round trip.
+"""
+
+from dataclasses import dataclass
+
+from brownie import Contract, interface, web3
+
+MULTICALL3 = "0xcA11bde05977b3631167028862bE2a173976CA11"
+
+# StrategyState field -> strategy view function
+VIEWS = (
+    ("estimated_total_assets", "estimatedTotalAssets"),
+    ("balance_deployed", "balanceDeployed"),
+    ("short_deployed", "shortDeployed"),
+    ("debt_ratio", "calcDebtRatio"),
+    ("collateral_ratio", "calcCollateral"),
+    ("pending_rewards", "pendingRewards"),
+    ("total_liquidity", "getTotalLiquidity"),
+    ("lower_tick", "lowerTick"),
+    ("upper_tick", "upperTick"),
+    ("wing_count", "wingCount"),
+    ("rungs_out_of_range", "rungsOutOfRange"),
+    ("mark_twap_price", "getBaseTokenMarkTwapPrice"),
+    ("spot_price", "getBaseTokenSpotPrice"),
+    # the bands rebalanceDebt and rebalanceCollateral check, read with the
+    # ratios so a change by governance applies from the next read
+    ("debt_lower", "debtLower"),
+    ("debt_upper", "debtUpper"),
+    ("collat_lower", "collatLower"),
+    ("collat_upper", "collatUpper"),
+)
+
+
+@dataclass
+class StrategyState:
+    """Snapshot of one strategy. Views that reverted are None."""
+
+    __slots__ = ("strategy", "block") + tuple(name for name, _ in VIEWS)
+    strategy: str
+    block: int
+    estimated_total_assets: int
+    balance_deployed: int
+    short_deployed: int
+    debt_ratio: int
+    collateral_ratio: int
+    pending_rewards: int
+    total_liquidity: int
+    lower_tick: int
+    upper_tick: int
+    wing_count: int
+    rungs_out_of_range: int
+    mark_twap_price: int
+    spot_price: int
+    debt_lower: int
+    debt_upper: int
+    collat_lower: int
+    collat_upper: int
+
+
+def get_multicall(address=MULTICALL3):
+    if len(web3.eth.get_code(address)) == 0:
+        raise ValueError("no Multicall3 deployed at {}".format(address))
+    return interface.IMulticall3(address)
+
+
+def read_states(strategies, multicall=None, block=None):
+    """
+    Read a `StrategyState` for each strategy in one eth_call.
+
+    `strategies` are brownie contract objects (or addresses of verified
+    strategies); `block` defaults to latest.
+    """
+    multicall = multicall or get_multicall()
+    strategies = [s if hasattr(s, "calcDebtRatio") else Contract(s) for s in strategies]
+
+    calls = [(multicall.address, False, multicall.getBlockNumber.encode_input())]
+    for strategy in strategies:
+        for _, fn in VIEWS:
+            calls.append((strategy.address, True, getattr(strategy, fn).encode_input()))
+
+    results = multicall.aggregate3.call(calls, block_identifier=block)
+    block_number = multicall.getBlockNumber.decode_output(results[0][1])
+
+    states = []
+    offset = 1
+    for strategy in strategies:
+        values = []
+        for _, fn in VIEWS:
+            success, data = results[offset]
+            offset += 1
+            values.append(
+                int(getattr(strategy, fn).decode_output(data)) if success else None
+            )
+        states.append(StrategyState(strategy.address, block_number, *values))
+    return states
+
+
+def read_state(strategy, multicall=None, block=None):
+    return read_states([strategy], multicall, block)[0]
@@ -0,0 +1,171 @@
+"""
+A local Perp v2 market for tests and simulations on a plain dev chain.
+
+`deploy_perp_stack` deploys the contracts in `contracts/mocks/perp` (Vault,
+ClearingHouse, OrderBook, AccountBalance, Exchange, MarketRegistry,
+ClearingHouseConfig and a vETH/vUSD pool), wires them together and seeds the
+pool with a wide backstop maker so takers and the strategy have depth. The
+strategy is then deployed through the parameterized `PerpStrategy` entry:
+
+    perp = deploy_perp_stack(accounts[9])
+    strategy = PerpStrategy.deploy(vault, perp.strategy_config(), {"from": gov})
+
+The local stack follows Perp's accounting (order debts, taker positions, owed
+realized PnL, free collateral by ratio) with a few simplifications: fees are
+charged in quote at the pool fee ratio, the index price is the pool's spot
+price and there is no funding.
+"""
+
+import math
+from dataclasses import dataclass
+
+from brownie import (
+    MockAccountBalance,
+    MockClearingHouse,
+    MockClearingHouseConfig,
+    MockERC20,
+    MockExchange,
+    MockMarketRegistry,
+    MockOrderBook,
+    MockPerpVault,
+    MockUniswapV3Pool,
+    chain,
+)
+
+MAX_DEADLINE = 2**256 - 1
+
+
+def sqrt_price_x96(price):
+    """Q64.96 square root of `price` (quote per base, both 18 decimals)."""
+    return math.isqrt(int(price * 10**18) << 192) // 10**9
+
+
+@dataclass
+class PerpStack:
+    settlement_token: object
+    quote_token: object
+    base_token: object
+    pool: object
+    clearing_house_config: object
+    market_registry: object
+    order_book: object
+    account_balance: object
+    exchange: object
+    vault: object
+    clearing_house: object
+
+    def strategy_config(
+        self,
+        min_deploy=10**4,
+        min_profit=1,
+        tick_range_multiplier=200,
+        twap_time=0,
+        debt_multiple=10_000,
+    ):
+        """`CoreStrategyPerpConfig` for this market, with `WETHPERP`'s defaults."""
+        return (
+            self.settlement_token,
+            self.base_token,
+            min_deploy,
+            min_profit,
+            self.vault,
+            self.market_registry,
+            self.base_token,
+            tick_range_multiplier,
+            twap_time,
+            debt_multiple,
+        )
+
+    def deposit(self, account, amount):
+        """Mint `amount` of the settlement token to `account` and deposit it as collateral."""
+        self.settlement_token.mint(account, amount, {"from": account})
+        self.settlement_token.approve(self.vault, amount, {"from": account})
+        self.vault.deposit(self.settlement_token, amount, {"from": account})
+
+    def add_liquidity(self, maker, quote, lower_tick, upper_tick):
+        """Add `quote` (18 decimals) and the base worth the same at spot over the range."""
+        price = (self.pool.slot0()[0] / 2**96) ** 2
+        return self.clearing_house.addLiquidity(
+            (
+                self.base_token,
+                int(quote / price),
+                quote,
+                lower_tick,
+                upper_tick,
+                0,
+                0,
+                False,
+                MAX_DEADLINE,
+            ),
+            {"from": maker},
+        )
+
+
+def deploy_perp_stack(
+    owner,
+    price=2000,
+    fee=1000,
+    tick_spacing=60,
+    settlement_decimals=6,
+    backstop=None,
+    backstop_quote=5_000_000 * 10**18,
+    backstop_width=12_000,
+):
+    """
+    Deploy and wire a local Perp market for a vETH pool at `price`.
+
+    `backstop` (default `owner`) deposits collateral and adds `backstop_quote`
+    of vUSD (and the matching vETH) over `backstop_width` ticks either side of
+    the price; pass `backstop_quote=0` for an empty pool. The chain is then
+    moved past the twap interval so mark TWAPs can be read straight away.
+    """
+    tx = {"from": owner}
+    settlement_token = MockERC20.deploy("USD Coin", "USDC", settlement_decimals, tx)
+    quote_token = MockERC20.deploy("Perp vUSD", "vUSD", 18, tx)
+    base_token = MockERC20.deploy("Perp vETH", "vETH", 18, tx)
+
+    config = MockClearingHouseConfig.deploy(tx)
+    registry = MockMarketRegistry.deploy(quote_token, tx)
+    pool = MockUniswapV3Pool.deploy(
+        base_token, quote_token, fee, tick_spacing, sqrt_price_x96(price), tx
+    )
+    registry.addPool(base_token, pool, tx)
+    order_book = MockOrderBook.deploy(registry, tx)
+    account_balance = MockAccountBalance.deploy(registry, order_book, tx)
+    exchange = MockExchange.deploy(registry, tx)
+    vault = MockPerpVault.deploy(
+        settlement_token, config, account_balance, exchange, tx
+    )
+    clearing_house = MockClearingHouse.deploy(
+        vault, config, registry, order_book, account_balance, exchange, tx
+    )
+    for contract in (pool, order_book, account_balance, vault):
+        contract.setClearingHouse(clearing_house, tx)
+    account_balance.setVault(vault, tx)
+
+    stack = PerpStack(
+        settlement_token,
+        quote_token,
+        base_token,
+        pool,
+        config,
+        registry,
+        order_book,
+        account_balance,
+        exchange,
+        vault,
+        clearing_house,
+    )
+    if backstop_quote:
+        maker = backstop or owner
+        # twice the initial margin on the order's base and quote debt
+        stack.deposit(
+            maker, backstop_quote * 4 // 10 // 10 ** (18 - settlement_decimals)
+        )
+        tick = pool.slot0()[1] // tick_spacing * tick_spacing
+        width = backstop_width // tick_spacing * tick_spacing
+        stack.add_liquidity(maker, backstop_quote, tick - width, tick + width)
+
+    chain.sleep(config.getTwapInterval() + 1)
+    chain.mine()
+    return stack
@@ -0,0 +1,157 @@
+"""
+Registry of the Perp markets the strategy is deployed on.
+
+`markets.yml` holds one section per brownie network. A section's `defaults`
+apply to every market in it and each market only lists what differs, which
+for a Perp market on the same vault is usually just its base token:
+
+    optimism-main:
+      defaults:
+        vault: "0x49d7..."
+        want: "0x7F5c..."
+        perp_vault: "0xAD7b..."
+        market_registry: "0xd582..."
+      markets:
+        vETH: {base_token: "0x8C83..."}
+        vBTC: {base_token: "0x86f1...", tick_range_multiplier: 100}
+
+Each market is deployed through the parameterized `PerpStrategy` entry with
+its `CoreStrategyPerpConfig` (see `scripts/deploy.py`); `entry` names a fixed
+entry contract such as `WETHPERP` instead, whose constructor only takes the
+vault. `partial_withdraw` turns on the strategy's partial withdrawals,
+`insurance` overrides `StrategyInsurance` settings and `debt_ratio` adds the
+strategy to the vault.
+"""
+
+from dataclasses import dataclass, field, fields
+from pathlib import Path
+
+import yaml
+from eth_utils import is_address, to_checksum_address
+
+from scripts.sim.insurance import InsuranceConfig, check_config
+
+ADDRESSES = ("vault", "want", "short", "perp_vault", "market_registry", "base_token")
+# StrategyInsurance setter for each InsuranceConfig field
+INSURANCE_SETTERS = {
+    "target_fund_size": "setTargetFundSize",
+    "profit_take_rate": "setProfitTakeRate",
+    "maximum_compensation_rate": "setmaximumCompenstionRate",
+}
+
+
+@dataclass
+class Market:
+    name: str
+    vault: str
+    want: str
+    perp_vault: str
+    market_registry: str
+    base_token: str
+    short: str = None  # the base token unless set
+    # CoreStrategyPerpConfig, with WETHPERP's values as defaults
+    min_deploy: int = 10**4
+    min_profit: int = 1
+    tick_range_multiplier: int = 200
+    twap_time: int = 0
+    debt_multiple: int = 10000
+    # setPartialWithdraw after deployment
+    partial_withdraw: bool = False
+    entry: str = "PerpStrategy"
+    keeper: str = None
+    insurance: dict = field(default_factory=dict)
+    debt_ratio: int = None
+    max_debt_per_harvest: int = 2**256 - 1
+    performance_fee: int = 1000
+
+    def strategy_config(self):
+        """`CoreStrategyPerpConfig` as a tuple, in struct order."""
+        return (
+            self.want,
+            self.short or self.base_token,
+            self.min_deploy,
+            self.min_profit,
+            self.perp_vault,
+            self.market_registry,
+            self.base_token,
+            self.tick_range_multiplier,
+            self.twap_time,
+            self.debt_multiple,
+        )
+
+    def constructor_args(self):
+        if self.entry == "PerpStrategy":
+            return (self.vault, self.strategy_config())
+        return (self.vault,)
+
+
+def check_market(market):
+    """Raises ValueError for settings the constructor or setters would revert on."""
+
+    def fail(reason):
+        raise ValueError("market {}: {}".format(market.name, reason))
+
+    for name in ADDRESSES + ("keeper",):
+        value = getattr(market, name)
+        if value is None and name in ("short", "keeper"):
+            continue
+        if not is_address(value):
+            fail("{} '{}' is not an address".format(name, value))
+    if not 0 < market.tick_range_multiplier < 2**23:
+        fail("tick_range_multiplier must be a positive int24")
+    if not 0 <= market.twap_time < 2**24:
+        fail("twap_time must be a uint24")
+    if not 0 < market.debt_multiple < 2**32:
+        fail("debt_multiple must be a positive uint32")
+    # the strategy stores them as uint96 and uint128
+    if not 0 <= market.min_deploy < 2**96:
+        fail("min_deploy must be a uint96")
+    if not 0 <= market.min_profit < 2**128:
+        fail("min_profit must be a uint128")
+    unknown = set(market.insurance) - set(INSURANCE_SETTERS)
+    if unknown:
+        fail("unknown insurance settings {}".format(sorted(unknown)))
+    if not check_config(InsuranceConfig(**market.insurance)):
+        fail("insurance settings out of range")
+    if market.debt_ratio is not None and not 0 <= market.debt_ratio <= 10000:
+        fail("debt_ratio must be in basis points")
+
+
+def load_markets(path="markets.yml", network=None):
+    """
+    Markets for `network` (every network when None), defaults applied,
+    addresses checksummed and validated.
+    """
+    registry = yaml.safe_load(Path(path).read_text()) or {}
+    if network is not None:
+        if network not in registry:
+            raise ValueError("no markets for network '{}' in {}".format(network, path))
+        registry = {network: registry[network]}
+
+    names = {f.name for f in fields(Market)}
+    markets = []
+    for section in registry.values():
+        defaults = section.get("defaults", {})
+        for name, overrides in (section.get("markets") or {}).items():
+            values = dict(defaults, **(overrides or {}), name=name)
+            values["insurance"] = dict(
+                defaults.get("insurance", {}), **(overrides or {}).get("insurance", {})
+            )
+            unknown = set(values) - names
+            if unknown:
+                raise ValueError(
+                    "market {}: unknown settings {}".format(name, sorted(unknown))
+                )
+            market = Market(**values)
+            check_market(market)
+            for key in ADDRESSES + ("keeper",):
+                if getattr(market, key) is not None:
+                    setattr(market, key, to_checksum_address(getattr(market, key)))
+            markets.append(market)
+    return markets
+
+
+def network_settings(path="markets.yml", network=None):
+    """The non-market keys of a network section (`perp_lib`, `gas`)."""
+    section = (yaml.safe_load(Path(path).read_text()) or {}).get(network) or {}
+    return {k: v for k, v in section.items() if k not in ("defaults", "markets")}
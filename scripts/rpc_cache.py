@@ -0,0 +1,278 @@
+"""
+Caching JSON-RPC proxy for forked test chains.
+
+Ganache forks fetch every storage slot, code blob and balance it touches from
+the upstream node. This proxy sits between ganache and the upstream node, pins
+all state reads to a single block and stores the responses in SQLite, keyed by
+method, params and block. Repeat runs are served from disk; with `offline` set
+a cache miss is returned as an error instead of going upstream.
+
+    python -m scripts.rpc_cache https://mainnet.optimism.io --db .rpc-cache.sqlite
+
+The op test suite starts the proxy itself when the RPC_CACHE environment
+variable points at a cache file (`route_fork`, called from tests/op/conftest.py).
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import sqlite3
+import threading
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# method -> index of the block parameter (None: immutable, no block parameter)
+CACHEABLE = {
+    "eth_getStorageAt": 2,
+    "eth_getCode": 1,
+    "eth_getBalance": 1,
+    "eth_getTransactionCount": 1,
+    "eth_call": 1,
+    "eth_getBlockByNumber": 0,
+    "eth_getBlockByHash": None,
+    "eth_getTransactionByHash": None,
+    "eth_getTransactionReceipt": None,
+    "eth_chainId": None,
+    "net_version": None,
+}
+MOVING_TAGS = ("latest", "pending", "safe", "finalized")
+
+
+class RpcCache:
+    """SQLite backed response store, safe to share between threads and processes."""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, result TEXT)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)"
+        )
+        self._db.commit()
+
+    @staticmethod
+    def key(method, params):
+        raw = json.dumps([method, params], sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT result FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def put(self, key, result):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?)",
+                (key, json.dumps(result)),
+            )
+            self._db.commit()
+
+    def setdefault_meta(self, name, value):
+        """Store `value` unless `name` is already set; returns the stored value."""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR IGNORE INTO meta VALUES (?, ?)", (name, str(value))
+            )
+            self._db.commit()
+            return self._db.execute(
+                "SELECT value FROM meta WHERE name = ?", (name,)
+            ).fetchone()[0]
+
+    def get_meta(self, name):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM meta WHERE name = ?", (name,)
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def set_meta(self, name, value):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO meta VALUES (?, ?)", (name, str(value))
+            )
+            self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+
+class RpcCacheProxy:
+    def __init__(self, upstream, db_path, block=None, offline=False):
+        self.upstream = upstream
+        self.cache = RpcCache(db_path)
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        self.url = None
+        self._ids = itertools.count(1)
+
+        if block is None:
+            stored = self.cache.get_meta("block")
+            if stored is None:
+                # proxies started together on an empty cache (one per xdist
+                # worker) all keep the block the first of them stored
+                latest = int(self._upstream("eth_blockNumber", []), 16)
+                stored = self.cache.setdefault_meta("block", latest)
+            self.block = int(stored)
+        else:
+            self.block = int(block)
+            self.cache.set_meta("block", self.block)
+
+    def _upstream(self, method, params):
+        if self.offline:
+            raise LookupError("{} not cached and proxy is offline".format(method))
+        body = json.dumps(
+            {
+                "jsonrpc": "2.0",
+                "id": next(self._ids),
+                "method": method,
+                "params": params,
+            }
+        ).encode()
+        request = urllib.request.Request(
+            self.upstream, body, {"Content-Type": "application/json"}
+        )
+        with urllib.request.urlopen(request, timeout=60) as response:
+            reply = json.loads(response.read())
+        if "error" in reply:
+            raise RuntimeError(reply["error"])
+        return reply["result"]
+
+    def _pin(self, method, params):
+        index = CACHEABLE[method]
+        params = list(params)
+        if index is None:
+            return params
+        if len(params) <= index:
+            params.extend([None] * (index + 1 - len(params)))
+        tag = params[index]
+        if tag is None or tag in MOVING_TAGS:
+            params[index] = hex(self.block)
+        elif tag == "earliest":
+            params[index] = "0x0"
+        return params
+
+    def call(self, method, params):
+        if method == "eth_blockNumber":
+            return hex(self.block)
+        if method not in CACHEABLE:
+            return self._upstream(method, params)
+
+        params = self._pin(method, params or [])
+        key = RpcCache.key(method, params)
+        result = self.cache.get(key)
+        if result is not None:
+            self.hits += 1
+            return result
+        self.misses += 1
+        result = self._upstream(method, params)
+        if result is not None:
+            self.cache.put(key, result)
+        return result
+
+    def handle(self, payload):
+        if isinstance(payload, list):
+            return [self.handle(item) for item in payload]
+        reply = {"jsonrpc": "2.0", "id": payload.get("id")}
+        try:
+            reply["result"] = self.call(payload["method"], payload.get("params", []))
+        except LookupError as exc:
+            reply["error"] = {"code": -32001, "message": str(exc)}
+        except RuntimeError as exc:
+            reply["error"] = exc.args[0]
+        except (OSError, ValueError) as exc:
+            # upstream unreachable, timed out or not answering JSON
+            reply["error"] = {"code": -32603, "message": str(exc)}
+        return reply
+
+    def serve(self, host="127.0.0.1", port=8546):
+        """Start serving in a daemon thread; returns the HTTP server."""
+        proxy = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.dumps(proxy.handle(json.loads(self.rfile.read(length))))
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body.encode())
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        self.url = "http://{}:{}".format(host, server.server_address[1])
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    @property
+    def fork_url(self):
+        """Value to pass as ganache's `fork` setting."""
+        return "{}@{}".format(self.url, self.block)
+
+
+def route_fork(cmd_settings, networks, environ):
+    """
+    Pin the `fork` of a brownie network's ganache `cmd_settings` to the block
+    FORK_BLOCK names in `environ` and, when RPC_CACHE names a cache file, send
+    it through a `RpcCacheProxy` on that file (offline with RPC_CACHE_OFFLINE=1).
+    `networks` resolves a fork given as a network id. Returns the proxy, if any.
+    """
+    if "fork" not in cmd_settings:
+        return None
+    fork = cmd_settings["fork"]
+    if fork in networks:
+        fork = networks[fork]["host"]
+    fork = fork.split("@")[0]
+    fork_block = environ.get("FORK_BLOCK")
+
+    cache_path = environ.get("RPC_CACHE")
+    if cache_path:
+        proxy = RpcCacheProxy(
+            fork,
+            cache_path,
+            block=fork_block,
+            offline=environ.get("RPC_CACHE_OFFLINE") == "1",
+        )
+        proxy.serve(port=0)
+        cmd_settings["fork"] = proxy.fork_url
+        return proxy
+    if fork_block:
+        cmd_settings["fork"] = "{}@{}".format(fork, fork_block)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("upstream")
+    parser.add_argument("--db", default=".rpc-cache.sqlite")
+    parser.add_argument("--port", type=int, default=8546)
+    parser.add_argument("--block", type=int)
+    parser.add_argument("--offline", action="store_true")
+    args = parser.parse_args()
+
+    proxy = RpcCacheProxy(args.upstream, args.db, args.block, args.offline)
+    server = proxy.serve(port=args.port)
+    print(
+        "caching {} at block {} on http://127.0.0.1:{}".format(
+            args.upstream, proxy.block, args.port
+        )
+    )
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
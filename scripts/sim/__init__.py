@@ -0,0 +1,3 @@
+"""Off-chain models of the CoreStrategyPerp contracts for backtesting."""
+
+from .strategy import Market, SimConfig, SimResult, StrategySim, gbm_paths, simulate
@@ -0,0 +1,332 @@
+"""
+Break a deployed strategy's PnL down per harvest.
+
+`Attribution` reads the strategy's event history from an archive node and
+splits what each harvest reported to the vault (`StrategyReported` gain minus
+loss) into:
+
+- `fees`: maker fees collected (`LiquidityChanged.quoteFee`), which happens
+  whenever liquidity is removed, including `_collectPendingFees`.
+- `funding`: funding received (`-FundingPaymentSettled.fundingPayment`).
+- `execution`: the cost of the strategy's own taker trades
+  (`PositionChanged`, from `openPosition` and `closePosition`) against the
+  market price before each of them. `taker_fees` is the fee part of it.
+- `insurance`: compensation received from minus payments requested by the
+  `StrategyInsurance` fund.
+- `il`: the rest, which is the divergence between the liquidity position
+  and its hedge (impermanent loss) plus any PnL not covered above.
+
+All amounts are in USD. The market price before a trade is the price after
+the previous `PositionChanged` of any trader in the same market, so the
+market's trades are read as well as the strategy's.
+
+Runs are incremental. Each finished harvest is appended to a `ColumnStore`
+(`<out_dir>/harvests`), and the running sums of the open harvest interval
+are saved with the last block processed in `<out_dir>/checkpoint.json`. A
+re-run after new blocks only fetches and folds the blocks after the
+checkpoint:
+
+    python -m scripts.sim.attribution https://archive.node <strategy> attribution \\
+        --from-block 50000000
+"""
+
+import argparse
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from eth_utils import to_checksum_address
+from hexbytes import HexBytes
+from web3 import Web3
+
+from .ingest import _get_logs, _signed, _topic, _topic_hex, _words
+from .store import ColumnStore
+
+POSITION_CHANGED = _topic(
+    "PositionChanged(address,address,int256,int256,uint256,int256,int256,uint256)"
+)
+LIQUIDITY_CHANGED = _topic(
+    "LiquidityChanged(address,address,address,int24,int24,int256,int256,int128,uint256)"
+)
+FUNDING_PAYMENT_SETTLED = _topic("FundingPaymentSettled(address,address,int256)")
+STRATEGY_REPORTED = _topic(
+    "StrategyReported(address,uint256,uint256,uint256,uint256,uint256,uint256,uint256,uint256)"
+)
+INSURANCE_PAYMENT = _topic("InsurancePayment(uint256,uint256,uint256)")
+INSURANCE_PAYOUT = _topic("InsurancePayout(uint256)")
+
+COMPONENTS = ("fees", "funding", "execution", "taker_fees", "insurance")
+ATTRIBUTION_COLUMNS = (
+    ("block", "<u8", ()),
+    ("timestamp", "<u8", ()),
+    # gain - loss reported to the vault
+    ("pnl", "<f8", ()),
+    ("fees", "<f8", ()),
+    ("funding", "<f8", ()),
+    ("execution", "<f8", ()),
+    ("taker_fees", "<f8", ()),
+    ("insurance", "<f8", ()),
+    ("il", "<f8", ()),
+    ("trades", "<u4", ()),
+    ("liquidity_changes", "<u4", ()),
+)
+
+STRATEGY_ABI = [
+    {
+        "name": name,
+        "type": "function",
+        "stateMutability": "view",
+        "inputs": [],
+        "outputs": [{"name": "", "type": "address"}],
+    }
+    for name in ("vault", "perpVault", "short", "insurance", "want")
+]
+GETTER_ABI = [
+    {
+        "name": name,
+        "type": "function",
+        "stateMutability": "view",
+        "inputs": [],
+        "outputs": [{"name": "", "type": output}],
+    }
+    for name, output in (("getClearingHouse", "address"), ("decimals", "uint8"))
+]
+
+
+def _topic_address(address):
+    return "0x" + address[2:].lower().rjust(64, "0")
+
+
+def _address(topic):
+    return to_checksum_address(_topic_hex(topic)[-40:])
+
+
+def _uint_field(log, words, position):
+    """
+    Field `position` of an event of uint256 fields. Funds deployed before the
+    telemetry schema indexed all of them, so they are read from the topics.
+    """
+    if words:
+        return words[position]
+    return int.from_bytes(HexBytes(log["topics"][position + 1]), "big")
+
+
+def _empty_interval():
+    interval = {name: 0.0 for name in COMPONENTS}
+    interval.update(trades=0, liquidity_changes=0)
+    return interval
+
+
+class Attribution:
+    def __init__(
+        self,
+        out_dir,
+        strategy,
+        vault,
+        clearing_house,
+        base_token,
+        insurance=None,
+        want_decimals=6,
+    ):
+        self.out_dir = Path(out_dir)
+        self.strategy = to_checksum_address(strategy)
+        self.vault = to_checksum_address(vault)
+        self.clearing_house = to_checksum_address(clearing_house)
+        self.base_token = to_checksum_address(base_token)
+        # a strategy without a fund reports the zero address
+        self.insurance = (
+            to_checksum_address(insurance) if insurance and int(insurance, 16) else None
+        )
+        self.want_unit = 10**want_decimals
+        self.store = ColumnStore(self.out_dir / "harvests", ATTRIBUTION_COLUMNS)
+
+        self._checkpoint_path = self.out_dir / "checkpoint.json"
+        if self._checkpoint_path.exists():
+            self.checkpoint = json.loads(self._checkpoint_path.read_text())
+        else:
+            self.checkpoint = {
+                "last_block": -1,
+                "sqrt_price_x96": None,
+                "interval": _empty_interval(),
+            }
+        # rows of a range that was stored before its checkpoint was written
+        blocks = self.store.column("block")
+        self._stored_through = int(blocks[-1]) if len(blocks) else -1
+
+    @classmethod
+    def from_strategy(cls, w3, strategy, out_dir):
+        """Look the vault, market and insurance fund up from the strategy."""
+        contract = w3.eth.contract(to_checksum_address(strategy), abi=STRATEGY_ABI)
+        perp_vault = w3.eth.contract(
+            contract.functions.perpVault().call(), abi=GETTER_ABI
+        )
+        want = w3.eth.contract(contract.functions.want().call(), abi=GETTER_ABI)
+        return cls(
+            out_dir,
+            strategy,
+            contract.functions.vault().call(),
+            perp_vault.functions.getClearingHouse().call(),
+            contract.functions.short().call(),
+            contract.functions.insurance().call(),
+            want.functions.decimals().call(),
+        )
+
+    @property
+    def last_block(self):
+        return self.checkpoint["last_block"]
+
+    def fetch_range(self, w3, start, end):
+        """The logs attribution needs for `[start, end]`, in chain order, and report timestamps."""
+        base = {"fromBlock": start, "toBlock": end}
+        strategy = _topic_address(self.strategy)
+        logs = _get_logs(
+            w3,
+            dict(
+                base,
+                address=self.clearing_house,
+                topics=[POSITION_CHANGED, None, _topic_address(self.base_token)],
+            ),
+        )
+        logs += _get_logs(
+            w3,
+            dict(
+                base,
+                address=self.clearing_house,
+                topics=[[LIQUIDITY_CHANGED, FUNDING_PAYMENT_SETTLED], strategy],
+            ),
+        )
+        logs += _get_logs(
+            w3, dict(base, address=self.vault, topics=[STRATEGY_REPORTED, strategy])
+        )
+        if self.insurance:
+            logs += _get_logs(
+                w3,
+                dict(
+                    base,
+                    address=self.insurance,
+                    topics=[[INSURANCE_PAYMENT, INSURANCE_PAYOUT]],
+                ),
+            )
+        logs.sort(key=lambda log: (int(log["blockNumber"]), int(log["logIndex"])))
+        reports = {
+            int(log["blockNumber"])
+            for log in logs
+            if _topic_hex(log["topics"][0]) == STRATEGY_REPORTED
+        }
+        timestamps = {b: int(w3.eth.get_block(b)["timestamp"]) for b in reports}
+        return logs, timestamps
+
+    def _fold(self, logs, timestamps):
+        """Fold logs (in chain order) into the open interval; returns the finished harvests."""
+        interval = self.checkpoint["interval"]
+        sqrt_price = self.checkpoint["sqrt_price_x96"]
+        rows = []
+        for log in logs:
+            topic = _topic_hex(log["topics"][0])
+            words = _words(log["data"])
+            if topic == POSITION_CHANGED:
+                if _address(log["topics"][1]) == self.strategy:
+                    size, notional = _signed(words[0]), _signed(words[1])
+                    # price before the trade, falling back to the price after it
+                    price = ((sqrt_price or words[5]) / 2**96) ** 2
+                    # notional includes the fee; both are 18 decimals
+                    interval["execution"] += (notional + size * price) / 1e18
+                    interval["taker_fees"] -= words[2] / 1e18
+                    interval["trades"] += 1
+                sqrt_price = words[5]
+            elif topic == LIQUIDITY_CHANGED:
+                interval["fees"] += words[-1] / 1e18
+                interval["liquidity_changes"] += 1
+            elif topic == FUNDING_PAYMENT_SETTLED:
+                interval["funding"] -= _signed(words[0]) / 1e18
+            elif topic == INSURANCE_PAYMENT:
+                interval["insurance"] -= _uint_field(log, words, 2) / self.want_unit
+            elif topic == INSURANCE_PAYOUT:
+                interval["insurance"] += _uint_field(log, words, 0) / self.want_unit
+            elif topic == STRATEGY_REPORTED:
+                block = int(log["blockNumber"])
+                pnl = (words[0] - words[1]) / self.want_unit
+                explained = sum(
+                    interval[name] for name in COMPONENTS if name != "taker_fees"
+                )
+                if block > self._stored_through:
+                    rows.append(
+                        (
+                            block,
+                            timestamps[block],
+                            pnl,
+                            interval["fees"],
+                            interval["funding"],
+                            interval["execution"],
+                            interval["taker_fees"],
+                            interval["insurance"],
+                            pnl - explained,
+                            interval["trades"],
+                            interval["liquidity_changes"],
+                        )
+                    )
+                interval = _empty_interval()
+        self.checkpoint["interval"] = interval
+        self.checkpoint["sqrt_price_x96"] = sqrt_price
+        return rows
+
+    def process(self, logs, timestamps, last_block):
+        """
+        Fold the logs of the blocks up to `last_block`, store the harvests they
+        finish and move the checkpoint to `last_block`.
+        """
+        rows = self._fold(logs, timestamps)
+        columns = list(zip(*rows)) or [[]] * len(ATTRIBUTION_COLUMNS)
+        self.store.append(
+            {name: col for (name, _, _), col in zip(ATTRIBUTION_COLUMNS, columns)},
+            last_block,
+        )
+        self.checkpoint["last_block"] = last_block
+        tmp = self._checkpoint_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.checkpoint, indent=2))
+        os.replace(tmp, self._checkpoint_path)
+
+    def run(self, w3, from_block=0, to_block=None, chunk=2000, workers=8):
+        """Process `[from_block, to_block]` (default: latest) after the checkpoint."""
+        start = max(from_block, self.last_block + 1)
+        end = w3.eth.block_number if to_block is None else to_block
+        ranges = [(s, min(s + chunk - 1, end)) for s in range(start, end + 1, chunk)]
+        with ThreadPoolExecutor(workers) as executor:
+            window = workers * 4
+            for offset in range(0, len(ranges), window):
+                batch = ranges[offset : offset + window]
+                fetched = executor.map(lambda r: self.fetch_range(w3, *r), batch)
+                for (_, range_end), (logs, timestamps) in zip(batch, fetched):
+                    self.process(logs, timestamps, range_end)
+        return self.store
+
+    def harvests(self):
+        """Every stored harvest as a dict of arrays."""
+        return {name: self.store.column(name)[:] for name, _, _ in ATTRIBUTION_COLUMNS}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("rpc")
+    parser.add_argument("strategy")
+    parser.add_argument("out_dir")
+    parser.add_argument("--from-block", type=int, default=0)
+    parser.add_argument("--to-block", type=int)
+    parser.add_argument("--chunk", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    w3 = Web3(Web3.HTTPProvider(args.rpc, request_kwargs={"timeout": 60}))
+    attribution = Attribution.from_strategy(w3, args.strategy, args.out_dir)
+    store = attribution.run(
+        w3, args.from_block, args.to_block, args.chunk, args.workers
+    )
+    harvests = attribution.harvests()
+    print("{} harvests up to block {}".format(store.rows, store.last_block))
+    for name in ("pnl", "fees", "funding", "execution", "insurance", "il"):
+        print("{:>10} {:14.2f}".format(name, harvests[name].sum()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""
+When to harvest: the profit-maximizing cadence for a strategy.
+
+A harvest costs gas (`gas_used` at the L2 gas price plus the L1 data fee) and
+turns the maker fees accrued since the last one (`pendingRewards`) into
+reported profit, which the vault lends back at the same harvest. Fees that
+are still pending earn nothing, so waiting `T` seconds between harvests costs
+`a * (1 - take) * r * T / 2` per second in missed compounding, where `r` is
+the fee accrual rate, `a` the yield the redeployed fees would earn and `take`
+the share of profit paid to `StrategyInsurance`. `HarvestScheduler` scores a
+grid of candidate intervals against `cost / T` plus that and gives the
+`pendingRewards` threshold to harvest at, `r * T`. With `a` taken as the
+strategy's own fee yield, `r / capital`, the best threshold is
+`sqrt(2 * cost * capital / (1 - take))`, whatever the accrual rate.
+
+`CoreStrategyPerp.setHarvestThreshold` makes `harvestTrigger` wait for that
+threshold between `minReportDelay` and `maxReportDelay`; the keeper daemon
+keeps it up to date.
+
+`backtest` replays the fee accrual of a recorded history (the metrics a
+`Replay` writes) under any number of schedules at once and reports what each
+would have earned:
+
+    python -m scripts.sim.harvest <metrics dir> --gas-price-gwei 0.01 --eth-price 1800
+"""
+
+import argparse
+from dataclasses import dataclass
+
+import numpy as np
+
+from .metrics import ACTIONS, METRIC_COLUMNS
+from .store import ColumnStore
+
+BPS_MAX = 10000
+SCHEDULE_METRICS = ("harvests", "gas", "harvested", "insurance", "forgone", "net")
+
+
+@dataclass
+class HarvestModel:
+    gas_used: int = 3_000_000
+    # L1 data fee of a harvest transaction, in USD
+    l1_fee: float = 0.0
+    # StrategyInsurance.profitTakeRate, in basis points
+    insurance_take: int = 1000
+    # yield per second of redeployed fees, the strategy's fee yield when None
+    reinvest_yield: float = None
+    # BaseStrategy report delays, in seconds
+    min_report_delay: int = 14400
+    max_report_delay: int = 21600
+
+    def harvest_cost(self, gas_price, eth_price):
+        """USD cost of one harvest at `gas_price` (wei) and `eth_price` (USD)."""
+        return np.asarray(gas_price) * self.gas_used / 1e18 * eth_price + self.l1_fee
+
+
+class HarvestScheduler:
+    def __init__(
+        self,
+        model=None,
+        half_life=3 * 86400.0,
+        min_interval=600.0,
+        max_interval=30 * 86400.0,
+        candidates=4096,
+    ):
+        self.model = model or HarvestModel()
+        self.decay = np.log(2) / half_life
+        self.intervals = np.geomspace(min_interval, max_interval, candidates)
+        # exponentially weighted accrued fees and elapsed seconds
+        self._sums = np.zeros(2)
+        self._time = None
+        self._pending = None
+
+    @property
+    def rate(self):
+        """Maker fees accrued per second, in USD."""
+        return self._sums[0] / self._sums[1] if self._sums[1] else 0.0
+
+    def observe(self, timestamp, pending):
+        """
+        Fold in `pendingRewards` (in USD) at `timestamp`. A drop means fees
+        were collected by a harvest or rebalance, so all of `pending` is new.
+        """
+        if self._time is not None:
+            elapsed = max(timestamp - self._time, 0)
+            accrued = pending - self._pending if pending >= self._pending else pending
+            self._sums *= np.exp(-self.decay * elapsed)
+            self._sums += (accrued, elapsed)
+        self._time = max(timestamp, self._time or timestamp)
+        self._pending = pending
+
+    def _yield(self, capital, rate):
+        if self.model.reinvest_yield is not None:
+            return self.model.reinvest_yield
+        return rate / capital
+
+    def objective(self, capital, cost, rate=None):
+        """
+        Net USD per second of harvesting every candidate interval. `cost` may
+        be an array of gas cost scenarios, which gives one row each.
+        """
+        rate = self.rate if rate is None else rate
+        cost = np.asarray(cost, dtype=np.float64)[..., None]
+        keep = 1 - self.model.insurance_take / BPS_MAX
+        forgone = self._yield(capital, rate) * keep * rate * self.intervals / 2
+        return keep * rate - cost / self.intervals - forgone
+
+    def interval(self, capital, cost, rate=None):
+        """`(seconds, net USD per second)` of the best interval, ignoring the report delays."""
+        rates = self.objective(capital, cost, rate)
+        if rates.ndim > 1:
+            rates = rates.mean(axis=0)
+        index = int(np.argmax(rates))
+        return float(self.intervals[index]), float(rates[index])
+
+    def threshold(self, capital, cost, rate=None):
+        """
+        The `pendingRewards` (USD) to harvest at, or None before any accrual
+        was observed. Outside the report delays the delays decide instead.
+        """
+        rate = self.rate if rate is None else rate
+        if rate <= 0:
+            return None
+        seconds, _ = self.interval(capital, cost, rate)
+        return rate * seconds
+
+
+def accrued_fees(pending):
+    """Cumulative fees from a `pendingRewards` series that resets when collected."""
+    pending = np.asarray(pending, dtype=np.float64)
+    steps = np.diff(pending, prepend=pending[:1])
+    # a drop is a collection: everything pending afterwards is new
+    steps = np.where(steps < 0, pending, steps)
+    return np.cumsum(steps)
+
+
+def backtest(
+    timestamps,
+    accrued,
+    thresholds,
+    min_delays,
+    max_delays,
+    cost,
+    reinvest_yield,
+    insurance_take=1000,
+):
+    """
+    Replay cumulative fees `accrued` (USD, at `timestamps`) under one schedule
+    per element of `thresholds`, `min_delays` and `max_delays`, as
+    `harvestTrigger` with a threshold would run them: no harvest before the
+    minimum delay, a harvest at the maximum delay, and in between as soon as
+    the fees accrued since the last harvest reach the threshold. A fixed
+    interval `T` is threshold 0 with both delays `T`. `cost` is the USD cost
+    of a harvest at each timestamp (or one for all).
+
+    Returns a dict of per-schedule arrays: `harvests`, `gas`, `harvested`
+    fees, the `insurance` take, the compounding `forgone` while fees were
+    pending, and `net` (accrued fees after the take, less gas and forgone).
+    """
+    t = np.asarray(timestamps, dtype=np.float64)
+    fees = np.asarray(accrued, dtype=np.float64)
+    n = len(t)
+    thresholds, min_delays, max_delays = np.broadcast_arrays(
+        *(np.asarray(x, dtype=np.float64) for x in (thresholds, min_delays, max_delays))
+    )
+    cost = np.broadcast_to(np.asarray(cost, dtype=np.float64), (n,))
+    keep = 1 - insurance_take / BPS_MAX
+    # integral of the fees from the start up to each timestamp
+    area = np.concatenate(([0.0], np.cumsum(fees[:-1] * np.diff(t))))
+
+    last = np.zeros(thresholds.shape, dtype=np.int64)
+    result = {name: np.zeros(thresholds.shape) for name in SCHEDULE_METRICS}
+    active = np.ones(thresholds.shape, dtype=bool)
+    while active.any():
+        earliest = np.searchsorted(t, t[last] + min_delays)
+        reached = np.searchsorted(fees, fees[last] + thresholds)
+        latest = np.searchsorted(t, t[last] + max_delays)
+        following = np.minimum(np.maximum(earliest, reached), latest)
+        following = np.maximum(following, last + 1)
+        active &= following < n
+        at = np.where(active, following, last)
+        result["harvests"] += active
+        result["gas"] += np.where(active, cost[np.minimum(at, n - 1)], 0)
+        result["harvested"] += fees[at] - fees[last]
+        result["forgone"] += area[at] - area[last] - fees[last] * (t[at] - t[last])
+        last = at
+    # fees still pending at the end
+    result["forgone"] += area[-1] - area[last] - fees[last] * (t[-1] - t[last])
+    result["forgone"] *= reinvest_yield * keep
+    result["insurance"] = result["harvested"] * (1 - keep)
+    result["net"] = fees[-1] * keep - result["gas"] - result["forgone"]
+    return result
+
+
+def load_history(metrics_dir, want_decimals=6):
+    """`(timestamps, accrued fees, capital, harvest timestamps)` of a `Replay` metrics store."""
+    store = ColumnStore(metrics_dir, METRIC_COLUMNS)
+    timestamps = store.column("timestamp")[:].astype(np.float64)
+    pending = np.nan_to_num(store.column("pending_rewards")[:]) / 1e18
+    capital = np.nan_to_num(store.column("estimated_total_assets")[:])
+    harvested = store.column("actions")[:] & (1 << ACTIONS.index("harvest")) > 0
+    return (
+        timestamps,
+        accrued_fees(pending),
+        capital / 10**want_decimals,
+        timestamps[harvested],
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("metrics_dir")
+    parser.add_argument("--want-decimals", type=int, default=6)
+    parser.add_argument("--gas-used", type=int, default=3_000_000)
+    parser.add_argument("--gas-price-gwei", type=float, default=0.001)
+    parser.add_argument("--eth-price", type=float, default=2000.0)
+    parser.add_argument("--l1-fee", type=float, default=0.0)
+    parser.add_argument("--insurance-take", type=int, default=1000)
+    args = parser.parse_args()
+
+    model = HarvestModel(
+        gas_used=args.gas_used, l1_fee=args.l1_fee, insurance_take=args.insurance_take
+    )
+    cost = float(model.harvest_cost(args.gas_price_gwei * 1e9, args.eth_price))
+    timestamps, accrued, capital, _ = load_history(args.metrics_dir, args.want_decimals)
+    duration = timestamps[-1] - timestamps[0]
+    rate = (accrued[-1] - accrued[0]) / duration
+    capital = float(np.mean(capital))
+    scheduler = HarvestScheduler(model)
+    reinvest = scheduler._yield(capital, rate)
+    threshold = scheduler.threshold(capital, cost, rate)
+
+    names = ["every report (minProfit)", "optimized threshold"]
+    thresholds = [0.0, threshold or 0.0]
+    min_delays = [model.min_report_delay] * 2
+    max_delays = [model.max_report_delay] * 2
+    for hours in (1, 6, 24, 72, 168):
+        names.append("every {}h".format(hours))
+        thresholds.append(0.0)
+        min_delays.append(hours * 3600)
+        max_delays.append(hours * 3600)
+    result = backtest(
+        timestamps,
+        accrued,
+        thresholds,
+        min_delays,
+        max_delays,
+        cost,
+        reinvest,
+        model.insurance_take,
+    )
+    print(
+        "{:.0f} days, {:.2f} USD of fees, {:.4f} USD per harvest, threshold {}".format(
+            duration / 86400, accrued[-1], cost, threshold
+        )
+    )
+    print("{:>26}".format("") + "".join("{:>12}".format(m) for m in SCHEDULE_METRICS))
+    for i, name in enumerate(names):
+        print(
+            "{:>26}".format(name)
+            + "".join("{:12.2f}".format(result[m][i]) for m in SCHEDULE_METRICS)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+"""
+Pull Perp market history from an archive node into memory-mappable columns.
+
+`ingest` reads the Uniswap V3 `Swap`, `Mint` and `Burn` logs of a Perp pool
+(and optionally the Exchange `FundingUpdated` logs of its base token) in
+fixed-size block ranges fetched by a thread pool, and appends them in block
+order to two `ColumnStore`s under `out_dir`: `pool` and `funding`. Re-running
+continues from the last block stored, so the same command keeps a history up
+to date.
+
+    python -m scripts.sim.ingest https://archive.node <pool> history \\
+        --from-block 2000000 --exchange <exchange> --base-token <vETH>
+
+Replays read the columns with `ColumnStore.iter_chunks`, which never loads a
+whole file.
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from eth_utils import keccak, to_checksum_address
+from hexbytes import HexBytes
+from web3 import Web3
+
+from .store import ColumnStore, uint_column
+
+SWAP, MINT, BURN = 0, 1, 2
+
+POOL_COLUMNS = (
+    ("block", "<u8", ()),
+    ("log_index", "<u4", ()),
+    ("timestamp", "<u8", ()),
+    ("kind", "u1", ()),
+    # pool state after the event; Mint and Burn carry the last swap's values
+    ("tick", "<i4", ()),
+    ("sqrt_price_x96", "u1", (20,)),
+    ("price", "<f8", ()),
+    # active liquidity after a swap, or the liquidity minted / burned
+    ("liquidity", "u1", (16,)),
+    ("tick_lower", "<i4", ()),
+    ("tick_upper", "<i4", ()),
+    ("amount0", "<f8", ()),
+    ("amount1", "<f8", ()),
+)
+FUNDING_COLUMNS = (
+    ("block", "<u8", ()),
+    ("log_index", "<u4", ()),
+    ("timestamp", "<u8", ()),
+    ("mark_twap", "<f8", ()),
+    ("index_twap", "<f8", ()),
+)
+
+
+def _topic(signature):
+    return "0x" + keccak(text=signature).hex()
+
+
+TOPICS = {
+    _topic("Swap(address,address,int256,int256,uint160,uint128,int24)"): SWAP,
+    _topic("Mint(address,address,int24,int24,uint128,uint256,uint256)"): MINT,
+    _topic("Burn(address,int24,int24,uint128,uint256,uint256)"): BURN,
+}
+FUNDING_UPDATED = _topic("FundingUpdated(address,uint256,uint256)")
+
+
+def _words(data):
+    data = bytes(HexBytes(data))
+    return [int.from_bytes(data[i : i + 32], "big") for i in range(0, len(data), 32)]
+
+
+def _signed(value, bits=256):
+    value &= (1 << bits) - 1
+    return value - (1 << bits) if value >> (bits - 1) else value
+
+
+def _topic_hex(topic):
+    return "0x" + bytes(HexBytes(topic)).hex()
+
+
+def decode_pool_logs(logs, timestamps, tick=0, sqrt_price_x96=0):
+    """
+    Turn raw pool logs (sorted by block and log index) into `POOL_COLUMNS`.
+    `tick` / `sqrt_price_x96` are the pool state before the first log.
+    """
+    rows = []
+    for log in logs:
+        kind = TOPICS[_topic_hex(log["topics"][0])]
+        words = _words(log["data"])
+        tick_lower = tick_upper = 0
+        if kind == SWAP:
+            amount0, amount1 = _signed(words[0]), _signed(words[1])
+            sqrt_price_x96, liquidity, tick = words[2], words[3], _signed(words[4])
+        else:
+            tick_lower = _signed(int.from_bytes(HexBytes(log["topics"][2]), "big"))
+            tick_upper = _signed(int.from_bytes(HexBytes(log["topics"][3]), "big"))
+            # Mint has the sender as its first data word
+            liquidity, amount0, amount1 = words[-3:]
+        block = int(log["blockNumber"])
+        rows.append(
+            (
+                block,
+                int(log["logIndex"]),
+                timestamps[block],
+                kind,
+                tick,
+                sqrt_price_x96,
+                liquidity,
+                tick_lower,
+                tick_upper,
+                amount0 / 1e18,
+                amount1 / 1e18,
+            )
+        )
+    columns = list(zip(*rows)) or [[]] * 11
+    sqrt_prices = uint_column(columns[5], 20)
+    return {
+        "block": columns[0],
+        "log_index": columns[1],
+        "timestamp": columns[2],
+        "kind": columns[3],
+        "tick": columns[4],
+        "sqrt_price_x96": sqrt_prices,
+        "price": [(s / 2**96) ** 2 for s in columns[5]],
+        "liquidity": uint_column(columns[6], 16),
+        "tick_lower": columns[7],
+        "tick_upper": columns[8],
+        "amount0": columns[9],
+        "amount1": columns[10],
+    }
+
+
+def decode_funding_logs(logs, timestamps):
+    rows = []
+    for log in logs:
+        mark_twap, index_twap = _words(log["data"])[:2]
+        block = int(log["blockNumber"])
+        rows.append(
+            (
+                block,
+                int(log["logIndex"]),
+                timestamps[block],
+                mark_twap / 1e18,
+                index_twap / 1e18,
+            )
+        )
+    columns = list(zip(*rows)) or [[]] * 5
+    return dict(zip((name for name, _, _ in FUNDING_COLUMNS), columns))
+
+
+def block_prices(store, start_block=0, end_block=None, chunk=1 << 16):
+    """
+    Stream `(block, timestamp, sqrtPriceX96)` after the last swap of each block
+    in a pool store, reading it chunk by chunk.
+    """
+    pending = None
+    names = ["block", "timestamp", "kind", "sqrt_price_x96"]
+    for columns in store.iter_chunks(chunk, names):
+        blocks = columns["block"]
+        swaps = np.flatnonzero(
+            (columns["kind"] == SWAP)
+            & (blocks >= start_block)
+            & (blocks <= (end_block if end_block is not None else blocks[-1]))
+        )
+        if len(swaps) == 0:
+            continue
+        # rows are in block order, so the last swap of a block precedes a change
+        swap_blocks = blocks[swaps]
+        last = swaps[np.append(swap_blocks[1:] != swap_blocks[:-1], True)]
+        for row in last:
+            block = int(blocks[row])
+            if pending is not None and pending[0] != block:
+                yield pending
+            sqrt_price_x96 = int.from_bytes(
+                columns["sqrt_price_x96"][row].tobytes(), "big"
+            )
+            pending = (block, int(columns["timestamp"][row]), sqrt_price_x96)
+    if pending is not None:
+        yield pending
+
+
+def _get_logs(w3, params):
+    """eth_getLogs, halving the range when the node refuses it."""
+    try:
+        return list(w3.eth.get_logs(params))
+    except Exception:
+        start, end = params["fromBlock"], params["toBlock"]
+        if start >= end:
+            raise
+        middle = (start + end) // 2
+        return _get_logs(w3, dict(params, toBlock=middle)) + _get_logs(
+            w3, dict(params, fromBlock=middle + 1)
+        )
+
+
+def fetch_range(w3, pool, start, end, exchange=None, base_token=None):
+    """Logs and block timestamps for `[start, end]`."""
+    pool_logs = _get_logs(
+        w3,
+        {"fromBlock": start, "toBlock": end, "address": pool, "topics": [list(TOPICS)]},
+    )
+    funding_logs = []
+    if exchange is not None:
+        funding_logs = _get_logs(
+            w3,
+            {
+                "fromBlock": start,
+                "toBlock": end,
+                "address": exchange,
+                "topics": [
+                    FUNDING_UPDATED,
+                    "0x" + base_token[2:].lower().rjust(64, "0"),
+                ],
+            },
+        )
+    order = lambda log: (int(log["blockNumber"]), int(log["logIndex"]))  # noqa: E731
+    pool_logs.sort(key=order)
+    funding_logs.sort(key=order)
+    blocks = {int(log["blockNumber"]) for log in pool_logs + funding_logs}
+    timestamps = {block: int(w3.eth.get_block(block)["timestamp"]) for block in blocks}
+    return pool_logs, funding_logs, timestamps
+
+
+def _after(data, last_block):
+    """The rows of decoded `data` past `last_block`."""
+    keep = np.asarray(data["block"], dtype=np.int64) > last_block
+    if keep.all():
+        return data
+    return {name: np.asarray(values)[keep] for name, values in data.items()}
+
+
+def open_stores(out_dir):
+    return (
+        ColumnStore("{}/pool".format(out_dir), POOL_COLUMNS),
+        ColumnStore("{}/funding".format(out_dir), FUNDING_COLUMNS),
+    )
+
+
+def ingest(
+    w3,
+    pool,
+    out_dir,
+    from_block,
+    to_block=None,
+    exchange=None,
+    base_token=None,
+    chunk=2000,
+    workers=8,
+):
+    """Append `[from_block, to_block]` (default: latest) to the stores in `out_dir`."""
+    pool_store, funding_store = open_stores(out_dir)
+    start = max(from_block, min(pool_store.last_block, funding_store.last_block) + 1)
+    end = w3.eth.block_number if to_block is None else to_block
+    ranges = [(s, min(s + chunk - 1, end)) for s in range(start, end + 1, chunk)]
+
+    tick, sqrt_price_x96 = 0, 0
+    if pool_store.rows:
+        tick = int(pool_store.column("tick")[-1])
+        sqrt_price_x96 = int.from_bytes(
+            pool_store.column("sqrt_price_x96")[-1].tobytes(), "big"
+        )
+
+    with ThreadPoolExecutor(workers) as executor:
+        # bounded look-ahead so a slow range does not pile up finished ones
+        window = workers * 4
+        for offset in range(0, len(ranges), window):
+            batch = ranges[offset : offset + window]
+            fetched = executor.map(
+                lambda r: fetch_range(w3, pool, r[0], r[1], exchange, base_token),
+                batch,
+            )
+            for (_, range_end), (pool_logs, funding_logs, timestamps) in zip(
+                batch, fetched
+            ):
+                data = decode_pool_logs(pool_logs, timestamps, tick, sqrt_price_x96)
+                if pool_logs:
+                    tick = int(data["tick"][-1])
+                    sqrt_price_x96 = int.from_bytes(
+                        np.asarray(data["sqrt_price_x96"][-1]).tobytes(), "big"
+                    )
+                # a store that got ahead of the other before an interrupted
+                # run already has these rows
+                pool_store.append(_after(data, pool_store.last_block), range_end)
+                funding = decode_funding_logs(funding_logs, timestamps)
+                funding_store.append(
+                    _after(funding, funding_store.last_block), range_end
+                )
+    return pool_store, funding_store
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("rpc")
+    parser.add_argument("pool")
+    parser.add_argument("out_dir")
+    parser.add_argument("--from-block", type=int, default=0)
+    parser.add_argument("--to-block", type=int)
+    parser.add_argument("--exchange")
+    parser.add_argument("--base-token")
+    parser.add_argument("--chunk", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    w3 = Web3(Web3.HTTPProvider(args.rpc, request_kwargs={"timeout": 60}))
+    pool_store, funding_store = ingest(
+        w3,
+        to_checksum_address(args.pool),
+        args.out_dir,
+        args.from_block,
+        args.to_block,
+        args.exchange and to_checksum_address(args.exchange),
+        args.base_token,
+        args.chunk,
+        args.workers,
+    )
+    print(
+        "{} pool events, {} funding updates up to block {}".format(
+            pool_store.rows, funding_store.rows, pool_store.last_block
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
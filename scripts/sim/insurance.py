@@ -0,0 +1,397 @@
+"""
+Monte Carlo model of `StrategyInsurance`.
+
+`InsuranceFund` is an integer-exact port of `contracts/StrategyInsurance.sol`
+and `settle_harvest` of the insurance block at the end of
+`CoreStrategyPerp.prepareReturn`; they are the reference the vectorised
+`simulate_insurance` is tested against, and are in turn checked against the
+contract on a local chain (`tests/local/test_insurance.py`).
+
+`simulate_insurance` runs the same accounting over a batch of harvest
+sequences at once. Each harvest's result is drawn as a return on the
+strategy's total debt, either from the strategy simulator (`returns_from_sim`)
+or by resampling recorded harvests (`bootstrap`). `run_insurance_sweep` fans
+a list of fund parameters out over a process pool and reports, per parameter
+set, how often the fund runs dry and what share of losses it covers:
+
+    python -m scripts.sim.insurance insurance.yml insurance.npz
+
+Where the fund pays out more than the loss being reported (it also
+compensates losses still owed from earlier harvests), `prepareReturn` reports
+the excess as profit.
+"""
+
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, fields, replace
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+from .strategy import SimConfig, gbm_paths, simulate
+from .sweep import grid, latin_hypercube, random_sample
+
+BPS_MAX = 10000
+METRICS = (
+    "depletion_probability",
+    "coverage",
+    "premiums",
+    "compensation",
+    "written_off",
+    "final_balance",
+)
+
+_returns = None
+
+
+@dataclass
+class InsuranceConfig:
+    # StrategyInsurance defaults, in basis points of total debt / profit
+    target_fund_size: int = 50
+    profit_take_rate: int = 1000
+    maximum_compensation_rate: int = 5
+
+
+def check_config(config):
+    """Returns False for settings the insurance setters would revert on."""
+    return (
+        0 <= config.target_fund_size < 500
+        and 0 <= config.profit_take_rate < 4000
+        and 0 <= config.maximum_compensation_rate < 50
+    )
+
+
+class InsuranceFund:
+    """
+    `StrategyInsurance` for one strategy. `balance` stands in for
+    `want.balanceOf(insurance)`; transfers into the fund are `deposit`.
+    """
+
+    def __init__(self, config=None, balance=0, loss_sum=0):
+        self.config = config or InsuranceConfig()
+        self.balance = balance
+        self.loss_sum = loss_sum
+
+    def deposit(self, amount):
+        self.balance += amount
+
+    def report_profit(self, total_debt, profit):
+        """Returns (payment, compensation)."""
+        if self.loss_sum > profit:
+            self.loss_sum -= profit
+            return 0, self._compensate(total_debt)
+        self.loss_sum = 0
+        if self.balance >= total_debt * self.config.target_fund_size // BPS_MAX:
+            return 0, 0
+        return profit * self.config.profit_take_rate // BPS_MAX, 0
+
+    def report_loss(self, total_debt, loss):
+        """Returns the compensation sent to the strategy."""
+        self.loss_sum += loss
+        return self._compensate(total_debt)
+
+    def _compensate(self, total_debt):
+        if self.balance == 0:
+            self.loss_sum = 0
+            return 0
+        max_comp = self.config.maximum_compensation_rate * total_debt // BPS_MAX
+        compensation = min(self.balance, self.loss_sum, max_comp)
+        self.balance -= compensation
+        self.loss_sum -= compensation
+        return compensation
+
+
+def settle_harvest(fund, total_debt, profit, loss):
+    """
+    The insurance step of `prepareReturn` for a harvest that found `profit`
+    and `loss` against `total_debt` (the debt before the harvest).
+
+    Returns the (profit, loss) reported to the vault and the payment kept in
+    the strategy because it failed the `insurancePayment < _profit` check.
+    """
+    if loss >= profit:
+        loss -= profit
+        compensation = fund.report_loss(total_debt, loss)
+        if compensation > loss:
+            return compensation - loss, 0, 0
+        return 0, loss - compensation, 0
+    profit -= loss
+    payment, compensation = fund.report_profit(total_debt, profit)
+    profit = profit - payment + compensation
+    if payment > 0 and payment < profit:
+        fund.deposit(payment)
+        return profit, 0, 0
+    return profit, 0, payment
+
+
+@dataclass
+class InsuranceResult:
+    config: InsuranceConfig
+    balance: np.ndarray
+    loss_sum: np.ndarray
+    total_debt: np.ndarray
+    losses: np.ndarray  # net losses reported to the fund
+    compensation: np.ndarray
+    premiums: np.ndarray
+    written_off: np.ndarray  # lossSum dropped by an empty fund
+    depleted_at: np.ndarray  # first harvest the fund ran dry, -1 if never
+    initial_debt: int
+    n_harvests: int
+    balance_history: np.ndarray = None  # (n_paths, n_harvests) when recorded
+
+    @property
+    def depleted(self):
+        return self.depleted_at >= 0
+
+    def summary(self):
+        """Aggregates over paths; amounts are in basis points of the initial debt."""
+        scale = BPS_MAX / self.initial_debt
+        losses = self.losses.sum()
+        return {
+            "depletion_probability": self.depleted.mean(),
+            "coverage": self.compensation.sum() / losses if losses else 1.0,
+            "premiums": self.premiums.mean() * scale,
+            "compensation": self.compensation.mean() * scale,
+            "written_off": self.written_off.mean() * scale,
+            "final_balance": self.balance.mean() * scale,
+        }
+
+
+def simulate_insurance(
+    returns,
+    config=None,
+    total_debt=10**10,
+    balance=0,
+    loss_sum=0,
+    record=False,
+):
+    """
+    Run the fund over a batch of harvest sequences.
+
+    `returns` has shape (n_paths, n_harvests): each harvest's profit (or
+    -loss) as a fraction of the strategy's total debt before it. Amounts are
+    integers in want units (the default debt is 10k USDC); the fund starts
+    with `balance` and `loss_sum`. As in the vault, profit is paid out and
+    leaves the debt unchanged while reported losses reduce it.
+    """
+    config = config or InsuranceConfig()
+    returns = np.atleast_2d(np.asarray(returns, dtype=np.float64))
+    n_paths, n_harvests = returns.shape
+    target, take, max_rate = (
+        config.target_fund_size,
+        config.profit_take_rate,
+        config.maximum_compensation_rate,
+    )
+
+    debt = np.full(n_paths, total_debt, dtype=np.int64)
+    bal = np.full(n_paths, balance, dtype=np.int64)
+    ls = np.full(n_paths, loss_sum, dtype=np.int64)
+    carry = np.zeros(n_paths, dtype=np.int64)
+    losses = np.zeros(n_paths, dtype=np.int64)
+    paid = np.zeros(n_paths, dtype=np.int64)
+    premiums = np.zeros(n_paths, dtype=np.int64)
+    written_off = np.zeros(n_paths, dtype=np.int64)
+    depleted_at = np.full(n_paths, -1, dtype=np.int64)
+    history = np.empty((n_paths, n_harvests), dtype=np.int64) if record else None
+
+    for t in range(n_harvests):
+        pnl = np.trunc(returns[:, t] * debt).astype(np.int64) + carry
+        is_loss = pnl <= 0
+        loss = np.where(is_loss, -pnl, 0)
+        profit = np.where(is_loss, 0, pnl)
+
+        # reportLoss adds to lossSum; reportProfit first nets profit against it
+        pending = ~is_loss & (ls > profit)
+        owed = np.where(is_loss, ls + loss, np.where(pending, ls - profit, 0))
+        compensating = is_loss | pending
+        dry = compensating & (bal == 0)
+        comp = np.where(
+            compensating & ~dry,
+            np.minimum(np.minimum(bal, owed), max_rate * debt // BPS_MAX),
+            0,
+        )
+        below_target = bal < debt * target // BPS_MAX
+        payment = np.where(
+            ~is_loss & ~pending & below_target, profit * take // BPS_MAX, 0
+        )
+        reported_profit = profit - payment + comp
+        transferred = (payment > 0) & (payment < reported_profit)
+
+        newly_dry = (dry & (owed > 0)) | (compensating & (comp == bal) & (comp < owed))
+        depleted_at[newly_dry & (depleted_at < 0)] = t
+        written_off += np.where(dry, owed, 0)
+        losses += loss
+        paid += comp
+        premiums += np.where(transferred, payment, 0)
+
+        bal = bal - comp + np.where(transferred, payment, 0)
+        ls = np.where(dry, 0, owed - comp)
+        # compensation above the loss is reported as profit and keeps the debt
+        debt = np.where(is_loss, debt - np.maximum(loss - comp, 0), debt)
+        # an untransferred payment stays in the strategy as next harvest's profit
+        carry = np.where(~is_loss & ~transferred, payment, 0)
+        if record:
+            history[:, t] = bal
+
+    return InsuranceResult(
+        config=config,
+        balance=bal,
+        loss_sum=ls,
+        total_debt=debt,
+        losses=losses,
+        compensation=paid,
+        premiums=premiums,
+        written_off=written_off,
+        depleted_at=depleted_at,
+        initial_debt=total_debt,
+        n_harvests=n_harvests,
+        balance_history=history,
+    )
+
+
+def returns_from_sim(result):
+    """Per-harvest returns on debt from a `SimResult` (needs `harvest_interval`)."""
+    pnl = result.harvest_pnl
+    losses = np.minimum(pnl, 0)
+    debt = result.deposited[:, None] + np.cumsum(losses, axis=1) - losses
+    return pnl / debt
+
+
+def bootstrap(samples, n_paths, n_harvests, block_size=1, seed=None):
+    """
+    Resample recorded per-harvest returns into (n_paths, n_harvests) sequences.
+
+    Consecutive blocks of `block_size` harvests are drawn together (a moving
+    block bootstrap) so runs of losses in the record survive resampling.
+    """
+    samples = np.asarray(samples, dtype=np.float64).ravel()
+    block_size = max(1, min(block_size, len(samples)))
+    rng = np.random.default_rng(seed)
+    n_blocks = -(-n_harvests // block_size)
+    starts = rng.integers(0, len(samples) - block_size + 1, (n_paths, n_blocks))
+    idx = (starts[:, :, None] + np.arange(block_size)).reshape(n_paths, -1)
+    return samples[idx[:, :n_harvests]]
+
+
+def _init_worker(returns_path):
+    global _returns
+    _returns = np.load(returns_path, mmap_mode="r")
+
+
+def _run_one(index, config, total_debt, balance):
+    if not check_config(config):
+        return index, None
+    return index, simulate_insurance(_returns, config, total_debt, balance).summary()
+
+
+def run_insurance_sweep(
+    params, returns, base=None, total_debt=10**10, balance=0, workers=None
+):
+    """
+    Evaluate each `InsuranceConfig` override in `params` against the same
+    `returns`. Returns a dict of columns (the `METRICS`, `valid` and one
+    `param_<name>` per parameter), NaN where the setters would revert.
+    """
+    base = base or InsuranceConfig()
+    configs = [replace(base, **p) for p in params]
+    columns = {name: np.full(len(params), np.nan) for name in METRICS}
+    columns["valid"] = np.zeros(len(params), dtype=bool)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "returns.npy")
+        np.save(path, np.asarray(returns, dtype=np.float64))
+        with ProcessPoolExecutor(
+            max_workers=workers or os.cpu_count(),
+            initializer=_init_worker,
+            initargs=(path,),
+        ) as pool:
+            futures = [
+                pool.submit(_run_one, i, config, total_debt, balance)
+                for i, config in enumerate(configs)
+            ]
+            for future in futures:
+                index, summary = future.result()
+                if summary is None:
+                    continue
+                columns["valid"][index] = True
+                for name in METRICS:
+                    columns[name][index] = summary[name]
+    for name in params[0] if params else ():
+        columns["param_" + name] = np.asarray([p[name] for p in params])
+    return columns
+
+
+def load_returns(spec):
+    """Harvest returns for a spec's `returns` section (`file`, `sim` or both)."""
+    if "file" in spec:
+        samples = np.load(spec["file"], mmap_mode="r")
+        if samples.ndim == 2 and "bootstrap" not in spec:
+            return samples
+    else:
+        paths = spec.get("paths", {})
+        prices = gbm_paths(
+            paths.get("n_paths", 1000),
+            paths.get("n_steps", 24 * 30),
+            s0=paths.get("s0", 1500.0),
+            vol=paths.get("vol", 0.8),
+            seed=paths.get("seed", 0),
+        )
+        config = replace(SimConfig(harvest_interval=24), **spec.get("sim", {}))
+        samples = returns_from_sim(simulate(prices, config, volume=spec.get("volume")))
+        if "bootstrap" not in spec:
+            return samples
+    options = spec["bootstrap"]
+    return bootstrap(
+        samples,
+        options.get("n_paths", 10_000),
+        options.get("n_harvests", 365),
+        block_size=options.get("block_size", 1),
+        seed=options.get("seed"),
+    )
+
+
+def main(spec_path="insurance.yml", out_path="insurance.npz"):
+    spec = yaml.safe_load(Path(spec_path).read_text())
+    sampler = spec.get("sampler", "grid")
+    if sampler == "grid":
+        params = grid(spec["params"])
+    elif sampler == "random":
+        params = random_sample(spec["params"], spec["samples"], spec.get("seed"))
+    elif sampler == "lhs":
+        params = latin_hypercube(spec["params"], spec["samples"], spec.get("seed"))
+    else:
+        raise ValueError("unknown sampler '{}'".format(sampler))
+    for p in params:
+        for name in p:
+            p[name] = int(round(p[name]))
+
+    results = run_insurance_sweep(
+        params,
+        load_returns(spec.get("returns", {})),
+        base=replace(InsuranceConfig(), **spec.get("base", {})),
+        total_debt=spec.get("total_debt", 10**10),
+        balance=spec.get("balance", 0),
+        workers=spec.get("workers"),
+    )
+    np.savez_compressed(out_path, **results)
+    names = [f.name for f in fields(InsuranceConfig)]
+    for i in np.argsort(results["depletion_probability"]):
+        if not results["valid"][i]:
+            continue
+        print(
+            "{}  depleted {:6.2%}  coverage {:6.2%}  premiums {:7.2f} bps".format(
+                " ".join(
+                    "{}={}".format(n, params[i].get(n, getattr(InsuranceConfig(), n)))
+                    for n in names
+                ),
+                results["depletion_probability"][i],
+                results["coverage"][i],
+                results["premiums"][i],
+            )
+        )
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,87 @@
+"""
+Compare ladder mode against a single range on the same price paths.
+
+`setLadder` adds up to `MAX_WINGS` wings next to the core range, each with its
+own multiplier and a share (in basis points) of the deployed capital; the core
+keeps the rest. With in-place rebalancing, a rebalance and the keeper's
+`shiftRungs` only move the rungs the price has left, so the wide wings keep
+earning (and keep their taker residual open) while the narrow core follows the
+price. `compare` runs both modes over one batch of paths and reports the mean
+of each metric:
+
+    python -m scripts.sim.ladder --ladder 400:3000 --ladder 1200:2000 \\
+        --multiplier 100 --paths 200 --steps 720 --volume 1e6
+"""
+
+import argparse
+from dataclasses import replace
+
+import numpy as np
+
+from .strategy import SimConfig, gbm_paths, simulate
+
+METRICS = (
+    "pnl",
+    "fees_collected",
+    "taker_fees_paid",
+    "debt_rebalances",
+    "rung_shifts",
+    "time_in_range",
+)
+
+
+def compare(prices, ladder, base=None, deposit=10_000.0, volume=None):
+    """
+    `{"single": {metric: mean}, "ladder": {metric: mean}}` of `base` (default
+    `SimConfig()`) without and with the wings `ladder`, both rebalancing in
+    place and shifting rungs that leave the price.
+    """
+    base = replace(
+        base or SimConfig(), in_place_rebalance=True, shift_rungs=True, ladder=()
+    )
+    results = {}
+    for name, config in (
+        ("single", base),
+        ("ladder", replace(base, ladder=tuple(ladder))),
+    ):
+        summary = simulate(prices, config, deposit, volume=volume).summary()
+        results[name] = {m: float(np.mean(summary[m])) for m in METRICS}
+    return results
+
+
+def _wing(text):
+    multiplier, weight = text.split(":")
+    return int(multiplier), int(weight)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--ladder", type=_wing, action="append", required=True, metavar="MULT:BPS"
+    )
+    parser.add_argument("--multiplier", type=int, default=200)
+    parser.add_argument("--paths", type=int, default=200)
+    parser.add_argument("--steps", type=int, default=720)
+    parser.add_argument("--vol", type=float, default=0.8)
+    parser.add_argument("--volume", type=float, default=1e6)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    prices = gbm_paths(args.paths, args.steps, vol=args.vol, seed=args.seed)
+    results = compare(
+        prices,
+        args.ladder,
+        SimConfig(tick_range_multiplier=args.multiplier),
+        volume=args.volume,
+    )
+    print("{:>18} {:>14} {:>14}".format("", "single", "ladder"))
+    for metric in METRICS:
+        print(
+            "{:>18} {:14.4f} {:14.4f}".format(
+                metric, results["single"][metric], results["ladder"][metric]
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Python port of `contracts/lib/LiquidityAmounts.sol`.
+
+Scalar functions take Q64.96 sqrt prices and are integer-exact. The `*_array`
+functions take plain float sqrt prices (sqrt(token1/token0)) and broadcast over
+NumPy arrays.
+"""
+
+import numpy as np
+
+from .tickmath import Q96
+
+
+def _sort(sqrt_ratio_a, sqrt_ratio_b):
+    if sqrt_ratio_a > sqrt_ratio_b:
+        return sqrt_ratio_b, sqrt_ratio_a
+    return sqrt_ratio_a, sqrt_ratio_b
+
+
+def _to_uint128(x: int) -> int:
+    if x >= 1 << 128:
+        raise OverflowError("uint128")
+    return x
+
+
+def get_liquidity_for_amount0(sqrt_ratio_a_x96, sqrt_ratio_b_x96, amount0):
+    sqrt_ratio_a_x96, sqrt_ratio_b_x96 = _sort(sqrt_ratio_a_x96, sqrt_ratio_b_x96)
+    intermediate = sqrt_ratio_a_x96 * sqrt_ratio_b_x96 // Q96
+    return _to_uint128(amount0 * intermediate // (sqrt_ratio_b_x96 - sqrt_ratio_a_x96))
+
+
+def get_liquidity_for_amount1(sqrt_ratio_a_x96, sqrt_ratio_b_x96, amount1):
+    sqrt_ratio_a_x96, sqrt_ratio_b_x96 = _sort(sqrt_ratio_a_x96, sqrt_ratio_b_x96)
+    return _to_uint128(amount1 * Q96 // (sqrt_ratio_b_x96 - sqrt_ratio_a_x96))
+
+
+def get_liquidity_for_amounts(
+    sqrt_ratio_x96, sqrt_ratio_a_x96, sqrt_ratio_b_x96, amount0, amount1
+):
+    sqrt_ratio_a_x96, sqrt_ratio_b_x96 = _sort(sqrt_ratio_a_x96, sqrt_ratio_b_x96)
+    if sqrt_ratio_x96 <= sqrt_ratio_a_x96:
+        return get_liquidity_for_amount0(sqrt_ratio_a_x96, sqrt_ratio_b_x96, amount0)
+    if sqrt_ratio_x96 < sqrt_ratio_b_x96:
+        liquidity0 = get_liquidity_for_amount0(
+            sqrt_ratio_x96, sqrt_ratio_b_x96, amount0
+        )
+        liquidity1 = get_liquidity_for_amount1(
+            sqrt_ratio_a_x96, sqrt_ratio_x96, amount1
+        )
+        return min(liquidity0, liquidity1)
+    return get_liquidity_for_amount1(sqrt_ratio_a_x96, sqrt_ratio_b_x96, amount1)
+
+
+def get_amount0_for_liquidity(sqrt_ratio_a_x96, sqrt_ratio_b_x96, liquidity):
+    sqrt_ratio_a_x96, sqrt_ratio_b_x96 = _sort(sqrt_ratio_a_x96, sqrt_ratio_b_x96)
+    return (
+        (liquidity << 96)
+        * (sqrt_ratio_b_x96 - sqrt_ratio_a_x96)
+        // sqrt_ratio_b_x96
+        // sqrt_ratio_a_x96
+    )
+
+
+def get_amount1_for_liquidity(sqrt_ratio_a_x96, sqrt_ratio_b_x96, liquidity):
+    sqrt_ratio_a_x96, sqrt_ratio_b_x96 = _sort(sqrt_ratio_a_x96, sqrt_ratio_b_x96)
+    return liquidity * (sqrt_ratio_b_x96 - sqrt_ratio_a_x96) // Q96
+
+
+def get_amounts_for_liquidity(
+    sqrt_ratio_x96, sqrt_ratio_a_x96, sqrt_ratio_b_x96, liquidity
+):
+    sqrt_ratio_a_x96, sqrt_ratio_b_x96 = _sort(sqrt_ratio_a_x96, sqrt_ratio_b_x96)
+    if sqrt_ratio_x96 <= sqrt_ratio_a_x96:
+        return (
+            get_amount0_for_liquidity(sqrt_ratio_a_x96, sqrt_ratio_b_x96, liquidity),
+            0,
+        )
+    if sqrt_ratio_x96 < sqrt_ratio_b_x96:
+        return (
+            get_amount0_for_liquidity(sqrt_ratio_x96, sqrt_ratio_b_x96, liquidity),
+            get_amount1_for_liquidity(sqrt_ratio_a_x96, sqrt_ratio_x96, liquidity),
+        )
+    return 0, get_amount1_for_liquidity(sqrt_ratio_a_x96, sqrt_ratio_b_x96, liquidity)
+
+
+def amount0_for_liquidity_array(sqrt_a, sqrt_b, liquidity):
+    lo, hi = np.minimum(sqrt_a, sqrt_b), np.maximum(sqrt_a, sqrt_b)
+    return liquidity * (hi - lo) / (hi * lo)
+
+
+def amount1_for_liquidity_array(sqrt_a, sqrt_b, liquidity):
+    lo, hi = np.minimum(sqrt_a, sqrt_b), np.maximum(sqrt_a, sqrt_b)
+    return liquidity * (hi - lo)
+
+
+def amounts_for_liquidity_array(sqrt_p, sqrt_a, sqrt_b, liquidity):
+    """Vectorised `getAmountsForLiquidity`; assumes sqrt_a < sqrt_b."""
+    sqrt_c = np.clip(sqrt_p, sqrt_a, sqrt_b)
+    amount0 = liquidity * (sqrt_b - sqrt_c) / (sqrt_b * sqrt_c)
+    amount1 = liquidity * (sqrt_c - sqrt_a)
+    return amount0, amount1
+
+
+def liquidity_for_amounts_array(sqrt_p, sqrt_a, sqrt_b, amount0, amount1):
+    """Vectorised `getLiquidityForAmounts`; assumes sqrt_a < sqrt_b."""
+    sqrt_c = np.clip(sqrt_p, sqrt_a, sqrt_b)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        liquidity0 = amount0 * sqrt_c * sqrt_b / (sqrt_b - sqrt_c)
+        liquidity1 = amount1 / (sqrt_c - sqrt_a)
+    below = sqrt_p <= sqrt_a
+    above = sqrt_p >= sqrt_b
+    liquidity = np.where(
+        below,
+        amount0 * sqrt_a * sqrt_b / (sqrt_b - sqrt_a),
+        np.where(
+            above,
+            amount1 / (sqrt_b - sqrt_a),
+            np.minimum(liquidity0, liquidity1),
+        ),
+    )
+    return liquidity
@@ -0,0 +1,20 @@
+"""Per-block strategy metrics recorded by `Replay`, readable without brownie."""
+
+ACTIONS = ("rebalanceDebt", "rebalanceCollateral", "harvest")
+
+METRIC_COLUMNS = (
+    ("block", "<u8", ()),
+    ("timestamp", "<u8", ()),
+    ("source_block", "<u8", ()),
+    ("tick", "<i4", ()),
+    ("spot_price", "<f8", ()),
+    ("mark_twap_price", "<f8", ()),
+    ("debt_ratio", "<f8", ()),
+    ("collateral_ratio", "<f8", ()),
+    ("estimated_total_assets", "<f8", ()),
+    ("pending_rewards", "<f8", ()),
+    # bit i set when ACTIONS[i] went through after this block
+    ("actions", "u1", ()),
+    ("swaps", "<u2", ()),
+    ("failed", "<u2", ()),
+)
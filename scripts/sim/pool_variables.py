@@ -0,0 +1,32 @@
+"""Python port of the tick helpers in `contracts/lib/PoolVariables.sol`."""
+
+import numpy as np
+
+
+def floor(tick: int, tick_spacing: int) -> int:
+    """Rounds tick down towards negative infinity to a multiple of `tick_spacing`."""
+    # solidity division truncates towards zero
+    compressed = abs(tick) // tick_spacing * (-1 if tick < 0 else 1)
+    if tick < 0 and tick % tick_spacing != 0:
+        compressed -= 1
+    return compressed * tick_spacing
+
+
+def base_ticks(current_tick: int, base_threshold: int, tick_spacing: int):
+    tick_floor = floor(current_tick, tick_spacing)
+    return tick_floor - base_threshold, tick_floor + base_threshold
+
+
+def floor_array(ticks, tick_spacing):
+    # numpy floor division already rounds towards negative infinity
+    return (np.asarray(ticks, dtype=np.int64) // tick_spacing) * tick_spacing
+
+
+def base_ticks_array(current_ticks, base_threshold, tick_spacing):
+    tick_floor = floor_array(current_ticks, tick_spacing)
+    return tick_floor - base_threshold, tick_floor + base_threshold
+
+
+def determine_ticks(current_tick, tick_spacing, tick_range_multiplier):
+    """Mirror of `PerpLib.determineTicks` given an already resolved (spot or TWAP) tick."""
+    return base_ticks(current_tick, tick_spacing * tick_range_multiplier, tick_spacing)
@@ -0,0 +1,327 @@
+"""
+Replay recorded market history against a deployed strategy on a local chain.
+
+`Replay` walks the per-block prices of a pool history written by
+`scripts/sim/ingest.py` and moves the local pool to each of them with a
+`ClearingHouse.openPosition` capped by `sqrtPriceLimitX96`, so the strategy
+sees the same sequence of prices (and mark TWAP) as the recorded market.
+Automining is switched off while replaying: `batch_size` recorded blocks are
+sent without waiting for receipts and then mined together into one local block
+stamped with the last recorded timestamp. Between batches a `Policy` decides
+which keeper actions to send, and one row of strategy metrics per local block
+is appended to a `ColumnStore`.
+
+    brownie run sim/replay main <strategy> <history dir> <metrics dir> <want whale> --network op-fork
+
+The recorded path is rebased onto the local pool price by default, so only the
+relative moves of the history are replayed.
+"""
+
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+from brownie import accounts, chain, interface, web3
+
+from scripts.keeper.state import get_multicall, read_states
+
+from .ingest import block_prices, open_stores
+from .metrics import ACTIONS, METRIC_COLUMNS
+from .store import ColumnStore
+
+THRESHOLDS = ("debtLower", "debtUpper", "collatLower", "collatUpper")
+
+
+class Policy:
+    """
+    Decides the keeper actions after each replayed block.
+
+    With the defaults it rebalances on the strategy's own debt and collateral
+    bands (as `scripts/keeper/daemon.py` does) and harvests every
+    `harvest_interval` seconds of recorded time. `debt_band` and
+    `collateral_band` override the on-chain thresholds with `(lower, upper)`
+    in basis points; subclasses can override `actions` for anything else.
+    """
+
+    def __init__(
+        self,
+        harvest_interval=86400,
+        rebalance=True,
+        debt_band=None,
+        collateral_band=None,
+    ):
+        self.harvest_interval = harvest_interval
+        self.rebalance = rebalance
+        self.debt_band = debt_band
+        self.collateral_band = collateral_band
+
+    def actions(self, state, thresholds, since_harvest):
+        actions = []
+        if self.rebalance:
+            debt = self.debt_band or (thresholds["debtLower"], thresholds["debtUpper"])
+            collateral = self.collateral_band or (
+                thresholds["collatLower"],
+                thresholds["collatUpper"],
+            )
+            if state.debt_ratio is not None and not (
+                debt[0] <= state.debt_ratio <= debt[1]
+            ):
+                actions.append("rebalanceDebt")
+            elif state.collateral_ratio is not None and not (
+                collateral[0] <= state.collateral_ratio <= collateral[1]
+            ):
+                actions.append("rebalanceCollateral")
+        if self.harvest_interval is not None and since_harvest >= self.harvest_interval:
+            actions.append("harvest")
+        return actions
+
+
+def _request(method, params):
+    response = web3.provider.make_request(method, params)
+    if "error" in response:
+        raise ValueError(response["error"])
+    return response.get("result")
+
+
+def set_automine(enabled):
+    """Anvil and Hardhat take `evm_setAutomine`; Ganache 7 uses `miner_start/stop`."""
+    try:
+        _request("evm_setAutomine", [enabled])
+    except ValueError:
+        _request("miner_start" if enabled else "miner_stop", [])
+
+
+class Replay:
+    def __init__(
+        self,
+        strategy,
+        trader,
+        keeper,
+        history,
+        metrics,
+        policy=None,
+        batch_size=10,
+        rebase=True,
+        multicall=None,
+        swap_gas=3_000_000,
+        keeper_gas=8_000_000,
+        max_quote=10**18 * 10**8,
+        max_base=10**18 * 10**6,
+        flush_every=100,
+        max_rpc=8,
+    ):
+        """
+        `trader` must already have collateral in the Perp vault (see
+        `fund_trader`); it takes the other side of every recorded move.
+        `history` is an ingest output directory, `metrics` the directory of
+        the metrics `ColumnStore`.
+        """
+        self.strategy = strategy
+        self.trader = trader
+        self.keeper = keeper
+        self.pool_store, _ = open_stores(history)
+        self.metrics = ColumnStore(metrics, METRIC_COLUMNS)
+        self.policy = policy or Policy()
+        self.batch_size = batch_size
+        self.rebase = rebase
+        self.multicall = multicall or get_multicall()
+        self.swap_gas = swap_gas
+        self.keeper_gas = keeper_gas
+        self.max_quote = max_quote
+        self.max_base = max_base
+        self.flush_every = flush_every
+        self._executor = ThreadPoolExecutor(max_rpc)
+
+        perp_vault = interface.IVault(strategy.perpVault())
+        self.clearing_house = interface.IClearingHouse(perp_vault.getClearingHouse())
+        registry = interface.IMarketRegistry(strategy.marketRegistery())
+        self.pool = interface.IUniswapV3PoolState(registry.getPool(strategy.short()))
+        self.base_token = strategy.short()
+        self.thresholds = {name: getattr(strategy, name)() for name in THRESHOLDS}
+        self._nonces = {}
+        self._rows = []
+
+    def _nonce(self, account):
+        if account.address not in self._nonces:
+            self._nonces[account.address] = web3.eth.get_transaction_count(
+                account.address, "pending"
+            )
+        nonce = self._nonces[account.address]
+        self._nonces[account.address] += 1
+        return nonce
+
+    def _send(self, account, to, data, gas):
+        """Submit without waiting: automine is off, so it stays pending until `_mine`."""
+        return web3.eth.send_transaction(
+            {
+                "from": account.address,
+                "to": to,
+                "data": data,
+                "gas": gas,
+                "nonce": self._nonce(account),
+            }
+        )
+
+    def _move_to(self, current, target):
+        is_base_to_quote = target < current
+        # exact input on the side being sold; the price limit stops the fill
+        amount = self.max_base if is_base_to_quote else self.max_quote
+        data = self.clearing_house.openPosition.encode_input(
+            [self.base_token, is_base_to_quote, True, amount, 0, 2**256 - 1, target, 0]
+        )
+        return self._send(self.trader, self.clearing_house.address, data, self.swap_gas)
+
+    def _mine(self, timestamp, hashes):
+        """Mine the pending transactions; returns how many of `hashes` reverted."""
+        chain.mine(timestamp=timestamp)
+        receipts = self._executor.map(web3.eth.wait_for_transaction_receipt, hashes)
+        return sum(1 for receipt in receipts if receipt["status"] == 0)
+
+    def _record(self, timestamp, source_block, swaps, failed, actions, state, tick):
+        def value(x):
+            return math.nan if x is None else float(x)
+
+        self._rows.append(
+            (
+                state.block,
+                timestamp,
+                source_block,
+                tick,
+                value(state.spot_price) / 1e18,
+                value(state.mark_twap_price) / 1e18,
+                value(state.debt_ratio),
+                value(state.collateral_ratio),
+                value(state.estimated_total_assets),
+                value(state.pending_rewards),
+                actions,
+                swaps,
+                failed,
+            )
+        )
+        if len(self._rows) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self._rows:
+            return
+        columns = list(zip(*self._rows))
+        last_block = columns[2][-1]
+        self.metrics.append(
+            {name: column for (name, _, _), column in zip(METRIC_COLUMNS, columns)},
+            last_block,
+        )
+        self._rows = []
+
+    def _keep(self, state, timestamp, since_harvest):
+        """Send and mine the policy's keeper actions. Returns (bitmask, failed)."""
+        names = self.policy.actions(state, self.thresholds, since_harvest)
+        if not names:
+            return 0, 0
+        hashes = [
+            self._send(
+                self.keeper,
+                self.strategy.address,
+                getattr(self.strategy, name).encode_input(),
+                self.keeper_gas,
+            )
+            for name in names
+        ]
+        chain.mine(timestamp=timestamp)
+        self._time = timestamp
+        mask, failed = 0, 0
+        for name, receipt in zip(
+            names, self._executor.map(web3.eth.wait_for_transaction_receipt, hashes)
+        ):
+            if receipt["status"] == 0:
+                failed += 1
+            else:
+                mask |= 1 << ACTIONS.index(name)
+        return mask, failed
+
+    def _step(self, batch, source_block, source_time, totals):
+        """Mine a batch, let the policy act and record the block."""
+        # Optimism blocks can share a timestamp; local blocks may not go back
+        timestamp = max(source_time + self._offset, self._time + 1)
+        self._time = timestamp
+        failed = self._mine(timestamp, batch)
+        slot0 = self.pool.slot0()
+        # a reverted or partial move leaves the pool somewhere else
+        self._sqrt_price = slot0["sqrtPriceX96"]
+        state = read_states([self.strategy], self.multicall)[0]
+        actions, keeper_failed = self._keep(
+            state, timestamp + 1, source_time - self._last_harvest
+        )
+        if actions & (1 << ACTIONS.index("harvest")):
+            self._last_harvest = source_time
+        for i, name in enumerate(ACTIONS):
+            totals[name] += bool(actions & (1 << i))
+        failed += keeper_failed
+        totals["swaps"] += len(batch)
+        totals["failed"] += failed
+        self._record(
+            timestamp, source_block, len(batch), failed, actions, state, slot0["tick"]
+        )
+
+    def run(self, start_block=0, end_block=None, max_blocks=None):
+        """
+        Replay recorded blocks `[start_block, end_block]` (at most `max_blocks`
+        of them). Returns a summary dict; the per-block metrics are in
+        `self.metrics`.
+        """
+        self._sqrt_price = self.pool.slot0()["sqrtPriceX96"]
+        self._time = chain.time()
+        self._nonces = {}
+        scale = None
+        totals = {"blocks": 0, "swaps": 0, "failed": 0}
+        totals.update({name: 0 for name in ACTIONS})
+        batch = []
+        item = None
+
+        set_automine(False)
+        try:
+            for item in block_prices(self.pool_store, start_block, end_block):
+                source_block, source_time, target = item
+                if scale is None:
+                    scale = (self._sqrt_price, target) if self.rebase else (1, 1)
+                    # recorded time continues from the local chain time
+                    self._offset = chain.time() + 1 - source_time
+                    self._last_harvest = source_time
+                target = target * scale[0] // scale[1]
+                if target != self._sqrt_price:
+                    batch.append(self._move_to(self._sqrt_price, target))
+                    self._sqrt_price = target
+                totals["blocks"] += 1
+                if totals["blocks"] == max_blocks:
+                    break
+                if totals["blocks"] % self.batch_size == 0:
+                    self._step(batch, source_block, source_time, totals)
+                    batch = []
+            if totals["blocks"] % self.batch_size or totals["blocks"] == max_blocks:
+                self._step(batch, item[0], item[1], totals)
+        finally:
+            set_automine(True)
+            self.flush()
+        return totals
+
+
+def fund_trader(strategy, trader, whale, amount):
+    """Deposit `amount` of want from `whale` as the trader's Perp collateral."""
+    perp_vault = interface.IVault(strategy.perpVault())
+    token = interface.IERC20Extended(strategy.want())
+    token.transfer(trader, amount, {"from": whale})
+    token.approve(perp_vault, amount, {"from": trader})
+    perp_vault.deposit(token, amount, {"from": trader})
+
+
+def main(strategy, history, metrics, whale, batch_size=10):
+    from brownie import WETHPERP
+
+    strategy = WETHPERP.at(strategy)
+    trader, keeper = accounts[0], accounts[1]
+    whale = accounts.at(whale, force=True)
+    balance = interface.IERC20Extended(strategy.want()).balanceOf(whale)
+    fund_trader(strategy, trader, whale, balance // 2)
+    strategy.setKeeper(keeper, {"from": accounts.at(strategy.strategist(), force=True)})
+    replay = Replay(
+        strategy, trader, keeper, history, metrics, batch_size=int(batch_size)
+    )
+    print(replay.run())
@@ -0,0 +1,131 @@
+"""
+Append-only columnar storage for event histories.
+
+A store is a directory holding one raw little-endian file per column plus a
+`meta.json` with the schema, the committed row count and the last block
+covered. Columns are fixed width, so any of them can be opened as a NumPy
+memmap and streamed without loading the file. Appends write the column files
+first and then commit the new row count atomically; bytes past the committed
+count (from an interrupted append) are dropped on the next open.
+"""
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+
+def _schema(columns):
+    return [[name, np.dtype(dtype).str, list(shape)] for name, dtype, shape in columns]
+
+
+def uint_column(values, width):
+    """Encode Python ints as a (n, width) big-endian uint8 column."""
+    return np.frombuffer(
+        b"".join(int(v).to_bytes(width, "big") for v in values), dtype=np.uint8
+    ).reshape(-1, width)
+
+
+def uint_values(column):
+    """Decode a (n, width) big-endian uint8 column back to Python ints."""
+    return [int.from_bytes(row.tobytes(), "big") for row in np.asarray(column)]
+
+
+class ColumnStore:
+    def __init__(self, path, columns, readonly=False):
+        """
+        `columns` is a sequence of `(name, dtype, shape)`; shape is () for
+        scalars. A `readonly` store reads a store another process appends to
+        without touching its files, and sees new rows after `refresh`.
+        """
+        self.path = Path(path)
+        self.readonly = readonly
+        self.columns = {
+            name: (np.dtype(dtype), tuple(shape)) for name, dtype, shape in columns
+        }
+        meta_path = self.path / "meta.json"
+        if readonly:
+            self.refresh()
+            if self.meta["columns"] != _schema(columns):
+                raise ValueError("{} was written with a different schema".format(path))
+            return
+        self.path.mkdir(parents=True, exist_ok=True)
+        if meta_path.exists():
+            self.meta = json.loads(meta_path.read_text())
+            if self.meta["columns"] != _schema(columns):
+                raise ValueError("{} was written with a different schema".format(path))
+        else:
+            self.meta = {"columns": _schema(columns), "rows": 0, "last_block": -1}
+            self._commit()
+        for name in self.columns:
+            # drop anything written after the last commit
+            file = self._file(name)
+            file.touch()
+            size = self.rows * self._row_bytes(name)
+            if file.stat().st_size != size:
+                os.truncate(file, size)
+
+    @property
+    def rows(self):
+        return self.meta["rows"]
+
+    @property
+    def last_block(self):
+        return self.meta["last_block"]
+
+    def refresh(self):
+        """Re-read the committed row count, for a store appended to elsewhere."""
+        self.meta = json.loads((self.path / "meta.json").read_text())
+
+    def _file(self, name):
+        return self.path / (name + ".bin")
+
+    def _row_bytes(self, name):
+        dtype, shape = self.columns[name]
+        return dtype.itemsize * int(np.prod(shape, dtype=np.int64))
+
+    def _commit(self):
+        tmp = self.path / "meta.json.tmp"
+        tmp.write_text(json.dumps(self.meta, indent=2))
+        os.replace(tmp, self.path / "meta.json")
+
+    def append(self, data, last_block):
+        """Append equal-length columns and mark everything up to `last_block` as stored."""
+        if self.readonly:
+            raise ValueError("{} is open read-only".format(self.path))
+        if set(data) != set(self.columns):
+            raise ValueError("expected columns {}".format(sorted(self.columns)))
+        arrays = {}
+        for name, (dtype, shape) in self.columns.items():
+            array = np.ascontiguousarray(data[name], dtype=dtype)
+            arrays[name] = array.reshape((-1,) + shape)
+        lengths = {len(a) for a in arrays.values()}
+        if len(lengths) > 1:
+            raise ValueError("columns have different lengths")
+        for name, array in arrays.items():
+            with open(self._file(name), "ab") as f:
+                f.write(array.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        self.meta["rows"] += lengths.pop() if lengths else 0
+        self.meta["last_block"] = max(self.meta["last_block"], int(last_block))
+        self._commit()
+
+    def column(self, name):
+        """Read-only memmap of a column (an empty array when there are no rows)."""
+        dtype, shape = self.columns[name]
+        if self.rows == 0:
+            return np.empty((0,) + shape, dtype=dtype)
+        return np.memmap(
+            self._file(name), dtype=dtype, mode="r", shape=(self.rows,) + shape
+        )
+
+    def iter_chunks(self, size=1 << 16, names=None):
+        """Yield `{name: slice}` dicts of at most `size` rows, straight from the memmaps."""
+        names = names or list(self.columns)
+        columns = {name: self.column(name) for name in names}
+        for start in range(0, self.rows, size):
+            yield {
+                name: column[start : start + size] for name, column in columns.items()
+            }
@@ -0,0 +1,665 @@
+"""
+Vectorised model of the `CoreStrategyPerp` state machine.
+
+Every method operates on a batch of independent price paths at once. State is
+kept in flat NumPy arrays (one element per path) and each operation mirrors the
+internal function of the same name in `contracts/CoreStrategyPerp.sol`, working
+on the subset of paths selected by an index array. Amounts are floats
+denominated in quote (USD); prices are quote per base.
+
+The Perp accounting (account value, free collateral and debt value) follows the
+Perp v2 ClearingHouse closely enough to reproduce `calcDebtRatio` and
+`calcCollateral`, but funding payments and the insurance fund are not modelled.
+
+Positions are kept per rung, as columns of (n_paths, n_rungs) arrays: rung 0 is
+the core range and the others the wings of `SimConfig.ladder` (`setLadder`).
+"""
+
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from .liquidity_amounts import (
+    amount0_for_liquidity_array,
+    amounts_for_liquidity_array,
+    liquidity_for_amounts_array,
+)
+from .pool_variables import base_ticks_array
+from .tickmath import sqrt_price_at_tick_array, tick_at_price_array
+
+BASIS_PRECISION = 10000
+DUST_LIQ = 100e-18
+
+
+@dataclass
+class SimConfig:
+    # CoreStrategyPerpConfig
+    min_deploy: float = 1e-2  # 1e4 USDC units
+    min_profit: float = 1e-6  # 1 USDC unit
+    tick_range_multiplier: int = 200
+    twap_time: int = 0  # in steps
+    debt_multiple: int = 10000
+    # setDebtThresholds / setCollateralThresholds / setSlippageConfig
+    debt_lower: int = 9900
+    debt_upper: int = 10100
+    collat_lower: int = 4900
+    collat_upper: int = 5100
+    collat_limit: int = 7500
+    slippage_adj: int = 9900
+    partial_withdraw: bool = False  # setPartialWithdraw
+    in_place_rebalance: bool = False  # setRebalanceConfig
+    residual_tolerance: int = 50
+    # setLadder: (multiplier, weight) of each wing next to the core range
+    ladder: tuple = ()
+    # keeper calls shiftRungs on the rungs the mark price has left
+    shift_rungs: bool = False
+    # Perp market
+    tick_spacing: int = 60
+    mark_twap_steps: int = 0  # ClearingHouseConfig twap interval, in steps
+    maker_fee: float = 0.001
+    taker_fee: float = 0.001
+    im_ratio: float = 0.1
+    pool_liquidity: float = 1e7
+    # keeper behaviour
+    keeper_interval: int = 1
+    harvest_interval: int = 0
+    keeper_collateral: bool = True
+
+
+@dataclass
+class Market:
+    """Prices seen by the strategy at a single step, one element per path."""
+
+    price: np.ndarray
+    tick: np.ndarray
+    mark_price: np.ndarray  # getBaseTokenMarkTwapPrice
+    determine_tick: np.ndarray  # tick used by PerpLib.determineTicks
+    sqrt_price: np.ndarray = field(init=False)
+    mark_sqrt_price: np.ndarray = field(init=False)
+
+    def __post_init__(self):
+        self.sqrt_price = np.sqrt(self.price)
+        self.mark_sqrt_price = np.sqrt(self.mark_price)
+
+
+class StrategySim:
+    def __init__(self, config: SimConfig, n_paths: int):
+        self.config = config
+        self.n_paths = n_paths
+        zeros = lambda: np.zeros(n_paths)  # noqa: E731
+        # strategy
+        self.want = zeros()
+        self.total_debt = zeros()
+        self.deposited = zeros()
+        self.profit_paid = zeros()
+        # rungs: the core range, then the ladder wings
+        self.multipliers = np.array(
+            [config.tick_range_multiplier] + [m for m, _ in config.ladder]
+        )
+        wings = np.array([w for _, w in config.ladder], dtype=np.float64)
+        self.weights = np.concatenate(([BASIS_PRECISION - wings.sum()], wings))
+        self.weights /= BASIS_PRECISION
+        rungs = lambda dtype=np.float64: np.zeros(  # noqa: E731
+            (n_paths, len(self.multipliers)), dtype=dtype
+        )
+        self.rung_lower = rungs(np.int64)
+        self.rung_upper = rungs(np.int64)
+        # perp account
+        self.collateral = zeros()
+        self.rung_liquidity = rungs()
+        self.rung_base_debt = rungs()
+        self.rung_quote_debt = rungs()
+        self.taker_base = zeros()
+        self.taker_quote = zeros()
+        self.pending_fees = zeros()
+        # counters
+        self.fees_collected = zeros()
+        self.taker_fees_paid = zeros()
+        self.debt_rebalances = np.zeros(n_paths, dtype=np.int64)
+        self.collat_rebalances = np.zeros(n_paths, dtype=np.int64)
+        self.rung_shifts = np.zeros(n_paths, dtype=np.int64)
+        self.harvests = np.zeros(n_paths, dtype=np.int64)
+
+    # views
+
+    @property
+    def lower_tick(self):
+        """lowerTick, the core range"""
+        return self.rung_lower[:, 0]
+
+    @property
+    def upper_tick(self):
+        return self.rung_upper[:, 0]
+
+    @property
+    def liquidity(self):
+        """getTotalLiquidity"""
+        return self.rung_liquidity.sum(axis=1)
+
+    def _range_sqrt(self, idx):
+        return (
+            sqrt_price_at_tick_array(self.rung_lower[idx]),
+            sqrt_price_at_tick_array(self.rung_upper[idx]),
+        )
+
+    def _maker_amounts(self, mkt, idx):
+        """Per rung amounts of the liquidity positions."""
+        sqrt_a, sqrt_b = self._range_sqrt(idx)
+        return amounts_for_liquidity_array(
+            mkt.sqrt_price[idx][:, None], sqrt_a, sqrt_b, self.rung_liquidity[idx]
+        )
+
+    def _maker_balances(self, mkt, idx):
+        """Base and quote of the liquidity positions net of what they minted."""
+        amount0, amount1 = self._maker_amounts(mkt, idx)
+        return (
+            (amount0 - self.rung_base_debt[idx]).sum(axis=1),
+            (amount1 - self.rung_quote_debt[idx]).sum(axis=1),
+        )
+
+    def balance_deployed(self, mkt, idx=slice(None)):
+        """perpVault.getAccountValue"""
+        maker_base, maker_quote = self._maker_balances(mkt, idx)
+        base = maker_base + self.taker_base[idx]
+        quote = maker_quote + self.taker_quote[idx]
+        return (
+            self.collateral[idx]
+            + self.pending_fees[idx]
+            + base * mkt.price[idx]
+            + quote
+        )
+
+    def estimated_total_assets(self, mkt, idx=slice(None)):
+        return self.want[idx] + self.balance_deployed(mkt, idx)
+
+    def free_collateral(self, mkt, idx=slice(None)):
+        """perpVault.getFreeCollateral"""
+        maker_base, _ = self._maker_balances(mkt, idx)
+        price = mkt.price[idx]
+        position = maker_base + self.taker_base[idx]
+        base_balance = self.taker_base[idx] - self.rung_base_debt[idx].sum(axis=1)
+        quote_balance = self.taker_quote[idx] - self.rung_quote_debt[idx].sum(axis=1)
+        debt_value = np.maximum(-base_balance, 0) * price + np.maximum(
+            -quote_balance, 0
+        )
+        margin = self.config.im_ratio * np.maximum(np.abs(position) * price, debt_value)
+        collateral = self.collateral[idx] + self.pending_fees[idx]
+        value = np.minimum(collateral, self.balance_deployed(mkt, idx))
+        return np.maximum(value - margin, 0)
+
+    def short_deployed(self, mkt, idx=slice(None)):
+        sqrt_a, sqrt_b = self._range_sqrt(idx)
+        # the contract passes max(mark, lower) unsorted, so above the range the
+        # amount is measured between upper and mark, exactly as on chain
+        return amount0_for_liquidity_array(
+            np.maximum(mkt.mark_sqrt_price[idx][:, None], sqrt_a),
+            sqrt_b,
+            self.rung_liquidity[idx],
+        ).sum(axis=1)
+
+    def rungs_out_of_range(self, mkt, idx=slice(None)):
+        """`rungsOutOfRange` as a (paths, rungs) mask."""
+        tick = tick_at_price_array(mkt.mark_price[idx])[:, None]
+        out = (tick < self.rung_lower[idx]) | (tick >= self.rung_upper[idx])
+        return out & (self.rung_liquidity[idx] > 0)
+
+    def calc_debt_ratio(self, mkt, idx=slice(None)):
+        short_amount = self.short_deployed(mkt, idx) * mkt.price[idx]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = (
+                self.total_debt[idx]
+                * self.config.debt_multiple
+                / 20000
+                * BASIS_PRECISION
+                / short_amount
+            )
+        return np.where(short_amount > 0, ratio, 0.0)
+
+    def calc_collateral(self, mkt, idx=slice(None)):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = (
+                self.free_collateral(mkt, idx) * BASIS_PRECISION / self.total_debt[idx]
+            )
+        return np.where(self.total_debt[idx] > 0, ratio, 0.0)
+
+    # internal operations, each acting on the paths in `idx`
+
+    def _collect_pending_fees(self, idx):
+        fees = self.pending_fees[idx]
+        self.collateral[idx] += fees
+        self.fees_collected[idx] += fees
+        self.pending_fees[idx] = 0
+        return fees
+
+    def _liquidate_all_to_lend(self, mkt, idx):
+        idx = idx[self.liquidity[idx] > 0]
+        if idx.size == 0:
+            return
+        self._remove_liquidity_fraction(mkt, idx, np.ones(idx.shape))
+
+    def _remove_liquidity_fraction(self, mkt, idx, fraction):
+        """
+        `_removeLiquidity` of `fraction` of each position, leaving the ranges as
+        they are. `fraction` is per path, or per path and rung.
+        """
+        fraction = np.asarray(fraction, dtype=np.float64)
+        if fraction.ndim == 1:
+            fraction = fraction[:, None]
+        self._collect_pending_fees(idx)
+        amount0, amount1 = self._maker_amounts(mkt, idx)
+        # removed liquidity leaves the residual as a taker position
+        self.taker_base[idx] += (fraction * (amount0 - self.rung_base_debt[idx])).sum(
+            axis=1
+        )
+        self.taker_quote[idx] += (fraction * (amount1 - self.rung_quote_debt[idx])).sum(
+            axis=1
+        )
+        self.rung_liquidity[idx] *= 1 - fraction
+        self.rung_base_debt[idx] *= 1 - fraction
+        self.rung_quote_debt[idx] *= 1 - fraction
+
+    def _withdraw_partial(self, mkt, idx, amount, deployed):
+        """`_withdrawPartial`: remove `amount / deployed` of the liquidity in place."""
+        self._remove_liquidity_fraction(mkt, idx, np.minimum(amount / deployed, 1.0))
+        self._close_residual(mkt, idx)
+        self._remove_collateral(mkt, idx, amount)
+
+    def _close_position(self, mkt, idx):
+        notional = self.taker_base[idx] * mkt.price[idx]
+        fee = np.abs(notional) * self.config.taker_fee
+        self.collateral[idx] += self.taker_quote[idx] + notional - fee
+        self.taker_fees_paid[idx] += fee
+        self.taker_base[idx] = 0
+        self.taker_quote[idx] = 0
+
+    def _determine_ticks(self, mkt, idx, rungs=None):
+        """`_determineTicks`, or `_recentreRung` of the rungs in the mask `rungs`."""
+        spacing = self.config.tick_spacing
+        lower, upper = base_ticks_array(
+            mkt.determine_tick[idx][:, None], spacing * self.multipliers, spacing
+        )
+        if rungs is not None:
+            lower = np.where(rungs, lower, self.rung_lower[idx])
+            upper = np.where(rungs, upper, self.rung_upper[idx])
+        self.rung_lower[idx], self.rung_upper[idx] = lower, upper
+
+    def _add_liquidity_to_short_market(self, mkt, idx, amount):
+        """Adds `amount` across the rungs by weight."""
+        self._add_liquidity(mkt, idx, np.asarray(amount)[..., None] * self.weights)
+
+    def _add_liquidity(self, mkt, idx, amounts):
+        """`_addLiquidity` of a (paths, rungs) array of amounts."""
+        sqrt_a, sqrt_b = self._range_sqrt(idx)
+        sqrt_p = mkt.sqrt_price[idx][:, None]
+        liquidity = liquidity_for_amounts_array(
+            sqrt_p,
+            sqrt_a,
+            sqrt_b,
+            amounts / mkt.mark_price[idx][:, None] / 2,
+            amounts / 2,
+        )
+        liquidity = np.maximum(liquidity, 0)
+        amount0, amount1 = amounts_for_liquidity_array(
+            sqrt_p, sqrt_a, sqrt_b, liquidity
+        )
+        self.rung_liquidity[idx] += liquidity
+        self.rung_base_debt[idx] += amount0
+        self.rung_quote_debt[idx] += amount1
+
+    def _deploy_from_lend(self, mkt, idx, amount):
+        self._liquidate_all_to_lend(mkt, idx)
+        self._determine_ticks(mkt, idx)
+        leverage = amount * self.config.debt_multiple / BASIS_PRECISION
+        self._add_liquidity_to_short_market(mkt, idx, leverage)
+
+    def _remove_collateral(self, mkt, idx, amount):
+        amount = np.minimum(amount, self.free_collateral(mkt, idx))
+        self.collateral[idx] -= amount
+        self.want[idx] += amount
+
+    def _close_residual(self, mkt, idx):
+        notional = np.abs(self.taker_base[idx]) * mkt.price[idx]
+        tolerance = (
+            self.estimated_total_assets(mkt, idx)
+            * self.config.residual_tolerance
+            / BASIS_PRECISION
+        )
+        self._close_position(mkt, idx[notional > tolerance])
+
+    def _liquidity_for_amount(self, mkt, idx, amount):
+        """Liquidity `amount` would mint in the core range."""
+        sqrt_a, sqrt_b = self._range_sqrt(idx)
+        liquidity = liquidity_for_amounts_array(
+            mkt.sqrt_price[idx],
+            sqrt_a[:, 0],
+            sqrt_b[:, 0],
+            amount / mkt.mark_price[idx] / 2,
+            amount / 2,
+        )
+        return np.maximum(liquidity, 0)
+
+    def _redeploy(self, mkt, idx):
+        self._liquidate_all_to_lend(mkt, idx)
+        self._close_position(mkt, idx)
+        self._deploy_from_lend(mkt, idx, self.estimated_total_assets(mkt, idx))
+
+    def _shift_rungs(self, mkt, idx, rungs):
+        """`_shiftRungs`: move the rungs in the (paths, rungs) mask back around the price."""
+        self._remove_liquidity_fraction(mkt, idx, rungs.astype(np.float64))
+        self._close_residual(mkt, idx)
+        self._determine_ticks(mkt, idx, rungs)
+        leverage = (
+            self.estimated_total_assets(mkt, idx)
+            * self.config.debt_multiple
+            / BASIS_PRECISION
+        )
+        self._add_liquidity(
+            mkt, idx, np.where(rungs, leverage[:, None] * self.weights, 0)
+        )
+
+    def shift_rungs(self, mkt, idx, rungs=None):
+        """`shiftRungs`, by default of every rung out of range."""
+        out = self.rungs_out_of_range(mkt, idx)
+        rungs = out if rungs is None else rungs & out
+        move = rungs.any(axis=1)
+        self.rung_shifts[idx[move]] += 1
+        self._shift_rungs(mkt, idx[move], rungs[move])
+        return idx[move]
+
+    def _rebalance(self, mkt, idx):
+        cfg = self.config
+        if not cfg.in_place_rebalance:
+            self._redeploy(mkt, idx)
+            return
+
+        empty = idx[self.liquidity[idx] == 0]
+        self._deploy_from_lend(mkt, empty, self.estimated_total_assets(mkt, empty))
+        live = idx[self.liquidity[idx] > 0]
+        if len(self.multipliers) > 1:
+            # ladder: only the rungs the price has left move
+            out = self.rungs_out_of_range(mkt, live)
+            some = out.any(axis=1)
+            self._redeploy(mkt, live[~some])
+            self.rung_shifts[live[some]] += 1
+            self._shift_rungs(mkt, live[some], out[some])
+            return
+
+        spacing = cfg.tick_spacing
+        lower, upper = base_ticks_array(
+            mkt.determine_tick[live], spacing * cfg.tick_range_multiplier, spacing
+        )
+        moved = (self.lower_tick[live] != lower) | (self.upper_tick[live] != upper)
+        self._shift_rungs(mkt, live[moved], np.ones((moved.sum(), 1), dtype=bool))
+
+        # same range: only add or remove the difference in size
+        keep = live[~moved]
+        leverage = (
+            self.estimated_total_assets(mkt, keep) * cfg.debt_multiple / BASIS_PRECISION
+        )
+        target = self._liquidity_for_amount(mkt, keep, leverage)
+        current = self.liquidity[keep]
+        grow = target > current
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self._add_liquidity_to_short_market(
+                mkt,
+                keep[grow],
+                (leverage * (target - current) / target)[grow],
+            )
+            shrink = keep[target < current]
+            self._remove_liquidity_fraction(
+                mkt, shrink, ((current - target) / current)[target < current]
+            )
+        self._close_residual(mkt, shrink)
+
+    # external entry points
+
+    def deploy(self, mkt, idx, amount):
+        """`_deploy`: move idle want into Perp and open the LP position."""
+        amount = np.broadcast_to(amount, idx.shape)
+        keep = amount >= self.config.min_deploy
+        idx, amount = idx[keep], amount[keep]
+        if idx.size == 0:
+            return
+        self.want[idx] -= amount
+        self.collateral[idx] += amount
+        self._deploy_from_lend(mkt, idx, amount)
+
+    def deposit(self, mkt, amount, idx=None):
+        """Vault deposit followed by the harvest that deploys it."""
+        idx = np.arange(self.n_paths) if idx is None else idx
+        self.want[idx] += amount
+        self.total_debt[idx] += amount
+        self.deposited[idx] += amount
+        self.deploy(mkt, idx, self.want[idx])
+
+    def withdraw(self, mkt, idx, amount_needed):
+        """`_withdraw`; returns the amount of want freed for each path in `idx`."""
+        amount_needed = np.broadcast_to(np.asarray(amount_needed, float), idx.shape)
+        balance_want = self.want[idx].copy()
+        deployed = self.balance_deployed(mkt, idx)
+        todo = amount_needed > balance_want
+        with np.errstate(divide="ignore", invalid="ignore"):
+            strat_percent = (amount_needed - balance_want) * BASIS_PRECISION / deployed
+        full = idx[todo & (strat_percent > 9500)]
+        partial = todo & (strat_percent <= 9500)
+
+        # liquidateAllPositionsInternal
+        self._liquidate_all_to_lend(mkt, full)
+        self._remove_collateral(mkt, full, self.free_collateral(mkt, full))
+
+        part = idx[partial]
+        if self.config.partial_withdraw:
+            self._withdraw_partial(
+                mkt,
+                part,
+                (amount_needed - balance_want)[partial],
+                deployed[partial],
+            )
+            return np.where(todo, self.want[idx] - balance_want, amount_needed)
+        self._liquidate_all_to_lend(mkt, part)
+        self._remove_collateral(mkt, part, amount_needed[partial])
+        readd = self.total_debt[part] > amount_needed[partial]
+        self._add_liquidity_to_short_market(
+            mkt, part[readd], (deployed[partial] - amount_needed[partial])[readd]
+        )
+        freed = np.where(todo, self.want[idx] - balance_want, amount_needed)
+        return freed
+
+    def rebalance_debt(self, mkt, idx):
+        self.debt_rebalances[idx] += 1
+        self._rebalance(mkt, idx)
+
+    def rebalance_collateral(self, mkt, idx):
+        self.collat_rebalances[idx] += 1
+        self._rebalance(mkt, idx)
+
+    def harvest(self, mkt, idx):
+        """`prepareReturn` + `adjustPosition`; returns the reported profit (or -loss)."""
+        cfg = self.config
+        collect = idx[
+            (self.pending_fees[idx] > cfg.min_profit)
+            & (self.liquidity[idx] >= DUST_LIQ)
+        ]
+        self._collect_pending_fees(collect)
+        self.harvests[idx] += 1
+
+        pnl = self.estimated_total_assets(mkt, idx) - self.total_debt[idx]
+        gain = pnl > 0
+        freed = self.withdraw(mkt, idx[gain], pnl[gain])
+        # profit is sent back to the vault, losses reduce the strategy's debt
+        paid = np.minimum(freed, self.want[idx[gain]])
+        self.want[idx[gain]] -= paid
+        self.profit_paid[idx[gain]] += paid
+        self.total_debt[idx[~gain]] += pnl[~gain]
+        self.deploy(mkt, idx, self.want[idx])
+        return pnl
+
+    def accrue_fees(self, mkt, volume):
+        """
+        Credit maker fees for `volume` (quote notional) traded at the current
+        tick; returns whether any rung was in range.
+        """
+        tick = mkt.tick[:, None]
+        in_range = (
+            (self.rung_liquidity > 0)
+            & (tick >= self.rung_lower)
+            & (tick < self.rung_upper)
+        )
+        active = np.where(in_range, self.rung_liquidity, 0).sum(axis=1)
+        share = active / (active + self.config.pool_liquidity)
+        self.pending_fees += volume * self.config.maker_fee * share
+        return in_range.any(axis=1)
+
+
+@dataclass
+class SimResult:
+    config: SimConfig
+    final_assets: np.ndarray
+    total_debt: np.ndarray
+    deposited: np.ndarray
+    profit_paid: np.ndarray
+    fees_collected: np.ndarray
+    taker_fees_paid: np.ndarray
+    debt_rebalances: np.ndarray
+    collat_rebalances: np.ndarray
+    rung_shifts: np.ndarray
+    time_in_range: np.ndarray
+    min_debt_ratio: np.ndarray
+    max_debt_ratio: np.ndarray
+    harvest_pnl: np.ndarray  # (n_paths, n_harvests)
+    debt_ratio: np.ndarray = None  # (n_paths, n_steps) when recorded
+    collat_ratio: np.ndarray = None
+
+    def summary(self):
+        """Per-path scalar metrics, keyed by name."""
+        return {
+            "final_assets": self.final_assets,
+            "pnl": self.final_assets + self.profit_paid - self.deposited,
+            "fees_collected": self.fees_collected,
+            "taker_fees_paid": self.taker_fees_paid,
+            "debt_rebalances": self.debt_rebalances,
+            "collat_rebalances": self.collat_rebalances,
+            "rung_shifts": self.rung_shifts,
+            "time_in_range": self.time_in_range,
+            "min_debt_ratio": self.min_debt_ratio,
+            "max_debt_ratio": self.max_debt_ratio,
+        }
+
+
+def _twap_ticks(ticks, window):
+    """Arithmetic mean tick over the trailing `window` steps (what `observe` returns)."""
+    if window <= 0:
+        return ticks
+    cumulative = np.cumsum(ticks, axis=1, dtype=np.float64)
+    lagged = np.zeros_like(cumulative)
+    lagged[:, window:] = cumulative[:, :-window]
+    counts = np.minimum(np.arange(1, ticks.shape[1] + 1), window)
+    return np.floor((cumulative - lagged) / counts).astype(np.int64)
+
+
+def gbm_paths(n_paths, n_steps, s0=1500.0, vol=0.8, dt=1 / (365 * 24), seed=None):
+    """Geometric brownian motion price paths with annualised `vol` and step `dt` (years)."""
+    rng = np.random.default_rng(seed)
+    shocks = rng.standard_normal((n_paths, n_steps)) * vol * np.sqrt(dt)
+    log_returns = shocks - 0.5 * vol**2 * dt
+    log_returns[:, 0] = 0
+    return s0 * np.exp(np.cumsum(log_returns, axis=1))
+
+
+def simulate(prices, config=None, deposit=10_000.0, volume=None, record=False):
+    """
+    Run the strategy over a batch of price paths.
+
+    `prices` has shape (n_paths, n_steps) in quote per base. `volume` is the
+    quote notional traded in the pool per step (same shape, or broadcastable),
+    used to accrue maker fees while the position is in range.
+    """
+    config = config or SimConfig()
+    prices = np.atleast_2d(np.asarray(prices, dtype=np.float64))
+    n_paths, n_steps = prices.shape
+    volume = np.zeros(1) if volume is None else np.asarray(volume, dtype=np.float64)
+    volume = np.broadcast_to(volume, prices.shape)
+
+    ticks = tick_at_price_array(prices)
+    determine_ticks = _twap_ticks(ticks, config.twap_time)
+    if config.mark_twap_steps > 0:
+        mark_ticks = _twap_ticks(ticks, config.mark_twap_steps)
+        mark_prices = np.power(1.0001, mark_ticks.astype(np.float64))
+    else:
+        mark_prices = prices
+
+    def market(t):
+        return Market(
+            price=prices[:, t],
+            tick=ticks[:, t],
+            mark_price=mark_prices[:, t],
+            determine_tick=determine_ticks[:, t],
+        )
+
+    sim = StrategySim(config, n_paths)
+    everyone = np.arange(n_paths)
+    sim.deposit(market(0), deposit)
+
+    in_range_steps = np.zeros(n_paths)
+    min_ratio = np.full(n_paths, np.inf)
+    max_ratio = np.zeros(n_paths)
+    harvest_pnl = []
+    debt_ratio_hist = np.empty((n_paths, n_steps)) if record else None
+    collat_ratio_hist = np.empty((n_paths, n_steps)) if record else None
+
+    for t in range(n_steps):
+        mkt = market(t)
+        in_range_steps += sim.accrue_fees(mkt, volume[:, t])
+
+        debt_ratio = sim.calc_debt_ratio(mkt)
+        if t % config.keeper_interval == 0:
+            active = sim.estimated_total_assets(mkt) > config.min_deploy
+            out_of_band = (debt_ratio < config.debt_lower) | (
+                debt_ratio > config.debt_upper
+            )
+            rebalance = np.flatnonzero(active & out_of_band)
+            if rebalance.size:
+                sim.rebalance_debt(mkt, rebalance)
+            if config.keeper_collateral:
+                collat = sim.calc_collateral(mkt)
+                out_of_band = (collat < config.collat_lower) | (
+                    collat > config.collat_upper
+                )
+                out_of_band[rebalance] = False
+                rebalance = np.flatnonzero(active & out_of_band)
+                if rebalance.size:
+                    sim.rebalance_collateral(mkt, rebalance)
+            if config.shift_rungs:
+                sim.shift_rungs(mkt, np.flatnonzero(active))
+            debt_ratio = sim.calc_debt_ratio(mkt)
+
+        if config.harvest_interval and (t + 1) % config.harvest_interval == 0:
+            harvest_pnl.append(sim.harvest(mkt, everyone))
+
+        min_ratio = np.minimum(min_ratio, debt_ratio)
+        max_ratio = np.maximum(max_ratio, debt_ratio)
+        if record:
+            debt_ratio_hist[:, t] = debt_ratio
+            collat_ratio_hist[:, t] = sim.calc_collateral(mkt)
+
+    last = market(n_steps - 1)
+    return SimResult(
+        config=config,
+        final_assets=sim.estimated_total_assets(last),
+        total_debt=sim.total_debt.copy(),
+        deposited=sim.deposited,
+        profit_paid=sim.profit_paid,
+        fees_collected=sim.fees_collected + sim.pending_fees,
+        taker_fees_paid=sim.taker_fees_paid,
+        debt_rebalances=sim.debt_rebalances,
+        collat_rebalances=sim.collat_rebalances,
+        rung_shifts=sim.rung_shifts,
+        time_in_range=in_range_steps / n_steps,
+        min_debt_ratio=min_ratio,
+        max_debt_ratio=max_ratio,
+        harvest_pnl=(
+            np.stack(harvest_pnl, axis=1) if harvest_pnl else np.zeros((n_paths, 0))
+        ),
+        debt_ratio=debt_ratio_hist,
+        collat_ratio=collat_ratio_hist,
+    )
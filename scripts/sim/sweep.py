@@ -0,0 +1,248 @@
+"""
+Parallel parameter sweeps over `SimConfig`.
+
+A sweep is a list of parameter sets (built with `grid`, `random_sample` or
+`latin_hypercube`) evaluated against one shared batch of price paths. Work is
+split into fixed-size chunks which are fanned out over a process pool; each
+finished chunk is written atomically as a compressed NPZ file, so an
+interrupted sweep resumes by skipping the chunks already on disk.
+
+    python -m scripts.sim.sweep sweep.yml sweep-out
+"""
+
+import hashlib
+import itertools
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import fields, replace
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+from .strategy import BASIS_PRECISION, SimConfig, gbm_paths, simulate
+
+CONFIG_FIELDS = {f.name: f.type for f in fields(SimConfig)}
+METRICS = (
+    "pnl",
+    "fees_collected",
+    "taker_fees_paid",
+    "debt_rebalances",
+    "collat_rebalances",
+    "time_in_range",
+)
+
+_prices = None
+_volume = None
+
+
+def grid(space):
+    """Cartesian product of `{name: [values]}`."""
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*space.values())]
+
+
+def _scale(space, unit):
+    params = []
+    names = list(space)
+    for row in unit:
+        sample = {}
+        for name, u in zip(names, row):
+            lo, hi = space[name]
+            value = lo + u * (hi - lo)
+            if CONFIG_FIELDS.get(name) in (int, "int"):
+                value = int(round(value))
+            sample[name] = value
+        params.append(sample)
+    return params
+
+
+def random_sample(space, n, seed=None):
+    """`n` uniform samples from `{name: (low, high)}`."""
+    rng = np.random.default_rng(seed)
+    return _scale(space, rng.random((n, len(space))))
+
+
+def latin_hypercube(space, n, seed=None):
+    """`n` Latin hypercube samples from `{name: (low, high)}`."""
+    rng = np.random.default_rng(seed)
+    unit = np.empty((n, len(space)))
+    for j in range(len(space)):
+        unit[:, j] = (rng.permutation(n) + rng.random(n)) / n
+    return _scale(space, unit)
+
+
+def check_config(config):
+    """Returns False for settings the strategy setters would revert on."""
+    return (
+        config.debt_lower <= BASIS_PRECISION
+        and config.debt_lower < config.debt_upper
+        and config.collat_limit <= BASIS_PRECISION
+        and config.collat_limit > config.collat_upper
+        and config.collat_upper > config.collat_lower
+        and config.tick_range_multiplier > 0
+        # the strategy stores thresholds and slippage as uint16, debtMultiple as uint32
+        and 0 <= config.debt_lower
+        and config.debt_upper < 2**16
+        and 0 <= config.collat_lower
+        and 0 <= config.debt_multiple < 2**32
+        and 0 <= config.slippage_adj < 2**16
+        and 0 <= config.residual_tolerance <= BASIS_PRECISION
+    )
+
+
+def _init_worker(prices_path, volume):
+    global _prices, _volume
+    _prices = np.load(prices_path, mmap_mode="r")
+    _volume = volume
+
+
+def _run_chunk(chunk_id, params, base, deposit, out_dir):
+    columns = {name: np.full(len(params), np.nan) for name in METRICS + ("pnl_p05",)}
+    columns["valid"] = np.zeros(len(params), dtype=bool)
+    for row, overrides in enumerate(params):
+        config = replace(base, **overrides)
+        if not check_config(config):
+            continue
+        columns["valid"][row] = True
+        summary = simulate(_prices, config, deposit, volume=_volume).summary()
+        for name in METRICS:
+            columns[name][row] = np.mean(summary[name])
+        columns["pnl_p05"][row] = np.percentile(summary["pnl"], 5)
+
+    for name in params[0]:
+        columns["param_" + name] = [p[name] for p in params]
+    columns["index"] = list(range(chunk_id * len(params), (chunk_id + 1) * len(params)))
+
+    path = out_dir / "chunk_{:06d}.npz".format(chunk_id)
+    tmp = out_dir / "chunk_{:06d}.tmp.npz".format(chunk_id)
+    np.savez_compressed(tmp, **{k: np.asarray(v) for k, v in columns.items()})
+    os.replace(tmp, path)
+    return chunk_id
+
+
+def _fingerprint(params, base, deposit, prices):
+    digest = hashlib.sha256()
+    digest.update(json.dumps(params, sort_keys=True, default=float).encode())
+    digest.update(repr(base).encode())
+    digest.update(repr(deposit).encode())
+    digest.update(np.ascontiguousarray(prices).tobytes())
+    return digest.hexdigest()
+
+
+def run_sweep(
+    params,
+    prices,
+    out_dir,
+    base=None,
+    deposit=10_000.0,
+    volume=None,
+    chunk_size=8,
+    workers=None,
+):
+    """
+    Evaluate every parameter set in `params` and store results under `out_dir`.
+
+    Re-running with the same inputs only computes the chunks that are missing.
+    Returns the merged results, as loaded by `load_results`.
+    """
+    base = base or SimConfig()
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    prices = np.asarray(prices, dtype=np.float64)
+
+    manifest_path = out_dir / "manifest.json"
+    fingerprint = _fingerprint(params, base, deposit, prices)
+    if manifest_path.exists():
+        manifest = json.loads(manifest_path.read_text())
+        if manifest["fingerprint"] != fingerprint:
+            raise ValueError("{} holds results for a different sweep".format(out_dir))
+    else:
+        np.save(out_dir / "prices.npy", prices)
+        manifest = {
+            "fingerprint": fingerprint,
+            "size": len(params),
+            "chunk_size": chunk_size,
+            "base": repr(base),
+        }
+        manifest_path.write_text(json.dumps(manifest, indent=2))
+    chunk_size = manifest["chunk_size"]
+
+    chunks = [
+        (i, params[start : start + chunk_size])
+        for i, start in enumerate(range(0, len(params), chunk_size))
+    ]
+    todo = [
+        (i, chunk)
+        for i, chunk in chunks
+        if not (out_dir / "chunk_{:06d}.npz".format(i)).exists()
+    ]
+    if todo:
+        with ProcessPoolExecutor(
+            max_workers=workers or os.cpu_count(),
+            initializer=_init_worker,
+            initargs=(str(out_dir / "prices.npy"), volume),
+        ) as pool:
+            futures = [
+                pool.submit(_run_chunk, i, chunk, base, deposit, out_dir)
+                for i, chunk in todo
+            ]
+            for done, future in enumerate(as_completed(futures), 1):
+                future.result()
+                print("chunk {}/{} done".format(done, len(todo)))
+    return load_results(out_dir)
+
+
+def load_results(out_dir):
+    """Concatenate all finished chunks into a dict of columns, ordered by index."""
+    files = sorted(Path(out_dir).glob("chunk_[0-9]*[0-9].npz"))
+    if not files:
+        return {}
+    parts = [dict(np.load(f)) for f in files]
+    merged = {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+    order = np.argsort(merged["index"])
+    return {k: v[order] for k, v in merged.items()}
+
+
+def main(spec_path="sweep.yml", out_dir="sweep-out"):
+    spec = yaml.safe_load(Path(spec_path).read_text())
+    sampler = spec.get("sampler", "grid")
+    if sampler == "grid":
+        params = grid(spec["params"])
+    elif sampler == "random":
+        params = random_sample(spec["params"], spec["samples"], spec.get("seed"))
+    elif sampler == "lhs":
+        params = latin_hypercube(spec["params"], spec["samples"], spec.get("seed"))
+    else:
+        raise ValueError("unknown sampler '{}'".format(sampler))
+
+    paths = spec.get("paths", {})
+    if "file" in paths:
+        prices = np.load(paths["file"], mmap_mode="r")
+    else:
+        prices = gbm_paths(
+            paths.get("n_paths", 1000),
+            paths.get("n_steps", 24 * 7),
+            s0=paths.get("s0", 1500.0),
+            vol=paths.get("vol", 0.8),
+            seed=paths.get("seed", 0),
+        )
+    base = replace(SimConfig(), **spec.get("base", {}))
+    results = run_sweep(
+        params,
+        prices,
+        out_dir,
+        base=base,
+        deposit=spec.get("deposit", 10_000.0),
+        volume=spec.get("volume"),
+        chunk_size=spec.get("chunk_size", 8),
+        workers=spec.get("workers"),
+    )
+    best = np.nanargmax(results["pnl"])
+    print("best of {} runs: {}".format(len(params), params[best]))
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
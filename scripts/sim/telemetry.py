@@ -0,0 +1,310 @@
+"""
+Index a strategy's telemetry events into time series for dashboards.
+
+`CoreStrategyPerp` and its `StrategyInsurance` fund emit one event per thing
+worth charting, with only their kind indexed and the values in the data:
+
+- `Rebalanced`: a debt (kind 0) or collateral (kind 1) rebalance, with the
+  ratio that triggered it and the capital deployed before it.
+- `TicksUpdated`: a liquidity range (rung 0 is the core range, the others
+  ladder wings) moved, with the multiplier it used.
+- `Harvested`: the fees collected, profit and loss reported, and the
+  insurance payment and compensation of each harvest.
+- `Withdrawn`: want requested from and freed by the position; the
+  difference is the slippage of the withdrawal.
+- `PerpCallFailed`: a Perp call the strategy tolerates reverted, and why.
+- `InsurancePayment`, `InsurancePayout`: the fund's side of a harvest.
+
+`Telemetry` fetches the logs of both contracts in fixed-size block ranges
+with a thread pool, like `scripts/sim/ingest.py`, and appends each event to
+its own `ColumnStore` under `out_dir/<event>` with its block, log index and
+timestamp. Amounts are stored as floats in want (fees in quote, 18 decimals).
+Re-running continues from the last block stored:
+
+    python -m scripts.sim.telemetry https://archive.node <strategy> telemetry \\
+        --from-block 50000000
+
+Dashboards open the stores with `open_stores(out_dir, readonly=True)`, which
+never writes to them, `refresh` them to see new rows, and read them with
+`window`, `latest` and `resample`. These binary search the timestamp column
+and slice the memmaps, so a query costs the rows it returns and not the
+length of the history.
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from eth_utils import to_checksum_address
+from hexbytes import HexBytes
+from web3 import Web3
+
+from .attribution import GETTER_ABI, STRATEGY_ABI
+from .ingest import _get_logs, _signed, _topic, _topic_hex, _words
+from .store import ColumnStore
+
+# how a field is read: an indexed topic, a raw or signed word, an amount in
+# want or in 18 decimals, or a string
+TOPIC, UINT, INT, WANT, QUOTE, TEXT = range(6)
+TEXT_BYTES = 64
+REBALANCE_DEBT, REBALANCE_COLLATERAL = 0, 1
+CALL_CLOSE_POSITION, CALL_COLLECT_FEES = 1, 2
+
+# name: (signature, emitted by the insurance fund, ((column, dtype, field), ...))
+EVENTS = {
+    "rebalanced": (
+        "Rebalanced(uint8,uint256,uint256)",
+        False,
+        (("kind", "u1", TOPIC), ("ratio", "<u4", UINT), ("deployed", "<f8", WANT)),
+    ),
+    "ticks": (
+        "TicksUpdated(uint8,int24,int24,int24)",
+        False,
+        (
+            ("rung", "u1", TOPIC),
+            ("lower_tick", "<i4", INT),
+            ("upper_tick", "<i4", INT),
+            ("multiplier", "<i4", INT),
+        ),
+    ),
+    "harvested": (
+        "Harvested(uint256,uint256,uint256,uint256,uint256)",
+        False,
+        (
+            ("fees", "<f8", QUOTE),
+            ("profit", "<f8", WANT),
+            ("loss", "<f8", WANT),
+            ("insurance_payment", "<f8", WANT),
+            ("compensation", "<f8", WANT),
+        ),
+    ),
+    "withdrawn": (
+        "Withdrawn(uint256,uint256,uint256)",
+        False,
+        (
+            ("requested", "<f8", WANT),
+            ("freed", "<f8", WANT),
+            ("strat_percent", "<u4", UINT),
+        ),
+    ),
+    "call_failed": (
+        "PerpCallFailed(uint8,string)",
+        False,
+        (("call", "u1", TOPIC), ("reason", "S{}".format(TEXT_BYTES), TEXT)),
+    ),
+    "insurance_payment": (
+        "InsurancePayment(uint256,uint256,uint256)",
+        True,
+        (
+            ("strategy_debt", "<f8", WANT),
+            ("profit", "<f8", WANT),
+            ("payment", "<f8", WANT),
+        ),
+    ),
+    "insurance_payout": (
+        "InsurancePayout(uint256)",
+        True,
+        (("payout", "<f8", WANT),),
+    ),
+}
+TOPICS = {_topic(signature): name for name, (signature, _, _) in EVENTS.items()}
+KEY_COLUMNS = (("block", "<u8", ()), ("log_index", "<u4", ()), ("timestamp", "<u8", ()))
+
+
+def event_columns(name):
+    return KEY_COLUMNS + tuple(
+        (column, dtype, ()) for column, dtype, _ in EVENTS[name][2]
+    )
+
+
+def open_stores(out_dir, readonly=False):
+    """`{event: ColumnStore}` under `out_dir`."""
+    return {
+        name: ColumnStore(Path(out_dir) / name, event_columns(name), readonly)
+        for name in EVENTS
+    }
+
+
+def _text(data, offset):
+    length = int.from_bytes(data[offset : offset + 32], "big")
+    return data[offset + 32 : offset + 32 + length][:TEXT_BYTES]
+
+
+def decode_log(log, want_unit):
+    """`(event, row)` of a telemetry log, or None for any other log."""
+    name = TOPICS.get(_topic_hex(log["topics"][0]))
+    if name is None:
+        return None
+    fields = EVENTS[name][2]
+    topics = [int.from_bytes(HexBytes(t), "big") for t in log["topics"][1:]]
+    indexed = sum(field == TOPIC for _, _, field in fields)
+    data = bytes(HexBytes(log["data"]))
+    # funds deployed before this schema indexed every field
+    words = topics[indexed:] + _words(data)
+    row = [int(log["blockNumber"]), int(log["logIndex"])]
+    for _, _, field in fields:
+        if field == TOPIC:
+            row.append(topics.pop(0))
+            continue
+        word = words.pop(0)
+        if field == INT:
+            row.append(_signed(word))
+        elif field == WANT:
+            row.append(word / want_unit)
+        elif field == QUOTE:
+            row.append(word / 1e18)
+        elif field == TEXT:
+            row.append(_text(data, word))
+        else:
+            row.append(word)
+    return name, row
+
+
+class Telemetry:
+    def __init__(self, out_dir, strategy, insurance=None, want_decimals=6):
+        self.strategy = to_checksum_address(strategy)
+        # a strategy without a fund reports the zero address
+        self.insurance = (
+            to_checksum_address(insurance) if insurance and int(insurance, 16) else None
+        )
+        self.want_unit = 10**want_decimals
+        self.stores = open_stores(out_dir)
+
+    @classmethod
+    def from_strategy(cls, w3, strategy, out_dir):
+        """Look the insurance fund and want decimals up from the strategy."""
+        contract = w3.eth.contract(to_checksum_address(strategy), abi=STRATEGY_ABI)
+        want = w3.eth.contract(contract.functions.want().call(), abi=GETTER_ABI)
+        return cls(
+            out_dir,
+            strategy,
+            contract.functions.insurance().call(),
+            want.functions.decimals().call(),
+        )
+
+    @property
+    def last_block(self):
+        return min(store.last_block for store in self.stores.values())
+
+    def fetch_range(self, w3, start, end):
+        """Telemetry logs of `[start, end]` in chain order, and their block timestamps."""
+        logs = _get_logs(
+            w3,
+            {
+                "fromBlock": start,
+                "toBlock": end,
+                "address": [a for a in (self.strategy, self.insurance) if a],
+                "topics": [list(TOPICS)],
+            },
+        )
+        logs.sort(key=lambda log: (int(log["blockNumber"]), int(log["logIndex"])))
+        blocks = {int(log["blockNumber"]) for log in logs}
+        timestamps = {b: int(w3.eth.get_block(b)["timestamp"]) for b in blocks}
+        return logs, timestamps
+
+    def process(self, logs, timestamps, last_block):
+        """Append the events of the blocks up to `last_block` to their stores."""
+        insurance = {
+            name for name, (_, emitted_by_fund, _) in EVENTS.items() if emitted_by_fund
+        }
+        rows = {name: [] for name in EVENTS}
+        for log in logs:
+            decoded = decode_log(log, self.want_unit)
+            if decoded is None:
+                continue
+            name, row = decoded
+            address = to_checksum_address(log["address"])
+            if address != (self.insurance if name in insurance else self.strategy):
+                continue
+            block = row[0]
+            # a store that got ahead of the others before an interrupted run
+            if block <= self.stores[name].last_block:
+                continue
+            rows[name].append(row[:2] + [timestamps[block]] + row[2:])
+        for name, store in self.stores.items():
+            columns = list(zip(*rows[name])) or [[]] * len(store.columns)
+            store.append(
+                {column: values for column, values in zip(store.columns, columns)},
+                last_block,
+            )
+
+    def run(self, w3, from_block=0, to_block=None, chunk=2000, workers=8):
+        """Index `[from_block, to_block]` (default: latest) after the last block stored."""
+        start = max(from_block, self.last_block + 1)
+        end = w3.eth.block_number if to_block is None else to_block
+        ranges = [(s, min(s + chunk - 1, end)) for s in range(start, end + 1, chunk)]
+        with ThreadPoolExecutor(workers) as executor:
+            # bounded look-ahead so a slow range does not pile up finished ones
+            window = workers * 4
+            for offset in range(0, len(ranges), window):
+                batch = ranges[offset : offset + window]
+                fetched = executor.map(lambda r: self.fetch_range(w3, *r), batch)
+                for (_, range_end), (logs, timestamps) in zip(batch, fetched):
+                    self.process(logs, timestamps, range_end)
+        return self.stores
+
+
+def _bounds(store, start, end):
+    timestamps = store.column("timestamp")
+    first = 0 if start is None else int(np.searchsorted(timestamps, start, "left"))
+    last = (
+        len(timestamps)
+        if end is None
+        else int(np.searchsorted(timestamps, end, "right"))
+    )
+    return first, last
+
+
+def window(store, start=None, end=None, names=None):
+    """`{column: array}` of the rows with `start <= timestamp <= end`."""
+    first, last = _bounds(store, start, end)
+    return {name: store.column(name)[first:last] for name in names or store.columns}
+
+
+def latest(store, n=1, names=None):
+    """`{column: array}` of the last `n` rows."""
+    return {
+        name: store.column(name)[max(store.rows - n, 0) :]
+        for name in names or store.columns
+    }
+
+
+def resample(store, column, bucket, start, end):
+    """
+    `(bucket starts, sums, counts)` of `column` over `[start, end)` in buckets
+    of `bucket` seconds, for charting totals, rates or means.
+    """
+    first, last = _bounds(store, start, end - 1)
+    timestamps = store.column("timestamp")[first:last]
+    values = np.asarray(store.column(column)[first:last], dtype=np.float64)
+    count = -(-(end - start) // bucket)
+    index = (timestamps.astype(np.int64) - start) // bucket
+    return (
+        start + np.arange(count) * bucket,
+        np.bincount(index, weights=values, minlength=count),
+        np.bincount(index, minlength=count),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("rpc")
+    parser.add_argument("strategy")
+    parser.add_argument("out_dir")
+    parser.add_argument("--from-block", type=int, default=0)
+    parser.add_argument("--to-block", type=int)
+    parser.add_argument("--chunk", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    w3 = Web3(Web3.HTTPProvider(args.rpc, request_kwargs={"timeout": 60}))
+    telemetry = Telemetry.from_strategy(w3, args.strategy, args.out_dir)
+    stores = telemetry.run(w3, args.from_block, args.to_block, args.chunk, args.workers)
+    print("up to block {}".format(telemetry.last_block))
+    for name, store in stores.items():
+        print("{:>18} {:8d}".format(name, store.rows))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""
+Volatility-adaptive width for the strategy's liquidity range.
+
+`PerpLib.determineTicks` centres a range of `tickSpacing * tickRangeMultiplier`
+ticks on each side of the current tick. `RangeOptimizer` picks the multiplier
+that maximises the expected return per second of the hedged position, for
+every candidate multiplier at once. For a position of value `V` (the
+strategy's assets times `debtMultiple`) in a range of half width `h` in log
+price:
+
+- fees: the range holds `V * c / (2 * sqrt(P))` liquidity, with
+  `c = 1 / (1 - exp(-h / 2))` the concentration over a full range position,
+  and earns `maker_fee * volume` times its share of the active liquidity.
+- impermanent loss: the hedged position loses `V * c * sigma^2 / 8` per second
+  (the loss-versus-rebalancing rate of a Uniswap V3 range).
+- rebalances: the price leaves the range after `h^2 / sigma^2` seconds on
+  average and the keeper takes `keeper_delay` seconds to react. Each
+  rebalance closes a taker residual of about `V / 2`, paying the taker fee and
+  the price impact of that trade on the pool, and pays gas.
+
+`sigma^2`, the volume and the pool's active liquidity are exponentially
+weighted with `half_life` seconds. `observe` folds in one observation in
+constant time and `load` seeds the averages from a pool history written by
+`scripts/sim/ingest.py`, so a keeper can call `decide` every block:
+
+    optimizer = RangeOptimizer(RangeModel(tick_spacing=60, max_multiplier=4000))
+    optimizer.load(open_stores("history")[0])
+    optimizer.decide(current=200, capital=1e6)
+"""
+
+import math
+from dataclasses import dataclass
+
+import numpy as np
+
+from .ingest import SWAP
+from .strategy import BASIS_PRECISION
+
+LOG_TICK = math.log(1.0001)
+
+
+@dataclass
+class RangeModel:
+    tick_spacing: int = 60
+    maker_fee: float = 0.001
+    taker_fee: float = 0.001
+    debt_multiple: int = 10000
+    # gas of one rebalance, in USD
+    rebalance_gas: float = 0.0
+    # seconds between the price leaving the range and the rebalance
+    keeper_delay: float = 0.0
+    # candidate multipliers, both inclusive
+    min_multiplier: int = 1
+    max_multiplier: int = 4096
+
+
+class RangeOptimizer:
+    def __init__(self, model=None, half_life=3600.0):
+        self.model = model or RangeModel()
+        self.decay = math.log(2) / half_life
+        self.multipliers = np.arange(
+            self.model.min_multiplier, self.model.max_multiplier + 1
+        )
+        half_width = self.multipliers * self.model.tick_spacing * LOG_TICK
+        self._half_width_sq = half_width**2
+        self._concentration = 1 / -np.expm1(-half_width / 2)
+        # exponentially weighted sums of squared log returns, quote volume,
+        # active liquidity and elapsed seconds
+        self._sums = np.zeros(4)
+        self._time = None
+        self._tick = None
+        self._price = None
+
+    @property
+    def variance(self):
+        """Variance of the log price per second."""
+        return self._sums[0] / self._sums[3] if self._sums[3] else 0.0
+
+    @property
+    def volume(self):
+        """Quote volume traded per second."""
+        return self._sums[1] / self._sums[3] if self._sums[3] else 0.0
+
+    @property
+    def liquidity(self):
+        """Time weighted active liquidity of the pool, in 18 decimal units."""
+        return self._sums[2] / self._sums[3] if self._sums[3] else 0.0
+
+    @property
+    def price(self):
+        return self._price
+
+    def observe(self, timestamp, tick, volume=0.0, liquidity=None):
+        """
+        Fold in the pool state at `timestamp`: its tick, the quote volume
+        traded since the previous observation and the active liquidity (in
+        18 decimal units). The first observation only sets the reference.
+        """
+        if self._time is not None:
+            elapsed = max(timestamp - self._time, 0)
+            self._sums *= math.exp(-self.decay * elapsed)
+            if liquidity is None:
+                liquidity = self.liquidity
+            self._sums += (
+                ((tick - self._tick) * LOG_TICK) ** 2,
+                volume,
+                liquidity * elapsed,
+                elapsed,
+            )
+        self._time = max(timestamp, self._time or timestamp)
+        self._tick = tick
+        self._price = 1.0001**tick
+
+    def load(self, store, start_block=0, end_block=None, chunk=1 << 16):
+        """Seed the averages with the swaps of a pool `ColumnStore`, oldest first."""
+        names = ["block", "timestamp", "kind", "tick", "amount1", "liquidity"]
+        for columns in store.iter_chunks(chunk, names):
+            blocks = columns["block"]
+            swaps = (columns["kind"] == SWAP) & (blocks >= start_block)
+            if end_block is not None:
+                swaps &= blocks <= end_block
+            if not swaps.any():
+                continue
+            self.observe_many(
+                columns["timestamp"][swaps],
+                columns["tick"][swaps],
+                np.abs(columns["amount1"][swaps]),
+                _liquidity(columns["liquidity"][swaps]),
+            )
+        return self
+
+    def observe_many(self, timestamps, ticks, volumes, liquidity):
+        """`observe` for arrays of observations in time order, vectorized."""
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        ticks = np.asarray(ticks, dtype=np.float64)
+        if len(timestamps) == 0:
+            return
+        if self._time is None:
+            self.observe(timestamps[0], ticks[0])
+            timestamps, ticks = timestamps[1:], ticks[1:]
+            volumes, liquidity = volumes[1:], liquidity[1:]
+            if len(timestamps) == 0:
+                return
+        previous_time = np.concatenate(([self._time], timestamps[:-1]))
+        previous_tick = np.concatenate(([self._tick], ticks[:-1]))
+        elapsed = np.maximum(timestamps - previous_time, 0)
+        end = max(timestamps[-1], self._time)
+        weights = np.exp(-self.decay * (end - np.maximum(timestamps, self._time)))
+        self._sums *= math.exp(-self.decay * (end - self._time))
+        self._sums += (
+            weights @ (((ticks - previous_tick) * LOG_TICK) ** 2),
+            weights @ np.asarray(volumes, dtype=np.float64),
+            weights @ (np.asarray(liquidity, dtype=np.float64) * elapsed),
+            weights @ elapsed,
+        )
+        self._time = end
+        self._tick = ticks[-1]
+        self._price = 1.0001 ** ticks[-1]
+
+    def objective(
+        self, capital, variance=None, volume=None, liquidity=None, price=None
+    ):
+        """
+        Expected return per second, as a share of `capital` (USD), of every
+        candidate multiplier. The market defaults to the observed averages;
+        `variance` may be an array of scenarios, which gives one row each.
+        """
+        model = self.model
+        variance = np.asarray(
+            self.variance if variance is None else variance, dtype=np.float64
+        )[..., None]
+        volume = self.volume if volume is None else volume
+        liquidity = self.liquidity if liquidity is None else liquidity
+        sqrt_price = math.sqrt(self.price if price is None else price)
+        value = capital * model.debt_multiple / BASIS_PRECISION
+
+        position = value * self._concentration / (2 * sqrt_price)
+        fees = model.maker_fee * volume * position / (position + liquidity)
+        loss = value * self._concentration * variance / 8
+        # closing V / 2 of quote moves sqrt(P) by V / (2 * L)
+        impact = value**2 / (8 * liquidity * sqrt_price) if liquidity else 0.0
+        rebalance = value * model.taker_fee / 2 + impact + model.rebalance_gas
+        with np.errstate(divide="ignore"):
+            exit_time = self._half_width_sq / variance
+        cycle = exit_time + model.keeper_delay
+        with np.errstate(invalid="ignore"):
+            in_range = np.where(np.isinf(exit_time), 1.0, exit_time / cycle)
+        return (in_range * (fees - loss) - rebalance / cycle) / capital
+
+    def best(self, capital, variance=None, volume=None, liquidity=None, price=None):
+        """`(multiplier, return per second)` of the best candidate."""
+        rates = self.objective(capital, variance, volume, liquidity, price)
+        if rates.ndim > 1:
+            rates = rates.mean(axis=0)
+        index = int(np.argmax(rates))
+        return int(self.multipliers[index]), float(rates[index])
+
+    def decide(self, current, capital, min_gain=0.0, horizon=86400.0, limits=None):
+        """
+        The multiplier to push, or None when the best candidate does not beat
+        `current` by more than `min_gain` USD over `horizon` seconds (the cost
+        of the transaction that sets it). `limits` restricts the candidates to
+        `(low, high)`, the strategy's `minTickRangeMultiplier` and
+        `maxTickRangeMultiplier`. Nothing is pushed before any time was observed.
+        """
+        if not self._sums[3]:
+            return None
+        rates = self.objective(capital)
+        if limits is not None:
+            allowed = (self.multipliers >= limits[0]) & (self.multipliers <= limits[1])
+            rates = np.where(allowed, rates, -np.inf)
+        index = int(np.argmax(rates))
+        best = int(self.multipliers[index])
+        if best == current or np.isneginf(rates[index]):
+            return None
+        position = np.searchsorted(self.multipliers, current)
+        if position < len(self.multipliers) and self.multipliers[position] == current:
+            current_rate = rates[position]
+        else:
+            current_rate = -np.inf
+        if (rates[index] - current_rate) * capital * horizon <= min_gain:
+            return None
+        return best
+
+
+def _liquidity(column):
+    """Big endian uint128 bytes to floats in 18 decimal units."""
+    column = np.asarray(column, dtype=np.float64)
+    weights = 256.0 ** np.arange(column.shape[1] - 1, -1, -1)
+    return column @ weights / 1e18
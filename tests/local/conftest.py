@@ -0,0 +1,63 @@
+import pytest
+from brownie import project
+
+from scripts.local_perp import deploy_perp_stack
+
+# Everything but the market comes from the Optimism fixtures
+from tests.op.conftest import (  # noqa: F401
+    RELATIVE_APPROX,
+    amount,
+    deployed_vault,
+    gov,
+    guardian,
+    keeper,
+    management,
+    multicall,
+    perp_lib,
+    perplib_contract,
+    rewards,
+    shared_setup,
+    strategist,
+    treasury,
+    user,
+    vault,
+)
+
+
+@pytest.fixture(scope="module")
+def perp(module_isolation, accounts):
+    yield deploy_perp_stack(accounts[9])
+
+
+@pytest.fixture(scope="session")
+def strategy_contract():
+    yield project.PerpStrategyProject.PerpStrategy
+
+
+@pytest.fixture(scope="module")
+def token(perp):
+    yield perp.settlement_token
+
+
+@pytest.fixture(scope="module")
+def whale(perp, accounts):
+    whale = accounts[8]
+    perp.settlement_token.mint(whale, 100_000_000 * 10**6, {"from": whale})
+    yield whale
+
+
+@pytest.fixture(scope="module")
+def conf(token, whale):
+    yield {"token": token.address, "whale": whale.address}
+
+
+@pytest.fixture(scope="module")
+def strategy(vault, gov, strategist, keeper, strategy_contract, perp_lib, perp):
+    strategy = strategy_contract.deploy(vault, perp.strategy_config(), {"from": gov})
+    insurance = strategist.deploy(
+        project.PerpStrategyProject.StrategyInsurance, strategy
+    )
+    strategy.setKeeper(keeper)
+    strategy.setInsurance(insurance, {"from": gov})
+    vault.addStrategy(strategy, 10_000, 0, 2**256 - 1, 1_000, {"from": gov})
+    yield strategy
@@ -0,0 +1,41 @@
+import pytest
+from brownie import chain, web3
+
+from scripts.local_perp import MAX_DEADLINE
+from scripts.sim.attribution import Attribution
+
+
+def test_attributes_harvests(strategy, perp, gov, tmp_path):
+    attribution = Attribution.from_strategy(web3, strategy, tmp_path)
+    perp.deposit(gov, 1_000_000 * 10**6)
+    for is_base_to_quote in (False, True, False):
+        perp.clearing_house.openPosition(
+            (perp.base_token, is_base_to_quote, True, 10**20, 0, MAX_DEADLINE, 0, 0),
+            {"from": gov},
+        )
+    chain.sleep(3600)
+    tx = strategy.harvest()
+    report = tx.events["StrategyReported"]
+
+    attribution.run(web3, chunk=7, workers=2)
+    harvests = attribution.harvests()
+    assert harvests["block"][-1] == tx.block_number
+    assert harvests["pnl"][-1] == pytest.approx(
+        (report["gain"] - report["loss"]) / 10**6
+    )
+    assert harvests["fees"][-1] > 0
+    assert harvests["funding"][-1] == 0
+    components = ("fees", "funding", "execution", "insurance", "il")
+    assert sum(harvests[name][-1] for name in components) == pytest.approx(
+        harvests["pnl"][-1]
+    )
+
+    # a later run only folds the new blocks
+    rows = attribution.store.rows
+    chain.sleep(3600)
+    tx = strategy.harvest()
+    attribution = Attribution.from_strategy(web3, strategy, tmp_path)
+    attribution.run(web3)
+    assert attribution.store.rows == rows + 1
+    assert attribution.last_block == tx.block_number
+    assert list(attribution.harvests()["fees"][:rows]) == list(harvests["fees"])
@@ -0,0 +1,76 @@
+import json
+
+from brownie import web3
+
+from scripts.deploy import deploy_markets
+from scripts.markets import Market
+
+
+def market(perp, vault, name, **kwargs):
+    return Market(
+        name=name,
+        vault=vault.address,
+        want=perp.settlement_token.address,
+        perp_vault=perp.vault.address,
+        market_registry=perp.market_registry.address,
+        base_token=perp.base_token.address,
+        **kwargs
+    )
+
+
+def test_deploys_and_resumes(perp, vault, gov, keeper, tmp_path):
+    manifest = tmp_path / "deployment.json"
+    # a run that sent PerpLib and died before the node kept the transaction
+    nonce = gov.nonce
+    lib = gov.get_deployment_address(nonce)
+    sent = {"tx": "0x" + "11" * 32, "nonce": nonce, "address": lib, "status": "sent"}
+    manifest.write_text(
+        json.dumps(
+            {
+                "chain_id": web3.eth.chain_id,
+                "deployer": gov.address,
+                "steps": {"PerpLib": sent},
+                "manual": {},
+            }
+        )
+    )
+
+    eth = market(
+        perp,
+        vault,
+        "vETH",
+        keeper=keeper.address,
+        insurance={"profit_take_rate": 2000},
+        debt_ratio=0,
+        partial_withdraw=True,
+    )
+    strategy, insurance = deploy_markets([eth], gov, manifest, batch_size=2)["vETH"]
+    steps = json.loads(manifest.read_text())["steps"]
+    assert steps["PerpLib"]["address"] == lib and len(web3.eth.get_code(lib)) > 0
+    assert all(step["status"] == "confirmed" for step in steps.values())
+    assert strategy.insurance() == insurance
+    assert strategy.keeper() == keeper
+    assert strategy.partialWithdraw()
+    assert insurance.profitTakeRate() == 2000
+    assert vault.strategies(strategy)["activation"] > 0
+
+    # a second market only sends its own strategy, insurance and setInsurance
+    nonce = gov.nonce
+    wide = market(perp, vault, "vETH-wide", tick_range_multiplier=400)
+    deployed = deploy_markets([eth, wide], gov, manifest)
+    assert gov.nonce == nonce + 3
+    assert deployed["vETH"] == (strategy, insurance)
+    assert deployed["vETH-wide"][0].tickRangeMultiplier() == 400
+    assert not deployed["vETH-wide"][0].partialWithdraw()
+
+
+def test_leaves_governance_calls_in_manifest(perp, vault, gov, strategist, tmp_path):
+    manifest = tmp_path / "deployment.json"
+    eth = market(perp, vault, "vETH", debt_ratio=0)
+    strategy, _ = deploy_markets([eth], strategist, manifest)["vETH"]
+    assert vault.strategies(strategy)["activation"] == 0
+
+    call = json.loads(manifest.read_text())["manual"]["vETH.addStrategy"]
+    assert call["to"] == vault.address
+    gov.transfer(call["to"], data=call["data"])
+    assert vault.strategies(strategy)["activation"] > 0
@@ -0,0 +1,99 @@
+import asyncio
+
+from brownie import chain
+
+from scripts.keeper.daemon import Keeper
+from scripts.local_perp import MAX_DEADLINE
+from scripts.sim.harvest import HarvestModel, HarvestScheduler
+
+
+def trade(perp, trader, quote=100_000 * 10**18):
+    """Buy and sell back `quote` of base, paying maker fees both ways."""
+    for is_base_to_quote in (False, True):
+        perp.clearing_house.openPosition(
+            (
+                perp.base_token,
+                is_base_to_quote,
+                not is_base_to_quote,
+                quote,
+                0,
+                MAX_DEADLINE,
+                0,
+                0,
+            ),
+            {"from": trader},
+        )
+
+
+def test_trigger_waits_for_threshold(strategy, perp, gov, keeper):
+    perp.deposit(gov, 10_000_000 * 10**6)
+    chain.sleep(strategy.minReportDelay() + 1)
+    chain.mine()
+
+    strategy.setHarvestThreshold(10**30, {"from": keeper})
+    assert not strategy.harvestTrigger(0)
+    strategy.setHarvestThreshold(1, {"from": keeper})
+    assert not strategy.harvestTrigger(0)
+    trade(perp, gov)
+    assert strategy.pendingRewards() > 0
+    assert strategy.harvestTrigger(0)
+
+    # maxReportDelay still forces a report
+    strategy.setHarvestThreshold(10**30, {"from": keeper})
+    chain.sleep(strategy.maxReportDelay())
+    chain.mine()
+    assert strategy.harvestTrigger(0)
+    strategy.harvest({"from": keeper})
+    assert not strategy.harvestTrigger(0)
+
+
+def test_keeper_pushes_threshold(strategy, perp, gov, keeper, multicall):
+    # a fixed cost keeps the threshold independent of the local gas price
+    scheduler = HarvestScheduler(HarvestModel(gas_used=0, l1_fee=1.0))
+    bot = Keeper(
+        [strategy],
+        keeper,
+        multicall,
+        price_move_bps=0,
+        trigger_interval=10**9,
+        harvests={strategy: scheduler},
+    )
+    perp.deposit(gov, 10_000_000 * 10**6)
+    assert asyncio.run(bot.run_once()) == []
+
+    trade(perp, gov)
+    chain.mine(10)
+    sent = asyncio.run(bot.run_once())
+    assert [tx.fn_name for tx in sent] == ["setHarvestThreshold"]
+    sent[0].wait(1)
+    assert scheduler.rate > 0
+    assert strategy.harvestThreshold() == bot.strategies[0].harvest_threshold > 0
+
+    # a threshold within the tolerance is left alone
+    trade(perp, gov)
+    chain.mine(10)
+    assert asyncio.run(bot.run_once()) == []
+
+
+def test_trigger_fires_on_loss_below_threshold(
+    deployed_vault, strategy, perp, gov, keeper
+):
+    strategy.setHarvestThreshold(10**30, {"from": keeper})
+    chain.sleep(strategy.minReportDelay() + 1)
+    chain.mine()
+    assert not strategy.harvestTrigger(0)
+
+    # the price move leaves the strategy below its debt, with no fees near
+    # the threshold and before maxReportDelay
+    perp.deposit(gov, 10_000_000 * 10**6)
+    perp.clearing_house.openPosition(
+        (perp.base_token, False, True, 500_000 * 10**18, 0, MAX_DEADLINE, 0, 0),
+        {"from": gov},
+    )
+    params = deployed_vault.strategies(strategy)
+    assert (
+        strategy.estimatedTotalAssets() + strategy.debtThreshold() < params["totalDebt"]
+    )
+    assert strategy.pendingRewards() < strategy.harvestThreshold()
+    assert chain.time() - params["lastReport"] < strategy.maxReportDelay()
+    assert strategy.harvestTrigger(0)
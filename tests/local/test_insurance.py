@@ -0,0 +1,53 @@
+import numpy as np
+from brownie import accounts, project
+
+from scripts.sim.insurance import InsuranceConfig, InsuranceFund
+
+
+def test_port_matches_contract(strategy, strategist, gov, token, whale):
+    config = InsuranceConfig(
+        target_fund_size=20, profit_take_rate=2500, maximum_compensation_rate=10
+    )
+    insurance = strategist.deploy(
+        project.PerpStrategyProject.StrategyInsurance, strategy
+    )
+    insurance.setTargetFundSize(config.target_fund_size, {"from": gov})
+    insurance.setProfitTakeRate(config.profit_take_rate, {"from": gov})
+    insurance.setmaximumCompenstionRate(config.maximum_compensation_rate, {"from": gov})
+    token.transfer(insurance, 3 * 10**6, {"from": whale})
+    fund = InsuranceFund(config, balance=3 * 10**6)
+    caller = accounts.at(strategy, force=True)
+
+    rng = np.random.default_rng(7)
+    debt = 10**10
+    for pnl in map(int, rng.normal(0, 10**7, 40)):
+        profit, loss = max(pnl, 0), max(-pnl, 0)
+        if loss >= profit:
+            tx = insurance.reportLoss(debt, loss - profit, {"from": caller})
+            assert tx.return_value == fund.report_loss(debt, loss - profit)
+            debt -= max(loss - profit - tx.return_value, 0)
+        else:
+            tx = insurance.reportProfit(debt, profit - loss, {"from": caller})
+            payment, compensation = fund.report_profit(debt, profit - loss)
+            assert tuple(tx.return_value) == (payment, compensation)
+            if 0 < payment < profit - loss - payment + compensation:
+                token.transfer(insurance, payment, {"from": whale})
+                fund.deposit(payment)
+        assert insurance.lossSum() == fund.loss_sum
+        assert token.balanceOf(insurance) == fund.balance
+
+
+def test_harvest_reports_compensation_above_loss(
+    deployed_vault, strategy, vault, gov, token, whale
+):
+    insurance = project.PerpStrategyProject.StrategyInsurance.at(strategy.insurance())
+    token.transfer(insurance, 10**7, {"from": whale})
+    # a loss from an earlier harvest the fund could only partly cover
+    debt = vault.strategies(strategy)["totalDebt"]
+    insurance.reportLoss(debt, debt // 10, {"from": accounts.at(strategy, force=True)})
+    assert insurance.lossSum() > 0
+
+    tx = strategy.harvest({"from": gov})
+    event = tx.events["Harvested"]
+    assert event["compensation"] > 0
+    assert event["loss"] == 0
@@ -0,0 +1,64 @@
+import brownie
+from brownie import chain
+
+from scripts.local_perp import MAX_DEADLINE
+
+
+def test_ladder_shifts_one_rung(deployed_vault, strategy, perp, gov, keeper):
+    strategy.setTickRangeLimits(1, 400, {"from": gov})
+    strategy.setTickRangeMultiplier(5, {"from": keeper})
+    with brownie.reverts():
+        strategy.setLadder([200, 400], [5000, 5000], {"from": gov})
+    with brownie.reverts():
+        strategy.setLadder([200], [4000], {"from": keeper})
+
+    # the live position is spread over the core range and the wing
+    total = strategy.getTotalLiquidity()
+    strategy.setLadder([200], [4000], {"from": gov})
+    assert strategy.wingCount() == 1
+    lower, upper, multiplier, weight = strategy.wings(0)
+    assert (multiplier, weight) == (200, 4000)
+    assert upper - lower == 2 * 200 * 60
+    assert strategy.upperTick() - strategy.lowerTick() == 2 * 5 * 60
+    assert strategy.getRungLiquidity(0) > 0 and strategy.getRungLiquidity(1) > 0
+    assert strategy.getTotalLiquidity() != total
+    assert strategy.rungsOutOfRange() == 0
+    with brownie.reverts():
+        strategy.shiftRungs(1, {"from": keeper})
+
+    # a buy moves the price out of the core range only
+    perp.deposit(gov, 10_000_000 * 10**6)
+    perp.clearing_house.openPosition(
+        (perp.base_token, False, True, 500_000 * 10**18, 0, MAX_DEADLINE, 0, 0),
+        {"from": gov},
+    )
+    chain.sleep(900)
+    chain.mine()
+    assert strategy.rungsOutOfRange() == 1
+    with brownie.reverts():
+        strategy.shiftRungs(2, {"from": keeper})
+    wing_liquidity = strategy.getRungLiquidity(1)
+    tx = strategy.shiftRungs(1, {"from": keeper})
+    assert [e["rung"] for e in tx.events["TicksUpdated"]] == [0]
+    assert strategy.wings(0)[:2] == (lower, upper)
+    assert strategy.getRungLiquidity(1) == wing_liquidity
+    assert strategy.rungsOutOfRange() == 0
+
+    # one harvest collects the fees of every rung
+    assert strategy.pendingRewards() > 0
+    chain.sleep(3600)
+    tx = strategy.harvest({"from": gov})
+    assert tx.events["Harvested"]["fees"] > 0
+
+    # dropping the wings puts everything back in the core range
+    strategy.setLadder([], [], {"from": gov})
+    assert strategy.wingCount() == 0
+    assert strategy.getTotalLiquidity() == strategy.getRungLiquidity(0) > 0
+
+
+def test_undeployed_rungs_are_not_out_of_range(strategy, gov):
+    # the wing has no ticks or liquidity until the position is deployed
+    strategy.setLadder([200], [4000], {"from": gov})
+    assert strategy.wingCount() == 1
+    assert strategy.wings(0)[:2] == (0, 0)
+    assert strategy.rungsOutOfRange() == 0
@@ -0,0 +1,58 @@
+import brownie
+from brownie import project
+
+from scripts.keeper.packed import CALLS, DEFAULT_FEES, benchmark, encode, l1_fee
+from scripts.local_perp import MAX_DEADLINE
+
+
+def test_opcodes_do_not_shadow_functions(strategy):
+    first_bytes = {int(sig[2:4], 16) for sig in strategy.signatures.values()}
+    assert not first_bytes & {opcode for opcode, _, _ in CALLS.values()}
+
+
+def test_packed_setters(strategy, gov, keeper, user):
+    gov.transfer(strategy, 0, data=encode("setDebtThresholds", 9700, 10300))
+    assert (strategy.debtLower(), strategy.debtUpper()) == (9700, 10300)
+    gov.transfer(
+        strategy, 0, data=encode("setCollateralThresholds", 5000, 8000, 9000, 9500)
+    )
+    assert strategy.collatLower() == 5000 and strategy.collatUpper() == 9000
+    keeper.transfer(strategy, 0, data=encode("setHarvestThreshold", 10**6))
+    assert strategy.harvestThreshold() == 10**6
+    strategy.setTickRangeLimits(50, 400, {"from": gov})
+    keeper.transfer(strategy, 0, data=encode("setTickRangeMultiplier", 250))
+    assert strategy.tickRangeMultiplier() == 250
+
+    # the ABI functions' checks apply
+    with brownie.reverts("!authorized"):
+        user.transfer(strategy, 0, data=encode("setDebtThresholds", 9800, 10200))
+    with brownie.reverts():
+        keeper.transfer(strategy, 0, data=encode("setTickRangeMultiplier", 401))
+    with brownie.reverts("!packed"):
+        gov.transfer(strategy, 0, data=encode("setDebtThresholds", 1, 2)[:-1])
+    with brownie.reverts("!packed"):
+        gov.transfer(strategy, 0, data=b"\x1d")
+
+
+def test_packed_keeper_calls(deployed_vault, strategy, perp, gov, keeper):
+    # in band
+    with brownie.reverts():
+        keeper.transfer(strategy, 0, data=encode("rebalanceDebt"))
+    perp.deposit(gov, 10_000_000 * 10**6)
+    perp.clearing_house.openPosition(
+        (perp.base_token, False, True, 500_000 * 10**18, 0, MAX_DEADLINE, 0, 0),
+        {"from": gov},
+    )
+    tx = keeper.transfer(strategy, 0, data=encode("rebalanceDebt"))
+    assert "Rebalanced" in tx.events
+    assert strategy.debtLower() <= strategy.calcDebtRatio() <= strategy.debtUpper()
+
+
+def test_oracle_fee_matches(gov):
+    oracle = gov.deploy(
+        project.PerpStrategyProject.MockGasPriceOracle, *DEFAULT_FEES.values()
+    )
+    data = encode("setCollateralThresholds", 6000, 8000, 10000, 20000)
+    assert oracle.getL1Fee(data) == l1_fee(data, **DEFAULT_FEES)
+    calls = [("tend", ()), ("setDebtThresholds", (9800, 10200))]
+    assert all(s.fee_saved > 0 for s in benchmark(oracle.getL1Fee, calls))
@@ -0,0 +1,66 @@
+import asyncio
+
+from brownie import web3
+
+from scripts.keeper.daemon import Keeper
+from scripts.keeper.preflight import preflight, simulate
+from scripts.local_perp import MAX_DEADLINE
+
+
+def test_simulates_keeper_calls(deployed_vault, strategy, perp, gov, keeper, user):
+    # in band: the bare require reverts without a reason
+    rebalance = strategy.rebalanceDebt.encode_input()
+    simulation = simulate(web3, strategy.address, rebalance, keeper.address)
+    assert not simulation.success and simulation.reason == ""
+    simulation = simulate(web3, strategy.address, rebalance, user.address)
+    assert simulation.reason == "!authorized"
+
+    perp.deposit(gov, 10_000_000 * 10**6)
+    perp.clearing_house.openPosition(
+        (perp.base_token, False, True, 500_000 * 10**18, 0, MAX_DEADLINE, 0, 0),
+        {"from": gov},
+    )
+    calls = [
+        strategy.rebalanceDebt.encode_input(),
+        strategy.rebalanceCollateral.encode_input(),
+        strategy.harvest.encode_input(),
+    ]
+    simulations = preflight(
+        web3, [(strategy.address, data) for data in calls], keeper.address
+    )
+    assert simulations[0].success and simulations[2].success
+    tx = strategy.rebalanceDebt(
+        {"from": keeper, "gas_limit": simulations[0].gas_limit()}
+    )
+    assert tx.status == 1
+    assert tx.gas_used <= simulations[0].gas <= tx.gas_limit
+
+
+def test_keeper_only_sends_calls_that_pass(
+    deployed_vault, strategy, perp, gov, keeper, multicall
+):
+    bot = Keeper(
+        [strategy], keeper, multicall, price_move_bps=0, trigger_interval=10**9
+    )
+    assert asyncio.run(bot.run_once()) == []
+    perp.deposit(gov, 10_000_000 * 10**6)
+    perp.clearing_house.openPosition(
+        (perp.base_token, False, True, 500_000 * 10**18, 0, MAX_DEADLINE, 0, 0),
+        {"from": gov},
+    )
+    ratio = strategy.calcDebtRatio()
+    assert ratio < strategy.debtLower()
+
+    # the keeper still has the old band and the strategy would revert
+    strategy.setDebtThresholds(ratio - 1, 20000, {"from": gov})
+    assert asyncio.run(bot.run_once()) == []
+    ((address, action, simulation),) = bot.rejected
+    assert (address, action) == (strategy.address, "rebalanceDebt")
+    assert not simulation.success and simulation.reason == ""
+
+    strategy.setDebtThresholds(9900, 10100, {"from": gov})
+    sent = asyncio.run(bot.run_once())
+    assert [tx.fn_name for tx in sent] == ["rebalanceDebt"]
+    sent[0].wait(1)
+    assert sent[0].status == 1
+    assert sent[0].gas_limit < web3.eth.get_block("latest").gasLimit
@@ -0,0 +1,99 @@
+import asyncio
+
+import brownie
+from brownie import project, web3
+
+from scripts.keeper.daemon import Keeper
+from scripts.keeper.router import benchmark, execute
+from scripts.local_perp import MAX_DEADLINE
+
+
+def move_price(perp, gov):
+    perp.deposit(gov, 10_000_000 * 10**6)
+    perp.clearing_house.openPosition(
+        (perp.base_token, False, True, 500_000 * 10**18, 0, MAX_DEADLINE, 0, 0),
+        {"from": gov},
+    )
+
+
+def deploy_router(strategy, gov, keeper):
+    router = gov.deploy(project.PerpStrategyProject.KeeperRouter)
+    router.setKeeper(keeper, True, {"from": gov})
+    router.setStrategy(strategy, True, {"from": gov})
+    strategy.setKeeper(router, {"from": gov})
+    return router
+
+
+def test_router_runs_batch(deployed_vault, strategy, perp, gov, keeper, user):
+    router = deploy_router(strategy, gov, keeper)
+    with brownie.reverts("!keeper"):
+        router.execute(b"", {"from": user})
+    with brownie.reverts("!batch"):
+        router.execute(b"\x01" * 20, {"from": keeper})
+
+    move_price(perp, gov)
+    result = benchmark(
+        web3,
+        router.address,
+        keeper.address,
+        [(strategy.address, "rebalanceDebt"), (strategy.address, "harvest")],
+    )
+    assert result.items == 2
+    assert result.l1_gas_saved > 0
+
+    # no rung is out of range, the second rebalance is in band and the
+    # last item has no code: only the first rebalance goes through
+    items = [
+        (strategy.address, "shiftRungs"),
+        (strategy.address, "rebalanceDebt"),
+        (strategy.address, "rebalanceDebt"),
+        (user.address, "harvest"),
+    ]
+    tx, results = execute(router, items, keeper)
+    assert results == [False, True, False, False]
+    assert [e["index"] for e in tx.events["ItemFailed"]] == [0, 2, 3]
+    assert strategy.debtLower() <= strategy.calcDebtRatio() <= strategy.debtUpper()
+
+    # setters go through forward, with the strategy's revert
+    router.forward(
+        strategy, strategy.setHarvestThreshold.encode_input(5), {"from": keeper}
+    )
+    assert strategy.harvestThreshold() == 5
+    with brownie.reverts():
+        router.forward(strategy, strategy.shiftRungs.encode_input(0), {"from": keeper})
+
+    # and only the keeper calls, to the strategies the owner listed
+    with brownie.reverts("!call"):
+        router.forward(
+            strategy, strategy.setKeeper.encode_input(user), {"from": keeper}
+        )
+    with brownie.reverts("!call"):
+        router.forward(strategy, b"\x12", {"from": keeper})
+    with brownie.reverts("!strategy"):
+        router.forward(user, strategy.harvest.encode_input(), {"from": keeper})
+    with brownie.reverts("Ownable: caller is not the owner"):
+        router.setStrategy(user, True, {"from": keeper})
+    router.setStrategy(strategy, False, {"from": gov})
+    tx, results = execute(router, [(strategy.address, "harvest")], keeper)
+    assert results == [False]
+    assert bytes(tx.events["ItemFailed"]["reason"]) == b"!strategy"
+
+
+def test_keeper_sends_one_batch(deployed_vault, strategy, perp, gov, keeper, multicall):
+    router = deploy_router(strategy, gov, keeper)
+    bot = Keeper(
+        [strategy],
+        keeper,
+        multicall,
+        price_move_bps=0,
+        trigger_interval=10**9,
+        router=router,
+    )
+    assert asyncio.run(bot.run_once()) == []
+    move_price(perp, gov)
+    sent = asyncio.run(bot.run_once())
+    assert [tx.fn_name for tx in sent] == ["execute"]
+    sent[0].wait(1)
+    assert sent[0].events["Executed"]["results"] == 1
+    assert [action for _, action, _ in bot.sent] == ["rebalanceDebt"]
+    assert strategy.debtLower() <= strategy.calcDebtRatio() <= strategy.debtUpper()
@@ -0,0 +1,105 @@
+import brownie
+from brownie import web3
+
+from scripts.gas_profile import profile_tx
+from scripts.local_perp import MAX_DEADLINE
+
+
+def packed_slot(strategy, fields):
+    """Slot holding `[(value, bytes), ...]`, packed from the low order bytes up."""
+    packed = b"".join(
+        value.to_bytes(size, "big", signed=value < 0)
+        for value, size in reversed(fields)
+    )
+    for slot in range(64):
+        # not necessarily at the bottom: the first group can share the slot of
+        # BaseStrategy's last variables
+        if packed in bytes(web3.eth.get_storage_at(strategy.address, slot)):
+            return slot
+    return None
+
+
+def hot_fields(strategy, token, perp):
+    return [
+        (strategy.collatUpper(), 2),
+        (strategy.collatLower(), 2),
+        (strategy.debtUpper(), 2),
+        (strategy.debtLower(), 2),
+        (strategy.debtMultiple(), 4),
+        (strategy.collatLimit(), 2),
+        (strategy.slippageAdj(), 2),
+        (strategy.residualTolerance(), 2),
+        (token.decimals(), 1),
+        (perp.base_token.decimals(), 1),
+        (int(strategy.partialWithdraw()), 1),
+        (int(strategy.inPlaceRebalance()), 1),
+    ]
+
+
+def tick_fields(strategy):
+    return [
+        (strategy.lowerTick(), 3),
+        (strategy.upperTick(), 3),
+        (strategy.tickRangeMultiplier(), 3),
+        (strategy.minTickRangeMultiplier(), 3),
+        (strategy.maxTickRangeMultiplier(), 3),
+        (strategy.twapTime(), 3),
+        (strategy.twapInterval(), 4),
+        (strategy.wingCount(), 1),
+    ]
+
+
+def test_hot_state_is_packed(deployed_vault, strategy, token, perp, gov, keeper):
+    # values no other slot holds
+    strategy.setCollateralThresholds(4800, 70000, 5200, 7400, {"from": gov})
+    strategy.setDebtThresholds(9800, 10300, {"from": gov})
+    strategy.setSlippageConfig(9700, {"from": gov})
+    strategy.setRebalanceConfig(True, 60, {"from": gov})
+    strategy.setHarvestThreshold(2**100 + 1, {"from": keeper})
+
+    # the rebalance and withdraw parameters in one slot
+    assert strategy.debtMultiple() == 70000
+    hot = packed_slot(strategy, hot_fields(strategy, token, perp))
+    assert hot is not None
+    ticks = packed_slot(strategy, tick_fields(strategy))
+    assert ticks is not None and strategy.lowerTick() != 0
+    harvest = packed_slot(
+        strategy, [(strategy.minProfit(), 16), (strategy.harvestThreshold(), 16)]
+    )
+    assert harvest is not None
+    short = packed_slot(
+        strategy, [(int(strategy.short(), 16), 20), (strategy.minDeploy(), 12)]
+    )
+    assert short is not None
+    assert len({hot, ticks, harvest, short}) == 4
+
+    # values that do not fit their slot are rejected, not truncated
+    with brownie.reverts():
+        strategy.setDebtThresholds(9800, 2**16, {"from": gov})
+    with brownie.reverts():
+        strategy.setHarvestThreshold(2**128, {"from": keeper})
+    assert strategy.debtUpper() == 10300
+
+
+def test_profile_counts_storage_reads(
+    deployed_vault, strategy, perp, gov, keeper, user, vault
+):
+    perp.deposit(gov, 10_000_000 * 10**6)
+    perp.clearing_house.openPosition(
+        (perp.base_token, False, True, 500_000 * 10**18, 0, MAX_DEADLINE, 0, 0),
+        {"from": gov},
+    )
+    labels = {strategy.address: "Strategy", vault.address: "YearnVault"}
+    txs = {
+        "rebalanceDebt": strategy.rebalanceDebt({"from": keeper}),
+        "harvest": strategy.harvest({"from": keeper}),
+        "withdraw": vault.withdraw(
+            vault.balanceOf(user) // 2, user, 10_000, {"from": user}
+        ),
+    }
+    for name, tx in txs.items():
+        profile = profile_tx(tx, labels)
+        # the strategy reads its own storage whoever it is called by
+        assert profile["storage"]["Strategy"] > 0, name
+        assert profile["storage_reads"] == sum(profile["storage"].values())
+    assert "YearnVault" in profile["storage"]
@@ -0,0 +1,62 @@
+import pytest
+from brownie import chain, web3
+
+from scripts.local_perp import MAX_DEADLINE
+from scripts.sim.telemetry import (
+    REBALANCE_DEBT,
+    Telemetry,
+    latest,
+    open_stores,
+    window,
+)
+
+
+def test_indexes_strategy_events(
+    deployed_vault, strategy, perp, gov, keeper, user, amount, tmp_path
+):
+    vault = deployed_vault
+    vault.withdraw(amount // 4, {"from": user})
+    withdrawn = chain[-1]
+    perp.deposit(gov, 10_000_000 * 10**6)
+    perp.clearing_house.openPosition(
+        (perp.base_token, False, True, 500_000 * 10**18, 0, MAX_DEADLINE, 0, 0),
+        {"from": gov},
+    )
+    strategy.rebalanceDebt({"from": keeper})
+    chain.sleep(3600)
+    tx = strategy.harvest()
+
+    telemetry = Telemetry.from_strategy(web3, strategy, tmp_path)
+    telemetry.run(web3, chunk=5, workers=2)
+    assert telemetry.last_block == web3.eth.block_number
+
+    stores = open_stores(tmp_path, readonly=True)
+    # harvests withdraw their profit too
+    withdrawals = window(stores["withdrawn"])
+    (row,) = (withdrawals["block"] == withdrawn.number).nonzero()[0]
+    assert withdrawals["requested"][row] == pytest.approx(amount / 4 / 10**6, rel=1e-2)
+    assert 0 < withdrawals["freed"][row] <= withdrawals["requested"][row] + 1e-6
+
+    rebalance = latest(stores["rebalanced"])
+    assert rebalance["kind"][0] == REBALANCE_DEBT
+    assert not 9900 <= rebalance["ratio"][0] <= 10100
+
+    # the last range placed is the live one
+    ticks = window(stores["ticks"], names=["lower_tick", "upper_tick"])
+    assert ticks["lower_tick"][-1] == strategy.lowerTick()
+    assert ticks["upper_tick"][-1] == strategy.upperTick()
+
+    event = tx.events["Harvested"]
+    harvest = latest(stores["harvested"])
+    assert harvest["block"][0] == tx.block_number
+    assert harvest["fees"][0] == event["fees"] / 1e18
+    assert harvest["profit"][0] == event["profit"] / 10**6
+    assert harvest["insurance_payment"][0] == event["insurancePayment"] / 10**6
+
+    # a later run only indexes the new blocks
+    rows = stores["harvested"].rows
+    chain.sleep(3600)
+    strategy.harvest()
+    Telemetry.from_strategy(web3, strategy, tmp_path).run(web3)
+    stores["harvested"].refresh()
+    assert stores["harvested"].rows == rows + 1
@@ -0,0 +1,78 @@
+import asyncio
+
+import brownie
+from brownie import chain
+
+from scripts.keeper.daemon import Keeper
+from scripts.local_perp import MAX_DEADLINE
+from scripts.sim.tick_range import RangeModel, RangeOptimizer
+
+
+def test_keeper_sets_width_within_limits(strategy, gov, strategist, keeper, perp):
+    assert strategy.minTickRangeMultiplier() == strategy.maxTickRangeMultiplier() == 200
+    with brownie.reverts():
+        strategy.setTickRangeMultiplier(100, {"from": keeper})
+    with brownie.reverts():
+        strategy.setTickRangeLimits(100, 400, {"from": keeper})
+    # the limits are governance's alone
+    with brownie.reverts():
+        strategy.setTickRangeLimits(100, 400, {"from": strategist})
+    with brownie.reverts():
+        strategy.setTickRangeLimits(0, 400, {"from": gov})
+
+    # narrowing the limits clamps the current width
+    strategy.setTickRangeLimits(250, 400, {"from": gov})
+    assert strategy.tickRangeMultiplier() == 250
+    strategy.setTickRangeLimits(50, 400, {"from": gov})
+    strategy.setTickRangeMultiplier(50, {"from": keeper})
+    with brownie.reverts():
+        strategy.setTickRangeMultiplier(401, {"from": keeper})
+
+    # the live range keeps its width until the next rebalance
+    assert strategy.upperTick() - strategy.lowerTick() == 2 * 200 * 60
+    perp.deposit(gov, 10_000_000 * 10**6)
+    perp.clearing_house.openPosition(
+        (perp.base_token, False, True, 500_000 * 10**18, 0, MAX_DEADLINE, 0, 0),
+        {"from": gov},
+    )
+    assert not strategy.debtLower() <= strategy.calcDebtRatio() <= strategy.debtUpper()
+    strategy.rebalanceDebt({"from": keeper})
+    assert strategy.upperTick() - strategy.lowerTick() == 2 * 50 * 60
+
+
+def test_keeper_pushes_optimized_width(strategy, gov, keeper, perp, multicall):
+    strategy.setTickRangeLimits(1, 400, {"from": gov})
+    ranges = RangeOptimizer(RangeModel(tick_spacing=60, max_multiplier=400))
+    bot = Keeper(
+        [strategy],
+        keeper,
+        multicall,
+        price_move_bps=0,
+        trigger_interval=10**9,
+        ranges={strategy: ranges},
+    )
+    # nothing observed yet: the width is left alone
+    assert asyncio.run(bot.run_once()) == []
+
+    perp.deposit(gov, 10_000_000 * 10**6)
+    # buy and sell back 100k of quote
+    for is_base_to_quote in (False, True) * 3:
+        perp.clearing_house.openPosition(
+            (
+                perp.base_token,
+                is_base_to_quote,
+                not is_base_to_quote,
+                100_000 * 10**18,
+                0,
+                MAX_DEADLINE,
+                0,
+                0,
+            ),
+            {"from": gov},
+        )
+        chain.mine(5)
+    sent = asyncio.run(bot.run_once())
+    assert [tx.fn_name for tx in sent] == ["setTickRangeMultiplier"]
+    sent[0].wait(1)
+    assert ranges.volume > 0
+    assert strategy.tickRangeMultiplier() == bot.strategies[0].multiplier != 200
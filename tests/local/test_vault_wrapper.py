@@ -0,0 +1,2 @@
+# The Optimism scenarios, run against the local Perp stack from conftest.py
+from tests.op.test_vault_wrapper import *  # noqa: F401,F403
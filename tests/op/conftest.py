@@ -1,6 +1,12 @@
+import os
+
 import pytest
 from brownie import config
-from brownie import interface, StrategyInsurance, project, accounts
+from brownie import interface, StrategyInsurance, project, accounts, web3
+from brownie._config import CONFIG as BROWNIE_CONFIG
+
+from scripts.keeper.state import MULTICALL3
+from scripts.rpc_cache import route_fork
 
 CONFIG = {
     "USDC": {
@@ -10,93 +16,98 @@ CONFIG = {
     },
 }
 
-@pytest.fixture
+
+def pytest_configure(config):
+    # Under xdist every worker launches its own forked chain, on the port
+    # brownie offsets by the worker id. FORK_BLOCK pins all of them to the same
+    # block so they start from identical state; RPC_CACHE sends them through a
+    # caching proxy (see scripts/rpc_cache.py). -N is a one element list.
+    network_id = (
+        config.getoption("--network")
+        or [BROWNIE_CONFIG.settings["networks"]["default"]]
+    )[0]
+    network = BROWNIE_CONFIG.networks.get(network_id, {})
+    if "cmd_settings" not in network:
+        return
+    config.rpc_cache_proxy = route_fork(
+        network["cmd_settings"], BROWNIE_CONFIG.networks, os.environ
+    )
+
+
+@pytest.fixture(scope="session")
 def strategy_contract():
     yield  project.PerpStrategyProject.WETHPERP
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def perplib_contract():
     yield  project.PerpStrategyProject.PerpLib
 
-@pytest.fixture
-def conf(strategy_contract):
-    yield CONFIG[strategy_contract._name]
-
-@pytest.fixture
-def gov(accounts):
-    #yield accounts.at("0x7601630eC802952ba1ED2B6e4db16F699A0a5A87", force=True)
-    yield accounts[1]
-
-@pytest.fixture
-def user(accounts):
-    yield accounts[0]
-
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def rewards(accounts):
     yield accounts[1]
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def guardian(accounts):
     yield accounts[2]
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def management(accounts):
     yield accounts[3]
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def strategist(accounts):
     yield accounts[4]
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def keeper(accounts):
     yield accounts[5]
 
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def token_name():
     yield "USDC"
     # yield "WETH"
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def conf(token_name):
     yield CONFIG[token_name]
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def gov(accounts):
     # yield accounts.at("0x7601630eC802952ba1ED2B6e4db16F699A0a5A87", force=True)
     yield accounts[1]
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def user(accounts):
     yield accounts[0]
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def treasury(accounts):
     yield accounts[2]
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def token(conf):
     yield interface.IERC20Extended(conf["token"])
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def whale(conf, accounts):
     yield accounts.at(conf["whale"], True)
 
 
-@pytest.fixture
-def amount(token, whale, user):
+@pytest.fixture(scope="module")
+def amount(module_isolation, token, whale, user):
     amount = 10_000 * 10 ** token.decimals()
     amount = min(amount, int(0.5 * token.balanceOf(whale)))
     # In order to get some funds for the token you are about to use,
@@ -111,8 +122,8 @@ def amount(token, whale, user):
 #     vault = interface.IVault(conf["vault"])
 #     yield vault
 
-@pytest.fixture
-def vault(pm, gov, rewards, guardian, management, token):
+@pytest.fixture(scope="module")
+def vault(module_isolation, pm, gov, rewards, guardian, management, token):
     Vault = pm(config["dependencies"][0]).Vault
     vault = guardian.deploy(Vault)
     vault.initialize(token, gov, rewards, "", "", guardian, management)
@@ -121,7 +132,7 @@ def vault(pm, gov, rewards, guardian, management, token):
     assert vault.token() == token.address
     yield vault
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def deployed_vault(chain, accounts, gov, token, vault, strategy, user, strategist, amount, RELATIVE_APPROX):
     # Deposit to the vault
     token.approve(vault.address, amount, {"from": user})
@@ -139,12 +150,20 @@ def deployed_vault(chain, accounts, gov, token, vault, strategy, user, strategis
     assert pytest.approx(strategy.estimatedTotalAssets(), rel=RELATIVE_APPROX) == amount
     yield vault 
 
-@pytest.fixture
-def perp_lib(gov, perplib_contract):
+@pytest.fixture(scope="module")
+def perp_lib(module_isolation, gov, perplib_contract):
     lib = perplib_contract.deploy({'from': gov});
     yield lib
 
-@pytest.fixture
+@pytest.fixture(scope="module")
+def multicall(module_isolation, gov):
+    # Optimism has the canonical Multicall3; plain dev chains get a local copy
+    if len(web3.eth.get_code(MULTICALL3)) > 0:
+        yield interface.IMulticall3(MULTICALL3)
+    else:
+        yield project.PerpStrategyProject.Multicall3.deploy({"from": gov})
+
+@pytest.fixture(scope="module")
 def strategy(vault, gov, user, strategist, keeper,  strategy_contract, perp_lib):
     strategy = strategy_contract.deploy(vault, {'from': gov})
     insurance = strategist.deploy(StrategyInsurance, strategy)
@@ -164,8 +183,9 @@ def strategy(vault, gov, user, strategist, keeper,  strategy_contract, perp_lib)
 def RELATIVE_APPROX():
     yield 1e-5
 
-# Function scoped isolation fixture to enable xdist.
-# Snapshots the chain before each test and reverts after test completion.
+# Deploying and harvesting against the fork dominates the run time, so it happens
+# once per module (and so once per xdist worker). The function scoped isolation
+# snapshots the chain after that shared setup and reverts to it after each test.
 @pytest.fixture(scope="function", autouse=True)
-def shared_setup(fn_isolation):
+def shared_setup(deployed_vault, multicall, fn_isolation):
     pass
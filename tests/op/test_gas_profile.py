@@ -0,0 +1,218 @@
+import json
+import os
+from pathlib import Path
+
+import pytest
+from brownie import interface, project
+
+from scripts.gas_profile import compare, profile_tx
+
+BASELINE = Path(__file__).parent / "gas_baseline.json"
+REPORT = Path(os.environ.get("GAS_REPORT", "gas-report.json"))
+TOLERANCE = float(os.environ.get("GAS_TOLERANCE", "0.02"))
+SCALES = [1, 10]
+
+results = {}
+
+
+@pytest.fixture(scope="module", autouse=True)
+def gas_report():
+    yield
+    if not results:
+        return
+    # merge, so xdist workers and partial runs add to the same report
+    report = json.loads(REPORT.read_text()) if REPORT.exists() else {}
+    report.update(results)
+    REPORT.write_text(json.dumps(report, indent=2, sort_keys=True))
+    if os.environ.get("GAS_UPDATE_BASELINE") == "1":
+        baseline = json.loads(BASELINE.read_text()) if BASELINE.exists() else {}
+        baseline.update(results)
+        BASELINE.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+
+
+@pytest.fixture(scope="module")
+def labels(strategy, vault, token):
+    pv = interface.IVault(strategy.perpVault())
+    ch = interface.IClearingHouse(pv.getClearingHouse())
+    return {
+        strategy.address: "Strategy",
+        vault.address: "YearnVault",
+        token.address: "Want",
+        strategy.short(): "BaseToken",
+        strategy.insurance(): "StrategyInsurance",
+        pv.address: "PerpVault",
+        ch.address: "ClearingHouse",
+        ch.getOrderBook(): "OrderBook",
+        ch.getExchange(): "Exchange",
+        ch.getAccountBalance(): "AccountBalance",
+        ch.getClearingHouseConfig(): "ClearingHouseConfig",
+        strategy.marketRegistery(): "MarketRegistry",
+    }
+
+
+def record(name, tx, labels, **extra):
+    result = profile_tx(tx, labels)
+    result.update(extra)
+    results[name] = result
+    if os.environ.get("GAS_UPDATE_BASELINE") == "1":
+        return
+    # the measurement is in the report either way; only the comparison needs
+    # a baseline recorded on a pinned FORK_BLOCK
+    if not BASELINE.exists():
+        pytest.skip("no {}, record it with GAS_UPDATE_BASELINE=1".format(BASELINE))
+    baseline = json.loads(BASELINE.read_text())
+    if name not in baseline:
+        pytest.skip(
+            "no baseline for {}, record it with GAS_UPDATE_BASELINE=1".format(name)
+        )
+    regressions = compare({name: result}, baseline, TOLERANCE)
+    assert not regressions, regressions
+
+
+def scale_up(scale, vault, strategy, token, whale, gov, amount):
+    if scale > 1:
+        extra = amount * (scale - 1)
+        token.approve(vault, extra, {"from": whale})
+        vault.deposit(extra, {"from": whale})
+        strategy.harvest({"from": gov})
+
+
+@pytest.mark.parametrize("scale", SCALES)
+def test_gas_harvest(chain, vault, strategy, token, whale, gov, amount, scale, labels):
+    scale_up(scale, vault, strategy, token, whale, gov, amount)
+    # new funds to deploy, so harvest goes through prepareReturn and a redeploy
+    token.approve(vault, amount, {"from": whale})
+    vault.deposit(amount, {"from": whale})
+    chain.sleep(3600)
+    tx = strategy.harvest({"from": gov})
+    record("harvest_x{}".format(scale), tx, labels)
+
+
+@pytest.mark.parametrize("scale", SCALES)
+@pytest.mark.parametrize("percent", [0.1, 50, 95, 99])
+@pytest.mark.parametrize("partial", [True, False])
+def test_gas_withdraw(
+    vault, strategy, token, whale, gov, user, amount, scale, percent, partial, labels
+):
+    scale_up(scale, vault, strategy, token, whale, gov, amount)
+    strategy.setPartialWithdraw(partial, {"from": gov})
+    shares = int(vault.balanceOf(user) * percent / 100)
+    expected = vault.pricePerShare() * shares // 10 ** vault.decimals()
+    before = token.balanceOf(user)
+    tx = vault.withdraw(shares, user, 10_000, {"from": user})
+    name = "withdraw_{}pc_x{}{}".format(percent, scale, "" if partial else "_full")
+    record(name, tx, labels, slippage=expected - (token.balanceOf(user) - before))
+
+
+def rebalance_mode(strategy, gov, in_place):
+    strategy.setRebalanceConfig(in_place, strategy.residualTolerance(), {"from": gov})
+    return "_in_place" if in_place else ""
+
+
+def record_rebalance(name, tx, labels, strategy, vault):
+    # the rebalance loss (taker fees and slippage) shows up in the share price
+    record(
+        name,
+        tx,
+        labels,
+        assets=strategy.estimatedTotalAssets(),
+        total_debt=vault.strategies(strategy)["totalDebt"],
+    )
+
+
+@pytest.mark.parametrize("scale", SCALES)
+@pytest.mark.parametrize("in_place", [False, True])
+def test_gas_rebalance_debt(
+    vault, strategy, token, whale, gov, keeper, amount, scale, in_place, labels
+):
+    scale_up(scale, vault, strategy, token, whale, gov, amount)
+    suffix = rebalance_mode(strategy, gov, in_place)
+    pv = interface.IVault(strategy.perpVault())
+    ch = interface.IClearingHouse(pv.getClearingHouse())
+    token.transfer(gov, amount * 100, {"from": whale})
+    token.approve(pv, amount * 100, {"from": gov})
+    pv.deposit(token, amount * 100, {"from": gov})
+    ch.openPosition(
+        [strategy.short(), False, True, 10**18 * 500000, 0, 2**256 - 1, 0, 0],
+        {"from": gov},
+    )
+    assert strategy.calcDebtRatio() < strategy.debtLower()
+    tx = strategy.rebalanceDebt({"from": keeper})
+    name = "rebalance_debt_x{}{}".format(scale, suffix)
+    record_rebalance(name, tx, labels, strategy, vault)
+
+
+@pytest.mark.parametrize("scale", SCALES)
+@pytest.mark.parametrize("in_place", [False, True])
+def test_gas_rebalance_collateral(
+    vault, strategy, token, whale, gov, keeper, amount, scale, in_place, labels
+):
+    scale_up(scale, vault, strategy, token, whale, gov, amount)
+    suffix = rebalance_mode(strategy, gov, in_place)
+    lower, upper = strategy.lowerTick(), strategy.upperTick()
+    # a higher debt multiple moves the collateral target away from the position
+    strategy.setCollateralThresholds(5900, 40000, 6100, 10000, {"from": gov})
+    tx = strategy.rebalanceCollateral({"from": keeper})
+    if in_place:
+        # the price did not move, so the position was resized in its range
+        assert (strategy.lowerTick(), strategy.upperTick()) == (lower, upper)
+    name = "rebalance_collateral_x{}{}".format(scale, suffix)
+    record_rebalance(name, tx, labels, strategy, vault)
+
+
+@pytest.mark.parametrize("scale", SCALES)
+def test_gas_liquidate_position_auth(
+    vault, strategy, token, whale, gov, amount, scale, labels
+):
+    scale_up(scale, vault, strategy, token, whale, gov, amount)
+    tx = strategy.liquidatePositionAuth(
+        strategy.estimatedTotalAssets() // 10, {"from": gov}
+    )
+    record("liquidate_position_auth_x{}".format(scale), tx, labels)
+
+
+@pytest.mark.parametrize(
+    "view",
+    [
+        "getBaseTokenMarkTwapPrice",
+        "getBaseTokenSpotPrice",
+        "getBaseTokenMarkTwapTick",
+        "shortDeployed",
+        "calcDebtRatio",
+    ],
+)
+def test_gas_cached_views(strategy, gov, view, labels):
+    # sent as a transaction so it can be traced like the entry points
+    tx = getattr(strategy, view).transact({"from": gov})
+    record("view_{}".format(view), tx, labels)
+    calls = results["view_{}".format(view)]["calls"]
+    # the Exchange, config and twap interval are cached by the strategy
+    assert "PerpVault" not in calls
+    assert "ClearingHouseConfig" not in calls
+
+
+@pytest.mark.parametrize(
+    "view", ["getBaseTokenMarkTwapPrice", "getBaseTokenMarkTwapTick"]
+)
+def test_gas_cache_saving(strategy, gov, view, labels):
+    # the same view resolving the Exchange, config and twap interval through
+    # the Perp Vault on every call, as the strategy did before caching them
+    uncached = gov.deploy(
+        project.PerpStrategyProject.UncachedPerpViews,
+        strategy.perpVault(),
+        strategy.baseToken(),
+    )
+    assert getattr(uncached, view)() == getattr(strategy, view)()
+    cached_tx = getattr(strategy, view).transact({"from": gov})
+    uncached_tx = getattr(uncached, view).transact({"from": gov})
+    # getExchange, getClearingHouseConfig and getTwapInterval are saved
+    cached_calls = profile_tx(cached_tx, labels)["call_count"]
+    assert profile_tx(uncached_tx, labels)["call_count"] - cached_calls == 3
+    assert cached_tx.gas_used < uncached_tx.gas_used
+    record(
+        "cache_{}".format(view),
+        cached_tx,
+        labels,
+        uncached_gas=uncached_tx.gas_used,
+        saved=uncached_tx.gas_used - cached_tx.gas_used,
+    )
@@ -0,0 +1,52 @@
+from brownie import interface, web3
+
+from scripts.sim.ingest import SWAP, ingest
+from scripts.sim.store import uint_values
+
+
+def swap(strategy, gov, is_base_to_quote, quote=10**18 * 10000):
+    pv = interface.IVault(strategy.perpVault())
+    ch = interface.IClearingHouse(pv.getClearingHouse())
+    # the quote side is exact in both directions
+    params = [strategy.short(), is_base_to_quote, not is_base_to_quote, quote]
+    ch.openPosition(params + [0, 2**256 - 1, 0, 0], {"from": gov})
+
+
+def test_ingest_swaps(chain, strategy, token, gov, whale, amount, tmp_path):
+    pv = interface.IVault(strategy.perpVault())
+    ch = interface.IClearingHouse(pv.getClearingHouse())
+    registry = interface.IMarketRegistry(strategy.marketRegistery())
+    pool = interface.IUniswapV3PoolState(registry.getPool(strategy.short()))
+    token.transfer(gov, amount * 100, {"from": whale})
+    token.approve(pv, amount * 100, {"from": gov})
+    pv.deposit(token, amount * 100, {"from": gov})
+
+    start = chain.height + 1
+    for is_base_to_quote in (False, True, False):
+        chain.sleep(60)
+        swap(strategy, gov, is_base_to_quote)
+    args = (ch.getExchange(), strategy.short())
+    # a small chunk size so the ranges are fetched by several workers
+    pool_store, funding_store = ingest(
+        web3, pool.address, tmp_path, start, chain.height, *args, chunk=1, workers=4
+    )
+    kinds = pool_store.column("kind")
+    assert (kinds == SWAP).sum() == 3
+    assert list(pool_store.column("block")) == sorted(pool_store.column("block"))
+    slot0 = pool.slot0()
+    assert pool_store.column("tick")[-1] == slot0["tick"]
+    assert uint_values(pool_store.column("sqrt_price_x96")[-1:]) == [
+        slot0["sqrtPriceX96"]
+    ]
+    assert funding_store.rows >= 1
+    assert pool_store.last_block == funding_store.last_block == chain.height
+
+    # a second run only appends the new blocks
+    rows = pool_store.rows
+    ticks = list(pool_store.column("tick"))
+    chain.sleep(60)
+    swap(strategy, gov, True)
+    pool_store, _ = ingest(web3, pool.address, tmp_path, start, chain.height, *args)
+    assert pool_store.rows == rows + 1
+    assert list(pool_store.column("tick")[:rows]) == ticks
+    assert pool_store.column("tick")[-1] == pool.slot0()["tick"]
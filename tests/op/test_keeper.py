@@ -0,0 +1,68 @@
+import asyncio
+
+from brownie import interface
+
+from scripts.keeper.daemon import Keeper
+
+
+def run_once(keeper):
+    sent = asyncio.run(keeper.run_once())
+    for tx in sent:
+        tx.wait(1)
+    return [tx.fn_name for tx in sent]
+
+
+def move_price(strategy, token, gov, whale, amount, size):
+    pv = interface.IVault(strategy.perpVault())
+    ch = interface.IClearingHouse(pv.getClearingHouse())
+    token.transfer(gov, amount * 100, {"from": whale})
+    token.approve(pv, amount * 100, {"from": gov})
+    pv.deposit(token, amount * 100, {"from": gov})
+    ch.openPosition(
+        [strategy.short(), False, True, size, 0, 999999999999999999999999, 0, 0],
+        {"from": gov},
+    )
+
+
+def test_keeper_idle(chain, strategy, keeper, multicall):
+    bot = Keeper([strategy], keeper, multicall, trigger_interval=10**9)
+    assert run_once(bot) == []
+    chain.mine(1)
+    # nothing moved: no reads and no transactions
+    assert run_once(bot) == []
+    assert bot.strategies[0].checked_block < chain.height
+
+
+def test_keeper_rebalances_debt(
+    chain, strategy, keeper, multicall, token, gov, whale, amount
+):
+    bot = Keeper([strategy], keeper, multicall, trigger_interval=10**9)
+    assert run_once(bot) == []
+
+    move_price(strategy, token, gov, whale, amount, 10**18 * 500000)
+    assert strategy.calcDebtRatio() < strategy.debtLower()
+    assert run_once(bot) == ["rebalanceDebt"]
+    assert strategy.debtLower() <= strategy.calcDebtRatio() <= strategy.debtUpper()
+
+    chain.mine(1)
+    assert run_once(bot) == []
+
+
+def test_keeper_harvests(chain, strategy, keeper, multicall, vault, gov):
+    vault.updateStrategyDebtRatio(strategy, 0, {"from": gov})
+    bot = Keeper([strategy], keeper, multicall, trigger_interval=1)
+    assert strategy.harvestTrigger(0)
+    assert run_once(bot) == ["harvest"]
+    assert vault.strategies(strategy)["totalDebt"] == 0
+
+
+def test_keeper_follows_threshold_changes(chain, strategy, keeper, multicall, gov):
+    bot = Keeper(
+        [strategy], keeper, multicall, max_idle_blocks=1, trigger_interval=10**9
+    )
+    assert run_once(bot) == []
+
+    # a band the current ratio is above, set after the keeper started
+    strategy.setDebtThresholds(9000, 9500, {"from": gov})
+    assert strategy.calcDebtRatio() > strategy.debtUpper()
+    assert run_once(bot) == ["rebalanceDebt"]
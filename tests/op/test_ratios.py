@@ -0,0 +1,53 @@
+from brownie import chain, interface
+
+from scripts.keeper.ratios import load_model
+
+
+def assert_matches(model, strategy, block):
+    kwargs = {"block_identifier": block.number}
+    assert model.mark_twap_tick(block.timestamp) == strategy.getBaseTokenMarkTwapTick(
+        **kwargs
+    )
+    assert model.spot_price() == strategy.getBaseTokenSpotPrice(**kwargs)
+    assert model.short_deployed(block.timestamp) == strategy.shortDeployed(**kwargs)
+    assert model.debt_ratio(block.timestamp) == strategy.calcDebtRatio(**kwargs)
+    assert model.collateral_ratio() == strategy.calcCollateral(**kwargs)
+
+
+def test_model_matches_views(strategy, vault):
+    model = load_model(strategy, vault)
+    assert_matches(model, strategy, chain[-1])
+
+
+def test_model_follows_swaps(strategy, vault, token, gov, whale, amount):
+    model = load_model(strategy, vault)
+    pv = interface.IVault(strategy.perpVault())
+    ch = interface.IClearingHouse(pv.getClearingHouse())
+    token.transfer(gov, amount * 100, {"from": whale})
+    token.approve(pv, amount * 100, {"from": gov})
+    pv.deposit(token, amount * 100, {"from": gov})
+
+    for size, is_short in [(10**20, False), (3 * 10**20, True), (10**19, False)]:
+        chain.sleep(120)
+        tx = ch.openPosition(
+            [strategy.short(), is_short, True, size, 0, 2**256 - 1, 0, 0],
+            {"from": gov},
+        )
+        event = tx.events["PositionChanged"]
+        model.update(tx.timestamp, event["sqrtPriceAfterX96"])
+        assert (
+            model.sqrt_price_x96
+            == interface.IUniswapV3PoolState(
+                interface.IMarketRegistry(strategy.marketRegistery()).getPool(
+                    strategy.short()
+                )
+            ).slot0()[0]
+        )
+        # free collateral moves with the index price, refresh it like a keeper would
+        model.position.free_collateral = pv.getFreeCollateral(strategy)
+        assert_matches(model, strategy, chain[-1])
+
+    # the TWAP keeps moving with time even without swaps
+    chain.sleep(600)
+    chain.mine(1)
+    assert_matches(model, strategy, chain[-1])
@@ -0,0 +1,100 @@
+import math
+
+import numpy as np
+import pytest
+from brownie import interface
+
+from scripts.sim.ingest import POOL_COLUMNS, SWAP
+from scripts.sim.replay import ACTIONS, Policy, Replay, fund_trader
+from scripts.sim.store import ColumnStore, uint_column
+
+BLOCKS = 60
+
+
+@pytest.fixture
+def history(tmp_path):
+    # two recorded swaps per block, drifting up 1% and back down
+    moves = np.concatenate([np.linspace(0, 0.01, 30), np.linspace(0.01, -0.005, 30)])
+    sqrt_prices = [int(2**96 * 40 * math.sqrt(1 + m)) for m in np.repeat(moves, 2)]
+    blocks = np.repeat(np.arange(1000, 1000 + BLOCKS), 2)
+    n = len(blocks)
+    store = ColumnStore(tmp_path / "history" / "pool", POOL_COLUMNS)
+    store.append(
+        {
+            "block": blocks,
+            "log_index": np.tile([0, 1], BLOCKS),
+            "timestamp": 1_650_000_000 + (blocks - 1000) * 2,
+            "kind": np.full(n, SWAP),
+            "tick": np.zeros(n),
+            "sqrt_price_x96": uint_column(sqrt_prices, 20),
+            "price": [(s / 2**96) ** 2 for s in sqrt_prices],
+            "liquidity": uint_column([0] * n, 16),
+            "tick_lower": np.zeros(n),
+            "tick_upper": np.zeros(n),
+            "amount0": np.zeros(n),
+            "amount1": np.zeros(n),
+        },
+        last_block=blocks[-1],
+    )
+    return tmp_path / "history", sqrt_prices[-1] / sqrt_prices[0]
+
+
+def test_replay(
+    strategy, keeper, accounts, whale, amount, multicall, history, tmp_path
+):
+    path, ratio = history
+    trader = accounts[6]
+    fund_trader(strategy, trader, whale, amount * 100)
+    registry = interface.IMarketRegistry(strategy.marketRegistery())
+    pool = interface.IUniswapV3PoolState(registry.getPool(strategy.short()))
+    start = pool.slot0()["sqrtPriceX96"]
+
+    replay = Replay(
+        strategy,
+        trader,
+        keeper,
+        path,
+        tmp_path / "metrics",
+        policy=Policy(harvest_interval=60),
+        batch_size=10,
+        multicall=multicall,
+    )
+    totals = replay.run()
+    assert totals["blocks"] == BLOCKS
+    assert totals["failed"] == 0
+    assert totals["harvest"] >= 1
+
+    # the pool followed the rebased path and the strategy was tracked per block
+    assert pool.slot0()["sqrtPriceX96"] / start == pytest.approx(ratio, rel=1e-4)
+    metrics = replay.metrics
+    assert metrics.rows == BLOCKS // 10
+    assert metrics.last_block == 1000 + BLOCKS - 1
+    assert np.isfinite(metrics.column("debt_ratio")).all()
+    harvested = metrics.column("actions") & (1 << ACTIONS.index("harvest"))
+    assert harvested.sum() == totals["harvest"] << ACTIONS.index("harvest")
+
+    # automine is back on for the rest of the test
+    strategy.harvest({"from": keeper})
+
+
+def test_replay_max_blocks(
+    strategy, keeper, accounts, whale, amount, multicall, history, tmp_path
+):
+    path, _ = history
+    trader = accounts[6]
+    fund_trader(strategy, trader, whale, amount * 100)
+    replay = Replay(
+        strategy,
+        trader,
+        keeper,
+        path,
+        tmp_path / "metrics",
+        policy=Policy(harvest_interval=None, rebalance=False),
+        batch_size=4,
+        multicall=multicall,
+    )
+    totals = replay.run(start_block=1010, max_blocks=10)
+    assert totals["blocks"] == 10
+    # two full batches and the remainder
+    assert replay.metrics.column("source_block").tolist() == [1013, 1017, 1019]
+    assert replay.metrics.column("actions").sum() == 0
@@ -0,0 +1,14 @@
+import os
+
+import pytest
+from brownie import chain
+
+
+def test_fork_goes_through_rpc_cache(pytestconfig, strategy):
+    if not os.environ.get("RPC_CACHE"):
+        pytest.skip("RPC_CACHE is not set")
+    proxy = pytestconfig.rpc_cache_proxy
+    assert proxy is not None
+    # the chain was forked at the proxy's block and read its state through it
+    assert chain.height > proxy.block
+    assert proxy.hits + proxy.misses > 0
@@ -0,0 +1,27 @@
+from scripts.keeper.state import VIEWS, read_state, read_states
+
+
+def test_read_state_matches_views(chain, strategy, multicall):
+    state = read_state(strategy, multicall)
+    assert state.block == chain.height
+    assert state.strategy == strategy.address
+    for name, fn in VIEWS:
+        assert getattr(state, name) == getattr(strategy, fn)()
+    assert state.total_liquidity > 0
+    assert state.lower_tick < state.upper_tick
+
+
+def test_read_states_batch(chain, strategy, multicall, gov, vault):
+    block = chain.height
+    vault.updateStrategyDebtRatio(strategy, 0, {"from": gov})
+    strategy.harvest({"from": gov})
+
+    before = read_states([strategy, strategy], multicall, block=block)[0]
+    now = read_state(strategy, multicall)
+    assert before.block == block
+    assert before.estimated_total_assets == strategy.estimatedTotalAssets(
+        block_identifier=block
+    )
+    assert before.total_liquidity > 0
+    assert now.block > block
+    assert now.total_liquidity == 0
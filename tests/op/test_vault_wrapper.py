@@ -1,7 +1,6 @@
 import brownie
 from brownie import interface, accounts
 import pytest
-import time 
 
 def strategySharePrice(strategy, vault):
     return strategy.estimatedTotalAssets() / vault.strategies(strategy)['totalDebt']
@@ -16,16 +15,7 @@ def steal(stealPercent, strategy, token, chain, gov, user):
 def test_calcDebt(
     chain, accounts, gov, token, vault, strategy, user, strategist, amount, RELATIVE_APPROX, conf, whale, keeper
 ):
-    # Deposit to the vault
-    user_balance_before = token.balanceOf(user)
-    token.approve(vault.address, amount, {"from": user})
-    vault.deposit(amount, {"from": user})
-    assert token.balanceOf(vault.address) == amount
-    
-    # harvest
-    chain.sleep(1)
-    chain.mine(1)
-    strategy.harvest()
+    # The vault is deposited and harvested by the shared setup
     reserve = accounts.at(whale, force=True)
     bigAmount = amount * 100;
     token.transfer(gov, bigAmount, {"from": reserve})
@@ -59,16 +49,8 @@ def test_calcDebt(
 def test_operation(
     chain, accounts, gov, token, vault, strategy, user, strategist, amount, RELATIVE_APPROX, conf, whale, keeper
 ):
-    # Deposit to the vault
-    user_balance_before = token.balanceOf(user)
-    token.approve(vault.address, amount, {"from": user})
-    vault.deposit(amount, {"from": user})
-    assert token.balanceOf(vault.address) == amount
-    
-    # harvest
-    chain.sleep(1)
-    chain.mine(1)
-    strategy.harvest()
+    # The user deposited their whole balance in the shared setup
+    user_balance_before = amount
     strat = strategy
     assert pytest.approx(strategy.estimatedTotalAssets(), rel=RELATIVE_APPROX) == amount
     # # make tiny swap to avoid issue where dif
@@ -93,22 +75,10 @@ def test_operation(
 def test_change_debt_lossy(
     chain, gov, token, vault, strategy, user, strategist, amount, RELATIVE_APPROX, conf
 ):
-    # Deposit to the vault and harvest
-    token.approve(vault.address, amount, {"from": user})
-    vault.deposit(amount, {"from": user})
-
-    vault.updateStrategyDebtRatio(strategy.address, 100_00, {"from": gov})
-    chain.sleep(1)
-    chain.mine(1)
-    time.sleep(1)
-    
-
-    strategy.harvest()
     assert pytest.approx(strategy.estimatedTotalAssets(), rel=RELATIVE_APPROX) == amount
 
     chain.sleep(1)
     chain.mine(1)
-    time.sleep(1)
 
     # Steal from the strategy
     steal = round(strategy.estimatedTotalAssets() * 0.01)
@@ -118,7 +88,6 @@ def test_change_debt_lossy(
 
     chain.sleep(1)
     chain.mine(1)
-    time.sleep(1)
     
     strategy.harvest()
     assert pytest.approx(strategy.estimatedTotalAssets(), rel=1e-2) == int(amount * 0.98 / 2) 
@@ -127,7 +96,6 @@ def test_change_debt_lossy(
 
     chain.sleep(1)
     chain.mine(1)
-    time.sleep(1)
     
 
     strategy.harvest()
@@ -137,15 +105,7 @@ def test_change_debt_lossy(
 def test_profitable_harvest(
     chain, accounts, gov, token, vault, strategy, user, strategist, amount, RELATIVE_APPROX, conf, whale
 ):
-    # Deposit to the vault
-    token.approve(vault.address, amount, {"from": user})
-    vault.deposit(amount, {"from": user})
-    assert token.balanceOf(vault.address) == amount
-
-    # Harvest 1: Send funds through the strategy
-    chain.sleep(1)
-    chain.mine(1)
-    strategy.harvest()
+    # Harvest 1 (shared setup) sent the funds through the strategy
     assert pytest.approx(strategy.estimatedTotalAssets(), rel=RELATIVE_APPROX) == amount
     before_pps = vault.pricePerShare()
 
@@ -170,14 +130,7 @@ def test_set_debt_thresholds(strategy, gov, user, vault, token, amount, chain):
     # Only the governance account can set the debt thresholds
     with brownie.reverts(""):
         strategy.setDebtThresholds(9900, 101000, {"from": user})
-    
-    # Deposit to the vault
-    user_balance_before = token.balanceOf(user)
-    token.approve(vault.address, amount, {"from": user})
-    vault.deposit(amount, {"from": user})
-    assert token.balanceOf(vault.address) == amount
-    
-    # harvest
+
     chain.sleep(1)
     chain.mine(1)
 
@@ -193,14 +146,7 @@ def test_set_collateral_thresholds(strategy, gov, user, vault, token, amount, ch
     # Only the governance account can set the debt thresholds
     with brownie.reverts(""):
         strategy.setCollateralThresholds(8900, 10000, 9100, 10000, {"from": user})
-    
-    # Deposit to the vault
-    user_balance_before = token.balanceOf(user)
-    token.approve(vault.address, amount, {"from": user})
-    vault.deposit(amount, {"from": user})
-    assert token.balanceOf(vault.address) == amount
-    
-    # harvest
+
     chain.sleep(1)
     chain.mine(1)
 
@@ -234,9 +180,28 @@ def test_set_collateral_thresholds(strategy, gov, user, vault, token, amount, ch
     assert pytest.approx(((100000 - strategy.debtMultiple())/10), rel=1e-2) == strategy.calcCollateral()
     assert pytest.approx(strategy.calcDebtRatio(), rel=1e-2) == 10000
 
-def test_sweep(gov, vault, strategy, token, user, amount, conf):
+def test_in_place_rebalance_collateral(strategy, gov, user):
+    with brownie.reverts(""):
+        strategy.setRebalanceConfig(True, 50, {"from": user})
+    with brownie.reverts(""):
+        strategy.setRebalanceConfig(True, 10001, {"from": gov})
+    strategy.setRebalanceConfig(True, 50, {"from": gov})
+    assert strategy.inPlaceRebalance()
+    lower, upper = strategy.lowerTick(), strategy.upperTick()
+    liquidity = strategy.getTotalLiquidity()
+
+    # Same price, bigger target: the range is kept and only topped up
+    strategy.setCollateralThresholds(5900, 40000, 6100, 10000, {"from": gov})
+    strategy.rebalanceCollateral()
+    assert strategy.lowerTick() == lower
+    assert strategy.upperTick() == upper
+    assert strategy.getTotalLiquidity() > liquidity
+    assert pytest.approx(((100000 - strategy.debtMultiple())/10), rel=1e-2) == strategy.calcCollateral()
+    assert pytest.approx(strategy.calcDebtRatio(), rel=1e-2) == 10000
+
+def test_sweep(gov, vault, strategy, token, user, amount, conf, whale):
     # Strategy want token doesn't work
-    token.transfer(strategy, amount, {"from": user})
+    token.transfer(strategy, amount, {"from": whale})
     assert token.address == strategy.want()
     assert token.balanceOf(strategy) > 0
     with brownie.reverts("!want"):
@@ -251,9 +216,6 @@ def test_sweep(gov, vault, strategy, token, user, amount, conf):
 def test_triggers(
     chain, gov, vault, strategy, token, amount, user, conf
 ):
-    # Deposit to the vault and harvest
-    token.approve(vault.address, amount, {"from": user})
-    vault.deposit(amount, {"from": user})
     vault.updateStrategyDebtRatio(strategy.address, 5_000, {"from": gov})
     chain.sleep(1)
     strategy.harvest()
@@ -266,15 +228,6 @@ def test_triggers(
 def test_lossy_withdrawal(
     chain, gov, accounts, token, vault, strategy, user, strategist, amount, RELATIVE_APPROX, conf
 ):
-    # Deposit to the vault and harvest
-    token.approve(vault.address, amount, {"from": user})
-    vault.deposit(amount, {"from": user})
-
-    vault.updateStrategyDebtRatio(strategy.address, 100_00, {"from": gov})
-    chain.sleep(1)
-    chain.mine(1)
-
-    strategy.harvest()
     assert pytest.approx(strategy.estimatedTotalAssets(), rel=RELATIVE_APPROX) == amount
 
     # Steal from the strategy
@@ -290,20 +243,13 @@ def test_lossy_withdrawal(
     assert pytest.approx(balAfter - balBefore, rel = 2e-3) == int(amount * .99)
 
 
+# the loss and slippage of a withdrawal are the same whichever way it is served
+@pytest.mark.parametrize("partial", [False, True])
 def test_lossy_withdrawal_partial(
-    chain, gov, accounts, token, vault, strategy, user, strategist, amount, RELATIVE_APPROX, conf
+    chain, gov, accounts, token, vault, strategy, user, strategist, amount, RELATIVE_APPROX, conf, partial
 ):
-    # Deposit to the vault and harvest
-    token.approve(vault.address, amount, {"from": user})
-    vault.deposit(amount, {"from": user})
-
-    vault.updateStrategyDebtRatio(strategy.address, 100_00, {"from": gov})
-
-    chain.sleep(1)
-    chain.mine(1)
-
-    strategy.harvest()
     assert pytest.approx(strategy.estimatedTotalAssets(), rel=RELATIVE_APPROX) == amount
+    strategy.setPartialWithdraw(partial, {'from': gov})
 
 
     # Steal from the strategy
@@ -315,8 +261,6 @@ def test_lossy_withdrawal_partial(
     balBefore = token.balanceOf(user)
     ssp_before = strategySharePrice(strategy, vault)
 
-    #give RPC a little break to stop it spzzing out 
-    time.sleep(5)
 
     half = int(amount / 2)
     vault.withdraw(half, user, 100, {'from' : user}) 
@@ -328,20 +272,41 @@ def test_lossy_withdrawal_partial(
     assert pytest.approx(ssp_before, rel = 2e-5) == ssp_after
 
 
-def test_lossy_withdrawal_tiny(
-    chain, gov, accounts, token, vault, strategy, user, strategist, amount, RELATIVE_APPROX, conf
+def test_partial_withdrawal_keeps_range(
+    chain, gov, token, vault, strategy, user, amount, RELATIVE_APPROX
 ):
-    # Deposit to the vault and harvest
-    token.approve(vault.address, amount, {"from": user})
-    vault.deposit(amount, {"from": user})
+    # off unless turned on
+    assert not strategy.partialWithdraw()
+    with brownie.reverts():
+        strategy.setPartialWithdraw(True, {'from': user})
+    strategy.setPartialWithdraw(True, {'from': gov})
+    lower, upper = strategy.lowerTick(), strategy.upperTick()
+    liquidity = strategy.getTotalLiquidity()
+
+    tenth = int(amount / 10)
+    vault.withdraw(tenth, user, 100, {'from' : user})
+    assert pytest.approx(token.balanceOf(user), rel = 2e-3) == tenth
+    # only the withdrawn share of liquidity came out of the existing range
+    assert strategy.lowerTick() == lower
+    assert strategy.upperTick() == upper
+    assert pytest.approx(strategy.getTotalLiquidity(), rel = 1e-3) == liquidity * 0.9
+    assert pytest.approx(strategy.calcDebtRatio(), rel = 1e-2) == 10000
+
+    # the taker position the removal left is closed down to the tolerance
+    pv = interface.IVault(strategy.perpVault())
+    ab = interface.IAccountBalance(interface.IClearingHouse(pv.getClearingHouse()).getAccountBalance())
+    size = abs(ab.getTakerPositionSize(strategy, strategy.short()))
+    notional = size * strategy.getBaseTokenSpotPrice() // 10**18
+    tolerance = strategy.estimatedTotalAssets() * 10**(18 - token.decimals()) * strategy.residualTolerance() // 10000
+    assert notional <= tolerance
 
 
-    vault.updateStrategyDebtRatio(strategy.address, 100_00, {"from": gov})
-    chain.sleep(1)
-    chain.mine(1)
-
-    strategy.harvest()
+@pytest.mark.parametrize("partial", [False, True])
+def test_lossy_withdrawal_tiny(
+    chain, gov, accounts, token, vault, strategy, user, strategist, amount, RELATIVE_APPROX, conf, partial
+):
     assert pytest.approx(strategy.estimatedTotalAssets(), rel=RELATIVE_APPROX) == amount
+    strategy.setPartialWithdraw(partial, {'from': gov})
 
     chain.sleep(1)
     chain.mine(1)
@@ -352,8 +317,6 @@ def test_lossy_withdrawal_tiny(
     balBefore = token.balanceOf(user)
     ssp_before = strategySharePrice(strategy, vault)
 
-    #give RPC a little break to stop it spzzing out 
-    time.sleep(5)
 
     tiny = int(amount * 0.001)
     vault.withdraw(tiny, user, 100, {'from' : user}) 
@@ -368,14 +331,6 @@ def test_lossy_withdrawal_tiny(
 def test_lossy_withdrawal_99pc(
     chain, gov, accounts, token, vault, strategy, user, strategist, amount, RELATIVE_APPROX, conf
 ):
-    # Deposit to the vault and harvest
-    token.approve(vault.address, amount, {"from": user})
-    vault.deposit(amount, {"from": user})
-
-    vault.updateStrategyDebtRatio(strategy.address, 100_00, {"from": gov})
-    chain.sleep(1)
-    chain.mine(1)
-    strategy.harvest()
     assert pytest.approx(strategy.estimatedTotalAssets(), rel=RELATIVE_APPROX) == amount
 
     chain.sleep(1)
@@ -387,8 +342,6 @@ def test_lossy_withdrawal_99pc(
     balBefore = token.balanceOf(user)
     ssp_before = strategySharePrice(strategy, vault)
 
-    #give RPC a little break to stop it spzzing out 
-    time.sleep(5)
 
     tiny = int(amount * 0.99)
     vault.withdraw(tiny, user, 100, {'from' : user}) 
@@ -413,8 +366,6 @@ def test_lossy_withdrawal_95pc(
     balBefore = token.balanceOf(user)
     ssp_before = strategySharePrice(strategy, vault)
 
-    #give RPC a little break to stop it spzzing out 
-    time.sleep(5)
     chain.sleep(1)
     chain.mine(1)
 
@@ -441,9 +392,12 @@ def test_set_perp_vault(strategy, gov, user):
     with brownie.reverts(""):
         strategy.setPerpVault(user, {"from": user})
 
-    # The slippage config can be updated by the governance account
-    strategy.setPerpVault(user, {"from": gov})
-    assert strategy.perpVault() == user
+    # The Perp components are resolved from the vault, so it must be a Perp vault
+    perp_vault = strategy.perpVault()
+    with brownie.reverts():
+        strategy.setPerpVault(user, {"from": gov})
+    strategy.setPerpVault(perp_vault, {"from": gov})
+    assert strategy.perpVault() == perp_vault
 
 
 # def test_set_insurance(strategy, gov, user):
@@ -455,24 +409,34 @@ def test_set_perp_vault(strategy, gov, user):
 #     strategy.setInsurance(user, {"from": gov})
 #     assert strategy.insurance() == user
 
-def test_set_perp_vault(strategy, gov, user):
+def test_set_perp_vault_refreshes_components(strategy, gov, user):
     # Only the governance account can set the Perp vault contract
     with brownie.reverts(""):
         strategy.setPerpVault(user, {"from": user})
 
-    # The Perp vault contract can be set by the governance account
-    strategy.setPerpVault(user, {"from": gov})
-    assert strategy.perpVault() == user
+    # The Perp vault contract can be set by the governance account, which
+    # resolves and caches the Exchange, ClearingHouseConfig and twap interval
+    perp_vault = interface.IVault(strategy.perpVault())
+    with brownie.reverts():
+        strategy.setPerpVault(user, {"from": gov})
+    strategy.setPerpVault(perp_vault, {"from": gov})
+    assert strategy.perpVault() == perp_vault
+    assert strategy.perpExchange() == perp_vault.getExchange()
+    config = interface.IClearingHouseConfig(perp_vault.getClearingHouseConfig())
+    assert strategy.clearingHouseConfig() == config
+    assert strategy.twapInterval() == config.getTwapInterval()
+
+
+def test_refresh_perp_components(strategy, gov, user):
+    with brownie.reverts(""):
+        strategy.refreshPerpComponents({"from": user})
+    twap_price = strategy.getBaseTokenMarkTwapPrice()
+    strategy.refreshPerpComponents({"from": gov})
+    assert strategy.getBaseTokenMarkTwapPrice() == twap_price
 
 def test_emergency_exit(
     chain, accounts, gov, token, vault, strategy, user, strategist, amount, RELATIVE_APPROX, conf
 ):
-    # Deposit to the vault
-    token.approve(vault.address, amount, {"from": user})
-    vault.deposit(amount, {"from": user})
-    chain.sleep(1)
-    chain.mine(1)
-    strategy.harvest()
     assert pytest.approx(strategy.estimatedTotalAssets(), rel=RELATIVE_APPROX) == amount
 
     # set emergency and exit
@@ -486,14 +450,10 @@ def test_emergency_exit(
 def test_change_debt(
     chain, gov, token, vault, strategy, user, strategist, amount, RELATIVE_APPROX, conf
 ):
-    # Deposit to the vault and harvest
-    token.approve(vault.address, amount, {"from": user})
-    vault.deposit(amount, {"from": user})
     vault.updateStrategyDebtRatio(strategy.address, 50_00, {"from": gov})
 
     chain.sleep(1)
     chain.mine(1)
-    time.sleep(1)
     strategy.harvest()
     half = int(amount / 2)
     assert pytest.approx(strategy.estimatedTotalAssets(), rel=RELATIVE_APPROX) == half
@@ -501,7 +461,6 @@ def test_change_debt(
     vault.updateStrategyDebtRatio(strategy.address, 100_00, {"from": gov})
     chain.sleep(1)
     chain.mine(1)
-    time.sleep(1)
     
     strategy.harvest()
     assert pytest.approx(strategy.estimatedTotalAssets(), rel=RELATIVE_APPROX) == amount
@@ -509,7 +468,6 @@ def test_change_debt(
     vault.updateStrategyDebtRatio(strategy.address, 50_00, {"from": gov})
     chain.sleep(1)
     chain.mine(1)
-    time.sleep(1)
     
     strategy.harvest()
     assert pytest.approx(strategy.estimatedTotalAssets(), rel=RELATIVE_APPROX) == half
@@ -517,7 +475,6 @@ def test_change_debt(
     vault.updateStrategyDebtRatio(strategy.address, 0, {"from": gov})
     chain.sleep(1)
     chain.mine(1)
-    time.sleep(1)
     
     strategy.harvest()
     assert strategy.estimatedTotalAssets() < 10 ** (token.decimals() - 3) # near zero
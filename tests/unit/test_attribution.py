@@ -0,0 +1,131 @@
+import pytest
+
+from scripts.sim.attribution import (
+    FUNDING_PAYMENT_SETTLED,
+    INSURANCE_PAYMENT,
+    INSURANCE_PAYOUT,
+    LIQUIDITY_CHANGED,
+    POSITION_CHANGED,
+    STRATEGY_REPORTED,
+    Attribution,
+)
+
+STRATEGY = "0x" + "aa" * 20
+TRADER = "0x" + "bb" * 20
+ETH = 10**18
+
+
+def word(value):
+    return (value % 2**256).to_bytes(32, "big").hex()
+
+
+def log(block, index, topics, words):
+    return {
+        "blockNumber": block,
+        "logIndex": index,
+        "topics": topics,
+        "data": "0x" + "".join(word(w) for w in words),
+    }
+
+
+def address_topic(address):
+    return "0x" + address[2:].rjust(64, "0")
+
+
+def trade(block, index, trader, size, notional, fee, sqrt_price):
+    return log(
+        block,
+        index,
+        [POSITION_CHANGED, address_topic(trader), "0x0"],
+        [size, notional, fee, 0, 0, sqrt_price],
+    )
+
+
+def liquidity(block, index, fee):
+    return log(
+        block,
+        index,
+        [LIQUIDITY_CHANGED, address_topic(STRATEGY), "0x0", "0x0"],
+        [-60, 60, 0, 0, 0, fee],
+    )
+
+
+def report(block, index, gain, loss):
+    return log(
+        block,
+        index,
+        [STRATEGY_REPORTED, address_topic(STRATEGY)],
+        [gain, loss, 0, 0, 0, 0, 0, 0],
+    )
+
+
+def attribution(path):
+    return Attribution(
+        path, STRATEGY, TRADER, TRADER, TRADER, insurance=TRADER, want_decimals=6
+    )
+
+
+def test_attributes_harvest(tmp_path):
+    logs = [
+        # the market trades at 4 before the strategy hedges
+        trade(1, 0, TRADER, ETH, -4 * ETH, 0, 2 * 2**96),
+        # the hedge pays 4.1, of which 0.01 is the fee
+        trade(2, 0, STRATEGY, ETH, -41 * ETH // 10, ETH // 100, 2 * 2**96 + 10**26),
+        liquidity(2, 1, ETH // 2),
+        log(
+            3, 0, [FUNDING_PAYMENT_SETTLED, address_topic(STRATEGY), "0x0"], [ETH // 5]
+        ),
+        log(4, 0, [INSURANCE_PAYMENT, "0x0", "0x0", word(50_000)], []),
+        report(4, 1, 10**6, 0),
+    ]
+    engine = attribution(tmp_path)
+    engine.process(logs, {4: 400}, 4)
+    harvest = {k: v[0] for k, v in engine.harvests().items()}
+    assert harvest["block"] == 4 and harvest["timestamp"] == 400
+    assert harvest["pnl"] == pytest.approx(1.0)
+    assert harvest["fees"] == pytest.approx(0.5)
+    assert harvest["funding"] == pytest.approx(-0.2)
+    assert harvest["execution"] == pytest.approx(-0.1)
+    assert harvest["taker_fees"] == pytest.approx(-0.01)
+    assert harvest["insurance"] == pytest.approx(-0.05)
+    assert harvest["il"] == pytest.approx(0.85)
+    assert (harvest["trades"], harvest["liquidity_changes"]) == (1, 1)
+
+
+def test_resumes_from_checkpoint(tmp_path):
+    first = [liquidity(1, 0, ETH), report(2, 0, 0, 10**6), liquidity(3, 0, ETH)]
+    second = [liquidity(5, 0, ETH), report(6, 0, 3 * 10**6, 0)]
+
+    engine = attribution(tmp_path)
+    engine.process(first, {2: 20}, 4)
+    # a new run starts from the checkpoint with the open interval
+    engine = attribution(tmp_path)
+    assert engine.last_block == 4
+    engine.process(second, {6: 60}, 6)
+    harvests = engine.harvests()
+    assert list(harvests["block"]) == [2, 6]
+    assert list(harvests["fees"]) == [1.0, 2.0]
+    assert list(harvests["il"]) == pytest.approx([-2.0, 1.0])
+
+    # rows stored by a run that died before writing its checkpoint
+    checkpoint = (tmp_path / "checkpoint.json").read_text()
+    engine.process([liquidity(7, 0, ETH), report(8, 0, 0, 0)], {8: 80}, 8)
+    (tmp_path / "checkpoint.json").write_text(checkpoint)
+    engine = attribution(tmp_path)
+    engine.process([liquidity(7, 0, ETH), report(8, 0, 0, 0)], {8: 80}, 8)
+    assert list(engine.harvests()["block"]) == [2, 6, 8]
+
+
+def test_reads_insurance_events_with_data_fields(tmp_path):
+    engine = attribution(tmp_path)
+    engine.process(
+        [
+            log(1, 0, [INSURANCE_PAYMENT], [10**8, 10**6, 50_000]),
+            log(1, 1, [INSURANCE_PAYOUT], [20_000]),
+            log(1, 2, [INSURANCE_PAYOUT, word(10_000)], []),
+            report(1, 3, 0, 0),
+        ],
+        {1: 10},
+        1,
+    )
+    assert engine.harvests()["insurance"][0] == pytest.approx(-0.02)
@@ -0,0 +1,77 @@
+from scripts.gas_profile import compare, summarize_trace
+
+TARGET = "00000000000000000000000000000000000000000000000000000000000000aa"
+
+
+def step(op, gas, depth, cost=3, stack=()):
+    return {"op": op, "gas": gas, "gasCost": cost, "depth": depth, "stack": list(stack)}
+
+
+def test_summarize_trace_exclusive_gas():
+    logs = [
+        step("PUSH1", 1000, 1),
+        step("STATICCALL", 997, 1, cost=900, stack=["ff", TARGET, "1"]),
+        step("SLOAD", 850, 2),  # callee
+        step("RETURN", 750, 2, cost=5),
+        step("STATICCALL", 700, 1, cost=600, stack=["ff", TARGET, "1"]),
+        step("STOP", 600, 2, cost=0),  # callee without code
+        step("STOP", 600, 1, cost=0),
+    ]
+    summary = summarize_trace(logs, {"0x" + "0" * 38 + "aa": "Target"})
+    assert summary["calls"] == {"Target": 2}
+    # SLOAD 100, RETURN 5; the first call cost 997 - 700 = 297, of which
+    # 105 was spent by the callee
+    assert summary["opcodes"]["SLOAD"] == 100
+    assert summary["opcodes"]["RETURN"] == 5
+    assert summary["opcodes"]["STATICCALL"] == 297 - 105 + 100
+    assert summary["opcodes"]["PUSH1"] == 3
+    assert sum(summary["opcodes"].values()) == 1000 - 600
+
+
+def test_compare_flags_regressions():
+    baseline = {
+        "harvest": {"gas_used": 1000, "call_count": 10},
+        "withdraw": {"gas_used": 1000, "call_count": 10},
+    }
+    report = {
+        "harvest": {"gas_used": 1015, "call_count": 10},
+        "withdraw": {"gas_used": 1100, "call_count": 11},
+        "new": {"gas_used": 5, "call_count": 1},
+    }
+    regressions = compare(report, baseline, tolerance=0.02)
+    assert len(regressions) == 2
+    assert all(r.startswith("withdraw") for r in regressions)
+    assert compare(report, baseline, tolerance=0.2) == [
+        "withdraw: external calls 10 -> 11"
+    ]
+
+
+def test_summarize_trace_storage_reads():
+    strategy = "0x" + "0" * 38 + "bb"
+    logs = [
+        step("SLOAD", 1000, 1, stack=["1"]),
+        step("SLOAD", 900, 1, stack=["1"]),  # warm, same slot
+        step("STATICCALL", 800, 1, cost=300, stack=["ff", TARGET, "1"]),
+        step("SLOAD", 700, 2, stack=["1"]),  # the target's slot 1
+        step("RETURN", 600, 2),
+        # a delegate call reads the caller's storage
+        step("DELEGATECALL", 500, 1, cost=300, stack=["ff", TARGET, "1"]),
+        step("SLOAD", 400, 2, stack=["2"]),
+        step("RETURN", 300, 2),
+        step("STOP", 200, 1, cost=0),
+    ]
+    labels = {strategy: "Strategy", "0x" + "0" * 38 + "aa": "Target"}
+    summary = summarize_trace(logs, labels, to=strategy.upper().replace("X", "x"))
+    assert summary["storage"] == {"Strategy": 2, "Target": 1}
+
+
+def test_compare_flags_storage_reads():
+    baseline = {
+        "harvest": {"gas_used": 1000, "call_count": 10, "storage_reads": 30},
+        "old": {"gas_used": 1000, "call_count": 10},
+    }
+    report = {
+        "harvest": {"gas_used": 1000, "call_count": 10, "storage_reads": 31},
+        "old": {"gas_used": 1000, "call_count": 10, "storage_reads": 31},
+    }
+    assert compare(report, baseline) == ["harvest: storage slots read 30 -> 31"]
@@ -0,0 +1,129 @@
+import numpy as np
+import pytest
+
+from scripts.sim.harvest import (
+    HarvestModel,
+    HarvestScheduler,
+    accrued_fees,
+    backtest,
+    load_history,
+)
+from scripts.sim.metrics import ACTIONS, METRIC_COLUMNS
+from scripts.sim.store import ColumnStore
+
+# 20% a year on 1e6, 0.01 gwei for 3m gas at 2000 USD
+CAPITAL = 1e6
+RATE = CAPITAL * 0.2 / (365 * 86400)
+COST = float(HarvestModel().harvest_cost(10**7, 2000))
+
+
+def test_threshold_follows_cost_and_capital():
+    scheduler = HarvestScheduler()
+    expected = np.sqrt(2 * COST * CAPITAL / 0.9)
+    assert scheduler.threshold(CAPITAL, COST, RATE) == pytest.approx(expected, rel=2e-3)
+    # the threshold does not depend on how fast fees accrue, the interval does
+    assert scheduler.threshold(CAPITAL, COST, RATE * 4) == pytest.approx(
+        expected, rel=2e-3
+    )
+    assert scheduler.interval(CAPITAL, COST, RATE * 4)[0] == pytest.approx(
+        scheduler.interval(CAPITAL, COST, RATE)[0] / 4, rel=2e-3
+    )
+    assert scheduler.threshold(CAPITAL, COST * 4, RATE) == pytest.approx(
+        expected * 2, rel=2e-3
+    )
+    # a bigger insurance take leaves less to compound
+    taken = HarvestScheduler(HarvestModel(insurance_take=3000))
+    assert taken.threshold(CAPITAL, COST, RATE) > expected
+    # gas scenarios are averaged
+    scenarios = scheduler.objective(CAPITAL, [COST, COST * 2], RATE)
+    assert scenarios.shape == (2, 4096)
+    assert scheduler.interval(CAPITAL, [COST / 2, COST * 1.5], RATE) == pytest.approx(
+        scheduler.interval(CAPITAL, COST, RATE)
+    )
+    assert scheduler.threshold(CAPITAL, COST) is None
+
+
+def test_observe_estimates_accrual_through_collections():
+    scheduler = HarvestScheduler(half_life=10**9)
+    pending = 0.0
+    for i in range(1000):
+        # collected every 100 observations
+        pending = 0.0 if i % 100 == 0 else pending + RATE * 60
+        scheduler.observe(i * 60, pending)
+    # nine collections each lose the minute before them
+    assert scheduler.rate == pytest.approx(RATE * 990 / 999)
+
+
+def test_accrued_fees():
+    pending = [1.0, 2.0, 3.5, 0.5, 1.0, 0.0, 2.0]
+    assert accrued_fees(pending).tolist() == [0.0, 1.0, 2.5, 3.0, 3.5, 3.5, 5.5]
+
+
+def slow_backtest(t, fees, threshold, min_delay, max_delay, cost, reinvest, take):
+    keep = 1 - take / 10000
+    harvests = gas = forgone = 0.0
+    last = 0
+    for i in range(1, len(t)):
+        forgone += (fees[i - 1] - fees[last]) * (t[i] - t[i - 1])
+        since = t[i] - t[last]
+        if since >= max_delay or (
+            since >= min_delay and fees[i] - fees[last] >= threshold
+        ):
+            harvests += 1
+            gas += cost[i]
+            last = i
+    return harvests, gas, fees[-1] * keep - gas - forgone * reinvest * keep
+
+
+def test_backtest_matches_loop():
+    rng = np.random.default_rng(3)
+    t = np.cumsum(rng.integers(1, 120, 5000)).astype(float)
+    fees = np.cumsum(rng.exponential(RATE * 60, 5000))
+    cost = rng.uniform(0.5, 2.0, 5000) * COST
+    thresholds = [0.0, 5.0, 20.0, 0.0, 1e9]
+    min_delays = [0, 3600, 3600, 7200, 0]
+    max_delays = [1e12, 86400, 21600, 7200, 43200]
+    result = backtest(t, fees, thresholds, min_delays, max_delays, cost, 1e-8, 1000)
+    for k in range(len(thresholds)):
+        harvests, gas, net = slow_backtest(
+            t, fees, thresholds[k], min_delays[k], max_delays[k], cost, 1e-8, 1000
+        )
+        assert result["harvests"][k] == harvests
+        assert result["gas"][k] == pytest.approx(gas)
+        assert result["net"][k] == pytest.approx(net)
+    assert result["insurance"] == pytest.approx(result["harvested"] * 0.1)
+
+
+def test_optimized_threshold_beats_fixed_schedules():
+    t = np.arange(0, 90 * 86400, 60, dtype=float)
+    fees = RATE * t
+    scheduler = HarvestScheduler(HarvestModel(min_report_delay=0))
+    threshold = scheduler.threshold(CAPITAL, COST * 100, RATE)
+    reinvest = RATE / CAPITAL
+    intervals = [600, 3600, 6 * 3600, 30 * 86400]
+    result = backtest(
+        t,
+        fees,
+        [threshold] + [0] * len(intervals),
+        [0] + intervals,
+        [1e12] + intervals,
+        COST * 100,
+        reinvest,
+    )
+    assert np.argmax(result["net"]) == 0
+
+
+def test_load_history(tmp_path):
+    store = ColumnStore(tmp_path, METRIC_COLUMNS)
+    n = 4
+    harvest = 1 << ACTIONS.index("harvest")
+    columns = {name: np.zeros(n) for name, _, _ in METRIC_COLUMNS}
+    columns["timestamp"] = [10, 20, 30, 40]
+    columns["pending_rewards"] = [0.0, 2e18, np.nan, 1e18]
+    columns["estimated_total_assets"] = [1e12] * n
+    columns["actions"] = [0, harvest, 0, 0]
+    store.append(columns, last_block=n)
+    timestamps, accrued, capital, harvests = load_history(tmp_path)
+    assert accrued.tolist() == [0.0, 2.0, 2.0, 3.0]
+    assert capital.tolist() == [1e6] * n
+    assert harvests.tolist() == [20.0]
@@ -0,0 +1,108 @@
+import numpy as np
+
+from scripts.sim import gbm_paths, simulate
+from scripts.sim.insurance import (
+    InsuranceConfig,
+    InsuranceFund,
+    bootstrap,
+    returns_from_sim,
+    run_insurance_sweep,
+    settle_harvest,
+    simulate_insurance,
+)
+from scripts.sim.strategy import SimConfig
+
+
+def replay(returns, config, total_debt, balance):
+    """The scalar port over one path, with the same carry-over as the engine."""
+    fund = InsuranceFund(config, balance)
+    debt, carry = total_debt, 0
+    for r in returns:
+        pnl = int(np.trunc(r * debt)) + carry
+        _, loss, carry = settle_harvest(fund, debt, max(pnl, 0), max(-pnl, 0))
+        debt -= loss
+    return fund.balance, fund.loss_sum, debt
+
+
+def test_fund_matches_contract_rules():
+    fund = InsuranceFund(balance=0)
+    # below target: 10% of profit is requested and paid in
+    assert settle_harvest(fund, 10**10, 10**8, 0) == (9 * 10**7, 0, 0)
+    assert fund.balance == 10**7
+    # an empty fund forgives the loss instead of carrying it
+    empty = InsuranceFund()
+    assert empty.report_loss(10**10, 10**6) == 0 and empty.loss_sum == 0
+
+    # compensation is capped at 5 bps of debt, the rest stays owed
+    assert settle_harvest(fund, 10**10, 0, 2 * 10**7) == (0, 2 * 10**7 - 5 * 10**6, 0)
+    assert (fund.balance, fund.loss_sum) == (5 * 10**6, 15 * 10**6)
+    # a small profit only nets against the owed losses and draws another payout
+    assert settle_harvest(fund, 10**10, 10**6, 0) == (6 * 10**6, 0, 0)
+    assert (fund.balance, fund.loss_sum) == (0, 9 * 10**6)
+    fund.deposit(10**6)
+    # a zero result with losses still owed is paid out as profit
+    assert settle_harvest(fund, 10**10, 0, 0) == (10**6, 0, 0)
+    assert (fund.balance, fund.loss_sum) == (0, 8 * 10**6)
+    # as is compensation above a smaller loss
+    fund.deposit(10**7)
+    assert settle_harvest(fund, 10**10, 0, 10**6) == (4 * 10**6, 0, 0)
+    assert (fund.balance, fund.loss_sum) == (5 * 10**6, 4 * 10**6)
+
+    full = InsuranceFund(balance=5 * 10**7)
+    assert full.report_profit(10**10, 10**8) == (0, 0)
+
+
+def test_vectorised_matches_port():
+    rng = np.random.default_rng(3)
+    returns = rng.normal(0.0002, 0.002, (64, 80))
+    returns[:, 10:14] = -0.003
+    for config, balance in [
+        (InsuranceConfig(), 0),
+        (InsuranceConfig(200, 3000, 40), 10**7),
+        (InsuranceConfig(0, 0, 1), 10**6),
+    ]:
+        result = simulate_insurance(returns, config, 10**10, balance, record=True)
+        for i in range(len(returns)):
+            assert replay(returns[i], config, 10**10, balance) == (
+                result.balance[i],
+                result.loss_sum[i],
+                result.total_debt[i],
+            )
+        assert (result.balance_history[:, -1] == result.balance).all()
+
+    summary = result.summary()
+    assert 0 <= summary["coverage"] <= 1
+    assert summary["depletion_probability"] == result.depleted.mean()
+
+
+def test_depletion_and_sweep():
+    losses = np.full((4, 20), -0.001)
+    result = simulate_insurance(losses, balance=10**6)
+    # 5 bps of debt per harvest drains 1 USDC on the first loss
+    assert (result.depleted_at == 0).all()
+    assert (result.compensation == 10**6).all()
+    assert result.written_off.sum() > 0
+
+    columns = run_insurance_sweep(
+        [{"maximum_compensation_rate": 5}, {"maximum_compensation_rate": 60}],
+        bootstrap(losses[0], 8, 12, seed=0),
+        balance=10**6,
+        workers=2,
+    )
+    assert list(columns["valid"]) == [True, False]
+    assert columns["depletion_probability"][0] == 1.0
+    assert np.isnan(columns["coverage"][1])
+
+
+def test_return_sources():
+    samples = np.arange(10) / 1000
+    paths = bootstrap(samples, 5, 9, block_size=3, seed=1)
+    assert paths.shape == (5, 9)
+    # each block is a run of consecutive records
+    assert np.allclose(np.diff(paths[:, :3], axis=1), 0.001)
+
+    prices = gbm_paths(4, 48, seed=0)
+    sim = simulate(prices, SimConfig(harvest_interval=12), volume=1e6)
+    returns = returns_from_sim(sim)
+    assert returns.shape == (4, 4)
+    assert np.allclose(returns[:, 0] * 10_000.0, sim.harvest_pnl[:, 0])
@@ -0,0 +1,71 @@
+import pytest
+
+from scripts.markets import load_markets
+
+REGISTRY = """
+development:
+  defaults:
+    vault: "0x49d743e645c90ef4c6d5134533c1e62d08867b14"
+    want: "0x7F5c764cBc14f9669B88837ca1490cCa17c31607"
+    perp_vault: "0xAD7b4C162707E0B2b5f6fdDbD3f8538A5fbA0d60"
+    market_registry: "0xd5820eE0F55205f6cdE8BB0647072143b3060067"
+    insurance: {target_fund_size: 100}
+  markets:
+    vETH:
+      base_token: "0x8C835DFaA34e2AE61775e80EE29E2c724c6AE2BB"
+      entry: WETHPERP
+      partial_withdraw: true
+    vALT:
+      base_token: "0x8C835DFaA34e2AE61775e80EE29E2c724c6AE2BB"
+      tick_range_multiplier: 50
+      insurance: {profit_take_rate: 500}
+      debt_ratio: 2000
+"""
+
+
+def test_load_markets(tmp_path):
+    path = tmp_path / "markets.yml"
+    path.write_text(REGISTRY)
+    eth, alt = load_markets(path, "development")
+    assert eth.vault == "0x49d743E645C90ef4c6D5134533c1e62D08867b14"
+    assert eth.constructor_args() == (eth.vault,)
+    assert eth.partial_withdraw and not alt.partial_withdraw
+    assert alt.insurance == {"target_fund_size": 100, "profit_take_rate": 500}
+    assert alt.constructor_args()[1] == (
+        alt.want,
+        alt.base_token,
+        10**4,
+        1,
+        alt.perp_vault,
+        alt.market_registry,
+        alt.base_token,
+        50,
+        0,
+        10000,
+    )
+    with pytest.raises(ValueError):
+        load_markets(path, "optimism-main")
+
+    # the shipped registry loads
+    assert [m.name for m in load_markets("markets.yml")] == ["vETH"]
+
+
+@pytest.mark.parametrize(
+    "override",
+    [
+        "tick_range_multiplier: 0",
+        "insurance: {maximum_compensation_rate: 50}",
+        "insurance: {take: 1}",
+        "base_token: '0x1234'",
+        "leverage: 2",
+        # wider than the strategy's storage
+        "debt_multiple: 4294967296",
+        "min_deploy: 79228162514264337593543950336",
+        "min_profit: 340282366920938463463374607431768211456",
+    ],
+)
+def test_rejects_invalid_markets(tmp_path, override):
+    path = tmp_path / "markets.yml"
+    path.write_text(REGISTRY + "      " + override + "\n")
+    with pytest.raises(ValueError):
+        load_markets(path)
@@ -0,0 +1,69 @@
+import pytest
+
+from scripts.keeper.packed import (
+    BENCHMARK_CALLS,
+    DEFAULT_FEES,
+    abi_calldata,
+    benchmark,
+    encode,
+    l1_fee,
+)
+from scripts.keeper.router import selector
+
+
+def test_encode():
+    assert encode("harvest") == bytes([0x12])
+    assert encode("shiftRungs", 5) == bytes([0x18, 5])
+    assert encode("setDebtThresholds", 9800, 10200) == bytes.fromhex(
+        "1b" + "2648" + "27d8"
+    )
+    assert encode("setCollateralThresholds", 6000, 8000, 10000, 20000) == bytes.fromhex(
+        "1c" + "1770" + "1f40" + "2710" + "4e20"
+    )
+    assert encode("setHarvestThreshold", 1) == bytes([0x19]) + (1).to_bytes(16, "big")
+    # int24 in two's complement
+    assert encode("setTickRangeMultiplier", -60) == bytes.fromhex("1affffc4")
+    assert encode("setTickRangeMultiplier", 60) == bytes.fromhex("1a00003c")
+
+
+def test_encode_rejects_what_does_not_fit():
+    with pytest.raises(ValueError):
+        encode("setCollateralThresholds", 6000, 70000, 10000, 20000)
+    with pytest.raises(ValueError):
+        encode("setDebtThresholds", -1, 10200)
+    with pytest.raises(ValueError):
+        encode("shiftRungs", 256)
+    with pytest.raises(ValueError):
+        encode("setTickRangeMultiplier", 1 << 23)
+    with pytest.raises(ValueError):
+        encode("setDebtThresholds", 9800)
+    with pytest.raises(ValueError):
+        encode("setDoHealthCheck", True)
+
+
+def test_abi_calldata():
+    assert abi_calldata("tend") == selector("tend()")
+    data = abi_calldata("setTickRangeMultiplier", -60)
+    assert data[:4] == selector("setTickRangeMultiplier(int24)")
+    assert data[4:] == b"\xff" * 31 + b"\xc4"
+    assert len(abi_calldata("setCollateralThresholds", 1, 2, 3, 4)) == 4 + 4 * 32
+
+
+def test_l1_fee():
+    fees = dict(
+        l1_base_fee=10, blob_base_fee=0, base_fee_scalar=10**6, blob_base_fee_scalar=0
+    )
+    # a scalar of 1.0 prices each L1 gas at the L1 base fee
+    assert l1_fee(b"", **fees) == 68 * 16 * 10
+    assert l1_fee(b"\0\1", **fees) == (68 * 16 + 4 + 16) * 10
+    fees["blob_base_fee"], fees["blob_base_fee_scalar"] = 16, 10**6
+    assert l1_fee(b"", **fees) == 68 * 16 * 11
+
+
+def test_benchmark_saves_on_every_call():
+    savings = benchmark(lambda data: l1_fee(data, **DEFAULT_FEES), BENCHMARK_CALLS)
+    assert [s.name for s in savings] == [name for name, _ in BENCHMARK_CALLS]
+    assert all(s.packed_bytes < s.abi_bytes for s in savings)
+    assert all(s.fee_saved > 0 for s in savings)
+    (collateral,) = [s for s in savings if s.name == "setCollateralThresholds"]
+    assert (collateral.abi_bytes, collateral.packed_bytes) == (132, 9)
@@ -0,0 +1,114 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from web3 import Web3
+
+from scripts.keeper.preflight import decode_revert, preflight, simulate
+
+STRATEGY = "0x" + "aa" * 20
+KEEPER = "0x" + "bb" * 20
+
+
+def error_data(reason):
+    encoded = reason.encode()
+    return (
+        "0x08c379a0"
+        + (32).to_bytes(32, "big").hex()
+        + len(encoded).to_bytes(32, "big").hex()
+        + encoded.ljust(32, b"\0").hex()
+    )
+
+
+# calldata -> eth_call error, or None when the call goes through
+ERRORS = {
+    "0x01": None,
+    # geth: the revert data in `data`
+    "0x02": {"code": 3, "message": "execution reverted", "data": error_data("RL_LIQ")},
+    # ganache: a bare require, reason only in the message
+    "0x03": {
+        "code": -32000,
+        "message": "VM Exception while processing transaction: revert",
+    },
+    "0x04": {
+        "code": -32000,
+        "message": "VM Exception while processing transaction: revert",
+        "data": {"0xabc": {"error": "revert", "return": error_data("!authorized")}},
+    },
+}
+
+
+@pytest.fixture
+def node():
+    calls = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            calls.append((request["method"], request["params"]))
+            reply = {"jsonrpc": "2.0", "id": request["id"]}
+            error = ERRORS[request["params"][0]["data"]]
+            if error is not None:
+                reply["error"] = error
+            elif request["method"] == "eth_call":
+                reply["result"] = "0x"
+            else:
+                reply["result"] = hex(21000 + int(request["params"][0]["data"], 16))
+            body = json.dumps(reply).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = "http://127.0.0.1:{}".format(server.server_address[1])
+    yield Web3(Web3.HTTPProvider(url)), calls
+    server.shutdown()
+
+
+def test_decode_revert():
+    assert decode_revert("0x") == ""
+    assert decode_revert(error_data("CH_NEFCI")) == "CH_NEFCI"
+    panic = "0x4e487b71" + (0x11).to_bytes(32, "big").hex()
+    assert decode_revert(panic) == "Panic(0x11): arithmetic overflow"
+    assert decode_revert("0xdeadbeef") == "custom error 0xdeadbeef"
+
+
+def test_simulate_decodes_each_node(node):
+    w3, calls = node
+    ok = simulate(w3, STRATEGY, "0x01", KEEPER, overrides={KEEPER: {"balance": 10}})
+    assert ok.success and ok.gas == 21001
+    assert ok.gas_limit(0.5) == 31501
+    # the overrides go to eth_call but not to eth_estimateGas
+    assert calls[0] == (
+        "eth_call",
+        [
+            {"from": KEEPER, "to": STRATEGY, "data": "0x01"},
+            "pending",
+            {KEEPER: {"balance": "0xa"}},
+        ],
+    )
+    assert calls[1][0] == "eth_estimateGas" and len(calls[1][1]) == 2
+
+    reasons = [
+        simulate(w3, STRATEGY, data, KEEPER) for data in ("0x02", "0x03", "0x04")
+    ]
+    assert [s.success for s in reasons] == [False] * 3
+    assert [s.reason for s in reasons] == ["RL_LIQ", "", "!authorized"]
+    assert [s.gas for s in reasons] == [None] * 3
+    # nothing is estimated for calls that revert
+    assert [method for method, _ in calls].count("eth_estimateGas") == 1
+
+
+def test_preflight_keeps_candidate_order(node):
+    w3, calls = node
+    candidates = [(STRATEGY, data) for data in ("0x03", "0x01", "0x02", "0x01")] * 8
+    simulations = preflight(w3, candidates, KEEPER, workers=4)
+    assert [s.data for s in simulations] == [data for _, data in candidates]
+    assert [s.success for s in simulations] == [False, True, False, True] * 8
+    assert len(calls) == 32 + 16
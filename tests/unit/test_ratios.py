@@ -0,0 +1,122 @@
+import numpy as np
+import pytest
+
+from scripts.keeper.ratios import (
+    PositionSnapshot,
+    RatioModel,
+    TwapTracker,
+    price_x10_18,
+)
+from scripts.sim import liquidity_amounts as la
+from scripts.sim import tickmath as tm
+
+
+def brute_force_mean_tick(ticks_by_second, now, interval):
+    total = sum(ticks_by_second[t] for t in range(now - interval, now))
+    return int(total / interval)
+
+
+def test_twap_tracker_matches_per_second_accumulator():
+    rng = np.random.default_rng(1)
+    interval = 900
+    start = 1_000_000
+    ticks = {start + i: 70000 for i in range(interval)}
+    tracker = TwapTracker(interval, start, 70000)
+    tick = 70000
+    now = start
+    for _ in range(400):
+        step = int(rng.integers(0, 30))
+        for t in range(now, now + step):
+            ticks[t] = tick
+        now += step
+        tick = int(tick + rng.integers(-200, 200))
+        tracker.update(now, tick)
+        if now - start >= interval:
+            ticks[now] = tick
+            assert tracker.mean_tick(now) == brute_force_mean_tick(ticks, now, interval)
+    assert len(tracker._points) <= interval + 1
+
+
+def test_twap_tracker_rounds_towards_zero():
+    tracker = TwapTracker(10, 0, -1)
+    tracker.update(9, 0)
+    # mean of nine -1s and one 0 is -0.9, which Solidity truncates to 0
+    assert tracker.mean_tick(10) == 0
+    tracker = TwapTracker(10, 0, -2)
+    assert tracker.mean_tick(10) == -2
+    with pytest.raises(ValueError):
+        tracker.update(-1, 0)
+
+
+def test_twap_tracker_seeded_from_observe():
+    interval = 30
+    ticks = [100 + (i % 7) * 13 for i in range(interval)]
+    cumulatives = [5000]
+    for tick in ticks:
+        cumulatives.append(cumulatives[-1] + tick)
+    tracker = TwapTracker.from_cumulatives(interval, 500, cumulatives, 400)
+    assert tracker.cumulative(500) == cumulatives[-1]
+    assert tracker.mean_tick(500) == int(sum(ticks) / interval)
+    assert tracker.tick == 400
+
+
+def test_ratio_model_matches_formula():
+    lower, upper = 60000, 84000
+    liquidity = 10**20
+    position = PositionSnapshot(
+        lower_tick=lower,
+        upper_tick=upper,
+        liquidity=liquidity,
+        total_debt=10_000 * 10**6,
+        debt_multiple=10000,
+        want_decimals=6,
+        free_collateral=4_900 * 10**6,
+    )
+    sqrt_price = tm.get_sqrt_ratio_at_tick(75000)
+    model = RatioModel(position, TwapTracker(0, 0, 75000), sqrt_price, 0)
+
+    for t, tick in enumerate([75000, 74000, 59000, 85000], 1):
+        sqrt_price = tm.get_sqrt_ratio_at_tick(tick) + 12345
+        model.update(t, sqrt_price)
+        sqrt_mark = tm.get_sqrt_ratio_at_tick(tm.get_tick_at_sqrt_ratio(sqrt_price))
+        short = la.get_amount0_for_liquidity(
+            max(sqrt_mark, tm.get_sqrt_ratio_at_tick(lower)),
+            tm.get_sqrt_ratio_at_tick(upper),
+            liquidity,
+        )
+        assert model.short_deployed() == short
+        spot = price_x10_18(sqrt_price)
+        expected = (
+            position.total_debt
+            * 10000
+            // 20000
+            * 10**12
+            * 10000
+            // (short * spot // 10**18)
+        )
+        assert model.debt_ratio() == expected
+    assert model.collateral_ratio() == 4900
+
+    model.set_position(PositionSnapshot(lower, upper, 0, 1, 10000, 6))
+    assert model.debt_ratio() == 0
+
+
+def test_price_x10_18():
+    assert price_x10_18(tm.Q96) == 10**18
+    assert price_x10_18(tm.Q96 * 40) == 1600 * 10**18
+
+
+def test_ratio_model_sums_ladder_wings():
+    core = (72000, 78000, 10**19)
+    wings = ((66000, 84000, 3 * 10**19), (76000, 80000, 10**19))
+    position = PositionSnapshot(*core, 10_000 * 10**6, 10000, 6, wings=wings)
+    model = RatioModel(position, TwapTracker(0, 0, 77000), 0, 0)
+    sqrt_mark = tm.get_sqrt_ratio_at_tick(77000)
+    assert model.short_deployed() == sum(
+        la.get_amount0_for_liquidity(
+            max(sqrt_mark, tm.get_sqrt_ratio_at_tick(lower)),
+            tm.get_sqrt_ratio_at_tick(upper),
+            liquidity,
+        )
+        for lower, upper, liquidity in (core,) + wings
+    )
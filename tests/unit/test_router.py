@@ -0,0 +1,66 @@
+from types import SimpleNamespace
+
+import pytest
+
+from scripts.keeper.router import (
+    MAX_ITEMS,
+    TX_L1_GAS,
+    calldata_gas,
+    decode_batch,
+    decode_results,
+    due_action,
+    encode_batch,
+    execute_calldata,
+    selector,
+)
+
+STRATEGIES = ["0x" + "aa" * 20, "0x" + "0b" * 20]
+
+
+def test_batch_round_trip():
+    items = [(STRATEGIES[0], "harvest"), (STRATEGIES[1], "rebalanceCollateral")]
+    batch = encode_batch(items)
+    assert batch == bytes.fromhex("aa" * 20 + "00" + "0b" * 20 + "03")
+    assert [(s.lower(), a) for s, a in decode_batch(batch)] == items
+    with pytest.raises(ValueError):
+        encode_batch(items * (MAX_ITEMS // 2 + 1))
+
+    data = execute_calldata(batch)
+    assert data[:4] == selector("execute(bytes)")
+    assert int.from_bytes(data[4:36], "big") == 32
+    assert int.from_bytes(data[36:68], "big") == 42
+    assert data[68:110] == batch and len(data) == 68 + 64
+    assert decode_results(0b101, 3) == [True, False, True]
+
+
+def test_batch_saves_l1_gas():
+    assert calldata_gas(b"\0\1") == 20
+    items = [(s, "rebalanceDebt") for s in STRATEGIES * 4]
+    individual = len(items) * (calldata_gas(selector("rebalanceDebt()")) + TX_L1_GAS)
+    batched = calldata_gas(execute_calldata(encode_batch(items))) + TX_L1_GAS
+    assert batched < individual / 2
+
+
+def test_due_action():
+    def state(debt=10000, collat=5000, wings=0, out=0, debt_band=(9900, 10100)):
+        return SimpleNamespace(
+            debt_ratio=debt,
+            collateral_ratio=collat,
+            wing_count=wings,
+            rungs_out_of_range=out,
+            debt_lower=debt_band[0],
+            debt_upper=debt_band[1],
+            collat_lower=4900,
+            collat_upper=5100,
+        )
+
+    assert due_action(state()) is None
+    assert due_action(state(debt=9000, collat=9000)) == "rebalanceDebt"
+    assert due_action(state(collat=None)) is None
+    assert due_action(state(collat=6000)) == "rebalanceCollateral"
+    # a single range out of range waits for the debt rebalance
+    assert due_action(state(out=1)) is None
+    assert due_action(state(wings=2, out=0b100)) == "shiftRungs"
+    # the band comes with the state, so a new one applies from the next read
+    assert due_action(state(debt_band=(9000, 9500))) == "rebalanceDebt"
+    assert due_action(state(debt_band=(None, None))) is None
@@ -0,0 +1,126 @@
+import json
+import threading
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from scripts.rpc_cache import RpcCacheProxy, route_fork
+
+
+@pytest.fixture
+def upstream():
+    calls = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            calls.append((request["method"], request["params"]))
+            if request["method"] == "eth_blockNumber":
+                result = "0x64"
+            else:
+                result = "0x" + "ab" * 32
+            body = json.dumps({"jsonrpc": "2.0", "id": request["id"], "result": result})
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body.encode())
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield "http://127.0.0.1:{}".format(server.server_address[1]), calls
+    server.shutdown()
+
+
+def rpc(url, method, params):
+    body = json.dumps({"jsonrpc": "2.0", "id": 7, "method": method, "params": params})
+    request = urllib.request.Request(
+        url, body.encode(), {"Content-Type": "application/json"}
+    )
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def test_proxy_pins_block_and_caches(upstream, tmp_path):
+    url, calls = upstream
+    proxy = RpcCacheProxy(url, str(tmp_path / "cache.sqlite"))
+    proxy.serve(port=0)
+    assert proxy.block == 100
+    assert proxy.fork_url.endswith("@100")
+
+    slot = ["0x" + "11" * 20, "0x0", "latest"]
+    first = rpc(proxy.url, "eth_getStorageAt", slot)
+    second = rpc(proxy.url, "eth_getStorageAt", slot[:2] + ["0x64"])
+    assert first["result"] == second["result"]
+    assert first["id"] == 7
+    assert calls[-1] == ("eth_getStorageAt", slot[:2] + ["0x64"])
+    assert len(calls) == 2  # eth_blockNumber + one storage read
+    assert rpc(proxy.url, "eth_blockNumber", [])["result"] == "0x64"
+    assert proxy.hits == 1 and proxy.misses == 1
+
+
+def test_offline_replay(upstream, tmp_path):
+    url, calls = upstream
+    path = str(tmp_path / "cache.sqlite")
+    online = RpcCacheProxy(url, path)
+    online.call("eth_getCode", ["0x" + "22" * 20, "latest"])
+    online.cache.close()
+
+    offline = RpcCacheProxy("http://127.0.0.1:1", path, offline=True)
+    assert offline.block == 100
+    assert offline.call("eth_getCode", ["0x" + "22" * 20]) == "0x" + "ab" * 32
+    reply = offline.handle(
+        {"id": 1, "method": "eth_getCode", "params": ["0x" + "33" * 20, "latest"]}
+    )
+    assert reply["error"]["code"] == -32001
+
+
+def test_upstream_failure_is_a_json_rpc_error(upstream, tmp_path):
+    url, calls = upstream
+    proxy = RpcCacheProxy(url, str(tmp_path / "cache.sqlite"))
+    proxy.upstream = "http://127.0.0.1:1"
+    proxy.serve(port=0)
+
+    # the proxy answers instead of dropping the connection
+    reply = rpc(proxy.url, "eth_getCode", ["0x" + "44" * 20, "latest"])
+    assert reply["id"] == 7
+    assert reply["error"]["code"] == -32603
+    assert proxy.misses == 1
+
+
+def test_proxies_on_one_cache_share_the_block(upstream, tmp_path):
+    url, calls = upstream
+    path = str(tmp_path / "cache.sqlite")
+    first = RpcCacheProxy(url, path)
+    # a second worker's proxy keeps the first one's block, whatever is latest
+    first.cache.set_meta("block", 90)
+    assert RpcCacheProxy(url, path).block == 90
+    assert first.cache.setdefault_meta("block", 100) == "90"
+
+
+def test_route_fork(upstream, tmp_path):
+    url, calls = upstream
+    networks = {"op-main": {"host": url}}
+
+    settings = {"fork": "op-main", "port": 8545}
+    assert route_fork(settings, networks, {}) is None
+    assert settings["fork"] == "op-main"
+    route_fork(settings, networks, {"FORK_BLOCK": "90"})
+    assert settings["fork"] == url + "@90"
+    assert route_fork({"port": 8545}, networks, {"RPC_CACHE": "x"}) is None
+
+    # RPC_CACHE puts the proxy between ganache and the upstream node
+    settings = {"fork": url + "@90"}
+    env = {"RPC_CACHE": str(tmp_path / "cache.sqlite")}
+    proxy = route_fork(settings, networks, env)
+    assert proxy.upstream == url and proxy.block == 100
+    assert settings["fork"] == proxy.fork_url == proxy.url + "@100"
+    rpc(proxy.url, "eth_getCode", ["0x" + "55" * 20, "latest"])
+    assert calls[-1] == ("eth_getCode", ["0x" + "55" * 20, "0x64"])
+
+    settings = {"fork": "op-main"}
+    proxy = route_fork(settings, networks, dict(env, FORK_BLOCK="90"))
+    assert settings["fork"].endswith("@90") and proxy.block == 90
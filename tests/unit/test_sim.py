@@ -0,0 +1,224 @@
+import numpy as np
+import pytest
+
+from scripts.sim import Market, SimConfig, StrategySim, gbm_paths, simulate
+from scripts.sim import liquidity_amounts as la
+from scripts.sim import pool_variables as pv
+from scripts.sim import tickmath as tm
+from scripts.sim.ladder import compare
+
+
+def test_tickmath_bounds():
+    assert tm.get_sqrt_ratio_at_tick(0) == 1 << 96
+    assert tm.get_sqrt_ratio_at_tick(tm.MIN_TICK) == tm.MIN_SQRT_RATIO
+    assert tm.get_sqrt_ratio_at_tick(tm.MAX_TICK) == tm.MAX_SQRT_RATIO
+    assert tm.get_tick_at_sqrt_ratio(tm.MIN_SQRT_RATIO) == tm.MIN_TICK
+    assert tm.get_tick_at_sqrt_ratio(tm.MAX_SQRT_RATIO - 1) == tm.MAX_TICK - 1
+    with pytest.raises(ValueError):
+        tm.get_sqrt_ratio_at_tick(tm.MAX_TICK + 1)
+
+
+def test_tickmath_round_trip():
+    rng = np.random.default_rng(0)
+    for tick in rng.integers(tm.MIN_TICK, tm.MAX_TICK, 500):
+        tick = int(tick)
+        sqrt_price = tm.get_sqrt_ratio_at_tick(tick)
+        assert tm.get_tick_at_sqrt_ratio(sqrt_price) == tick
+        assert tm.get_tick_at_sqrt_ratio(sqrt_price + 1) == tick
+        if tick > tm.MIN_TICK:
+            assert tm.get_tick_at_sqrt_ratio(sqrt_price - 1) == tick - 1
+        approx = tm.sqrt_price_at_tick_array(tick) * 2**96
+        assert approx == pytest.approx(sqrt_price, rel=1e-9)
+
+
+def test_floor_matches_solidity():
+    assert pv.floor(-1, 60) == -60
+    assert pv.floor(-60, 60) == -60
+    assert pv.floor(59, 60) == 0
+    ticks = np.arange(-500, 500)
+    assert list(pv.floor_array(ticks, 60)) == [pv.floor(int(t), 60) for t in ticks]
+    assert pv.determine_ticks(74959, 60, 200) == (74940 - 12000, 74940 + 12000)
+
+
+def test_liquidity_amounts_vector_matches_exact():
+    sqrt_p = tm.get_sqrt_ratio_at_tick(74959)
+    sqrt_a = tm.get_sqrt_ratio_at_tick(62940)
+    sqrt_b = tm.get_sqrt_ratio_at_tick(86940)
+    amount0, amount1 = 10**21, 1800 * 10**21
+    liquidity = la.get_liquidity_for_amounts(sqrt_p, sqrt_a, sqrt_b, amount0, amount1)
+    exact = la.get_amounts_for_liquidity(sqrt_p, sqrt_a, sqrt_b, liquidity)
+
+    f = [x / 2**96 for x in (sqrt_p, sqrt_a, sqrt_b)]
+    vec_liquidity = la.liquidity_for_amounts_array(*f, amount0, amount1)
+    vec = la.amounts_for_liquidity_array(*f, vec_liquidity)
+    assert float(vec_liquidity) == pytest.approx(liquidity, rel=1e-9)
+    assert float(vec[0]) == pytest.approx(exact[0], rel=1e-9)
+    assert float(vec[1]) == pytest.approx(exact[1], rel=1e-9)
+
+
+def test_simulate_initial_ratios():
+    prices = np.full((3, 2), 1800.0)
+    for debt_multiple in (10000, 20000, 40000):
+        config = SimConfig(
+            debt_multiple=debt_multiple, keeper_collateral=False, debt_lower=0
+        )
+        result = simulate(prices, config, deposit=10_000, record=True)
+        # same expectations as test_set_collateral_thresholds on the fork
+        assert result.collat_ratio[0, 0] == pytest.approx(
+            (100000 - debt_multiple) / 10, rel=1e-2
+        )
+        assert result.debt_ratio[0, 0] == pytest.approx(10000, rel=1e-2)
+        assert result.final_assets == pytest.approx(10_000, rel=1e-6)
+
+
+def test_simulate_rebalances_on_price_move():
+    prices = np.concatenate([np.full((1, 5), 1800.0), np.full((1, 5), 2000.0)], axis=1)
+    result = simulate(prices, SimConfig(keeper_collateral=False), record=True)
+    assert result.debt_rebalances[0] == 1
+    assert result.debt_ratio[0, -1] == pytest.approx(10000, rel=1e-2)
+    assert result.taker_fees_paid[0] > 0
+
+
+def test_simulate_batch_is_path_independent():
+    prices = gbm_paths(64, 48, seed=3)
+    config = SimConfig(collat_lower=8000, collat_upper=9500, harvest_interval=12)
+    batch = simulate(prices, config, volume=1e6)
+    single = simulate(prices[5:6], config, volume=1e6)
+    assert batch.final_assets[5] == pytest.approx(single.final_assets[0])
+    assert batch.debt_rebalances[5] == single.debt_rebalances[0]
+    assert batch.harvest_pnl.shape == (64, 4)
+
+
+@pytest.mark.parametrize("partial", [True, False])
+def test_withdraw_modes(partial):
+    config = SimConfig(partial_withdraw=partial)
+    price = np.full(2, 1900.0)
+    mkt = Market(
+        price, tm.tick_at_price_array(price), price, tm.tick_at_price_array(price)
+    )
+    sim = StrategySim(config, 2)
+    sim.deposit(mkt, 10_000.0)
+    lower, upper = sim.lower_tick.copy(), sim.upper_tick.copy()
+    liquidity = sim.liquidity.copy()
+
+    idx = np.arange(2)
+    freed = sim.withdraw(mkt, idx, np.array([10.0, 5_000.0]))
+    assert freed == pytest.approx([10.0, 5_000.0], rel=1e-6)
+    assert list(sim.lower_tick) == list(lower)
+    assert list(sim.upper_tick) == list(upper)
+    if partial:
+        assert sim.liquidity == pytest.approx(liquidity * [0.999, 0.5], rel=1e-3)
+    assert sim.estimated_total_assets(mkt, idx) == pytest.approx(10_000.0, rel=1e-6)
+
+
+def test_partial_withdraw_closes_residual():
+    config = SimConfig(partial_withdraw=True)
+    price = np.full(1, 1900.0)
+    tick = tm.tick_at_price_array(price)
+    sim = StrategySim(config, 1)
+    sim.deposit(Market(price, tick, price, tick), 10_000.0)
+
+    # the range took on base as the price fell; removing half of it leaves
+    # a taker position worth more than the tolerance
+    price = np.full(1, 1700.0)
+    tick = tm.tick_at_price_array(price)
+    mkt = Market(price, tick, price, tick)
+    sim.withdraw(mkt, np.arange(1), 4_000.0)
+    residual = np.abs(sim.taker_base) * mkt.price
+    tolerance = sim.estimated_total_assets(mkt, np.arange(1)) * 50 / 10_000
+    assert residual <= tolerance
+    assert sim.taker_fees_paid[0] > 0
+
+
+def test_in_place_rebalance_resizes_same_range():
+    config = SimConfig(in_place_rebalance=True)
+    price = np.full(1, 1900.0)
+    tick = tm.tick_at_price_array(price)
+    mkt = Market(price, tick, price, tick)
+    sim = StrategySim(config, 1)
+    sim.deposit(mkt, 10_000.0)
+    lower, upper = sim.lower_tick.copy(), sim.upper_tick.copy()
+    liquidity = sim.liquidity.copy()
+
+    # more collateral at the same price: the range stays, only size changes
+    sim.collateral += 5_000.0
+    sim.rebalance_collateral(mkt, np.arange(1))
+    assert list(sim.lower_tick) == list(lower)
+    assert list(sim.upper_tick) == list(upper)
+    assert sim.liquidity == pytest.approx(liquidity * 1.5, rel=1e-6)
+    assert sim.taker_fees_paid[0] == 0
+
+
+def test_in_place_rebalance_saves_taker_fees():
+    prices = gbm_paths(64, 96, s0=1800, vol=0.8, seed=2)
+    fees = {}
+    for in_place in (False, True):
+        config = SimConfig(
+            in_place_rebalance=in_place,
+            collat_lower=8000,
+            collat_upper=9500,
+            collat_limit=10000,
+            tick_range_multiplier=100,
+        )
+        fees[in_place] = simulate(prices, config, volume=1e6).taker_fees_paid
+    assert fees[True].sum() < fees[False].sum()
+
+
+def test_ladder_shifts_only_rungs_out_of_range():
+    config = SimConfig(tick_range_multiplier=10, ladder=((400, 4000),))
+    price = np.full(1, 1900.0)
+    tick = tm.tick_at_price_array(price)
+    sim = StrategySim(config, 1)
+    sim.deposit(Market(price, tick, price, tick), 10_000.0)
+    wing_lower, wing_upper = sim.rung_lower[0, 1], sim.rung_upper[0, 1]
+    wing_liquidity = sim.rung_liquidity[0, 1]
+    assert sim.liquidity[0] == sim.rung_liquidity.sum()
+
+    # leaves the core range but not the wing's
+    price = np.full(1, 2100.0)
+    tick = tm.tick_at_price_array(price)
+    mkt = Market(price, tick, price, tick)
+    assert sim.rungs_out_of_range(mkt).tolist() == [[True, False]]
+    assert sim.shift_rungs(mkt, np.arange(1)).tolist() == [0]
+    assert sim.lower_tick[0] <= tick[0] < sim.upper_tick[0]
+    assert (sim.rung_lower[0, 1], sim.rung_upper[0, 1]) == (wing_lower, wing_upper)
+    assert sim.rung_liquidity[0, 1] == wing_liquidity
+    assert not sim.rungs_out_of_range(mkt).any()
+    assert sim.rung_shifts.tolist() == [1]
+
+    # a rung without liquidity is never out of range
+    sim.rung_liquidity[0, 1] = 0
+    price = np.full(1, 5000.0)
+    tick = tm.tick_at_price_array(price)
+    assert sim.rungs_out_of_range(Market(price, tick, price, tick)).tolist() == [
+        [True, False]
+    ]
+
+
+def test_ladder_rebalance_counts_rung_shifts():
+    config = SimConfig(
+        tick_range_multiplier=10, ladder=((400, 4000),), in_place_rebalance=True
+    )
+    price = np.full(1, 1900.0)
+    tick = tm.tick_at_price_array(price)
+    sim = StrategySim(config, 1)
+    sim.deposit(Market(price, tick, price, tick), 10_000.0)
+    wing_lower = sim.rung_lower[0, 1]
+
+    # an in place rebalance moves the core rung only, which counts as a shift
+    price = np.full(1, 2100.0)
+    tick = tm.tick_at_price_array(price)
+    sim.rebalance_debt(Market(price, tick, price, tick), np.arange(1))
+    assert sim.lower_tick[0] <= tick[0] < sim.upper_tick[0]
+    assert sim.rung_lower[0, 1] == wing_lower
+    assert sim.debt_rebalances.tolist() == [1]
+    assert sim.rung_shifts.tolist() == [1]
+
+
+def test_ladder_compares_against_single_range():
+    prices = gbm_paths(32, 96, s0=1800, vol=0.8, seed=3)
+    results = compare(
+        prices, ((400, 3000),), SimConfig(tick_range_multiplier=100), volume=1e6
+    )
+    assert results["ladder"]["taker_fees_paid"] < results["single"]["taker_fees_paid"]
+    assert results["ladder"]["fees_collected"] > 0
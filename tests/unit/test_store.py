@@ -0,0 +1,212 @@
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from scripts.sim.ingest import (
+    BURN,
+    FUNDING_UPDATED,
+    MINT,
+    POOL_COLUMNS,
+    SWAP,
+    TOPICS,
+    block_prices,
+    decode_funding_logs,
+    decode_pool_logs,
+    ingest,
+    open_stores,
+)
+from scripts.sim.store import ColumnStore, uint_column, uint_values
+
+COLUMNS = (("block", "<u8", ()), ("tick", "<i4", ()), ("sqrt", "u1", (20,)))
+
+
+def rows(blocks):
+    return {
+        "block": blocks,
+        "tick": [-b for b in blocks],
+        "sqrt": uint_column([2**159 + b for b in blocks], 20),
+    }
+
+
+def test_store_appends_and_reopens(tmp_path):
+    store = ColumnStore(tmp_path, COLUMNS)
+    store.append(rows([1, 2, 3]), last_block=10)
+    store.append(rows([]), last_block=20)
+    store.append(rows([25]), last_block=30)
+
+    store = ColumnStore(tmp_path, COLUMNS)
+    assert (store.rows, store.last_block) == (4, 30)
+    assert isinstance(store.column("block"), np.memmap)
+    assert store.column("tick").tolist() == [-1, -2, -3, -25]
+    assert uint_values(store.column("sqrt")) == [2**159 + b for b in (1, 2, 3, 25)]
+    chunks = list(store.iter_chunks(3, names=["block"]))
+    assert [c["block"].tolist() for c in chunks] == [[1, 2, 3], [25]]
+
+
+def test_store_drops_uncommitted_rows(tmp_path):
+    store = ColumnStore(tmp_path, COLUMNS)
+    store.append(rows([1, 2]), last_block=2)
+    # an append interrupted before the meta commit
+    with open(tmp_path / "tick.bin", "ab") as f:
+        f.write(np.int32(7).tobytes())
+    store = ColumnStore(tmp_path, COLUMNS)
+    assert store.rows == 2
+    assert (tmp_path / "tick.bin").stat().st_size == 8
+    with pytest.raises(ValueError):
+        ColumnStore(tmp_path, COLUMNS[:2])
+    with pytest.raises(ValueError):
+        store.append({"block": [3], "tick": [1, 2], "sqrt": uint_column([0], 20)}, 3)
+
+
+def test_readonly_store_follows_writer(tmp_path):
+    writer = ColumnStore(tmp_path, COLUMNS)
+    writer.append(rows([1, 2]), last_block=2)
+    # a reader never truncates the writer's append in progress
+    with open(tmp_path / "tick.bin", "ab") as f:
+        f.write(np.int32(7).tobytes())
+    reader = ColumnStore(tmp_path, COLUMNS, readonly=True)
+    assert (tmp_path / "tick.bin").stat().st_size == 12
+    assert reader.column("tick").tolist() == [-1, -2]
+    os.truncate(tmp_path / "tick.bin", 8)
+    writer.append(rows([3]), last_block=3)
+    assert reader.rows == 2
+    reader.refresh()
+    assert reader.column("block").tolist() == [1, 2, 3]
+    with pytest.raises(ValueError):
+        reader.append(rows([4]), last_block=4)
+
+
+def word(value):
+    return (value % 2**256).to_bytes(32, "big").hex()
+
+
+def log(block, index, topics, words):
+    return {
+        "blockNumber": block,
+        "logIndex": index,
+        "topics": topics,
+        "data": "0x" + "".join(word(w) for w in words),
+    }
+
+
+def test_decode_pool_logs(tmp_path):
+    swap, mint, burn = (t for t, k in sorted(TOPICS.items(), key=lambda i: i[1]))
+    sqrt_price = 79228162514264337593543950336 * 3  # price 9
+    logs = [
+        log(
+            5,
+            0,
+            [mint, "0x0", word(-600), word(600)],
+            [0xAB, 10**20, 10**18, 2 * 10**18],
+        ),
+        log(
+            6,
+            1,
+            [swap, "0x0", "0x0"],
+            [-(10**18), 9 * 10**18, sqrt_price, 10**21, 21972],
+        ),
+        log(6, 2, [burn, "0x0", word(-600), word(600)], [10**19, 10**17, 0]),
+    ]
+    data = decode_pool_logs(logs, {5: 100, 6: 112}, tick=-5, sqrt_price_x96=2**96)
+    assert list(data["kind"]) == [MINT, SWAP, BURN]
+    assert list(data["tick"]) == [-5, 21972, 21972]
+    assert uint_values(data["sqrt_price_x96"]) == [2**96, sqrt_price, sqrt_price]
+    assert uint_values(data["liquidity"]) == [10**20, 10**21, 10**19]
+    assert list(data["tick_lower"]) == [-600, 0, -600]
+    assert list(data["amount0"]) == [1.0, -1.0, 0.1]
+    assert data["price"][1] == pytest.approx(9)
+    assert list(data["timestamp"]) == [100, 112, 112]
+
+    store = ColumnStore(tmp_path, POOL_COLUMNS)
+    store.append(data, last_block=6)
+    assert store.column("tick_upper").tolist() == [600, 0, 600]
+
+    funding = decode_funding_logs(
+        [log(7, 0, [FUNDING_UPDATED, "0x0"], [2000 * 10**18, 1990 * 10**18])], {7: 130}
+    )
+    assert funding["mark_twap"] == (2000.0,) and funding["index_twap"] == (1990.0,)
+
+
+def test_block_prices_streams_last_swap_per_block(tmp_path):
+    blocks = [1, 1, 2, 3, 3, 3, 5]
+    kinds = [SWAP, SWAP, MINT, SWAP, SWAP, BURN, SWAP]
+    n = len(blocks)
+    store = ColumnStore(tmp_path, POOL_COLUMNS)
+    store.append(
+        {
+            "block": blocks,
+            "log_index": range(n),
+            "timestamp": [b * 10 for b in blocks],
+            "kind": kinds,
+            "tick": [0] * n,
+            "sqrt_price_x96": uint_column([100 + i for i in range(n)], 20),
+            "price": [0.0] * n,
+            "liquidity": uint_column([0] * n, 16),
+            "tick_lower": [0] * n,
+            "tick_upper": [0] * n,
+            "amount0": [0.0] * n,
+            "amount1": [0.0] * n,
+        },
+        last_block=5,
+    )
+    # chunks of two rows split blocks 1 and 3 across reads
+    assert list(block_prices(store, chunk=2)) == [
+        (1, 10, 101),
+        (3, 30, 104),
+        (5, 50, 106),
+    ]
+    assert list(block_prices(store, start_block=2, end_block=4)) == [(3, 30, 104)]
+
+
+def test_ingest_resumes_stores_that_got_apart(tmp_path, monkeypatch):
+    pool, exchange = "0x" + "11" * 20, "0x" + "22" * 20
+    swap = next(t for t, k in TOPICS.items() if k == SWAP)
+    logs = [
+        dict(
+            log(b, 0, [swap, "0x0", "0x0"], [1, 1, 2**96 + b, 10**18, b]), address=pool
+        )
+        for b in (2, 4, 6, 8)
+    ] + [
+        dict(log(b, 1, [FUNDING_UPDATED, "0x0"], [10**18, 10**18]), address=exchange)
+        for b in (3, 7)
+    ]
+
+    class Eth:
+        block_number = 8
+
+        def get_logs(self, params):
+            return [
+                entry
+                for entry in logs
+                if entry["address"] == params["address"]
+                and params["fromBlock"] <= entry["blockNumber"] <= params["toBlock"]
+            ]
+
+        def get_block(self, block):
+            return {"timestamp": 100 + block}
+
+    w3 = SimpleNamespace(eth=Eth())
+    append = ColumnStore.append
+
+    def interrupted(store, data, last_block):
+        # the run stops after the pool store committed blocks 5-6
+        if store.path.name == "funding" and last_block == 6:
+            raise KeyboardInterrupt
+        append(store, data, last_block)
+
+    monkeypatch.setattr(ColumnStore, "append", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        ingest(w3, pool, tmp_path, 1, 8, exchange, "0x" + "33" * 20, chunk=2, workers=1)
+    pool_store, funding_store = open_stores(tmp_path)
+    assert (pool_store.last_block, funding_store.last_block) == (6, 4)
+
+    monkeypatch.setattr(ColumnStore, "append", append)
+    pool_store, funding_store = ingest(
+        w3, pool, tmp_path, 1, 8, exchange, "0x" + "33" * 20, chunk=2, workers=1
+    )
+    assert pool_store.column("block").tolist() == [2, 4, 6, 8]
+    assert pool_store.column("tick").tolist() == [2, 4, 6, 8]
+    assert funding_store.column("block").tolist() == [3, 7]
+    assert pool_store.last_block == funding_store.last_block == 8
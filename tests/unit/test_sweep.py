@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from scripts.sim import gbm_paths
+from scripts.sim import sweep
+
+
+def test_samplers():
+    assert len(sweep.grid({"debt_multiple": [10000, 20000], "twap_time": [0, 5]})) == 4
+
+    space = {"tick_range_multiplier": (10, 400), "taker_fee": (0.0005, 0.002)}
+    samples = sweep.latin_hypercube(space, 16, seed=1)
+    multipliers = sorted(s["tick_range_multiplier"] for s in samples)
+    assert all(isinstance(m, int) for m in multipliers)
+    # one sample per stratum
+    strata = [int((m - 10) / (390 / 16)) for m in multipliers]
+    assert len(set(min(s, 15) for s in strata)) >= 15
+    assert len(sweep.random_sample(space, 5, seed=1)) == 5
+
+
+def test_run_sweep_resumes(tmp_path):
+    prices = gbm_paths(8, 24, seed=0)
+    params = sweep.grid(
+        {"tick_range_multiplier": [50, 200], "debt_lower": [9900, 20000]}
+    )
+    base = sweep.SimConfig(collat_lower=8000, collat_upper=9500, collat_limit=10000)
+    results = sweep.run_sweep(
+        params, prices, tmp_path, base=base, chunk_size=1, workers=2
+    )
+    assert list(results["index"]) == [0, 1, 2, 3]
+    # debt_lower above the upper threshold would revert in setDebtThresholds
+    assert list(results["valid"]) == [True, False, True, False]
+    assert np.isnan(results["pnl"][1])
+
+    finished = sorted(tmp_path.glob("chunk_*.npz"))
+    finished[2].unlink()
+    mtime = finished[0].stat().st_mtime_ns
+    resumed = sweep.run_sweep(params, prices, tmp_path, base=base, chunk_size=1)
+    assert finished[0].stat().st_mtime_ns == mtime
+    np.testing.assert_array_equal(resumed["pnl"], results["pnl"])
+
+    with pytest.raises(ValueError):
+        sweep.run_sweep(params[:2], prices, tmp_path, base=base)
+
+
+def test_check_config_bounds_packed_storage():
+    assert sweep.check_config(sweep.SimConfig(debt_multiple=70000))
+    # setDebtThresholds / setCollateralThresholds narrow to uint16 and uint32
+    assert not sweep.check_config(sweep.SimConfig(debt_upper=2**16))
+    assert not sweep.check_config(sweep.SimConfig(debt_multiple=2**32))
+    assert not sweep.check_config(sweep.SimConfig(slippage_adj=2**16))
+    assert not sweep.check_config(sweep.SimConfig(residual_tolerance=10001))
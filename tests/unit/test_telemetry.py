@@ -0,0 +1,154 @@
+import pytest
+
+from scripts.sim.ingest import _topic
+from scripts.sim.telemetry import (
+    CALL_CLOSE_POSITION,
+    REBALANCE_COLLATERAL,
+    Telemetry,
+    latest,
+    open_stores,
+    resample,
+    window,
+)
+
+STRATEGY = "0x" + "aa" * 20
+INSURANCE = "0x" + "bb" * 20
+WANT = 10**6
+
+
+def word(value):
+    return (value % 2**256).to_bytes(32, "big").hex()
+
+
+def log(address, block, index, signature, topics, words, tail=""):
+    return {
+        "address": address,
+        "blockNumber": block,
+        "logIndex": index,
+        "topics": [_topic(signature)] + ["0x" + word(t) for t in topics],
+        "data": "0x" + "".join(word(w) for w in words) + tail,
+    }
+
+
+def telemetry(path):
+    return Telemetry(path, STRATEGY, insurance=INSURANCE, want_decimals=6)
+
+
+def test_decodes_every_event(tmp_path):
+    reason = b"CH_NEP"
+    logs = [
+        log(
+            STRATEGY,
+            1,
+            0,
+            "Rebalanced(uint8,uint256,uint256)",
+            [REBALANCE_COLLATERAL],
+            [5300, 2 * WANT],
+        ),
+        log(
+            STRATEGY,
+            1,
+            1,
+            "TicksUpdated(uint8,int24,int24,int24)",
+            [2],
+            [-600, 1200, 10],
+        ),
+        log(
+            STRATEGY,
+            2,
+            0,
+            "Withdrawn(uint256,uint256,uint256)",
+            [],
+            [3 * WANT, 29 * WANT // 10, 1500],
+        ),
+        log(
+            STRATEGY,
+            2,
+            1,
+            "PerpCallFailed(uint8,string)",
+            [CALL_CLOSE_POSITION],
+            [32, len(reason)],
+            reason.ljust(32, b"\0").hex(),
+        ),
+        log(
+            INSURANCE,
+            3,
+            0,
+            "InsurancePayment(uint256,uint256,uint256)",
+            [],
+            [100 * WANT, 2 * WANT, WANT // 5],
+        ),
+        # a fund deployed before the schema indexed its fields
+        log(INSURANCE, 3, 1, "InsurancePayout(uint256)", [WANT // 2], []),
+        log(
+            STRATEGY,
+            3,
+            2,
+            "Harvested(uint256,uint256,uint256,uint256,uint256)",
+            [],
+            [10**18, 2 * WANT, 0, WANT // 5, 0],
+        ),
+        # the same events from elsewhere are not the strategy's
+        log(INSURANCE, 3, 3, "TicksUpdated(uint8,int24,int24,int24)", [0], [0, 60, 1]),
+        log(STRATEGY, 3, 4, "Transfer(address,address,uint256)", [0, 0], [1]),
+    ]
+    engine = telemetry(tmp_path)
+    engine.process(logs, {1: 10, 2: 20, 3: 30}, 5)
+    assert engine.last_block == 5
+
+    stores = open_stores(tmp_path, readonly=True)
+    rebalance = latest(stores["rebalanced"])
+    assert (rebalance["kind"][0], rebalance["ratio"][0]) == (REBALANCE_COLLATERAL, 5300)
+    assert rebalance["deployed"][0] == 2.0
+    ticks = latest(stores["ticks"], 5)
+    assert ticks["rung"].tolist() == [2]
+    assert ticks["lower_tick"].tolist() == [-600]
+    assert ticks["upper_tick"].tolist() == [1200]
+    withdrawn = latest(stores["withdrawn"])
+    assert withdrawn["requested"][0] - withdrawn["freed"][0] == pytest.approx(0.1)
+    assert withdrawn["strat_percent"][0] == 1500
+    failed = latest(stores["call_failed"])
+    assert (failed["call"][0], failed["reason"][0]) == (CALL_CLOSE_POSITION, reason)
+    assert latest(stores["insurance_payment"])["payment"][0] == 0.2
+    assert latest(stores["insurance_payout"])["payout"][0] == 0.5
+    harvest = latest(stores["harvested"])
+    assert harvest["fees"][0] == 1.0 and harvest["profit"][0] == 2.0
+    assert harvest["timestamp"][0] == 30 and harvest["log_index"][0] == 2
+
+
+def test_resumes_and_queries(tmp_path):
+    signature = "Harvested(uint256,uint256,uint256,uint256,uint256)"
+    logs = [
+        log(STRATEGY, b, 0, signature, [], [0, b * WANT, 0, 0, 0])
+        for b in range(1, 101)
+    ]
+    timestamps = {b: b * 60 for b in range(1, 101)}
+    engine = telemetry(tmp_path)
+    engine.process(logs[:50], timestamps, 50)
+    # one store got ahead before the run died
+    engine.stores["harvested"].append(
+        {
+            "block": [51],
+            "log_index": [0],
+            "timestamp": [51 * 60],
+            "fees": [0.0],
+            "profit": [51.0],
+            "loss": [0.0],
+            "insurance_payment": [0.0],
+            "compensation": [0.0],
+        },
+        51,
+    )
+    engine = telemetry(tmp_path)
+    assert engine.last_block == 50
+    engine.process(logs[50:], timestamps, 100)
+
+    store = open_stores(tmp_path, readonly=True)["harvested"]
+    assert store.column("block").tolist() == list(range(1, 101))
+    rows = window(store, 600, 1200, names=["block", "profit"])
+    assert rows["block"].tolist() == list(range(10, 21))
+    assert latest(store, 3)["profit"].tolist() == [98.0, 99.0, 100.0]
+    starts, sums, counts = resample(store, "profit", 3600, 0, 7200)
+    assert starts.tolist() == [0, 3600]
+    assert counts.tolist() == [59, 41]
+    assert sums.tolist() == [sum(range(1, 60)), sum(range(60, 101))]
@@ -0,0 +1,139 @@
+import math
+import time
+
+import numpy as np
+import pytest
+
+from scripts.sim.ingest import POOL_COLUMNS, SWAP
+from scripts.sim.store import ColumnStore, uint_column
+from scripts.sim.tick_range import LOG_TICK, RangeModel, RangeOptimizer
+
+# ETH-like: 80% a year and 8e8 USD a day through 5e6 of liquidity at 1800
+VARIANCE = 0.8**2 / (365 * 86400)
+VOLUME = 8e8 / 86400
+MARKET = dict(volume=VOLUME, liquidity=5e6, price=1800.0)
+
+
+def optimizer(**kwargs):
+    return RangeOptimizer(RangeModel(**kwargs))
+
+
+def test_width_follows_volatility_and_fees():
+    ranges = optimizer(rebalance_gas=5.0, keeper_delay=60)
+    calm, _ = ranges.best(1e7, VARIANCE / 4, **MARKET)
+    normal, rate = ranges.best(1e7, VARIANCE, **MARKET)
+    wild, _ = ranges.best(1e7, VARIANCE * 4, **MARKET)
+    assert calm < normal < wild
+    assert rate > 0
+    # more volume pays for more rebalances
+    assert ranges.best(1e7, VARIANCE, **dict(MARKET, volume=VOLUME * 4))[0] < normal
+    # a larger position dilutes its own fees and moves the pool more
+    assert ranges.best(1e8, VARIANCE, **MARKET)[0] > normal
+    # when the loss outruns the fees the widest range loses least
+    assert ranges.best(1e7, VARIANCE, **dict(MARKET, volume=VOLUME / 16))[0] == 4096
+
+
+def test_objective_matches_scalar_model():
+    ranges = optimizer(tick_spacing=10, rebalance_gas=2.0, keeper_delay=30)
+    rates = ranges.objective(1e5, VARIANCE, **MARKET)
+    for multiplier in (1, 50, 3000):
+        h = multiplier * 10 * LOG_TICK
+        concentration = 1 / (1 - math.exp(-h / 2))
+        position = 1e5 * concentration / (2 * math.sqrt(1800))
+        fees = 0.001 * VOLUME * position / (position + 5e6)
+        loss = 1e5 * concentration * VARIANCE / 8
+        rebalance = 1e5 * 0.001 / 2 + 1e10 / (8 * 5e6 * math.sqrt(1800)) + 2.0
+        exit_time = h**2 / VARIANCE
+        cycle = exit_time + 30
+        expected = (exit_time / cycle * (fees - loss) - rebalance / cycle) / 1e5
+        assert rates[multiplier - 1] == pytest.approx(expected, rel=1e-9)
+    # scenarios give one row each and `best` averages them
+    scenarios = ranges.objective(1e5, [VARIANCE, VARIANCE * 2], **MARKET)
+    assert scenarios.shape == (2, 4096)
+    assert ranges.best(1e5, [VARIANCE], **MARKET) == ranges.best(
+        1e5, VARIANCE, **MARKET
+    )
+
+
+def test_observe_estimates_variance_and_fees():
+    rng = np.random.default_rng(1)
+    ranges = RangeOptimizer(half_life=10**9)
+    sigma = math.sqrt(VARIANCE * 12)
+    ticks = 74000 + np.cumsum(np.round(rng.standard_normal(20000) * sigma / LOG_TICK))
+    for i, tick in enumerate(ticks):
+        ranges.observe(i * 12, int(tick), 1000.0, 5e6)
+    assert ranges.variance == pytest.approx(VARIANCE, rel=0.05)
+    assert ranges.volume == pytest.approx(1000 / 12, rel=1e-3)
+    assert ranges.liquidity == pytest.approx(5e6)
+    assert ranges.price == 1.0001 ** ticks[-1]
+
+
+def test_load_matches_observe(tmp_path):
+    rng = np.random.default_rng(2)
+    n = 500
+    blocks = np.repeat(np.arange(n // 2), 2)
+    timestamps = blocks * 2
+    ticks = 74000 + np.cumsum(rng.integers(-20, 21, n))
+    volumes = rng.uniform(0, 1e5, n)
+    liquidity = [int(x) * 10**18 for x in rng.integers(10**6, 10**7, n)]
+    kinds = [SWAP] * n
+    kinds[7] = 1  # a mint is skipped
+    store = ColumnStore(tmp_path, POOL_COLUMNS)
+    store.append(
+        {
+            "block": blocks,
+            "log_index": range(n),
+            "timestamp": timestamps,
+            "kind": kinds,
+            "tick": ticks,
+            "sqrt_price_x96": uint_column([0] * n, 20),
+            "price": [0.0] * n,
+            "liquidity": uint_column(liquidity, 16),
+            "tick_lower": [0] * n,
+            "tick_upper": [0] * n,
+            "amount0": [0.0] * n,
+            "amount1": -volumes,
+        },
+        last_block=n,
+    )
+    loaded = RangeOptimizer(half_life=300).load(store, chunk=64)
+    observed = RangeOptimizer(half_life=300)
+    for i in range(n):
+        if i != 7:
+            observed.observe(
+                timestamps[i], int(ticks[i]), volumes[i], liquidity[i] / 1e18
+            )
+    assert loaded.variance == pytest.approx(observed.variance, rel=1e-9)
+    assert loaded.volume == pytest.approx(observed.volume, rel=1e-9)
+    assert loaded.liquidity == pytest.approx(observed.liquidity, rel=1e-9)
+    assert loaded.price == observed.price
+
+
+def test_decide_holds_within_gain_and_limits():
+    ranges = optimizer(rebalance_gas=5.0, keeper_delay=60)
+    move = round(math.sqrt(VARIANCE * 86400) / LOG_TICK)
+    ranges.observe(0, 74000 - move)
+    ranges.observe(86400, 74000, 8e8, 5e6)
+    assert ranges.variance == pytest.approx(VARIANCE, rel=1e-2)
+    best, _ = ranges.best(1e7)
+    assert 1 < best < 100
+    assert ranges.decide(best, 1e7) is None
+    assert ranges.decide(best + 1, 1e7) == best
+    # the last step of a width is worth less than a transaction
+    assert ranges.decide(best + 1, 1e7, min_gain=5000.0) is None
+    assert ranges.decide(best - 1, 1e7, limits=(best - 1, best - 1)) is None
+    assert ranges.decide(best + 20, 1e7, limits=(best + 1, best + 10)) == best + 1
+    # a width outside the candidates is always replaced
+    assert ranges.decide(10**6, 1e7, min_gain=10**9) == best
+
+
+def test_decision_is_fast():
+    ranges = optimizer(max_multiplier=8192, rebalance_gas=5.0)
+    ranges.observe(0, 74000)
+    ranges.observe(12, 74003, 1e4, 5e6)
+    start = time.perf_counter()
+    for i in range(100):
+        ranges.observe(24 + i * 2, 74000 + i % 7, 1e4, 5e6)
+        ranges.decide(200, 1e6)
+    # well inside a 2 second Optimism block
+    assert (time.perf_counter() - start) / 100 < 0.01